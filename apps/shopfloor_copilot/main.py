@@ -1,10 +1,18 @@
 import os
+import asyncio
 import logging
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
 from nicegui import ui
 from apps.shopfloor_copilot.routers import ask, ingest, export, kpi, oee_analytics, realtime, diagnostics, violations
+from packages.db import (
+    dispose_engines, engine_pool_stats, close_async_pools, async_pool_stats,
+    ensure_kpi_cache_triggers, start_kpi_cache_listener, stop_kpi_cache_listener
+)
+from packages.tools.sqlkpi import close_kpi_pools
+from packages.tools.oee_rollups import ensure_rollups
+from packages.tools.oee_sql_tool import ensure_trend_index
 
 # Configure logging at startup
 logging.basicConfig(
@@ -35,6 +43,34 @@ app.include_router(violations.router)
 def health():
     return {"status": "ok", "app": "shopfloor_copilot"}
 
+@app.get("/health/db")
+def health_db():
+    """Connection pool usage of the shared database engines and async pools"""
+    return {**engine_pool_stats(), "async_pools": async_pool_stats()}
+
+@app.on_event("startup")
+async def install_oee_rollups():
+    """Create/refresh the trigger-maintained OEE rollup tables and the trend index"""
+    if not await asyncio.to_thread(ensure_rollups):
+        logger.error("❌ OEE rollup tables are not installed; /oee/lines and the OEE screens will fail "
+                     "until sql/oee_rollups.sql runs")
+    await asyncio.to_thread(ensure_trend_index)
+
+@app.on_event("startup")
+async def start_kpi_cache_invalidation():
+    """Install NOTIFY triggers and listen for KPI cache invalidations"""
+    if not await asyncio.to_thread(ensure_kpi_cache_triggers):
+        logger.error("❌ KPI cache NOTIFY triggers are not installed; cached KPI/OEE results are only "
+                     "refreshed every KPI_CACHE_BUCKET_S and can be stale after writes")
+    start_kpi_cache_listener()
+
+@app.on_event("shutdown")
+async def close_db_pools():
+    stop_kpi_cache_listener()
+    dispose_engines()
+    close_kpi_pools()
+    await close_async_pools()
+
 # Initialize NiceGUI with FastAPI
 app.mount("/static", StaticFiles(directory="apps/shopfloor_copilot/static"), name="static")
 ui.run_with(app, storage_secret="shopfloor-secret")
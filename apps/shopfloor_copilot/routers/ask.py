@@ -1,15 +1,20 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional, Literal, Dict, Any
+from typing import Optional, Literal, Dict, Any, Tuple
 import re
 import os
+import time
+import asyncio
 import httpx
 from datetime import datetime, timedelta
 from sqlalchemy import text
 from packages.core_rag.retriever import retrieve_and_answer, retrieve_passages, build_mes_filters
 from packages.core_rag.hybrid_retriever import hybrid_retrieve, hybrid_retrieve_and_answer
-from packages.core_rag.llm_client import generate_answer, check_ollama_health
+from packages.core_rag.llm_client import generate_answer_async, check_ollama_health
+from packages.core_rag.llm_cache import get_generation_cache
+from packages.core_rag.llm_scheduler import LLMBusyError, get_llm_scheduler, resolve_priority
 from packages.tools.oee_sql_tool import query_oee_trend
+from packages.tools.opc_snapshot import fetch_plant_snapshot
 from apps.shopfloor_copilot.routers.oee_analytics import get_db_engine
 
 router = APIRouter(tags=["ask"])
@@ -203,16 +208,13 @@ async def get_runtime_context_async() -> Dict[str, Any]:
     opc_url = os.getenv("OPC_STUDIO_URL", "http://opc-studio:8040")
     
     try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            response = await client.get(f"{opc_url}/snapshot")
-            if response.status_code == 200:
-                snapshot = response.json()
-                if snapshot.get("ok"):
-                    return {
-                        "available": True,
-                        "source": "opc-studio",
-                        "data": snapshot.get("data", {})
-                    }
+        snapshot = await fetch_plant_snapshot(opc_url, timeout=2.0)
+        if snapshot.get("ok"):
+            return {
+                "available": True,
+                "source": "opc-studio",
+                "data": snapshot.get("data", {})
+            }
     except Exception as e:
         pass
     
@@ -295,6 +297,109 @@ def build_runtime_context_string(snapshot: Dict[str, Any], kpi_trend: Dict[str,
     
     return "\n".join(context_parts) if context_parts else ""
 
+
+# ==================== Runtime context: intent gate + shared TTL cache ====================
+
+RUNTIME_CONTEXT_TTL_S = float(os.getenv("RUNTIME_CONTEXT_TTL_S", "5"))
+
+# Questions about live state or KPIs need runtime data; purely documentary
+# questions ("how do I...", "what does SOP-12 say", "which line uses...") do
+# not. Live/KPI phrasing is enough on its own; an equipment ID only counts
+# together with a runtime term ("is ST18 running?", "A01 output today").
+RUNTIME_INTENT_PATTERN = re.compile(
+    r"\b(right now|currently|at the moment|live|what'?s happening|status of|"
+    r"oee|availability|throughput|bottleneck|blocked|starved|active alarms?|"
+    r"why is .{0,40}\b(down|stopped|slow|faulted))\b",
+    re.IGNORECASE
+)
+EQUIPMENT_ID_PATTERN = re.compile(r"\b(ST\d{1,3}|[A-Z]\d{2}|SMT\d|WC\d{2})\b")
+RUNTIME_TERM_PATTERN = re.compile(
+    r"\b(now|today|current|state|status|running|stopped|down|fault\w*|alarm\w*|event\w*|"
+    r"shift|performance|cycle[ -]?time|scrap|output|speed|producing|doing)\b",
+    re.IGNORECASE
+)
+
+_runtime_cache: Dict[str, Any] = {"expires_at": 0.0, "value": None}
+_runtime_inflight: Optional["asyncio.Future"] = None
+
+
+def question_needs_runtime(query: str) -> bool:
+    """True if the question asks about live plant state, KPIs or the runtime of specific equipment."""
+    query = query or ""
+    if RUNTIME_INTENT_PATTERN.search(query):
+        return True
+    return bool(EQUIPMENT_ID_PATTERN.search(query) and RUNTIME_TERM_PATTERN.search(query))
+
+
+async def _fetch_runtime_context() -> Tuple[str, Dict[str, Any]]:
+    """Fetch snapshot, KPI trend and events concurrently and build the context string."""
+    started = time.monotonic()
+    try:
+        snapshot, kpi_trend, events = await asyncio.gather(
+            get_runtime_context_async(),
+            asyncio.to_thread(get_runtime_kpi_trend, minutes=15),
+            asyncio.to_thread(get_runtime_events, minutes=60)
+        )
+        
+        # Build context string for LLM with guardrails
+        runtime_context_text = build_runtime_context_string(snapshot, kpi_trend, events)
+        
+        runtime_metadata = {
+            "runtime_context_available": snapshot.get("available", False),
+            "runtime_source": snapshot.get("source", "unknown"),
+            "kpi_samples": kpi_trend.get("sample_count", 0),
+            "event_count": events.get("event_count", 0),
+            "runtime_fetch_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+        
+        # If runtime fetch failed, add explicit message
+        if not snapshot.get("available"):
+            runtime_metadata["runtime_status"] = "unavailable - continuing with RAG only"
+        
+        _runtime_cache["value"] = (runtime_context_text, runtime_metadata)
+        _runtime_cache["expires_at"] = time.monotonic() + RUNTIME_CONTEXT_TTL_S
+        return runtime_context_text, runtime_metadata
+    
+    except Exception as e:
+        # Guardrail: If runtime fetch fails entirely, continue with RAG only (not cached)
+        return (
+            "⚠️ RUNTIME DATA UNAVAILABLE - OPC Studio connection error. Using RAG documentation only.",
+            {
+                "runtime_context_error": str(e),
+                "runtime_status": "fetch failed - continuing with RAG only"
+            }
+        )
+
+
+async def get_runtime_context_cached() -> Tuple[str, Dict[str, Any]]:
+    """
+    Runtime context string + metadata, shared by all concurrent askers.
+    
+    Served from a short TTL cache; on a miss, concurrent callers await the
+    same in-flight fetch, so a burst of questions triggers a single fetch.
+    """
+    global _runtime_inflight
+    
+    if _runtime_cache["value"] is not None and time.monotonic() < _runtime_cache["expires_at"]:
+        text_value, metadata = _runtime_cache["value"]
+        return text_value, {**metadata, "runtime_cache": "hit"}
+    
+    if _runtime_inflight is None or _runtime_inflight.done():
+        _runtime_inflight = asyncio.ensure_future(_fetch_runtime_context())
+        role = "miss"
+    else:
+        role = "coalesced"
+    
+    text_value, metadata = await asyncio.shield(_runtime_inflight)
+    return text_value, {**metadata, "runtime_cache": role}
+
+
+def _cancel_runtime_task(task: Optional["asyncio.Future"]) -> None:
+    """Drop a runtime context fetch whose result will not be used (the shared fetch keeps running)."""
+    if task is not None and not task.done():
+        task.cancel()
+
+
 def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     """
     Convert simple dict filters to ChromaDB $and format if needed.
@@ -312,6 +417,14 @@ def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, A
 
 UserRole = Literal["operator", "line_manager", "quality_manager", "plant_manager"]
 
+def _busy_response(e: LLMBusyError) -> HTTPException:
+    """Translate LLM scheduler backpressure into 429/503 with a retry hint"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
 class AskReq(BaseModel):
     app: str
     query: str
@@ -323,6 +436,7 @@ class AskWithLLMReq(BaseModel):
     filters: dict | None = None
     role: UserRole = "operator"
     use_llm: bool = True
+    use_cache: bool = True  # Set False to bypass the LLM generation cache
 
 @router.post("/ask")
 def ask(req: AskReq):
@@ -338,43 +452,20 @@ async def ask_with_llm(req: AskWithLLMReq):
     VALID_LINES = ['M10', 'B02', 'C03', 'D01', 'SMT1', 'WC01']
     
     # ========== Phase A: Inject Runtime Context ==========
-    # Fetch runtime snapshot, KPI trends, and events
+    # Fetch runtime snapshot, KPI trends, and events concurrently in the
+    # background - only when the LLM will run and the question is about
+    # live plant state. Retrieval below overlaps with the fetch.
     runtime_enabled = os.getenv("RUNTIME_CONTEXT_ENABLED", "true").lower() in ("true", "1", "yes")
-    runtime_context_text = ""
+    runtime_task = None
     runtime_metadata = {}
     
     if runtime_enabled:
-        try:
-            # Get runtime snapshot with timeout guardrails
-            snapshot = await get_runtime_context_async()
-            
-            # Get KPI trend (last 15 minutes)
-            kpi_trend = get_runtime_kpi_trend(minutes=15)
-            
-            # Get recent events (last 60 minutes)
-            events = get_runtime_events(minutes=60)
-            
-            # Build context string for LLM with guardrails
-            runtime_context_text = build_runtime_context_string(snapshot, kpi_trend, events)
-            
-            runtime_metadata = {
-                "runtime_context_available": snapshot.get("available", False),
-                "runtime_source": snapshot.get("source", "unknown"),
-                "kpi_samples": kpi_trend.get("sample_count", 0),
-                "event_count": events.get("event_count", 0)
-            }
-            
-            # If runtime fetch failed, add explicit message
-            if not snapshot.get("available"):
-                runtime_metadata["runtime_status"] = "unavailable - continuing with RAG only"
-            
-        except Exception as e:
-            # Guardrail: If runtime fetch fails entirely, continue with RAG only
-            runtime_metadata = {
-                "runtime_context_error": str(e),
-                "runtime_status": "fetch failed - continuing with RAG only"
-            }
-            runtime_context_text = "⚠️ RUNTIME DATA UNAVAILABLE - OPC Studio connection error. Using RAG documentation only."
+        if not req.use_llm:
+            runtime_metadata = {"runtime_status": "skipped - LLM disabled"}
+        elif not question_needs_runtime(req.query):
+            runtime_metadata = {"runtime_status": "skipped - documentary question"}
+        else:
+            runtime_task = asyncio.ensure_future(get_runtime_context_cached())
     
     # ========== End Runtime Context Injection ==========
     
@@ -393,7 +484,7 @@ async def ask_with_llm(req: AskWithLLMReq):
             
             try:
                 # Query OEE data from database
-                oee_data = query_oee_trend(line_id=line_id, days=7)
+                oee_data = await asyncio.to_thread(query_oee_trend, line_id=line_id, days=7)
                 
                 if "error" not in oee_data:
                     # Create a summarized context for the LLM
@@ -417,12 +508,15 @@ Top Loss Categories:
                         summary_context += f"- {record['date']} {record['shift']}: OEE {record['oee']:.1%}, Main Loss: {record['main_loss']}\n"
                     
                     # Generate answer with summarized OEE data
-                    llm_result = generate_answer(
+                    llm_result = await generate_answer_async(
                         query=req.query,
                         context_passages=[{"text": summary_context, "metadata": {"doc_id": "OEE Database"}}],
-                        role=req.role
+                        role=req.role,
+                        use_cache=req.use_cache,
+                        priority=resolve_priority(req.role, "oee_query", req.query)
                     )
                     
+                    _cancel_runtime_task(runtime_task)
                     return {
                         "answer": llm_result.get("answer", ""),
                         "citations": [{"doc_id": "OEE Database", "source": "PostgreSQL", "type": "live_data"}],
@@ -437,6 +531,7 @@ Top Loss Categories:
                     # OEE query failed - provide helpful error with available lines
                     available_lines = ", ".join(VALID_LINES)
                     error_msg = f"❌ Line '{line_id}' not found in OEE database.\n\n✅ Available lines: {available_lines}\n\nPlease try one of these lines."
+                    _cancel_runtime_task(runtime_task)
                     return {
                         "answer": error_msg,
                         "citations": [{"doc_id": "System", "type": "error"}],
@@ -446,6 +541,9 @@ Top Loss Categories:
                         "role": req.role,
                         "retrieval_method": "error"
                     }
+            except LLMBusyError as e:
+                _cancel_runtime_task(runtime_task)
+                raise _busy_response(e)
             except Exception as e:
                 print(f"[OEE Query Error] {str(e)}")
                 # Fall through to regular retrieval
@@ -457,8 +555,9 @@ Top Loss Categories:
     # Normalize filters for ChromaDB (convert to $and if multiple fields)
     normalized_filters = normalize_filters(mes_filters)
     
-    # Use hybrid retrieval (BM25 + Dense Embeddings with RRF)
-    passages = hybrid_retrieve(
+    # Use hybrid retrieval (BM25 + Dense Embeddings with RRF), off the event loop
+    passages = await asyncio.to_thread(
+        hybrid_retrieve,
         query=req.query,
         collection_name="rag_core",  # Default collection name
         top_k=10,
@@ -466,6 +565,10 @@ Top Loss Categories:
         filters=normalized_filters
     )
     
+    runtime_context_text = ""
+    if runtime_task is not None:
+        runtime_context_text, runtime_metadata = await runtime_task
+    
     if not req.use_llm or not passages:
         # Fallback to legacy behavior
         # NOTE: Don't rebuild filters - retrieve_and_answer will call build_mes_filters itself
@@ -489,11 +592,17 @@ Top Loss Categories:
         })
     
     # Generate answer with Ollama (now includes runtime context)
-    llm_result = generate_answer(
-        query=req.query,
-        context_passages=passages,
-        role=req.role
-    )
+    # The LLM slot is awaited on the event loop, so queued requests hold no worker threads
+    try:
+        llm_result = await generate_answer_async(
+            query=req.query,
+            context_passages=passages,
+            role=req.role,
+            use_cache=req.use_cache,
+            priority=resolve_priority(req.role, "ask", req.query)
+        )
+    except LLMBusyError as e:
+        raise _busy_response(e)
     
     # Build citations
     citations = []
@@ -517,10 +626,22 @@ Top Loss Categories:
         "hits": len(passages),
         "role": req.role,
         "retrieval_method": "hybrid_bm25_vector_rrf",
-        "runtime_context": runtime_metadata  # Phase A: Include runtime context metadata
+        "runtime_context": runtime_metadata,  # Phase A: Include runtime context metadata
+        "prompt_tokens": llm_result.get("prompt_tokens", {}),
+        "llm_cached": llm_result.get("cached", False)
     }
 
 @router.get("/health/ollama")
 def ollama_health():
     """Check Ollama availability"""
     return check_ollama_health()
+
+@router.get("/llm/cache")
+def llm_cache_stats():
+    """LLM generation cache hit-rate metrics"""
+    return get_generation_cache().stats()
+
+@router.get("/llm/scheduler")
+def llm_scheduler_stats():
+    """LLM scheduler concurrency, queue depth and per-priority wait times"""
+    return get_llm_scheduler().stats()
@@ -11,6 +11,8 @@ from typing import Literal
 import logging
 
 from packages.diagnostics import DiagnosticsExplainer
+from packages.core_rag.llm_cache import get_generation_cache
+from packages.core_rag.llm_scheduler import LLMBusyError, get_llm_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +26,7 @@ class ExplainRequest(BaseModel):
     """Request model for diagnostic explanation."""
     scope: Literal["line", "station"]
     id: str  # Line ID (e.g., "A01") or Station ID (e.g., "ST18")
+    use_cache: bool = True  # Set False to force a fresh LLM generation
 
 
 class ExplainResponse(BaseModel):
@@ -91,7 +94,8 @@ async def explain_situation(request: ExplainRequest):
         result = await explainer.explain_situation(
             scope=request.scope,
             equipment_id=request.id,
-            profile=profile
+            profile=profile,
+            use_cache=request.use_cache
         )
         
         # Check for errors
@@ -114,6 +118,12 @@ async def explain_situation(request: ExplainRequest):
     
     except HTTPException:
         raise
+    except LLMBusyError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         logger.error(f"Diagnostic generation failed: {e}", exc_info=True)
         raise HTTPException(
@@ -134,5 +144,7 @@ async def health_check():
             "loss_category_analysis",
             "rag_retrieval",
             "structured_output"
-        ]
+        ],
+        "generation_cache": get_generation_cache().stats(),
+        "llm_scheduler": get_llm_scheduler().stats()
     }
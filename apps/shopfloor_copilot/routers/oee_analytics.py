@@ -4,186 +4,148 @@ OEE Analytics Router - SQL-based OEE trend analysis
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import os
+from packages.db import get_engine, cached_query
+from packages.tools.oee_sql_tool import fetch_oee_trends
 
 router = APIRouter(tags=["oee"])
 
 def get_db_engine():
-    """Create SQLAlchemy engine for PostgreSQL"""
-    DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
-    DB_PORT = os.getenv("POSTGRES_PORT", "5432")
-    DB_NAME = os.getenv("POSTGRES_DB", "mes_db")
-    DB_USER = os.getenv("POSTGRES_USER", "mes_user")
-    DB_PASS = os.getenv("POSTGRES_PASSWORD", "mes_pass")
-    
-    connection_string = f"postgresql+psycopg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    
-    # Connection pooling configuration
-    pool_size = int(os.getenv("SQLALCHEMY_POOL_SIZE", "10"))
-    max_overflow = int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", "20"))
-    pool_recycle = int(os.getenv("SQLALCHEMY_POOL_RECYCLE", "3600"))
-    pool_pre_ping = os.getenv("SQLALCHEMY_POOL_PRE_PING", "true").lower() == "true"
-    
-    return create_engine(
-        connection_string,
-        pool_size=pool_size,
-        max_overflow=max_overflow,
-        pool_recycle=pool_recycle,
-        pool_pre_ping=pool_pre_ping
-    )
+    """Shared pooled SQLAlchemy engine for PostgreSQL (created once per process)"""
+    return get_engine()
 
 class OEETrendRequest(BaseModel):
     line_id: str
     days: int = 14
     shift: Optional[str] = None  # If None, show all shifts
 
+class OEETrendBatchRequest(BaseModel):
+    line_ids: List[str]
+    days: int = 14
+    shift: Optional[str] = None  # If None, show all shifts
+
+def _trend_response(line_id: str, days: int, shift: Optional[str], data: dict) -> dict:
+    """Shape one line of fetch_oee_trends output as the /oee/trend payload"""
+    summary = data["summary"]
+    return {
+        "line_id": line_id,
+        "line_name": data["line_name"],
+        "period_days": days,
+        "shift_filter": shift,
+        "records": data["records"],
+        "summary": {
+            "avg_oee": round(summary["avg_oee"], 4),
+            "avg_availability": round(summary["avg_availability"], 4),
+            "avg_performance": round(summary["avg_performance"], 4),
+            "avg_quality": round(summary["avg_quality"], 4)
+        },
+        "trend_data": [
+            {
+                "date": r["date"],
+                "shift": r["shift"],
+                "line_name": r["line_name"],
+                "availability": round(float(r["availability"] or 0), 4),
+                "performance": round(float(r["performance"] or 0), 4),
+                "quality": round(float(r["quality"] or 0), 4),
+                "oee": round(float(r["oee"] or 0), 4),
+                "planned_time_min": float(r["planned_time_min"] or 0),
+                "downtime_min": float(r["unplanned_downtime_min"] or 0),
+                "total_units": int(r["total_units_produced"] or 0),
+                "good_units": int(r["good_units"] or 0),
+                "scrap_units": int(r["scrap_units"] or 0),
+                "main_loss": r["main_loss_category"]
+            }
+            for r in data["trend"]
+        ],
+        "top_losses": [
+            {
+                "category": l["category"],
+                "occurrences": int(l["occurrences"]),
+                "total_downtime_min": round(float(l["total_downtime_min"] or 0), 1),
+                "avg_oee": round(float(l["avg_oee"] or 0), 4)
+            }
+            for l in data["top_losses"]
+        ]
+    }
+
+def _oee_trends(line_ids: List[str], days: int, shift: Optional[str]) -> dict:
+    """Most recent N days of shift records (3 shifts/day) per line, one query for all lines"""
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        trends = fetch_oee_trends(conn, line_ids, shift=shift, max_rows=days * 3)
+    return {line_id: _trend_response(line_id, days, shift, data) for line_id, data in trends.items()}
+
 @router.post("/oee/trend")
 def get_oee_trend(req: OEETrendRequest):
     """
     Get OEE trend for a specific line over the last N days
     Returns: trend data + top loss categories
     """
-    engine = get_db_engine()
+    try:
+        trends = cached_query(
+            "oee.trend", req.model_dump(),
+            lambda: _oee_trends([req.line_id], req.days, req.shift),
+            tables=("oee_line_shift",)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    
+    if req.line_id not in trends:
+        raise HTTPException(status_code=404, detail=f"No data found for line {req.line_id}")
+    return trends[req.line_id]
+
+@router.post("/oee/trend/batch")
+def get_oee_trend_batch(req: OEETrendBatchRequest):
+    """
+    Get OEE trends for several lines in one round-trip
+    Returns: {"lines": {line_id: /oee/trend payload}, "missing": [line_ids without data]}
+    """
+    line_ids = list(dict.fromkeys(req.line_ids))
+    if not line_ids:
+        raise HTTPException(status_code=400, detail="line_ids must not be empty")
     
     try:
-        with engine.begin() as conn:
-            # Build query with optional shift filter
-            shift_filter = ""
-            if req.shift:
-                shift_filter = f"AND shift = '{req.shift}'"
-            
-            # Get OEE trend - use most recent N days of data available
-            query = text(f"""
-                WITH recent_data AS (
-                    SELECT 
-                        date,
-                        shift,
-                        line_name,
-                        ROUND(availability::numeric, 4) as availability,
-                        ROUND(performance::numeric, 4) as performance,
-                        ROUND(quality::numeric, 4) as quality,
-                        ROUND(oee::numeric, 4) as oee,
-                        planned_time_min,
-                        unplanned_downtime_min,
-                        total_units_produced,
-                        good_units,
-                        scrap_units,
-                        main_loss_category,
-                        ROW_NUMBER() OVER (ORDER BY date DESC, shift) as rn
-                    FROM oee_line_shift
-                    WHERE line_id = :line_id
-                      {shift_filter}
-                )
-                SELECT * FROM recent_data
-                WHERE rn <= :limit
-                ORDER BY date DESC, shift
-            """)
-            
-            result = conn.execute(query, {"line_id": req.line_id, "limit": req.days * 3})
-            rows = result.fetchall()
-            
-            if not rows:
-                raise HTTPException(status_code=404, detail=f"No data found for line {req.line_id}")
-            
-            # Convert to list of dicts
-            trend_data = []
-            for row in rows:
-                trend_data.append({
-                    "date": str(row.date),
-                    "shift": row.shift,
-                    "line_name": row.line_name,
-                    "availability": float(row.availability),
-                    "performance": float(row.performance),
-                    "quality": float(row.quality),
-                    "oee": float(row.oee),
-                    "planned_time_min": float(row.planned_time_min) if row.planned_time_min else 0,
-                    "downtime_min": float(row.unplanned_downtime_min) if row.unplanned_downtime_min else 0,
-                    "total_units": int(row.total_units_produced) if row.total_units_produced else 0,
-                    "good_units": int(row.good_units) if row.good_units else 0,
-                    "scrap_units": int(row.scrap_units) if row.scrap_units else 0,
-                    "main_loss": row.main_loss_category
-                })
-            
-            # Get top loss categories from same dataset
-            loss_query = text(f"""
-                WITH recent_data AS (
-                    SELECT 
-                        main_loss_category,
-                        unplanned_downtime_min,
-                        oee,
-                        ROW_NUMBER() OVER (ORDER BY date DESC, shift) as rn
-                    FROM oee_line_shift
-                    WHERE line_id = :line_id
-                      {shift_filter}
-                )
-                SELECT 
-                    main_loss_category,
-                    COUNT(*) as occurrences,
-                    ROUND(SUM(unplanned_downtime_min)::numeric, 1) as total_downtime_min,
-                    ROUND(AVG(oee)::numeric, 4) as avg_oee
-                FROM recent_data
-                WHERE rn <= :limit
-                GROUP BY main_loss_category
-                ORDER BY total_downtime_min DESC
-                LIMIT 5
-            """)
-            
-            loss_result = conn.execute(loss_query, {"line_id": req.line_id, "limit": req.days * 3})
-            top_losses = []
-            for row in loss_result:
-                top_losses.append({
-                    "category": row.main_loss_category,
-                    "occurrences": int(row.occurrences),
-                    "total_downtime_min": float(row.total_downtime_min),
-                    "avg_oee": float(row.avg_oee)
-                })
-            
-            # Calculate summary statistics
-            avg_oee = sum(d["oee"] for d in trend_data) / len(trend_data)
-            avg_availability = sum(d["availability"] for d in trend_data) / len(trend_data)
-            avg_performance = sum(d["performance"] for d in trend_data) / len(trend_data)
-            avg_quality = sum(d["quality"] for d in trend_data) / len(trend_data)
-            
-            return {
-                "line_id": req.line_id,
-                "line_name": trend_data[0]["line_name"],
-                "period_days": req.days,
-                "shift_filter": req.shift,
-                "records": len(trend_data),
-                "summary": {
-                    "avg_oee": round(avg_oee, 4),
-                    "avg_availability": round(avg_availability, 4),
-                    "avg_performance": round(avg_performance, 4),
-                    "avg_quality": round(avg_quality, 4)
-                },
-                "trend_data": trend_data,
-                "top_losses": top_losses
-            }
-            
+        trends = cached_query(
+            "oee.trend.batch", {"line_ids": sorted(line_ids), "days": req.days, "shift": req.shift},
+            lambda: _oee_trends(line_ids, req.days, req.shift),
+            tables=("oee_line_shift",)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    
+    return {
+        "period_days": req.days,
+        "shift_filter": req.shift,
+        "lines": {line_id: trends[line_id] for line_id in line_ids if line_id in trends},
+        "missing": [line_id for line_id in line_ids if line_id not in trends]
+    }
 
 @router.get("/oee/lines")
 def list_lines():
     """List all available lines with OEE data"""
+    return cached_query("oee.lines", None, _list_lines, tables=("oee_line_shift",))
+
+def _list_lines():
     engine = get_db_engine()
     
     try:
         with engine.begin() as conn:
+            # Monthly rollups: a handful of rows per line instead of every shift
             query = text("""
                 SELECT 
                     line_id,
-                    line_name,
-                    COUNT(*) as shifts,
-                    MIN(date) as start_date,
-                    MAX(date) as end_date,
-                    ROUND(AVG(oee)::numeric, 4) as avg_oee,
-                    ROUND(AVG(availability)::numeric, 4) as avg_availability,
-                    ROUND(AVG(performance)::numeric, 4) as avg_performance,
-                    ROUND(AVG(quality)::numeric, 4) as avg_quality
-                FROM oee_line_shift
-                GROUP BY line_id, line_name
+                    MAX(line_name) as line_name,
+                    SUM(shifts) as shifts,
+                    MIN(first_date) as start_date,
+                    MAX(last_date) as end_date,
+                    ROUND((SUM(sum_oee) / SUM(shifts))::numeric, 4) as avg_oee,
+                    ROUND((SUM(sum_availability) / SUM(shifts))::numeric, 4) as avg_availability,
+                    ROUND((SUM(sum_performance) / SUM(shifts))::numeric, 4) as avg_performance,
+                    ROUND((SUM(sum_quality) / SUM(shifts))::numeric, 4) as avg_quality
+                FROM oee_line_rollup
+                WHERE grain = 'month'
+                GROUP BY line_id
                 ORDER BY avg_oee DESC
             """)
             
@@ -9,6 +9,7 @@ import json
 from datetime import datetime
 from sqlalchemy import text
 from apps.shopfloor_copilot.routers.oee_analytics import get_db_engine
+from packages.tools.opc_snapshot import fetch_plant_snapshot
 
 router = APIRouter()
 
@@ -139,15 +140,11 @@ async def get_runtime_snapshot():
     # Try to fetch from OPC Studio if enabled
     if runtime_source in ("opc", "auto"):
         try:
-            import httpx
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{opc_url}/snapshot")
-                if response.status_code == 200:
-                    opc_data = response.json()
-                    if opc_data.get("ok"):
-                        opc_snapshot = opc_data.get("data", {})
-                        opc_timestamp = datetime.now()
-                        source = "opc"
+            opc_data = await fetch_plant_snapshot(opc_url, timeout=5.0)
+            if opc_data.get("ok"):
+                opc_snapshot = opc_data.get("data", {})
+                opc_timestamp = datetime.now()
+                source = "opc"
         except Exception as e:
             print(f"OPC Studio unavailable: {e}")
     
@@ -262,16 +259,11 @@ async def get_runtime_snapshot():
     # Try OPC Studio first if source is 'opc' or 'auto'
     if runtime_source in ("opc", "auto"):
         try:
-            async with httpx.AsyncClient(timeout=2.0) as client:
-                response = await client.get(f"{opc_url}/snapshot")
-                if response.status_code == 200:
-                    opc_snapshot = response.json()
-                    
-                    # Check if data is fresh enough
-                    if opc_snapshot.get("ok"):
-                        snapshot_data = opc_snapshot.get("data", {})
-                        source = "opc-studio"
-                        timestamp = datetime.now().isoformat()
+            opc_snapshot = await fetch_plant_snapshot(opc_url, timeout=2.0)
+            if opc_snapshot.get("ok"):
+                snapshot_data = opc_snapshot.get("data", {})
+                source = "opc-studio"
+                timestamp = datetime.now().isoformat()
                         
         except Exception as e:
             error_message = f"OPC Studio unavailable: {str(e)}"
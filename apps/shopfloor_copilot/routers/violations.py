@@ -58,7 +58,7 @@ async def acknowledge_violation(violation_id: str, request: AcknowledgmentReques
         persistence = get_violation_persistence()
         
         # Validate violation exists
-        violation = persistence.get_violation_by_id(uuid.UUID(violation_id))
+        violation = await persistence.get_violation_by_id_async(uuid.UUID(violation_id))
         if not violation:
             raise HTTPException(status_code=404, detail=f"Violation {violation_id} not found")
         
@@ -70,7 +70,7 @@ async def acknowledge_violation(violation_id: str, request: AcknowledgmentReques
             )
         
         # Add acknowledgment
-        ack_id = persistence.add_acknowledgment(
+        ack_id = await persistence.add_acknowledgment_async(
             violation_id=uuid.UUID(violation_id),
             ack_by=request.ack_by,
             ack_type=request.ack_type,
@@ -82,7 +82,7 @@ async def acknowledge_violation(violation_id: str, request: AcknowledgmentReques
             raise HTTPException(status_code=500, detail="Failed to add acknowledgment")
         
         # Get updated timeline
-        timeline = persistence.get_violation_timeline(uuid.UUID(violation_id))
+        timeline = await persistence.get_violation_timeline_async(uuid.UUID(violation_id))
         
         return {
             "ok": True,
@@ -122,7 +122,7 @@ async def resolve_violation(violation_id: str, request: ResolveRequest):
         persistence = get_violation_persistence()
         
         # Validate violation exists
-        violation = persistence.get_violation_by_id(uuid.UUID(violation_id))
+        violation = await persistence.get_violation_by_id_async(uuid.UUID(violation_id))
         if not violation:
             raise HTTPException(status_code=404, detail=f"Violation {violation_id} not found")
         
@@ -134,7 +134,7 @@ async def resolve_violation(violation_id: str, request: ResolveRequest):
             )
         
         # Resolve violation
-        success = persistence.resolve_violation(
+        success = await persistence.resolve_violation_async(
             violation_id=uuid.UUID(violation_id),
             ack_by=request.ack_by,
             comment=request.comment
@@ -176,7 +176,7 @@ async def get_violation_timeline(violation_id: str):
     try:
         persistence = get_violation_persistence()
         
-        timeline = persistence.get_violation_timeline(uuid.UUID(violation_id))
+        timeline = await persistence.get_violation_timeline_async(uuid.UUID(violation_id))
         
         if not timeline:
             raise HTTPException(status_code=404, detail=f"Violation {violation_id} not found")
@@ -213,20 +213,14 @@ async def get_active_violations(
     try:
         persistence = get_violation_persistence()
         
-        violations = persistence.get_active_violations(
+        # Enriched with state and ack_count from one batched acknowledgment query
+        enriched = await persistence.get_active_violations_async(
             station=station,
             profile=profile,
-            blocking_only=blocking_only
+            blocking_only=blocking_only,
+            with_state=True
         )
         
-        # Enrich with states
-        enriched = []
-        for violation in violations:
-            timeline = persistence.get_violation_timeline(violation['id'])
-            violation['state'] = timeline['state'] if timeline else 'OPEN'
-            violation['ack_count'] = timeline['ack_count'] if timeline else 0
-            enriched.append(violation)
-        
         return {
             "ok": True,
             "violations": enriched,
@@ -258,7 +252,7 @@ async def get_violation_history(
     try:
         persistence = get_violation_persistence()
         
-        violations = persistence.get_violation_history(
+        violations = await persistence.get_violation_history_async(
             station=station,
             profile=profile,
             limit=limit
@@ -64,18 +64,18 @@ def comparative_analytics_screen():
                     line_performance = conn.execute(text("""
                         SELECT 
                             line_id,
-                            line_name,
-                            COUNT(DISTINCT date) as operating_days,
-                            ROUND(AVG(oee)::numeric * 100, 1) as avg_oee,
-                            ROUND(AVG(availability)::numeric * 100, 1) as avg_availability,
-                            ROUND(AVG(performance)::numeric * 100, 1) as avg_performance,
-                            ROUND(AVG(quality)::numeric * 100, 1) as avg_quality,
+                            MAX(line_name) as line_name,
+                            SUM(operating_days) as operating_days,
+                            ROUND(SUM(sum_oee)::numeric / SUM(shifts) * 100, 1) as avg_oee,
+                            ROUND(SUM(sum_availability)::numeric / SUM(shifts) * 100, 1) as avg_availability,
+                            ROUND(SUM(sum_performance)::numeric / SUM(shifts) * 100, 1) as avg_performance,
+                            ROUND(SUM(sum_quality)::numeric / SUM(shifts) * 100, 1) as avg_quality,
                             SUM(total_units_produced) as total_production,
                             SUM(unplanned_downtime_min) as total_downtime,
-                            ROUND(AVG(unplanned_downtime_min)::numeric, 1) as avg_downtime_per_shift
-                        FROM oee_line_shift
-                        WHERE date >= :start_date AND date <= :end_date
-                        GROUP BY line_id, line_name
+                            ROUND(SUM(unplanned_downtime_min)::numeric / SUM(shifts), 1) as avg_downtime_per_shift
+                        FROM oee_line_rollup
+                        WHERE grain = 'day' AND period_start >= :start_date AND period_start <= :end_date
+                        GROUP BY line_id
                         ORDER BY avg_oee DESC
                     """), params).fetchall()
                     
@@ -127,15 +127,15 @@ def comparative_analytics_screen():
                 if show_all or comparison_type.value == 'Weekly Trends':
                     weekly_trends = conn.execute(text("""
                         SELECT 
-                            DATE_TRUNC('week', date)::date as week_start,
-                            ROUND(AVG(oee)::numeric * 100, 1) as avg_oee,
+                            DATE_TRUNC('week', period_start)::date as week_start,
+                            ROUND(SUM(sum_oee)::numeric / SUM(shifts) * 100, 1) as avg_oee,
                             SUM(total_units_produced) as total_production,
                             SUM(unplanned_downtime_min) as total_downtime,
                             COUNT(DISTINCT line_id) as active_lines,
-                            COUNT(*) as total_shifts
-                        FROM oee_line_shift
-                        WHERE date >= :start_date AND date <= :end_date
-                        GROUP BY DATE_TRUNC('week', date)
+                            SUM(shifts) as total_shifts
+                        FROM oee_line_rollup
+                        WHERE grain = 'day' AND period_start >= :start_date AND period_start <= :end_date
+                        GROUP BY DATE_TRUNC('week', period_start)
                         ORDER BY week_start
                     """), params).fetchall()
                     
@@ -143,11 +143,11 @@ def comparative_analytics_screen():
                     line_weekly_trends = conn.execute(text("""
                         SELECT 
                             line_id,
-                            DATE_TRUNC('week', date)::date as week_start,
-                            ROUND(AVG(oee)::numeric * 100, 1) as avg_oee
-                        FROM oee_line_shift
-                        WHERE date >= :start_date AND date <= :end_date
-                        GROUP BY line_id, DATE_TRUNC('week', date)
+                            DATE_TRUNC('week', period_start)::date as week_start,
+                            ROUND(SUM(sum_oee)::numeric / SUM(shifts) * 100, 1) as avg_oee
+                        FROM oee_line_rollup
+                        WHERE grain = 'day' AND period_start >= :start_date AND period_start <= :end_date
+                        GROUP BY line_id, DATE_TRUNC('week', period_start)
                         ORDER BY line_id, week_start
                     """), params).fetchall()
                     
@@ -3,7 +3,8 @@ import httpx
 from nicegui import ui, app
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from packages.db import get_engine
 from typing import Dict, List
 
 # Database connection
@@ -13,7 +14,7 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
 DB_NAME = os.getenv("DB_NAME", "ragdb")
 
-engine = create_engine(f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+engine = get_engine(f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
 
 def get_oee_component_trends(line_id: str, days: int) -> Dict:
     """Get Availability, Performance, Quality trends from unified view (prefers OPC Studio data)"""
@@ -10,6 +10,8 @@ import httpx
 from nicegui import ui
 from datetime import datetime
 
+from packages.tools.opc_snapshot import fetch_plant_snapshot
+
 # NiceGUI async functions run server-side, so use Docker internal hostname
 OPC_STUDIO_URL = os.getenv("OPC_STUDIO_URL", "http://opc-studio:8040")
 
@@ -47,9 +49,9 @@ async def fetch_plant_model():
 async def fetch_snapshot():
     """Fetch current plant snapshot"""
     try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            r = await client.get(f"{OPC_STUDIO_URL}/snapshot")
-            return r.json() if r.status_code == 200 else {"snapshot": {}, "error": f"HTTP {r.status_code}"}
+        return await fetch_plant_snapshot(OPC_STUDIO_URL, timeout=2.0)
+    except httpx.HTTPStatusError as e:
+        return {"snapshot": {}, "error": f"HTTP {e.response.status_code}"}
     except Exception as e:
         return {"snapshot": {}, "error": str(e)}
 
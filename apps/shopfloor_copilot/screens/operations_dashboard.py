@@ -241,12 +241,13 @@ def build_operations_dashboard(selected_line: str = None):
                     station_data = conn.execute(text("""
                         SELECT 
                             station_id,
-                            AVG(oee) as avg_oee,
-                            AVG(availability) as avg_avail,
-                            COUNT(*) as shifts
-                        FROM oee_station_shift
+                            SUM(sum_oee) / SUM(shifts) as avg_oee,
+                            SUM(sum_availability) / SUM(shifts) as avg_avail,
+                            SUM(shifts) as shifts
+                        FROM oee_station_rollup
                         WHERE line_id = :line_id
-                          AND date >= CURRENT_DATE - INTERVAL '7 days'
+                          AND grain = 'day'
+                          AND period_start >= CURRENT_DATE - INTERVAL '7 days'
                         GROUP BY station_id
                         ORDER BY avg_oee DESC
                     """), {"line_id": line_id}).fetchall()
@@ -258,11 +259,12 @@ def build_operations_dashboard(selected_line: str = None):
                 loss_data = conn.execute(text("""
                     SELECT 
                         loss_category,
-                        SUM(duration_min) as total_minutes,
-                        COUNT(*) as occurrences
-                    FROM oee_downtime_events
+                        SUM(total_duration_min) as total_minutes,
+                        SUM(events) as occurrences
+                    FROM oee_downtime_rollup
                     WHERE line_id = :line_id
-                      AND date >= CURRENT_DATE - INTERVAL '7 days'
+                      AND grain = 'day'
+                      AND period_start >= CURRENT_DATE - INTERVAL '7 days'
                     GROUP BY loss_category
                     ORDER BY total_minutes DESC
                     LIMIT 5
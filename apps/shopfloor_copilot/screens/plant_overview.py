@@ -1,9 +1,19 @@
 from nicegui import ui, app
 from sqlalchemy import text
 from apps.shopfloor_copilot.routers.oee_analytics import get_db_engine
+from packages.db import cached_query
 from datetime import datetime, timedelta
 import asyncio
 
+
+def _cached_rows(sql: str, params=None):
+    """Rows as dicts, shared across viewers via the KPI query cache"""
+    def run():
+        with get_db_engine().connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(text(sql), params or {})]
+    return cached_query(sql, params, run)
+
+
 def build_plant_overview(on_line_click=None):
     """Build the graphical Plant Overview page with traffic lights and live alarms"""
     
@@ -24,24 +34,22 @@ def build_plant_overview(on_line_click=None):
     async def load_data():
         # Fetch latest OEE data directly from database
         try:
-            engine = get_db_engine()
-            with engine.connect() as conn:
-                result = conn.execute(text("""
+            lines_data = _cached_rows("""
                     SELECT 
                         line_id,
-                        line_name,
-                        COUNT(*) as shifts,
-                        MIN(date) as start_date,
-                        MAX(date) as end_date,
-                        AVG(oee) as avg_oee,
-                        AVG(availability) as avg_availability,
-                        AVG(performance) as avg_performance,
-                        AVG(quality) as avg_quality
-                    FROM oee_line_shift
-                    GROUP BY line_id, line_name
+                        MAX(line_name) as line_name,
+                        SUM(shifts) as shifts,
+                        MIN(first_date) as start_date,
+                        MAX(last_date) as end_date,
+                        SUM(sum_oee) / SUM(shifts) as avg_oee,
+                        SUM(sum_availability) / SUM(shifts) as avg_availability,
+                        SUM(sum_performance) / SUM(shifts) as avg_performance,
+                        SUM(sum_quality) / SUM(shifts) as avg_quality
+                    FROM oee_line_rollup
+                    WHERE grain = 'month'
+                    GROUP BY line_id
                     ORDER BY avg_oee DESC
-                """))
-                lines_data = [dict(row._mapping) for row in result]
+            """)
         except Exception as e:
             print(f"Error fetching OEE data from database: {e}")
             lines_data = []
@@ -58,6 +66,7 @@ def build_plant_overview(on_line_click=None):
         # Fetch recent downtime events for live alarms
         active_alarms = []
         try:
+            engine = get_db_engine()
             with engine.connect() as conn:
                 # Get most recent downtime events from the last 2 hours
                 result = conn.execute(text("""
@@ -113,20 +122,18 @@ def build_plant_overview(on_line_click=None):
         # Fetch main losses for all lines in one query
         main_losses = {}
         try:
-            with engine.connect() as conn:
-                result = conn.execute(text("""
-                    SELECT line_id, loss_category, COUNT(*) as count
-                    FROM oee_downtime_events
-                    WHERE date >= CURRENT_DATE - INTERVAL '7 days'
+            result = _cached_rows("""
+                    SELECT line_id, loss_category, SUM(events) as count
+                    FROM oee_downtime_rollup
+                    WHERE grain = 'day' AND period_start >= CURRENT_DATE - INTERVAL '7 days'
                     GROUP BY line_id, loss_category
                     ORDER BY line_id, count DESC
-                """))
-                
-                current_line = None
-                for row in result:
-                    line_id = row[0]
-                    if line_id not in main_losses:
-                        main_losses[line_id] = row[1]  # Take first (most frequent) loss category
+            """)
+            
+            for row in result:
+                line_id = row['line_id']
+                if line_id not in main_losses:
+                    main_losses[line_id] = row['loss_category']  # Take first (most frequent) loss category
         except Exception as e:
             print(f"Error fetching main losses: {e}")
         
@@ -310,10 +317,11 @@ def _get_main_loss_for_line(line_id: str) -> str:
         with engine.connect() as conn:
             # Get most frequent loss category from last 7 days
             result = conn.execute(text("""
-                SELECT loss_category, COUNT(*) as count
-                FROM oee_downtime_events
+                SELECT loss_category, SUM(events) as count
+                FROM oee_downtime_rollup
                 WHERE line_id = :line_id
-                  AND date >= CURRENT_DATE - INTERVAL '7 days'
+                  AND grain = 'day'
+                  AND period_start >= CURRENT_DATE - INTERVAL '7 days'
                 GROUP BY loss_category
                 ORDER BY count DESC
                 LIMIT 1
@@ -1,6 +1,6 @@
 import os
 from nicegui import ui, app
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from typing import List, Dict
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
@@ -10,6 +10,7 @@ import io
 # Import export utilities
 import sys
 sys.path.insert(0, '/app')
+from packages.db import get_engine, cached_query
 from packages.export_utils.csv_export import create_csv_download
 from packages.export_utils.pdf_export import (
     export_to_pdf, 
@@ -25,31 +26,37 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
 DB_NAME = os.getenv("DB_NAME", "ragdb")
 
-engine = create_engine(f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+engine = get_engine(f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+
+def _cached_rows(sql: str, params: Dict) -> List[Dict]:
+    """Rows as dicts, shared across viewers via the KPI query cache"""
+    def run():
+        with engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(text(sql), params)]
+    return list(cached_query(sql, params, run))  # callers sort in place
 
 def get_production_lines_summary(days: int = 30) -> List[Dict]:
     """Get comprehensive summary for all production lines"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(f"""
+        # Daily rollups (maintained by triggers on oee_line_shift)
+        return _cached_rows("""
                 SELECT 
                     line_id,
-                    line_name,
-                    COUNT(DISTINCT date || shift) as total_shifts,
-                    AVG(oee) * 100 as avg_oee,
-                    AVG(availability) * 100 as avg_availability,
-                    AVG(performance) * 100 as avg_performance,
-                    AVG(quality) * 100 as avg_quality,
+                    MAX(line_name) as line_name,
+                    SUM(shifts) as total_shifts,
+                    SUM(sum_oee) / SUM(shifts) * 100 as avg_oee,
+                    SUM(sum_availability) / SUM(shifts) * 100 as avg_availability,
+                    SUM(sum_performance) / SUM(shifts) * 100 as avg_performance,
+                    SUM(sum_quality) / SUM(shifts) * 100 as avg_quality,
                     SUM(total_units_produced) as total_units,
                     SUM(good_units) as total_good_units,
-                    MAX(date) as last_updated
-                FROM oee_line_shift
-                WHERE date >= CURRENT_DATE - INTERVAL '{days} days'
-                GROUP BY line_id, line_name
+                    MAX(last_date) as last_updated
+                FROM oee_line_rollup
+                WHERE grain = 'day'
+                  AND period_start >= CURRENT_DATE - make_interval(days => :days)
+                GROUP BY line_id
                 ORDER BY avg_oee DESC
-            """))
-            
-            return [dict(row._mapping) for row in result]
+        """, {"days": days})
     except Exception as e:
         print(f"Error fetching production lines: {e}")
         return []
@@ -57,8 +64,7 @@ def get_production_lines_summary(days: int = 30) -> List[Dict]:
 def get_line_recent_issues(line_id: str, limit: int = 3) -> List[Dict]:
     """Get recent issues for a specific line"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
+        return _cached_rows("""
                 SELECT 
                     date,
                     shift,
@@ -70,9 +76,7 @@ def get_line_recent_issues(line_id: str, limit: int = 3) -> List[Dict]:
                 WHERE line_id = :line_id
                 ORDER BY start_timestamp DESC
                 LIMIT :limit
-            """), {"line_id": line_id, "limit": limit})
-            
-            return [dict(row._mapping) for row in result]
+        """, {"line_id": line_id, "limit": limit})
     except Exception as e:
         print(f"Error fetching issues for {line_id}: {e}")
         return []
@@ -80,9 +84,8 @@ def get_line_recent_issues(line_id: str, limit: int = 3) -> List[Dict]:
 def get_line_status(line_id: str) -> Dict:
     """Get real-time status of a production line"""
     try:
-        with engine.connect() as conn:
-            # Check latest shift data - use OEE to determine status
-            result = conn.execute(text("""
+        # Check latest shift data - use OEE to determine status
+        rows = _cached_rows("""
                 WITH latest_shift AS (
                     SELECT 
                         line_id,
@@ -129,18 +132,18 @@ def get_line_status(line_id: str) -> Dict:
                         ELSE 'running'
                     END as status
                 FROM latest_shift ls, active_downtime ad
-            """), {"line_id": line_id})
-            
-            row = result.fetchone()
-            if row:
-                return {
-                    'status': row[7],  # running, stopped, warning
-                    'last_updated': f"{row[1]} {row[2]}",
-                    'current_oee': float(row[3] or 0),
-                    'downtime_events': int(row[6] or 0)
-                }
-            else:
-                return {'status': 'unknown', 'last_updated': 'N/A', 'current_oee': 0, 'downtime_events': 0}
+        """, {"line_id": line_id})
+        
+        if rows:
+            row = rows[0]
+            return {
+                'status': row['status'],  # running, stopped, warning
+                'last_updated': f"{row['date']} {row['shift']}",
+                'current_oee': float(row['oee'] or 0),
+                'downtime_events': int(row['downtime_count'] or 0)
+            }
+        else:
+            return {'status': 'unknown', 'last_updated': 'N/A', 'current_oee': 0, 'downtime_events': 0}
     except Exception as e:
         print(f"Error fetching status for {line_id}: {e}")
         return {'status': 'unknown', 'last_updated': 'N/A', 'current_oee': 0, 'downtime_events': 0}
@@ -148,23 +151,21 @@ def get_line_status(line_id: str) -> Dict:
 def get_line_trend(line_id: str, days: int = 7) -> Dict:
     """Get OEE trend data for a specific line"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(f"""
+        rows = _cached_rows("""
                 SELECT 
                     date,
                     shift,
                     oee * 100 as oee
                 FROM oee_line_shift
                 WHERE line_id = :line_id
-                  AND date >= CURRENT_DATE - INTERVAL '{days} days'
+                  AND date >= CURRENT_DATE - make_interval(days => :days)
                 ORDER BY date, shift
-            """), {"line_id": line_id})
-            
-            rows = result.fetchall()
-            return {
-                'dates': [f"{row[0]} {row[1]}" for row in rows],
-                'oee': [float(row[2] or 0) for row in rows]
-            }
+        """, {"line_id": line_id, "days": days})
+        
+        return {
+            'dates': [f"{row['date']} {row['shift']}" for row in rows],
+            'oee': [float(row['oee'] or 0) for row in rows]
+        }
     except Exception as e:
         print(f"Error fetching trend for {line_id}: {e}")
         return {'dates': [], 'oee': []}
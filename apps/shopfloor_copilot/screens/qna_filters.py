@@ -1,7 +1,8 @@
 import os
 import httpx
 from nicegui import ui, app
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from packages.db import get_engine
 from typing import List, Dict
 from datetime import datetime
 
@@ -12,7 +13,7 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
 DB_NAME = os.getenv("DB_NAME", "ragdb")
 
-engine = create_engine(f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+engine = get_engine(f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
 
 def get_checklists_for_line(line_id: str, checklist_type: str = None) -> List[Dict]:
     """Get all checklists for a specific line"""
@@ -7,6 +7,8 @@ import httpx
 import asyncio
 from typing import Optional, Dict, Any, List
 
+from packages.tools.opc_semantic import fetch_semantic_stations
+from packages.tools.opc_stream import stream_plant_changes
 
 OPC_API = "http://opc-studio:8040"
 
@@ -42,18 +44,43 @@ class SemanticSignalsScreen:
     async def load_semantic_signals(self):
         """Load all semantic signals from plant"""
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.get(f"{OPC_API}/semantic/signals")
-                data = resp.json()
-                
-                if data.get("ok"):
-                    self.semantic_signals = data.get("semantic_signals", [])
-                    self.kpis = data.get("kpis", [])
-                    await self.render_signals()
-                    await self.render_kpis()
+            # Compact format with ETag: unchanged plant answers 304
+            stations = await fetch_semantic_stations(OPC_API)
+            self.semantic_signals = [sig for st in stations for sig in st["signals"]]
+            self.kpis = [kpi for st in stations for kpi in st["kpis"]]
+            await self.render_signals()
+            await self.render_kpis()
         except Exception as e:
             ui.notify(f"Failed to load semantic signals: {str(e)}", type="negative")
     
+    async def follow_semantic_signals(self):
+        """Keep signals current from the OPC Studio live stream; falls back to polling"""
+        stations: Dict[tuple, Dict[str, Any]] = {}
+        try:
+            async for message in stream_plant_changes(OPC_API, topics="signals"):
+                if message["type"] == "snapshot":
+                    stations = {(st["line"], st["station"]): st for st in message.get("stations", [])}
+                elif message["type"] == "signals":
+                    # Only changed signals arrive; merge them by semantic_id
+                    for changed in message["stations"]:
+                        key = (changed["line"], changed["station"])
+                        by_id = {sig["semantic_id"]: sig for sig in stations.get(key, {}).get("signals", [])}
+                        by_id.update({sig["semantic_id"]: sig for sig in changed["signals"]})
+                        stations[key] = {**changed, "signals": list(by_id.values())}
+                else:
+                    continue
+                self.semantic_signals = [sig for st in stations.values() for sig in st["signals"]]
+                self.kpis = [kpi for st in stations.values() for kpi in st["kpis"]]
+                await self.render_signals()
+                await self.render_kpis()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            ui.notify(f"Live signal stream unavailable ({e}); refreshing every 5 s", type="warning")
+            await self.load_semantic_signals()
+            if self.refresh_timer:
+                self.refresh_timer.activate()
+    
     async def load_station_signals(self):
         """Load semantic signals for selected station"""
         try:
@@ -356,11 +383,12 @@ class SemanticSignalsScreen:
         
         # Load data on startup
         asyncio.create_task(self.load_loss_categories())
-        asyncio.create_task(self.load_semantic_signals())
         asyncio.create_task(self.render_loss_category_legend())
         
-        # Auto-refresh every 5 seconds
-        self.refresh_timer = ui.timer(5.0, self.load_semantic_signals)
+        # Live updates pushed by OPC Studio; the 5 s refresh is only a fallback
+        self.refresh_timer = ui.timer(5.0, self.load_semantic_signals, active=False)
+        stream_task = asyncio.create_task(self.follow_semantic_signals())
+        ui.context.client.on_disconnect(stream_task.cancel)
 
 
 def render_semantic_signals():
@@ -65,18 +65,18 @@ def get_line_performance(start_date: datetime, end_date: datetime) -> List[Dict]
     cur.execute("""
         SELECT 
             line_id,
-            line_name,
-            AVG(oee) * 100 as avg_oee,
-            AVG(availability) * 100 as avg_availability,
-            AVG(performance) * 100 as avg_performance,
-            AVG(quality) * 100 as avg_quality,
+            MAX(line_name) as line_name,
+            SUM(sum_oee) / SUM(shifts) * 100 as avg_oee,
+            SUM(sum_availability) / SUM(shifts) * 100 as avg_availability,
+            SUM(sum_performance) / SUM(shifts) * 100 as avg_performance,
+            SUM(sum_quality) / SUM(shifts) * 100 as avg_quality,
             SUM(total_units_produced) as total_units,
             SUM(good_units) as good_units,
             SUM(scrap_units) as scrap_units,
-            COUNT(*) as shifts_worked
-        FROM oee_line_shift
-        WHERE date >= %s AND date <= %s
-        GROUP BY line_id, line_name
+            SUM(shifts) as shifts_worked
+        FROM oee_line_rollup
+        WHERE grain = 'day' AND period_start >= %s AND period_start <= %s
+        GROUP BY line_id
         ORDER BY avg_oee DESC
     """, (start_date.date(), end_date.date()))
     
@@ -109,11 +109,11 @@ def get_downtime_analysis(start_date: datetime, end_date: datetime) -> Dict:
     cur.execute("""
         SELECT 
             loss_category,
-            COUNT(*) as event_count,
-            SUM(duration_min) as total_duration,
-            AVG(duration_min) as avg_duration
-        FROM oee_downtime_events
-        WHERE date >= %s AND date <= %s
+            SUM(events) as event_count,
+            SUM(total_duration_min) as total_duration,
+            SUM(total_duration_min) / NULLIF(SUM(timed_events), 0) as avg_duration
+        FROM oee_downtime_rollup
+        WHERE grain = 'day' AND period_start >= %s AND period_start <= %s
         GROUP BY loss_category
         ORDER BY total_duration DESC
     """, (start_date.date(), end_date.date()))
@@ -0,0 +1,159 @@
+"""
+Safe expressions for semantic mappings (no eval).
+
+Expressions from YAML (loss_category_rule conditions, KPI formulas) are
+parsed once with `ast` and compiled into nested closures. Only literals, the
+declared variable names (dotted ids such as station.parts_count included),
+arithmetic, comparisons, boolean logic and conditional expressions are
+accepted; calls, other attribute access, subscripts and unknown names raise
+ExpressionError at compile time, so nothing in the config can run arbitrary
+code. The arithmetic operators also work elementwise on NumPy arrays.
+"""
+import ast
+import operator
+from typing import Any, Callable, Iterable, Mapping, Optional
+
+Env = Mapping[str, Any]
+Compiled = Callable[[Env], Any]
+
+
+class ExpressionError(ValueError):
+    """Expression is not valid or uses unsupported syntax"""
+
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Not: operator.not_,
+}
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+_LITERALS = (int, float, str, bool, type(None))
+
+
+def compile_expression(source: str, names: Iterable[str]) -> Compiled:
+    """
+    Compile `source` into a function of a {name: value} mapping.
+
+    Args:
+        source: Expression, e.g. "value < 90" or "a / (a + b)"
+        names: Variable names the expression may use
+
+    Raises:
+        ExpressionError: Syntax error, unknown name or unsupported construct
+    """
+    return compile_tree(parse_expression(source), names, source)
+
+
+def parse_expression(source: str) -> ast.AST:
+    """Expression AST (for callers that rewrite it before compile_tree)."""
+    try:
+        return ast.parse(str(source).strip(), mode="eval").body
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression '{source}': {e.msg}") from None
+
+
+def compile_tree(node: ast.AST, names: Iterable[str], source: str) -> Compiled:
+    """compile_expression() for an already parsed (and possibly rewritten) AST."""
+    return _compile(node, frozenset(names), source)
+
+
+def dotted_name(node: ast.AST) -> Optional[str]:
+    """'a.b.c' for a Name/Attribute chain, else None"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+def _compile(node: ast.AST, names: frozenset, source: str) -> Compiled:
+    if isinstance(node, ast.Constant):
+        if not isinstance(node.value, _LITERALS):
+            raise ExpressionError(f"Unsupported literal {node.value!r} in '{source}'")
+        constant = node.value
+        return lambda env: constant
+
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        key = dotted_name(node)
+        if key is None:
+            raise ExpressionError(f"Unsupported syntax (Attribute) in '{source}'")
+        if key not in names:
+            raise ExpressionError(f"Unknown name '{key}' in '{source}' (allowed: {sorted(names)})")
+        return lambda env: env[key]
+
+    if isinstance(node, (ast.Tuple, ast.List)):
+        items = [_compile(item, names, source) for item in node.elts]
+        return lambda env: tuple(item(env) for item in items)
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        op = _BINARY[type(node.op)]
+        left, right = _compile(node.left, names, source), _compile(node.right, names, source)
+        return lambda env: op(left(env), right(env))
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        op = _UNARY[type(node.op)]
+        operand = _compile(node.operand, names, source)
+        return lambda env: op(operand(env))
+
+    if isinstance(node, ast.BoolOp):
+        values = [_compile(value, names, source) for value in node.values]
+        if isinstance(node.op, ast.And):
+            def all_of(env):
+                result = True
+                for value in values:
+                    result = value(env)
+                    if not result:
+                        return result
+                return result
+            return all_of
+
+        def any_of(env):
+            result = False
+            for value in values:
+                result = value(env)
+                if result:
+                    return result
+            return result
+        return any_of
+
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        first = _compile(node.left, names, source)
+        rest = [(_COMPARE[type(op)], _compile(right, names, source)) for op, right in zip(node.ops, node.comparators)]
+
+        def compare(env):
+            left = first(env)
+            for op, right in rest:
+                value = right(env)
+                if not op(left, value):
+                    return False
+                left = value
+            return True
+        return compare
+
+    if isinstance(node, ast.IfExp):
+        test = _compile(node.test, names, source)
+        body, orelse = _compile(node.body, names, source), _compile(node.orelse, names, source)
+        return lambda env: body(env) if test(env) else orelse(env)
+
+    raise ExpressionError(f"Unsupported syntax ({type(node).__name__}) in '{source}'")
@@ -1,10 +1,16 @@
 import os
 import time
 import asyncio
-from typing import Dict, Any, Optional
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+import psycopg
 from psycopg.types.json import Json
+from psycopg_pool import PoolTimeout
 
-from .db import get_conn
+from .db import get_conn, pooled_conn
+from .historian_buffer import SpillBuffer
+from .recording import RecordingPolicy
 from .log import get_logger
 
 logger = get_logger("opc-studio.historian")
@@ -12,52 +18,292 @@ logger = get_logger("opc-studio.historian")
 HISTORIAN_ENABLED = os.getenv("HISTORIAN_ENABLED", "true").lower() in ("1","true","yes","on")
 INTERVAL_S = float(os.getenv("HISTORIAN_INTERVAL_S", "5"))
 
+# Partition/rollup/retention maintenance (see sql/init_opc_historian.sql);
+# a retention of 0 days keeps everything
+MAINTENANCE_INTERVAL_S = float(os.getenv("HISTORIAN_MAINTENANCE_INTERVAL_S", "60"))
+PARTITION_PREMAKE_DAYS = int(os.getenv("HISTORIAN_PARTITION_PREMAKE_DAYS", "3"))
+RETENTION_DAYS = int(os.getenv("HISTORIAN_RETENTION_DAYS", "30"))
+EVENTS_RETENTION_DAYS = int(os.getenv("HISTORIAN_EVENTS_RETENTION_DAYS", "365"))
+ROLLUP_1M_RETENTION_DAYS = int(os.getenv("HISTORIAN_ROLLUP_1M_RETENTION_DAYS", "0"))
+# Already-rolled-up time each refresh recomputes; rows sampled before now minus
+# this are re-rolled-up explicitly (see Historian.flush)
+ROLLUP_OVERLAP_S = float(os.getenv("HISTORIAN_ROLLUP_OVERLAP_S", "300"))
+
+# Store-and-forward (see historian_buffer.py): in-memory queue bound, spill
+# file and its size bound, and the writer's retry backoff while the DB is down
+QUEUE_MAX_BATCHES = int(os.getenv("HISTORIAN_QUEUE_MAX_BATCHES", "720"))
+SPILL_PATH = os.getenv(
+    "HISTORIAN_SPILL_PATH",
+    str(Path(__file__).resolve().parent.parent / "data" / "historian_spill.jsonl")
+)
+SPILL_MAX_MB = float(os.getenv("HISTORIAN_SPILL_MAX_MB", "512"))
+RETRY_MAX_S = float(os.getenv("HISTORIAN_RETRY_MAX_S", "30"))
+
+# Snapshot rows are sent as one array per column and unnested server-side,
+# so each table gets a single statement whose text never changes (and can
+# stay prepared) whatever the number of lines/stations. ts is the sampling
+# time (epoch seconds), so replayed batches keep their original timestamps.
+KPI_INSERT_SQL = """
+    INSERT INTO opc_kpi_samples(ts, plant, line, oee, availability, performance, quality, status)
+    SELECT to_timestamp(%s), r.*
+    FROM unnest(%s::text[], %s::text[], %s::float8[], %s::float8[], %s::float8[], %s::float8[], %s::text[]) AS r
+"""
+
+STATION_INSERT_SQL = """
+    INSERT INTO opc_station_samples(ts, plant, line, station, state, cycle_time_s, good_count, scrap_count, alarms)
+    SELECT to_timestamp(%s), r.*
+    FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::float8[], %s::int8[], %s::int8[], %s::jsonb[]) AS r
+"""
+
+EVENT_INSERT_SQL = """
+    INSERT INTO opc_events(ts, plant, line, station, event_type, payload)
+    VALUES (to_timestamp(%s), %s, %s, %s, %s, %s)
+"""
+
+def snapshot_rows(snapshot: Dict[str, Any]) -> Tuple[List[tuple], List[tuple]]:
+    """(opc_kpi_samples rows, opc_station_samples rows) of a plant snapshot, without ts; JSON-serializable"""
+    data = snapshot.get("data") or {}
+    plant = data.get("plant", "PLANT")
+    kpi_rows: List[tuple] = []
+    station_rows: List[tuple] = []
+    for line_id, line in (data.get("lines") or {}).items():
+        kpi_rows.append((
+            plant, line_id, float(line.get("oee",0)), float(line.get("availability",0)),
+            float(line.get("performance",0)), float(line.get("quality",0)), str(line.get("status",""))
+        ))
+        for st_id, st in (line.get("stations") or {}).items():
+            station_rows.append((
+                plant, line_id, st_id, str(st.get("state","")), float(st.get("cycle_time_s",0)),
+                int(st.get("good_count",0)), int(st.get("scrap_count",0)), list(st.get("alarms") or [])
+            ))
+    return kpi_rows, station_rows
+
+def _row_key_values(kind: str, row: tuple) -> Tuple[tuple, tuple]:
+    """Split a snapshot row into its (plant, line[, station]) key and signal values"""
+    if kind == "line":
+        return tuple(row[:2]), tuple(row[2:])
+    return tuple(row[:3]), tuple(row[3:])
+
+def _columns(rows: Sequence[Sequence[Any]]) -> List[list]:
+    return [list(col) for col in zip(*rows)]
+
+def _is_unavailable(e: Exception) -> bool:
+    """Database down/unreachable (retry later) rather than a bad batch"""
+    return isinstance(e, (psycopg.OperationalError, psycopg.InterfaceError, PoolTimeout))
+
 class Historian:
     def __init__(self):
         self.last_write_ts: Optional[float] = None
         self.enabled = HISTORIAN_ENABLED
         self.interval_s = INTERVAL_S
         self.last_error: Optional[str] = None
+        self.last_maintenance: Optional[Dict[str, Any]] = None
+        self.last_maintenance_error: Optional[str] = None
+        self.writes = 0
+        self.rows_written = 0
+        self.events_written = 0
+        self.last_write_rows = 0
+        self.last_write_ms: Optional[float] = None
+        self.avg_write_ms: Optional[float] = None
+        self.rows_per_s: Optional[float] = None
+        self.rows_skipped = 0
+        self.policy = RecordingPolicy.load()
+        # (kind, plant, line[, station]) -> (time.time() of the write, signal values written)
+        self._last_written: Dict[tuple, Tuple[float, tuple]] = {}
+        self.buffer = SpillBuffer(SPILL_PATH, QUEUE_MAX_BATCHES, int(SPILL_MAX_MB * 1024 * 1024))
+        self.last_flush_error: Optional[str] = None
+        # Earliest sampling time of batches written too late for the rollup
+        # overlap (replayed after an outage, or a backed-up queue); the next
+        # maintenance run re-rolls-up from there
+        self._late_from: Optional[float] = None
+        self._late_lock = threading.Lock()
 
     def write_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        """Queue the rows of a snapshot that the recording policy selects (written by writer_loop)."""
         if not self.enabled:
             return
-        data = snapshot.get("data") or {}
-        plant = data.get("plant", "PLANT")
-        lines = data.get("lines", {})
+        kpi_rows, station_rows = snapshot_rows(snapshot)
 
         now = time.time()
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                for line_id, line in lines.items():
-                    cur.execute(
-                        """INSERT INTO opc_kpi_samples(ts, plant, line, oee, availability, performance, quality, status)
-                           VALUES (NOW(), %s, %s, %s, %s, %s, %s, %s)""",
-                        (plant, line_id, float(line.get("oee",0)), float(line.get("availability",0)),
-                         float(line.get("performance",0)), float(line.get("quality",0)), str(line.get("status","")))
-                    )
-                    for st_id, st in (line.get("stations") or {}).items():
-                        cur.execute(
-                            """INSERT INTO opc_station_samples(ts, plant, line, station, state, cycle_time_s, good_count, scrap_count, alarms)
-                               VALUES (NOW(), %s, %s, %s, %s, %s, %s, %s, %s)""",
-                            (plant, line_id, st_id, str(st.get("state","")), float(st.get("cycle_time_s",0)),
-                             int(st.get("good_count",0)), int(st.get("scrap_count",0)), Json(st.get("alarms", [])))
-                        )
-            conn.commit()
+        kpi_rows, kpi_written = self._select_rows("line", kpi_rows, now)
+        station_rows, station_written = self._select_rows("station", station_rows, now)
+        if kpi_rows or station_rows:
+            self.buffer.put({"ts": now, "kpi": kpi_rows, "station": station_rows})
+        # Queued rows count as written: the buffer delivers them even across outages
+        self._last_written.update(kpi_written)
+        self._last_written.update(station_written)
         self.last_write_ts = now
         self.last_error = None
 
+    def _select_rows(self, kind: str, rows: List[tuple], now: float) -> Tuple[List[tuple], Dict[tuple, Tuple[float, tuple]]]:
+        """Rows the recording policy wants written, and their last-written cache entries"""
+        selected: List[tuple] = []
+        written: Dict[tuple, Tuple[float, tuple]] = {}
+        for row in rows:
+            key, values = _row_key_values(kind, row)
+            last = self._last_written.get((kind,) + key)
+            last_ts, last_values = last if last else (now, None)
+            if self.policy.should_record(kind, values, last_values, now - last_ts):
+                selected.append(row)
+                written[(kind,) + key] = (now, values)
+            else:
+                self.rows_skipped += 1
+        return selected, written
+
     def write_event(self, plant: str, line: str, station: str, event_type: str, payload: Dict[str, Any]) -> None:
         if not self.enabled:
             return
+        self.buffer.put({"ts": time.time(), "events": [[plant, line, station, event_type, payload]]})
+
+    def write_batch(self, batch: Dict[str, Any]) -> None:
+        """Write one queued batch in a single transaction."""
+        kpi_rows = batch.get("kpi") or []
+        station_rows = batch.get("station") or []
+        events = batch.get("events") or []
+        started = time.perf_counter()
+        # One prepared multi-row INSERT per table (rows passed as column
+        # arrays), on a pooled connection
+        with pooled_conn() as conn:
+            with conn.cursor() as cur:
+                if kpi_rows:
+                    cur.execute(KPI_INSERT_SQL, [batch["ts"]] + _columns(kpi_rows), prepare=True)
+                if station_rows:
+                    columns = _columns(station_rows)
+                    columns[-1] = [Json(alarms) for alarms in columns[-1]]
+                    cur.execute(STATION_INSERT_SQL, [batch["ts"]] + columns, prepare=True)
+                for plant, line, station, event_type, payload in events:
+                    cur.execute(EVENT_INSERT_SQL, (batch["ts"], plant, line, station, event_type, Json(payload)), prepare=True)
+        if kpi_rows or station_rows:
+            self._record_write(len(kpi_rows) + len(station_rows), time.perf_counter() - started)
+        self.events_written += len(events)
+
+    def flush(self) -> int:
+        """
+        Write queued and spilled batches, oldest first, until none are left.
+        Returns the number written; raises if the database is unavailable.
+        """
+        written = 0
+        while True:
+            head = self.buffer.peek()
+            if head is None:
+                self.last_flush_error = None
+                return written
+            source, batch, next_offset = head
+            try:
+                self.write_batch(batch)
+                if batch["ts"] < time.time() - ROLLUP_OVERLAP_S:
+                    self._mark_late(batch["ts"])
+            except Exception as e:
+                if _is_unavailable(e):
+                    self.buffer.start_spilling()
+                    raise
+                # Not retryable (bad data): drop it rather than block the queue
+                logger.exception("Dropping historian batch from %s: %s", source, e)
+                self.buffer.dropped_batches += 1
+            self.buffer.ack(source, next_offset)
+            written += 1
+
+    def _mark_late(self, ts: float) -> None:
+        with self._late_lock:
+            self._late_from = ts if self._late_from is None else min(self._late_from, ts)
+
+    def _record_write(self, rows: int, elapsed_s: float) -> None:
+        ms = elapsed_s * 1000
+        self.writes += 1
+        self.rows_written += rows
+        self.last_write_rows = rows
+        self.last_write_ms = round(ms, 2)
+        # Exponentially weighted so the figure tracks recent behaviour
+        self.avg_write_ms = round(ms if self.avg_write_ms is None else 0.8 * self.avg_write_ms + 0.2 * ms, 2)
+        self.rows_per_s = round(rows / elapsed_s, 1) if elapsed_s > 0 else None
+
+    def write_stats(self) -> Dict[str, Any]:
+        return {
+            "writes": self.writes,
+            "rows_written": self.rows_written,
+            "rows_skipped": self.rows_skipped,
+            "recording_mode": self.policy.mode,
+            "events_written": self.events_written,
+            "last_write_rows": self.last_write_rows,
+            "last_write_ms": self.last_write_ms,
+            "avg_write_ms": self.avg_write_ms,
+            "rows_per_s": self.rows_per_s,
+            "last_flush_error": self.last_flush_error,
+            **self.buffer.stats(),
+        }
+
+    def run_maintenance(self) -> Dict[str, Any]:
+        """Create upcoming partitions, refresh the 1m/1h rollups and apply retention."""
+        started = time.time()
+        # Autocommit: each step is its own short transaction, so a long rollup
+        # refresh never holds locks that block partition creation or drops
         with get_conn() as conn:
+            conn.autocommit = True
             with conn.cursor() as cur:
+                cur.execute("SELECT opc_historian_ensure_partitions(%s)", (PARTITION_PREMAKE_DAYS,))
+                created = cur.fetchone()[0]
+                cur.execute("SELECT opc_historian_refresh_rollups(make_interval(secs => %s))", (ROLLUP_OVERLAP_S,))
+                refreshed_to = cur.fetchone()[0]
+                with self._late_lock:
+                    late_from, self._late_from = self._late_from, None
+                if late_from is not None and refreshed_to is None:
+                    self._mark_late(late_from)  # no watermark yet; retry next run
+                elif late_from is not None:
+                    # Late samples landed behind the rollup watermark; keep the
+                    # marker (merged with newer late batches) until this succeeds
+                    try:
+                        cur.execute("SELECT opc_historian_rollup_range(to_timestamp(%s), %s)", (late_from, refreshed_to))
+                    except Exception:
+                        self._mark_late(late_from)
+                        raise
                 cur.execute(
-                    """INSERT INTO opc_events(ts, plant, line, station, event_type, payload)
-                       VALUES (NOW(), %s, %s, %s, %s, %s)""",
-                    (plant, line, station, event_type, Json(payload))
+                    "SELECT opc_historian_apply_retention(%s, %s, %s)",
+                    (RETENTION_DAYS, EVENTS_RETENTION_DAYS, ROLLUP_1M_RETENTION_DAYS)
                 )
-            conn.commit()
+                retention = cur.fetchone()[0]
+        result = {
+            "ts": started,
+            "duration_s": round(time.time() - started, 3),
+            "partitions_created": created,
+            "rollups_refreshed_to": refreshed_to.isoformat() if refreshed_to else None,
+            **retention,
+        }
+        if retention.get("dropped_partitions"):
+            logger.info("Historian retention dropped partitions: %s", retention["dropped_partitions"])
+        self.last_maintenance = result
+        self.last_maintenance_error = None
+        return result
+
+    async def maintenance_loop(self):
+        if not self.enabled:
+            return
+        logger.info(
+            "Historian maintenance every %ss; raw retention %s days, events %s days",
+            MAINTENANCE_INTERVAL_S, RETENTION_DAYS, EVENTS_RETENTION_DAYS
+        )
+        while True:
+            try:
+                await asyncio.to_thread(self.run_maintenance)
+            except Exception as e:
+                self.last_maintenance_error = str(e)
+                logger.exception("Historian maintenance failed: %s", e)
+            await asyncio.sleep(MAINTENANCE_INTERVAL_S)
+
+    async def writer_loop(self):
+        """The only task writing samples/events; retries with backoff while the DB is down."""
+        if not self.enabled:
+            return
+        backoff = 1.0
+        while True:
+            try:
+                await asyncio.to_thread(self.flush)
+                backoff = 1.0
+                await asyncio.sleep(min(self.interval_s, 1.0))
+            except Exception as e:
+                self.last_flush_error = str(e)
+                logger.warning("Historian database unavailable (retry in %.0fs): %s", backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RETRY_MAX_S)
 
     async def loop(self, snapshot_fn):
         if not self.enabled:
@@ -66,8 +312,9 @@ class Historian:
         logger.info("Historian enabled; interval_s=%s", self.interval_s)
         while True:
             try:
-                snap = snapshot_fn()
-                await asyncio.to_thread(self.write_snapshot, snap)
+                # Only queues rows (writer_loop does the DB work), so a slow or
+                # down database never holds up sampling
+                self.write_snapshot(snapshot_fn())
             except Exception as e:
                 self.last_error = str(e)
                 logger.exception("Historian write failed: %s", e)
@@ -0,0 +1,171 @@
+"""
+Store-and-forward buffer for historian writes.
+
+The sampler and the API enqueue write batches; a single writer drains them
+to Postgres. Batches wait in a bounded in-memory queue. When a write fails
+or the queue is full, new batches are appended to a local JSON-lines spill
+file instead, and the writer replays that file once the database is back.
+Memory is always drained before the file, and while the file is in use every
+new batch goes to it, so batches reach the database in the order they were
+taken.
+
+The replay position is kept in <spill file>.pos, so a restart resumes where
+it stopped (at worst one batch is written twice); batches still queued at
+shutdown are moved to the spill file.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .log import get_logger
+
+logger = get_logger("opc-studio.historian")
+
+Batch = Dict[str, Any]
+
+
+class SpillBuffer:
+    def __init__(self, spill_path: str, max_batches: int = 720, max_spill_bytes: int = 512 * 1024 * 1024):
+        self.spill_path = Path(spill_path)
+        self.pos_path = Path(spill_path + ".pos")
+        self.max_batches = max_batches
+        self.max_spill_bytes = max_spill_bytes
+        self._memory: deque = deque()
+        self._lock = threading.Lock()
+        self._offset = 0
+        self.spilling = False
+        self.spilled_batches = 0
+        self.replayed_batches = 0
+        self.dropped_batches = 0
+
+        # Resume a spill file left by a previous run
+        if self.spill_path.exists() and self.spill_path.stat().st_size > 0:
+            try:
+                self._offset = int(self.pos_path.read_text() or 0)
+            except (OSError, ValueError):
+                self._offset = 0
+            if self._offset < self.spill_path.stat().st_size:
+                self.spilling = True
+                logger.warning(
+                    "Replaying %d bytes of spilled historian writes from %s",
+                    self.spill_path.stat().st_size - self._offset, self.spill_path
+                )
+
+    def put(self, batch: Batch) -> None:
+        with self._lock:
+            if not self.spilling and len(self._memory) < self.max_batches:
+                self._memory.append(batch)
+                return
+            if not self.spilling:
+                logger.warning("Historian write queue full (%d batches); spilling to %s", len(self._memory), self.spill_path)
+            self.spilling = True
+            self._spill(batch)
+
+    def start_spilling(self) -> None:
+        """Send new batches to the spill file (called when a write fails)."""
+        with self._lock:
+            if not self.spilling:
+                logger.warning("Historian database unavailable; spilling writes to %s", self.spill_path)
+            self.spilling = True
+
+    def _spill(self, batch: Batch) -> None:
+        line = (json.dumps(batch, separators=(",", ":")) + "\n").encode()
+        size = self.spill_path.stat().st_size if self.spill_path.exists() else 0
+        if size - self._offset + len(line) > self.max_spill_bytes:
+            self.dropped_batches += 1
+            return
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, "ab") as f:
+            f.write(line)
+        self.spilled_batches += 1
+
+    def peek(self) -> Optional[Tuple[str, Batch, int]]:
+        """Oldest pending batch as (source, batch, next file offset), or None."""
+        with self._lock:
+            if self._memory:
+                return "memory", self._memory[0], self._offset
+            if not self.spill_path.exists():
+                self.spilling = False
+                return None
+            with open(self.spill_path, "rb") as f:
+                f.seek(self._offset)
+                while True:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        # Drained (or a torn last line from a crash): back to memory
+                        self._reset_spill()
+                        return None
+                    try:
+                        return "file", json.loads(line), self._offset + len(line)
+                    except ValueError:
+                        logger.error("Skipping unreadable historian spill record at offset %d", self._offset)
+                        self._offset += len(line)
+                        self.dropped_batches += 1
+
+    def ack(self, source: str, next_offset: int) -> None:
+        """Mark the batch returned by peek() as written."""
+        with self._lock:
+            if source == "memory":
+                if self._memory:  # persist() may have moved it to the file meanwhile
+                    self._memory.popleft()
+                return
+            self._offset = next_offset
+            self.replayed_batches += 1
+            if self._offset >= self.spill_path.stat().st_size:
+                self._reset_spill()
+                logger.info("Historian spill file replayed")
+            else:
+                self.pos_path.write_text(str(self._offset))
+
+    def persist(self) -> None:
+        """Move queued batches to the front of the spill file (on shutdown)."""
+        with self._lock:
+            if not self._memory:
+                return
+            rest = b""
+            if self.spill_path.exists():
+                with open(self.spill_path, "rb") as f:
+                    f.seek(self._offset)
+                    rest = f.read()
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.spill_path.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                for batch in self._memory:
+                    f.write((json.dumps(batch, separators=(",", ":")) + "\n").encode())
+                f.write(rest)
+            os.replace(tmp, self.spill_path)
+            self.pos_path.unlink(missing_ok=True)
+            self.spilled_batches += len(self._memory)
+            self._memory.clear()
+            self._offset = 0
+            self.spilling = True
+
+    def _reset_spill(self) -> None:
+        self.spill_path.unlink(missing_ok=True)
+        self.pos_path.unlink(missing_ok=True)
+        self._offset = 0
+        self.spilling = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            oldest = self._memory[0]["ts"] if self._memory else None
+            size = self.spill_path.stat().st_size if self.spill_path.exists() else 0
+        pending_spill = max(size - self._offset, 0)
+        if oldest is None and pending_spill:
+            head = self.peek()
+            oldest = head[1]["ts"] if head else None
+        return {
+            "queue_depth": len(self._memory),
+            "queue_max": self.max_batches,
+            "spilling": self.spilling,
+            "spilled_bytes": pending_spill,
+            "spilled_batches": self.spilled_batches,
+            "replayed_batches": self.replayed_batches,
+            "dropped_batches": self.dropped_batches,
+            # Age of the oldest batch not yet in the database
+            "replay_lag_s": round(time.time() - oldest, 1) if oldest else 0.0,
+        }
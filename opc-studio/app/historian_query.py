@@ -0,0 +1,272 @@
+"""
+Historian read API: downsampled time series for charts.
+
+A 30-day range of 5-second samples is ~500k rows per line; charts only need
+about as many points as they have pixels. Postgres splits the requested
+range into equal time buckets and keeps each bucket's minimum and maximum
+sample, so spikes survive the reduction. With method="lttb" the min/max
+candidates are then reduced to the target point count with
+Largest-Triangle-Three-Buckets, which picks the visually significant points.
+LTTB runs in plain Python: it sees at most 2 x MAX_POINTS candidates, too
+few for NumPy's per-call overhead to pay off.
+
+Ranges reaching back past the raw retention horizon are read from the 1m/1h
+rollup tables instead (their per-bucket min/max are the candidates), as the
+raw partitions there may already be dropped.
+
+The historian records on change (see recording.py), so a stored value holds
+until the next sample. Series are returned with step interpolation: the last
+value before `start` is carried in and the last value is held to `end`.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .db import pooled_conn
+from .historian import RETENTION_DAYS, ROLLUP_1M_RETENTION_DAYS
+from .recording import RecordingPolicy
+
+Point = Tuple[datetime, float]
+
+# (table, dimension columns, plottable metrics); metric names are whitelisted
+# because they are interpolated into the SQL as column names
+SERIES_SOURCES = {
+    "line": ("opc_kpi_samples", ("line",), ("oee", "availability", "performance", "quality")),
+    "station": ("opc_station_samples", ("line", "station"), ("cycle_time_s", "good_count", "scrap_count")),
+}
+
+MAX_POINTS = 5000
+DEFAULT_RANGE = timedelta(hours=24)
+
+RAW_SAMPLES_SQL = """
+    SELECT ts, {metric} AS v FROM {table}
+    WHERE {dims} AND ts >= %(start)s AND ts < %(end)s
+"""
+
+# Both extremes of each rollup bucket, stamped with the bucket start
+ROLLUP_SAMPLES_SQL = """
+    SELECT r.bucket AS ts, m.v FROM {table}_{tier} r
+    CROSS JOIN LATERAL (VALUES (r.{metric}_min), (r.{metric}_max)) AS m(v)
+    WHERE {dims} AND r.bucket >= %(start)s AND r.bucket < %(end)s
+"""
+
+# One hash aggregate per bucket: MIN/MAX over ARRAY[value, epoch] yields the
+# extreme value together with its timestamp (earliest one on ties)
+MINMAX_SQL = """
+    WITH s AS (
+        SELECT
+            EXTRACT(EPOCH FROM ts)::double precision AS e,
+            v::double precision AS v,
+            width_bucket(EXTRACT(EPOCH FROM ts), %(t0)s, %(t1)s, %(buckets)s) AS b
+        FROM ({samples}) samples
+        WHERE v IS NOT NULL
+    ),
+    agg AS (
+        SELECT MIN(ARRAY[v, e]) AS lo, MAX(ARRAY[v, -e]) AS hi
+        FROM s
+        GROUP BY b
+    )
+    SELECT to_timestamp(e) AS ts, v
+    FROM (
+        SELECT lo[2] AS e, lo[1] AS v FROM agg
+        UNION
+        SELECT -hi[2], hi[1] FROM agg
+    ) extremes
+    ORDER BY e
+"""
+
+
+# Latest sample of the lookback window before the range (value held into it)
+PRIOR_SQL = """
+    SELECT v::double precision FROM ({samples}) samples
+    WHERE v IS NOT NULL
+    ORDER BY ts DESC
+    LIMIT 1
+"""
+
+# Rollup tiers: the latest bucket's average (its min and max share one
+# timestamp, so picking among them would be arbitrary); counters have no
+# average, and their max is the bucket's last value
+PRIOR_ROLLUP_SQL = """
+    SELECT r.{column}::double precision FROM {table}_{tier} r
+    WHERE {dims} AND r.bucket >= %(start)s AND r.bucket < %(end)s AND r.{column} IS NOT NULL
+    ORDER BY r.bucket DESC
+    LIMIT 1
+"""
+ROLLUP_HELD_AGGREGATE = {"good_count": "max", "scrap_count": "max"}
+
+# Rollup rows are stamped with the bucket start
+TIER_WIDTHS = {"raw": timedelta(0), "1m": timedelta(minutes=1), "1h": timedelta(hours=1)}
+
+_heartbeat_lookback: Optional[timedelta] = None
+
+
+def hold_lookback(tier: str = "raw") -> timedelta:
+    """
+    How far before `start` to look for the held value: two recording
+    heartbeats, plus one bucket width for the rollup tiers (the bucket
+    holding `start` is stamped before it).
+    """
+    global _heartbeat_lookback
+    if _heartbeat_lookback is None:
+        _heartbeat_lookback = timedelta(seconds=2 * RecordingPolicy.load().max_silence_s)
+    return TIER_WIDTHS[tier] + _heartbeat_lookback
+
+
+def hold_steps(points: List[Point], prior: Optional[float], start: datetime, end: datetime) -> List[Point]:
+    """Step-hold reconstruction: carry `prior` in at `start` and hold the last value to `end`."""
+    held = list(points)
+    if prior is not None and (not held or held[0][0] > start):
+        held.insert(0, (start, prior))
+    if held and held[-1][0] < end:
+        held.append((end, held[-1][1]))
+    return held
+
+
+def lttb(points: Sequence[Point], threshold: int) -> List[Point]:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last point and, for each of the threshold - 2 buckets
+    in between, the point forming the largest triangle with the previously
+    kept point and the average of the next bucket.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    xs = [p[0].timestamp() for p in points]
+    ys = [p[1] for p in points]
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = max(next_end - next_start, 1)
+        avg_x = sum(xs[next_start:next_end]) / span if next_end > next_start else xs[-1]
+        avg_y = sum(ys[next_start:next_end]) / span if next_end > next_start else ys[-1]
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def _range(start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    end = end or datetime.now(timezone.utc)
+    start = start or end - DEFAULT_RANGE
+    # Naive datetimes are taken as UTC (ts columns are timestamptz)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return start, end
+
+
+def series_tier(start: datetime, end: datetime, buckets: int, now: Optional[datetime] = None) -> str:
+    """
+    Table tier to read: "raw" while the range is within raw retention,
+    otherwise the "1m" rollup, or "1h" when buckets are at least an hour
+    wide or the 1m rollups have aged out.
+    """
+    now = now or datetime.now(timezone.utc)
+    if RETENTION_DAYS <= 0 or start >= now - timedelta(days=RETENTION_DAYS):
+        return "raw"
+    if (end - start) / buckets >= timedelta(hours=1):
+        return "1h"
+    if ROLLUP_1M_RETENTION_DAYS > 0 and start < now - timedelta(days=ROLLUP_1M_RETENTION_DAYS):
+        return "1h"
+    return "1m"
+
+
+def query_series(
+    line: str,
+    metric: str,
+    station: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 1000,
+    method: str = "lttb",
+    plant: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Downsampled series of one line or station metric.
+
+    Args:
+        line: Line id
+        metric: Column to plot (see SERIES_SOURCES)
+        station: Station id; selects opc_station_samples instead of opc_kpi_samples
+        start, end: Time range (default: last 24 h)
+        points: Target number of points (at most MAX_POINTS)
+        method: "lttb" (exactly `points`) or "minmax" (min and max of points/2 buckets)
+        plant: Optional plant filter
+
+    Raises:
+        ValueError: on an unknown metric/method or an empty time range
+    """
+    source = "station" if station else "line"
+    table, dim_columns, metrics = SERIES_SOURCES[source]
+    if metric not in metrics:
+        raise ValueError(f"Unknown {source} metric '{metric}'; expected one of {', '.join(metrics)}")
+    if method not in ("lttb", "minmax"):
+        raise ValueError(f"Unknown method '{method}'; expected 'lttb' or 'minmax'")
+    start, end = _range(start, end)
+    if end <= start:
+        raise ValueError("end must be after start")
+    points = max(3, min(points, MAX_POINTS))
+
+    # LTTB chooses from the min/max of `points` buckets; minmax returns them directly
+    buckets = points if method == "lttb" else max(points // 2, 1)
+    params: Dict[str, Any] = {
+        "line": line, "station": station, "plant": plant,
+        "start": start, "end": end,
+        "t0": start.timestamp(), "t1": end.timestamp(), "buckets": buckets,
+    }
+    dims = " AND ".join(f"{col} = %({col})s" for col in dim_columns)
+    if plant:
+        dims += " AND plant = %(plant)s"
+    tier = series_tier(start, end, buckets)
+    if tier == "raw":
+        samples = RAW_SAMPLES_SQL.format(metric=metric, table=table, dims=dims)
+        prior_sql = PRIOR_SQL.format(samples=samples)
+    else:
+        samples = ROLLUP_SAMPLES_SQL.format(metric=metric, table=table, tier=tier, dims=dims)
+        column = f"{metric}_{ROLLUP_HELD_AGGREGATE.get(metric, 'avg')}"
+        prior_sql = PRIOR_ROLLUP_SQL.format(column=column, table=table, tier=tier, dims=dims)
+    sql = MINMAX_SQL.format(samples=samples)
+    prior_params = {**params, "start": start - hold_lookback(tier), "end": start}
+
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            candidates = [(ts, float(v)) for ts, v in cur.fetchall()]
+            cur.execute(prior_sql, prior_params)
+            row = cur.fetchone()
+
+    # Hold only up to now: nothing is known about the future part of a range
+    hold_end = min(end, datetime.now(timezone.utc))
+    candidates = hold_steps(candidates, row[0] if row else None, start, hold_end)
+    series = lttb(candidates, points) if method == "lttb" else candidates
+    return {
+        "line": line,
+        "station": station,
+        "metric": metric,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "method": method,
+        "source": tier,
+        "interpolation": "step",
+        "target_points": points,
+        "candidates": len(candidates),
+        "points": [[ts.isoformat(), v] for ts, v in series],
+    }
@@ -0,0 +1,451 @@
+"""
+Derived KPIs (derived_kpis in semantic_mappings.yaml), evaluated plant-wide.
+
+Each `formula` is compiled once with the safe expression compiler. A formula
+may use:
+
+  - semantic signal ids (station.parts_count): the signal's current value
+  - other KPI ids (oee.availability): that KPI's value for the same station
+  - window aggregates over the retained history of each station:
+
+      time_in_state('RUNNING', ...)  seconds spent in any of the states (station.state)
+      entries('FAULTED', ...)        transitions into any of the states
+      increase(station.parts_count)  sum of increments of a counter signal (resets count from 0)
+      elapsed()                      seconds observed
+      param('ideal_cycle_time_s', 40)  station attribute, with a default
+
+Windows default to KPI_WINDOW_S and can be set per KPI with `window_s`.
+
+KPI references form a dependency graph that is ordered once. On every
+history tick (SemanticEngine.observe) all inputs are gathered as one array
+per name over all stations, and only KPIs whose inputs or upstream KPIs
+changed are recomputed, each for the whole plant in one NumPy expression.
+History is kept as cumulative per-station accumulators plus a ring of
+snapshots every KPI_SNAPSHOT_S, so a window is current minus a snapshot.
+
+Results that are missing, infinite or NaN (0/0, no faults yet, station type
+without the signal) are not reported.
+"""
+import ast
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .expressions import ExpressionError, compile_tree, dotted_name, parse_expression
+from .log import get_logger
+
+logger = get_logger("opc-studio.semantic")
+
+KPI_WINDOW_S = float(os.getenv("KPI_WINDOW_S", "3600"))
+KPI_SNAPSHOT_S = float(os.getenv("KPI_SNAPSHOT_S", "60"))
+# Longer gaps between ticks (stalled loop, restart) are not attributed to a state
+KPI_MAX_GAP_S = float(os.getenv("KPI_MAX_GAP_S", "60"))
+
+STATE_SIGNAL = "station.state"
+AGGREGATES = ("time_in_state", "entries", "increase", "elapsed", "param")
+
+# (function, arguments, window_s)
+Aggregate = Tuple[str, Tuple[Any, ...], float]
+
+
+class _Aggregates(ast.NodeTransformer):
+    """Replace aggregate calls by variables named after the call"""
+
+    def __init__(self, signal_ids: frozenset, window_s: float, source: str):
+        self.signal_ids = signal_ids
+        self.window_s = window_s
+        self.source = source
+        self.found: Dict[str, Aggregate] = {}
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name not in AGGREGATES or node.keywords:
+            raise ExpressionError(f"Unsupported function in '{self.source}' (allowed: {', '.join(AGGREGATES)})")
+        args = tuple(self._argument(arg) for arg in node.args)
+
+        if name in ("time_in_state", "entries"):
+            if not args or not all(isinstance(arg, str) for arg in args):
+                raise ExpressionError(f"{name}() takes one or more state names in '{self.source}'")
+        elif name == "increase":
+            if len(args) != 1 or args[0] not in self.signal_ids:
+                raise ExpressionError(f"increase() takes one semantic signal id in '{self.source}'")
+        elif name == "elapsed":
+            if args:
+                raise ExpressionError(f"elapsed() takes no arguments in '{self.source}'")
+        else:
+            field_ok = len(args) in (1, 2) and isinstance(args[0], str)
+            default_ok = len(args) < 2 or isinstance(args[1], (int, float))
+            if not (field_ok and default_ok):
+                raise ExpressionError(f"param() takes a field name and a numeric default in '{self.source}'")
+
+        key = ast.unparse(node)
+        if name != "param":
+            key = f"{key}@{self.window_s:g}s"
+        self.found[key] = (name, args, self.window_s)
+        return ast.copy_location(ast.Name(id=key, ctx=ast.Load()), node)
+
+    def _argument(self, node: ast.AST) -> Any:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, int, float)):
+            return node.value
+        name = dotted_name(node)
+        if name is None:
+            raise ExpressionError(f"Aggregate arguments must be literals or signal ids in '{self.source}'")
+        return name
+
+
+class CompiledKpi:
+    """One derived KPI compiled for plant-wide evaluation"""
+
+    __slots__ = ("kpi_id", "definition", "formula", "window_s", "evaluate", "signals", "kpis", "aggregates")
+
+    def __init__(self, definition: Dict[str, Any], signal_ids: frozenset, kpi_ids: frozenset):
+        self.kpi_id = definition["kpi_id"]
+        self.definition = definition
+        self.formula = str(definition.get("formula", ""))
+        self.window_s = float(definition.get("window_s", KPI_WINDOW_S))
+        rewriter = _Aggregates(signal_ids, self.window_s, self.formula)
+        tree = rewriter.visit(parse_expression(self.formula))
+        self.aggregates = rewriter.found
+        self.evaluate = compile_tree(tree, signal_ids | kpi_ids | set(self.aggregates), self.formula)
+
+        names = {dotted_name(node) for node in ast.walk(tree) if isinstance(node, (ast.Name, ast.Attribute))}
+        self.kpis = frozenset(names & kpi_ids) - {self.kpi_id}
+        self.signals = frozenset(names & signal_ids) - self.kpis
+        if self.kpi_id in names:
+            raise ExpressionError(f"KPI {self.kpi_id} refers to itself")
+
+    @property
+    def inputs(self) -> frozenset:
+        """Signal and aggregate names the formula reads directly"""
+        return self.signals | frozenset(self.aggregates)
+
+
+def compile_kpis(definitions: Iterable[Dict[str, Any]], signal_ids: Iterable[str]) -> Tuple[List[CompiledKpi], Dict[str, str]]:
+    """
+    KPIs in dependency order, plus {kpi_id: error} for the ones that do not
+    compile, refer to a failed KPI or are part of a cycle.
+    """
+    definitions = [d for d in definitions if d.get("kpi_id")]
+    signals = frozenset(signal_ids)
+    kpi_ids = frozenset(d["kpi_id"] for d in definitions)
+    compiled: Dict[str, CompiledKpi] = {}
+    errors: Dict[str, str] = {}
+    for definition in definitions:
+        try:
+            kpi = CompiledKpi(definition, signals, kpi_ids)
+            compiled[kpi.kpi_id] = kpi
+        except ExpressionError as e:
+            errors[definition["kpi_id"]] = str(e)
+
+    ordered: List[CompiledKpi] = []
+    done: set = set()
+    pending = dict(compiled)
+    while pending:
+        ready = [kpi for kpi in pending.values() if kpi.kpis <= done | set(errors)]
+        if not ready:
+            break
+        for kpi in ready:
+            if kpi.kpis & set(errors):
+                errors[kpi.kpi_id] = f"depends on failed KPI {sorted(kpi.kpis & set(errors))}"
+            else:
+                ordered.append(kpi)
+                done.add(kpi.kpi_id)
+            del pending[kpi.kpi_id]
+    for kpi_id in pending:
+        errors[kpi_id] = "dependency cycle or unknown KPI"
+
+    for kpi_id, error in errors.items():
+        logger.error("KPI %s disabled: %s", kpi_id, error)
+    return ordered, errors
+
+
+def _numeric(values: Sequence[Any]) -> np.ndarray:
+    """Float array of `values`; missing or non-numeric entries are NaN"""
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            out[i] = value
+    return out
+
+
+def _grow(array: np.ndarray, shape: Tuple[int, ...], fill: float = 0.0) -> np.ndarray:
+    if array.shape == shape:
+        return array
+    grown = np.full(shape, fill, dtype=array.dtype)
+    grown[tuple(slice(0, n) for n in array.shape)] = array
+    return grown
+
+
+class KpiEngine:
+    def __init__(
+        self,
+        definitions: Iterable[Dict[str, Any]],
+        signal_ids: Iterable[str],
+        snapshot_s: float = KPI_SNAPSHOT_S,
+        max_gap_s: float = KPI_MAX_GAP_S,
+    ):
+        self.kpis, self.errors = compile_kpis(definitions, signal_ids)
+        self.snapshot_s = snapshot_s
+        self.max_gap_s = max_gap_s
+
+        aggregates: Dict[str, Aggregate] = {}
+        for kpi in self.kpis:
+            aggregates.update(kpi.aggregates)
+        self.aggregates = aggregates
+        self.counters = sorted({args[0] for name, args, _ in aggregates.values() if name == "increase"})
+        self.params = {args[0]: (args[1] if len(args) > 1 else math.nan)
+                       for name, args, _ in aggregates.values() if name == "param"}
+        uses_state = any(name in ("time_in_state", "entries") for name, _, _ in aggregates.values())
+        # Signals gathered per station on each tick
+        self.signal_ids = sorted(
+            {sid for kpi in self.kpis for sid in kpi.signals}
+            | set(self.counters)
+            | ({STATE_SIGNAL} if uses_state else set())
+        )
+
+        self.index: Dict[Hashable, int] = {}
+        self.states: Dict[str, int] = {}
+        self._seen = np.zeros(0, dtype=bool)
+        self._last_state = np.zeros(0, dtype=np.intp)
+        self._last_counter = np.zeros((0, len(self.counters)))
+        # Cumulative accumulators per station row
+        self._elapsed = np.zeros(0)
+        self._state_time = np.zeros((0, 0))
+        self._entries = np.zeros((0, 0))
+        self._increase = np.zeros((0, len(self.counters)))
+        windows = [w for _, _, w in aggregates.values()] or [0.0]
+        self._snapshots: deque = deque(maxlen=int(math.ceil(max(windows) / max(snapshot_s, 1e-9))) + 2)
+
+        self._inputs: Dict[str, np.ndarray] = {}
+        self.values: Dict[str, np.ndarray] = {}
+        self.ts: Optional[float] = None
+        self.timestamp: Optional[str] = None
+        self._lock = threading.Lock()
+        self.ticks = 0
+        # Ticks that changed at least one KPI value
+        self.changed_ticks = 0
+        self.evaluated = 0
+        self.skipped = 0
+        self.last_tick_ms: Optional[float] = None
+
+    def has_station(self, key: Hashable) -> bool:
+        return key in self.index and self.ts is not None
+
+    def _row(self, key: Hashable) -> int:
+        row = self.index.get(key)
+        if row is None:
+            row = self.index[key] = len(self.index)
+        return row
+
+    def _state_code(self, value: Any) -> int:
+        if not isinstance(value, str):
+            return -1
+        code = self.states.get(value)
+        if code is None:
+            code = self.states[value] = len(self.states)
+        return code
+
+    def update(
+        self,
+        ts: float,
+        keys: Sequence[Hashable],
+        columns: Dict[str, Sequence[Any]],
+        params: Optional[Dict[str, Sequence[Any]]] = None,
+    ) -> int:
+        """
+        One tick: `columns` holds each of `signal_ids` for every station in
+        `keys` (same order), `params` each param() field. Returns the number
+        of KPIs recomputed.
+        """
+        if not self.kpis:
+            return 0
+        started = time.perf_counter()
+        with self._lock:
+            rows = np.fromiter((self._row(key) for key in keys), dtype=np.intp, count=len(keys))
+            codes = np.fromiter((self._state_code(v) for v in columns.get(STATE_SIGNAL, ())), dtype=np.intp)
+            self._resize()
+
+            dt = 0.0 if self.ts is None else ts - self.ts
+            if not 0.0 <= dt <= self.max_gap_s:
+                dt = 0.0
+            seen = self._seen[rows]
+            self._elapsed[rows[seen]] += dt
+
+            if len(codes):
+                previous = self._last_state[rows]
+                held = (previous >= 0) & (codes >= 0)
+                self._state_time[rows[held], previous[held]] += dt
+                moved = held & (codes != previous)
+                self._entries[rows[moved], codes[moved]] += 1
+                self._last_state[rows] = np.where(codes >= 0, codes, previous)
+
+            for c, signal_id in enumerate(self.counters):
+                x = _numeric(columns.get(signal_id, ()))
+                last = self._last_counter[rows, c]
+                step = np.where(x >= last, x - last, x)   # counter reset: count from zero
+                self._increase[rows, c] += np.nan_to_num(step, nan=0.0)
+                self._last_counter[rows, c] = np.where(np.isnan(x), last, x)
+            self._seen[rows] = True
+
+            if not self._snapshots or ts - self._snapshots[-1][0] >= self.snapshot_s:
+                self._snapshots.append((ts, self._elapsed.copy(), self._state_time.copy(),
+                                        self._entries.copy(), self._increase.copy()))
+
+            n = len(self.index)
+            env: Dict[str, Any] = {}
+            for signal_id in self.signal_ids:
+                env[signal_id] = np.full(n, np.nan)
+                env[signal_id][rows] = _numeric(columns.get(signal_id, ()))
+            for field in self.params:
+                env[f"param:{field}"] = np.full(n, np.nan)
+                env[f"param:{field}"][rows] = _numeric((params or {}).get(field, ()))
+            env.update(self._aggregate_values(ts, env))
+
+            changed_inputs = {
+                name for name, value in env.items()
+                if not np.array_equal(value, self._inputs.get(name), equal_nan=True)
+            }
+            self._inputs = env
+
+            changed: set = set()
+            values = dict(self.values)
+            recomputed = 0
+            for kpi in self.kpis:
+                if kpi.kpi_id in values and not (kpi.inputs & changed_inputs or kpi.kpis & changed):
+                    self.skipped += 1
+                    continue
+                scope = {**env, **{kpi_id: values[kpi_id] for kpi_id in kpi.kpis}}
+                result = self._evaluate(kpi, scope, n)
+                recomputed += 1
+                if not np.array_equal(result, values.get(kpi.kpi_id), equal_nan=True):
+                    changed.add(kpi.kpi_id)
+                values[kpi.kpi_id] = result
+            self.values = values
+            if changed:
+                self.changed_ticks += 1
+            self.evaluated += recomputed
+            self.ts = ts
+            self.timestamp = datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+        self.ticks += 1
+        self.last_tick_ms = round((time.perf_counter() - started) * 1000, 3)
+        return recomputed
+
+    def _resize(self) -> None:
+        n, states, counters = len(self.index), len(self.states), len(self.counters)
+        self._seen = _grow(self._seen, (n,), False)
+        self._last_state = _grow(self._last_state, (n,), -1)
+        self._last_counter = _grow(self._last_counter, (n, counters), np.nan)
+        self._elapsed = _grow(self._elapsed, (n,))
+        self._state_time = _grow(self._state_time, (n, states))
+        self._entries = _grow(self._entries, (n, states))
+        self._increase = _grow(self._increase, (n, counters))
+
+    def _aggregate_values(self, ts: float, env: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        """Windowed aggregate arrays: accumulators now minus the window's base snapshot"""
+        n = len(self.index)
+        bases: Dict[float, tuple] = {}
+        out: Dict[str, np.ndarray] = {}
+        for key, (name, args, window_s) in self.aggregates.items():
+            if name == "param":
+                field, default = args[0], (args[1] if len(args) > 1 else math.nan)
+                out[key] = np.where(np.isnan(env[f"param:{field}"]), default, env[f"param:{field}"])
+                continue
+            base = bases.get(window_s)
+            if base is None:
+                base = bases[window_s] = self._base(ts - window_s)
+            _, elapsed, state_time, entries, increase = base
+            if name == "elapsed":
+                value = self._elapsed - _grow(elapsed, (n,))
+                value[~self._seen] = np.nan
+            elif name == "increase":
+                c = self.counters.index(args[0])
+                value = self._increase[:, c] - _grow(increase, self._increase.shape)[:, c]
+                value[np.isnan(self._last_counter[:, c])] = np.nan
+            else:
+                current, start = (self._state_time, state_time) if name == "time_in_state" else (self._entries, entries)
+                cols = [self.states[state] for state in args if state in self.states]
+                value = (current[:, cols] - _grow(start, current.shape)[:, cols]).sum(axis=1)
+                value[self._last_state < 0] = np.nan
+            out[key] = value
+        return out
+
+    def _base(self, since: float) -> tuple:
+        """Oldest snapshot inside the window (the first one while history is shorter)"""
+        for snapshot in self._snapshots:
+            if snapshot[0] >= since:
+                return snapshot
+        return self._snapshots[-1]
+
+    def _evaluate(self, kpi: CompiledKpi, env: Dict[str, Any], n: int) -> np.ndarray:
+        try:
+            with np.errstate(all="ignore"):
+                result = np.asarray(kpi.evaluate(env), dtype=float)
+            result = np.array(np.broadcast_to(result, (n,)))
+        except Exception as e:
+            logger.warning("KPI %s evaluation failed: %s", kpi.kpi_id, e)
+            return np.full(n, np.nan)
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+    def station_kpis(self, key: Hashable) -> List[Dict[str, Any]]:
+        """KPIs of one station from the latest tick"""
+        row = self.index.get(key)
+        values = self.values
+        out = []
+        if row is None:
+            return out
+        for kpi in self.kpis:
+            array = values.get(kpi.kpi_id)
+            if array is not None and row < len(array) and not np.isnan(array[row]):
+                out.append(self._result(kpi, float(array[row]), self.timestamp))
+        return out
+
+    def evaluate_signals(self, signal_values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        KPIs of a single set of signal values without history (window
+        aggregates are unknown, so only formulas without them can resolve).
+        """
+        env: Dict[str, Any] = {sid: _numeric([signal_values.get(sid)])[0] for sid in self.signal_ids}
+        for key, (name, args, _) in self.aggregates.items():
+            env[key] = float(args[1]) if name == "param" and len(args) > 1 else math.nan
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        out = []
+        for kpi in self.kpis:
+            value = float(self._evaluate(kpi, env, 1)[0])
+            env[kpi.kpi_id] = value
+            if not math.isnan(value):
+                out.append(self._result(kpi, value, timestamp))
+        return out
+
+    @staticmethod
+    def _result(kpi: CompiledKpi, value: float, timestamp: Optional[str]) -> Dict[str, Any]:
+        definition = kpi.definition
+        return {
+            "kpi_id": kpi.kpi_id,
+            "value": value,
+            "unit": definition.get("unit", ""),
+            "target": definition.get("target"),
+            "timestamp": timestamp,
+            "description": definition.get("description", ""),
+            "formula": kpi.formula,
+            "window_s": kpi.window_s,
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "kpis": [kpi.kpi_id for kpi in self.kpis],
+            "errors": self.errors,
+            "stations": len(self.index),
+            "states": sorted(self.states, key=self.states.get),
+            "snapshots": len(self._snapshots),
+            "ticks": self.ticks,
+            "evaluated": self.evaluated,
+            "skipped": self.skipped,
+            "last_tick_ms": self.last_tick_ms,
+        }
@@ -6,6 +6,10 @@ from .state import PlantState
 from .api import build_api
 from .ua_server import UAServer
 from .historian import Historian
+from .semantic_engine import get_semantic_engine
+from .stream import StreamHub
+from .signal_buffers import history_loop
+from .db import close_pool
 from .log import get_logger
 
 logger = get_logger("opc-studio")
@@ -19,9 +23,14 @@ async def run():
 
     historian = Historian()
     asyncio.create_task(historian.loop(lambda: state.snapshot()))
+    asyncio.create_task(historian.writer_loop())
+    asyncio.create_task(historian.maintenance_loop())
 
     http_port = int(os.getenv("OPC_STUDIO_HTTP_PORT", "8040"))
-    api = build_api(state, historian)
+    asyncio.create_task(history_loop(state, get_semantic_engine()))
+    stream = StreamHub(state, get_semantic_engine())
+    asyncio.create_task(stream.run())
+    api = build_api(state, historian, ua, stream)
 
     config = uvicorn.Config(api, host="0.0.0.0", port=http_port, log_level=os.getenv("LOG_LEVEL","info"))
     server = uvicorn.Server(config)
@@ -30,6 +39,8 @@ async def run():
         await server.serve()
     finally:
         await ua.stop()
+        historian.buffer.persist()
+        close_pool()
 
 if __name__ == "__main__":
     asyncio.run(run())
@@ -0,0 +1,124 @@
+"""
+Material context for /semantic/snapshot, read from v_material_evidence.
+
+All requested stations are looked up in one query (station = ANY(...)) on a
+pooled connection, and each station's context is cached for
+MATERIAL_CONTEXT_TTL_S seconds, so a full-plant semantic snapshot costs at
+most one database round-trip. Stations without evidence are cached too
+(evidence_present=False); lookup errors are not cached.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .db import pooled_conn
+from .log import get_logger
+
+logger = get_logger("opc-studio.material")
+
+CACHE_TTL_S = float(os.getenv("MATERIAL_CONTEXT_TTL_S", "5"))
+
+# v_material_evidence columns, in response order
+FIELDS = (
+    "mode", "active_serial", "active_lot",
+    "work_order", "operation",
+    "bom_revision", "as_built_revision",
+    "quality_status",
+    "dry_run_authorization",
+    "deviation_id",
+    "tooling_calibration_ok",
+    "operator_certified",
+    "material_ts",
+)
+
+# Latest active row per station (the view can hold several per station)
+MATERIAL_CONTEXT_SQL = f"""
+SELECT DISTINCT ON (station) station, {", ".join(FIELDS)}
+FROM v_material_evidence
+WHERE station = ANY(%s)
+ORDER BY station, material_ts DESC NULLS LAST
+"""
+
+
+def empty_context(error: Optional[str] = None) -> Dict[str, Any]:
+    """Context of a station without material evidence"""
+    context: Dict[str, Any] = {field: None for field in FIELDS}
+    context["evidence_present"] = False
+    if error:
+        context["error"] = error
+    return context
+
+
+def _row_context(row: Tuple) -> Dict[str, Any]:
+    context = dict(zip(FIELDS, row[1:]))
+    ts = context["material_ts"]
+    context["material_ts"] = ts.isoformat() if ts else None
+    context["evidence_present"] = True
+    return context
+
+
+class MaterialContextCache:
+    def __init__(self, ttl_s: float = CACHE_TTL_S):
+        self.ttl_s = ttl_s
+        # station -> (fetched_at, context)
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "hits": 0, "misses": 0, "errors": 0}
+
+    def get_many(self, stations: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Context per station (fresh copies); stations missing from the cache are fetched in one query."""
+        now = time.monotonic()
+        result: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        with self._lock:
+            for station in dict.fromkeys(stations):
+                entry = self._entries.get(station)
+                if entry and now - entry[0] < self.ttl_s:
+                    result[station] = dict(entry[1])
+                else:
+                    missing.append(station)
+            self.stats["hits"] += len(result)
+            self.stats["misses"] += len(missing)
+        if not missing:
+            return result
+
+        try:
+            fetched = self._fetch(missing)
+        except Exception as e:
+            logger.warning("Material context lookup failed for %d stations: %s", len(missing), e)
+            self.stats["errors"] += 1
+            result.update({station: empty_context(str(e)) for station in missing})
+            return result
+
+        with self._lock:
+            for station in missing:
+                context = fetched.get(station) or empty_context()
+                self._entries[station] = (now, context)
+                result[station] = dict(context)
+        return result
+
+    def get(self, station: str) -> Dict[str, Any]:
+        return self.get_many([station])[station]
+
+    def _fetch(self, stations: list) -> Dict[str, Dict[str, Any]]:
+        with pooled_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(MATERIAL_CONTEXT_SQL, (stations,), prepare=True)
+                rows = cur.fetchall()
+        self.stats["queries"] += 1
+        return {row[0]: _row_context(row) for row in rows}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache: Optional[MaterialContextCache] = None
+
+
+def get_material_cache() -> MaterialContextCache:
+    global _cache
+    if _cache is None:
+        _cache = MaterialContextCache()
+    return _cache
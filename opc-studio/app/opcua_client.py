@@ -1,32 +1,88 @@
 """
 OPC UA Client for OPC Explorer
 Provides connect, browse, read, and subscribe functionality
+
+Lists of nodes are handled in batches of OPCUA_BATCH_SIZE per service call
+(one Read, one CreateMonitoredItems / DeleteMonitoredItems per batch). Each
+watched node keeps its last OPCUA_WATCH_HISTORY changes; data changes are
+logged at DEBUG with an INFO summary at most every OPCUA_LOG_INTERVAL_S.
 """
 import asyncio
-from typing import Dict, List, Optional, Any
+import os
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Any
 from asyncua import Client, ua
 import logging
 
 logger = logging.getLogger(__name__)
 
+BATCH_SIZE = int(os.getenv("OPCUA_BATCH_SIZE", "200"))
+WATCH_HISTORY = int(os.getenv("OPCUA_WATCH_HISTORY", "256"))
+LOG_INTERVAL_S = float(os.getenv("OPCUA_LOG_INTERVAL_S", "10"))
+
+
+def _batches(items: List[Any], size: int = BATCH_SIZE) -> Iterable[List[Any]]:
+    for start in range(0, len(items), max(size, 1)):
+        yield items[start:start + size]
+
+
+def _timestamp(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
 
 class WatchlistHandler:
     """Subscription handler for watchlist monitoring"""
     
-    def __init__(self):
+    def __init__(self, history_size: int = WATCH_HISTORY, log_interval_s: float = LOG_INTERVAL_S):
         self.data_changes: Dict[str, Any] = {}
         self.last_values: Dict[str, Any] = {}
+        # node_id -> recent changes, oldest first
+        self.history: Dict[str, deque] = {}
+        self.history_size = history_size
+        self.log_interval_s = log_interval_s
+        self.changes = 0
+        self._logged_changes = 0
+        self._last_log = time.monotonic()
     
     def datachange_notification(self, node, val, data):
         """Called when a monitored node value changes"""
         node_id = str(node)
-        self.data_changes[node_id] = {
+        value = data.monitored_item.Value
+        change = {
             "value": val,
-            "timestamp": data.monitored_item.Value.ServerTimestamp.isoformat() if data.monitored_item.Value.ServerTimestamp else None,
-            "status": str(data.monitored_item.Value.StatusCode)
+            "timestamp": _timestamp(value.ServerTimestamp),
+            "source_timestamp": _timestamp(value.SourceTimestamp),
+            "status": str(value.StatusCode)
         }
+        self.data_changes[node_id] = change
         self.last_values[node_id] = val
-        logger.info(f"Data change: {node_id} = {val}")
+        history = self.history.get(node_id)
+        if history is None:
+            history = self.history[node_id] = deque(maxlen=self.history_size)
+        history.append(change)
+        self.changes += 1
+        logger.debug(f"Data change: {node_id} = {val}")
+        
+        now = time.monotonic()
+        if now - self._last_log >= self.log_interval_s:
+            logger.info(
+                f"Watchlist: {self.changes - self._logged_changes} data changes on "
+                f"{len(self.history)} nodes in the last {now - self._last_log:.0f}s"
+            )
+            self._logged_changes = self.changes
+            self._last_log = now
+    
+    def forget(self, node_id: str):
+        """Drop the values and history of an unsubscribed node"""
+        self.data_changes.pop(node_id, None)
+        self.last_values.pop(node_id, None)
+        self.history.pop(node_id, None)
+    
+    def get_history(self, node_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Recent changes of a node, oldest first (at most `limit`)"""
+        changes = list(self.history.get(node_id, ()))
+        return changes[-limit:] if limit else changes
 
 
 class OPCUAClient:
@@ -39,6 +95,8 @@ class OPCUAClient:
         self.subscription = None
         self.handler = WatchlistHandler()
         self.monitored_nodes: Dict[str, Any] = {}  # node_id -> handle
+        self.display_names: Dict[str, str] = {}   # node_id -> display name (read at subscribe)
+        self.batch_size = BATCH_SIZE
         
     async def connect(self, endpoint_url: str, timeout: int = 5) -> Dict[str, Any]:
         """Connect to OPC UA server"""
@@ -79,7 +137,10 @@ class OPCUAClient:
                 if self.subscription:
                     await self.subscription.delete()
                     self.subscription = None
+                    for node_id in self.monitored_nodes:
+                        self.handler.forget(node_id)
                     self.monitored_nodes.clear()
+                    self.display_names.clear()
                 
                 await self.client.disconnect()
                 logger.info(f"Disconnected from {self.endpoint_url}")
@@ -186,6 +247,42 @@ class OPCUAClient:
             logger.error(f"Read error for {node_id}: {e}")
             raise Exception(f"Failed to read node {node_id}: {str(e)}")
     
+    async def read_values(self, node_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Read the values of many nodes, one Read request per batch. Invalid or
+        unreadable nodes get an `error` entry instead of failing the call.
+        """
+        if not self.connected or not self.client:
+            raise Exception("Not connected to OPC UA server")
+        
+        results: List[Dict[str, Any]] = []
+        nodes = []
+        for node_id in node_ids:
+            entry = {"node_id": node_id, "value": None, "data_type": None, "timestamp": None, "status": None}
+            try:
+                nodes.append((entry, self.client.get_node(node_id)))
+            except Exception as e:
+                entry["error"] = f"Invalid node id: {e}"
+            results.append(entry)
+        
+        try:
+            for batch in _batches(nodes, self.batch_size):
+                data_values = await self.client.read_attributes([node for _, node in batch], ua.AttributeIds.Value)
+                for (entry, _), data_value in zip(batch, data_values):
+                    entry["status"] = str(data_value.StatusCode)
+                    if not data_value.StatusCode.is_good():
+                        entry["error"] = data_value.StatusCode.name
+                        continue
+                    if data_value.Value is not None:
+                        entry["value"] = data_value.Value.Value
+                        entry["data_type"] = str(data_value.Value.VariantType)
+                    entry["timestamp"] = _timestamp(data_value.ServerTimestamp)
+        except Exception as e:
+            logger.error(f"Bulk read error ({len(nodes)} nodes): {e}")
+            raise Exception(f"Failed to read {len(nodes)} nodes: {str(e)}")
+        
+        return results
+    
     async def write_node(self, node_id: str, value: Any, data_type: Optional[str] = None) -> Dict[str, Any]:
         """Write value to a node"""
         if not self.connected or not self.client:
@@ -218,69 +315,148 @@ class OPCUAClient:
     
     async def subscribe_node(self, node_id: str, publishing_interval: int = 500) -> Dict[str, Any]:
         """Add a node to the watchlist (subscription)"""
+        result = await self.subscribe_nodes([node_id], publishing_interval)
+        if result["failed"]:
+            raise Exception(f"Failed to subscribe to node {node_id}: {result['failed'][0]['error']}")
+        
+        if not result["subscribed"]:
+            return {
+                "success": True,
+                "node_id": node_id,
+                "message": "Already monitoring this node"
+            }
+        
+        return {
+            "success": True,
+            "node_id": node_id,
+            "monitoring": True,
+            "publishing_interval_ms": publishing_interval
+        }
+    
+    async def subscribe_nodes(self, node_ids: List[str], publishing_interval: int = 500) -> Dict[str, Any]:
+        """
+        Add many nodes to the watchlist with one CreateMonitoredItems request
+        per batch (instead of one per node).
+        """
         if not self.connected or not self.client:
             raise Exception("Not connected to OPC UA server")
         
+        subscribed, already, failed = [], [], []
         try:
             # Create subscription if it doesn't exist
             if not self.subscription:
                 self.subscription = await self.client.create_subscription(publishing_interval, self.handler)
                 logger.info(f"Created subscription with {publishing_interval}ms interval")
             
-            # Check if already monitoring
-            if node_id in self.monitored_nodes:
-                return {
-                    "success": True,
-                    "node_id": node_id,
-                    "message": "Already monitoring this node"
-                }
+            nodes = {}
+            for node_id in node_ids:
+                try:
+                    node = self.client.get_node(node_id)
+                except Exception as e:
+                    failed.append({"node_id": node_id, "error": f"Invalid node id: {e}"})
+                    continue
+                # Notifications report canonical node ids
+                key = node.nodeid.to_string()
+                if key in self.monitored_nodes:
+                    already.append(key)
+                else:
+                    nodes[key] = node
             
-            # Subscribe to node
-            node = self.client.get_node(node_id)
-            handle = await self.subscription.subscribe_data_change(node)
-            self.monitored_nodes[node_id] = handle
+            requests = 0
+            for batch in _batches(list(nodes.items()), self.batch_size):
+                handles = await self.subscription.subscribe_data_change([node for _, node in batch])
+                names = await self.client.read_attributes([node for _, node in batch], ua.AttributeIds.DisplayName)
+                requests += 1
+                for (key, _), handle, name in zip(batch, handles, names):
+                    if isinstance(handle, ua.StatusCode):
+                        failed.append({"node_id": key, "error": handle.name})
+                        continue
+                    self.monitored_nodes[key] = handle
+                    self.display_names[key] = name.Value.Value.Text if name.Value and name.Value.Value else key
+                    subscribed.append(key)
             
-            logger.info(f"Subscribed to {node_id}")
+            logger.info(f"Subscribed to {len(subscribed)} nodes in {requests} requests ({len(failed)} failed)")
             
             return {
-                "success": True,
-                "node_id": node_id,
-                "monitoring": True,
+                "success": not failed,
+                "subscribed": subscribed,
+                "already_monitoring": already,
+                "failed": failed,
+                "requests": requests,
+                "monitoring_count": len(self.monitored_nodes),
                 "publishing_interval_ms": publishing_interval
             }
             
         except Exception as e:
-            logger.error(f"Subscribe error for {node_id}: {e}")
-            raise Exception(f"Failed to subscribe to node {node_id}: {str(e)}")
+            logger.error(f"Subscribe error ({len(node_ids)} nodes): {e}")
+            raise Exception(f"Failed to subscribe to {len(node_ids)} nodes: {str(e)}")
     
     async def unsubscribe_node(self, node_id: str) -> Dict[str, Any]:
         """Remove a node from the watchlist"""
+        result = await self.unsubscribe_nodes([node_id])
+        if not result["unsubscribed"]:
+            return {
+                "success": False,
+                "node_id": node_id,
+                "message": "Node not in watchlist"
+            }
+        
+        return {
+            "success": True,
+            "node_id": node_id,
+            "monitoring": False
+        }
+    
+    async def unsubscribe_nodes(self, node_ids: List[str]) -> Dict[str, Any]:
+        """Remove many nodes from the watchlist, one DeleteMonitoredItems request per batch"""
         if not self.connected or not self.client:
             raise Exception("Not connected to OPC UA server")
         
+        keys = []
+        for node_id in node_ids:
+            try:
+                key = self.client.get_node(node_id).nodeid.to_string()
+            except Exception:
+                key = node_id
+            if key in self.monitored_nodes and key not in keys:
+                keys.append(key)
+        
         try:
-            if node_id not in self.monitored_nodes:
-                return {
-                    "success": False,
-                    "node_id": node_id,
-                    "message": "Node not in watchlist"
-                }
+            for batch in _batches(keys, self.batch_size):
+                await self.subscription.unsubscribe([self.monitored_nodes[key] for key in batch])
+                for key in batch:
+                    del self.monitored_nodes[key]
+                    self.display_names.pop(key, None)
+                    self.handler.forget(key)
             
-            handle = self.monitored_nodes[node_id]
-            await self.subscription.unsubscribe(handle)
-            del self.monitored_nodes[node_id]
-            
-            logger.info(f"Unsubscribed from {node_id}")
+            logger.info(f"Unsubscribed from {len(keys)} nodes")
             
             return {
                 "success": True,
-                "node_id": node_id,
-                "monitoring": False
+                "unsubscribed": keys,
+                "monitoring_count": len(self.monitored_nodes)
             }
             
         except Exception as e:
-            logger.error(f"Unsubscribe error for {node_id}: {e}")
-            raise Exception(f"Failed to unsubscribe from node {node_id}: {str(e)}")
+            logger.error(f"Unsubscribe error ({len(keys)} nodes): {e}")
+            raise Exception(f"Failed to unsubscribe from {len(keys)} nodes: {str(e)}")
+    
+    def get_watchlist_history(self, node_id: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Recent value changes of one watched node, or of all of them"""
+        if node_id is not None:
+            if self.client:
+                try:
+                    node_id = self.client.get_node(node_id).nodeid.to_string()
+                except Exception:
+                    pass
+            node_ids = [node_id] if node_id in self.monitored_nodes else []
+        else:
+            node_ids = list(self.monitored_nodes)
+        
+        return {
+            "history_size": self.handler.history_size,
+            "nodes": {nid: self.handler.get_history(nid, limit) for nid in node_ids}
+        }
     
     async def get_watchlist(self) -> Dict[str, Any]:
         """Get current watchlist with latest values"""
@@ -289,24 +465,16 @@ class OPCUAClient:
         
         watchlist = []
         for node_id in self.monitored_nodes.keys():
-            try:
-                # Get node info
-                node = self.client.get_node(node_id)
-                display_name = await node.read_display_name()
-                
-                # Get latest value from handler
-                latest = self.handler.last_values.get(node_id)
-                change_info = self.handler.data_changes.get(node_id, {})
-                
-                watchlist.append({
-                    "node_id": node_id,
-                    "display_name": display_name.Text,
-                    "value": latest,
-                    "timestamp": change_info.get("timestamp"),
-                    "status": change_info.get("status")
-                })
-            except Exception as e:
-                logger.warning(f"Error getting watchlist info for {node_id}: {e}")
+            # Latest value from handler; display name cached at subscribe
+            change_info = self.handler.data_changes.get(node_id, {})
+            watchlist.append({
+                "node_id": node_id,
+                "display_name": self.display_names.get(node_id, node_id),
+                "value": self.handler.last_values.get(node_id),
+                "timestamp": change_info.get("timestamp"),
+                "status": change_info.get("status"),
+                "history_count": len(self.handler.history.get(node_id, ()))
+            })
         
         return {
             "connected": True,
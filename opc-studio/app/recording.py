@@ -0,0 +1,100 @@
+"""
+Historian recording policy: deadband / change-only recording.
+
+Most stations hold the same state for minutes at a time, so writing every
+signal every interval mostly stores repeats. The policy decides, per signal,
+whether a new value differs enough from the last written one to be worth a
+row; unchanged rows are skipped until the max_silence_s heartbeat is due.
+Configured in config/historian_recording.yaml.
+"""
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import yaml
+
+from .log import get_logger
+
+logger = get_logger("opc-studio.recording")
+
+CONFIG_PATH = os.getenv(
+    "HISTORIAN_RECORDING_CONFIG",
+    str(Path(__file__).resolve().parent.parent / "config" / "historian_recording.yaml")
+)
+
+# Signals of each historian row kind, in snapshot_rows() column order
+SIGNALS = {
+    "line": ("oee", "availability", "performance", "quality", "status"),
+    "station": ("state", "cycle_time_s", "good_count", "scrap_count", "alarms"),
+}
+
+DEFAULT_MAX_SILENCE_S = 60.0
+# v_runtime_kpi only treats OPC lines with a row this recent as live
+# (sql/create_unified_views.sql); the heartbeat must be shorter
+LIVE_WINDOW_S = 120.0
+
+
+class RecordingPolicy:
+    """Per-signal recording rules; stateless (the last-written cache lives in Historian)."""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.mode = os.getenv("HISTORIAN_RECORDING_MODE", config.get("mode", "deadband")).lower()
+        if self.mode not in ("deadband", "all"):
+            logger.warning("Unknown historian recording mode '%s'; using 'all'", self.mode)
+            self.mode = "all"
+        self.max_silence_s = float(config.get("max_silence_s", DEFAULT_MAX_SILENCE_S))
+        if self.mode == "deadband" and self.max_silence_s >= LIVE_WINDOW_S:
+            logger.warning(
+                "max_silence_s=%.0f is not below the %.0f s live window of v_runtime_kpi; "
+                "steady lines will fall back to simulation data", self.max_silence_s, LIVE_WINDOW_S
+            )
+        self.signals: Dict[str, Dict[str, Dict[str, float]]] = {
+            kind: {name: dict((config.get(kind) or {}).get(name) or {}) for name in names}
+            for kind, names in SIGNALS.items()
+        }
+
+    @classmethod
+    def load(cls, path: str = CONFIG_PATH) -> "RecordingPolicy":
+        config_file = Path(path)
+        if not config_file.exists():
+            logger.warning("Recording policy not found at %s; recording on change", path)
+            return cls()
+        with open(config_file, "r") as f:
+            return cls(yaml.safe_load(f) or {})
+
+    def signal_changed(self, kind: str, name: str, last: Any, value: Any) -> bool:
+        rule = self.signals[kind].get(name) or {}
+        if value == last:
+            return False
+        if last is None or value is None:
+            return True
+        if "deadband_abs" in rule or "deadband_pct" in rule:
+            delta = abs(float(value) - float(last))
+            if "deadband_abs" in rule and delta >= float(rule["deadband_abs"]):
+                return True
+            if "deadband_pct" in rule and delta >= abs(float(last)) * float(rule["deadband_pct"]) / 100:
+                return True
+            return False
+        return True
+
+    def should_record(
+        self,
+        kind: str,
+        values: Sequence[Any],
+        last_values: Optional[Sequence[Any]],
+        silent_s: float
+    ) -> bool:
+        """
+        Whether a row with `values` (SIGNALS[kind] order) should be written,
+        given the last written values and the seconds since they were written.
+        """
+        if self.mode == "all" or last_values is None or silent_s >= self.max_silence_s:
+            return True
+        return any(
+            self.signal_changed(kind, name, last, value)
+            for name, last, value in zip(SIGNALS[kind], last_values, values)
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "max_silence_s": self.max_silence_s, "signals": self.signals}
@@ -10,13 +10,110 @@ Principles:
 """
 import yaml
 import logging
-from typing import Dict, List, Optional, Any
+import math
+import numpy as np
+from typing import Callable, Dict, List, Optional, Any, Tuple
 from pathlib import Path
 from datetime import datetime
 
+from .expressions import ExpressionError, compile_expression
+from .kpi_engine import KpiEngine
+from .signal_buffers import STATEFUL_TRANSFORMS, SignalBuffers
+
 logger = logging.getLogger(__name__)
 
 
+def _chain(steps: List[Optional[Callable[[Any], Any]]]) -> Optional[Callable[[Any], Any]]:
+    """Compose transform steps (None entries skipped) into one function"""
+    steps = [step for step in steps if step]
+    if not steps:
+        return None
+    if len(steps) == 1:
+        return steps[0]
+    
+    def pipeline(value):
+        for step in steps:
+            value = step(value)
+        return value
+    return pipeline
+
+
+def station_raw_data(station: Dict[str, Any]) -> Dict[str, Any]:
+    """Raw OPC tag values of one PlantState station"""
+    return {
+        'Status': station.get('state', 'IDLE'),
+        'Temperature': station.get('temperature', 0),
+        'Speed': station.get('speed', 0),
+        'ProductCount': station.get('good_count', 0),
+        'CycleTime': station.get('cycle_time_s', 0)
+    }
+
+
+class SignalPlan:
+    """
+    One semantic signal definition compiled for repeated execution.
+    
+    A pipeline with a stateful transform (moving_average, ewma, ...) is split
+    around it: `prefix` feeds the ring buffer, `suffix` is applied to the
+    buffer's output. Without history the stateful step passes values through.
+    """
+    
+    __slots__ = ('semantic_id', 'opc_source', 'template', 'transform', 'loss_category', 'stateful', 'prefix', 'suffix')
+    
+    def __init__(
+        self,
+        signal_def: Dict[str, Any],
+        pipeline: Tuple[Optional[Callable], Optional[Dict[str, Any]], Optional[Callable]],
+        loss_category: Callable[[Any], Optional[str]]
+    ):
+        self.semantic_id = signal_def['semantic_id']
+        self.opc_source = signal_def['opc_source']
+        self.prefix, self.stateful, self.suffix = pipeline
+        self.transform = _chain([self.prefix, self.suffix])
+        self.loss_category = loss_category
+        # Static part of the signal, in output key order
+        self.template = {
+            'semantic_id': signal_def['semantic_id'],
+            'value': None,
+            'unit': signal_def.get('unit'),
+            'timestamp': None,
+            'source_node': self.opc_source,
+            'loss_category': None,
+            'quality': 'good',
+            'description': signal_def.get('description', ''),
+            'data_type': signal_def.get('data_type', 'unknown')
+        }
+    
+    def history_input(self, raw_value: Any) -> float:
+        """Value entering the stateful transform (NaN if missing or not numeric)"""
+        try:
+            return float(self.prefix(raw_value) if self.prefix else raw_value)
+        except (TypeError, ValueError):
+            return math.nan
+    
+    def value(self, raw_value: Any, history: Optional[float] = None) -> Any:
+        """Signal value from the raw value, or from the stateful transform's output"""
+        if history is not None:
+            return self.suffix(history) if self.suffix else history
+        return self.transform(raw_value) if self.transform else raw_value
+    
+    def build(
+        self,
+        raw_value: Any,
+        timestamp: str,
+        metadata: Optional[Dict[str, Any]],
+        history: Optional[float] = None
+    ) -> Dict[str, Any]:
+        value = self.value(raw_value, history)
+        signal = dict(self.template)
+        signal['value'] = value
+        signal['timestamp'] = timestamp
+        signal['loss_category'] = self.loss_category(value)
+        if metadata:
+            signal['metadata'] = metadata
+        return signal
+
+
 class SemanticEngine:
     """Transforms raw OPC UA signals into semantic MES signals"""
     
@@ -26,6 +123,19 @@ class SemanticEngine:
         self.station_types: Dict[str, Any] = {}
         self.loss_categories: Dict[str, List[str]] = {}
         self.derived_kpis: List[Dict[str, Any]] = []
+        # station type -> compiled signal plans (built by load_config)
+        self.plans: Dict[str, List[SignalPlan]] = {}
+        self._warned_types: set = set()
+        # History for stateful transforms, fed by observe()
+        self.buffers = SignalBuffers()
+        self._history_rows: List[Tuple[str, str, SignalPlan]] = []
+        self._history_stations: set = set()
+        self.history_ticks = 0
+        # Bumped by observe() only when a buffered output or KPI value changed
+        self.values_version = 0
+        self._listeners: List[Callable[[], None]] = []
+        # Derived KPIs, evaluated plant-wide by observe()
+        self.kpi_engine = KpiEngine([], [])
         self.load_config()
     
     def load_config(self):
@@ -43,6 +153,19 @@ class SemanticEngine:
             self.station_types = self.config.get('station_types', {})
             self.loss_categories = self.config.get('loss_categories', {})
             self.derived_kpis = self.config.get('derived_kpis', [])
+            self.plans = {
+                station_type: [self._compile_signal(d) for d in model.get('semantic_signals', [])]
+                for station_type, model in self.station_types.items()
+                if model
+            }
+            self._warned_types = set()
+            self.buffers = SignalBuffers()
+            self._history_rows = []
+            self._history_stations = set()
+            self.kpi_engine = KpiEngine(
+                self.derived_kpis,
+                {plan.semantic_id for plans in self.plans.values() for plan in plans}
+            )
             
             logger.info(f"Loaded semantic mappings v{self.config.get('version', 'unknown')}")
             logger.info(f"Station types: {len(self.station_types)}, KPIs: {len(self.derived_kpis)}")
@@ -71,7 +194,8 @@ class SemanticEngine:
         self,
         raw_data: Dict[str, Any],
         station_type: str,
-        station_metadata: Optional[Dict[str, Any]] = None
+        station_metadata: Optional[Dict[str, Any]] = None,
+        station_key: Optional[Tuple[str, str]] = None
     ) -> List[Dict[str, Any]]:
         """
         Transform raw OPC UA data into semantic signals
@@ -80,133 +204,217 @@ class SemanticEngine:
             raw_data: Dict of OPC tag names to values {tag_name: value}
             station_type: Station type (assembly, welding, testing, robot)
             station_metadata: Optional metadata (station_id, line_id, etc.)
+            station_key: (line_id, station_id) whose history feeds stateful transforms
         
         Returns:
             List of semantic signals with loss_category classification
         """
-        semantic_signals = []
-        
-        # Get semantic model for station type
-        station_model = self.station_types.get(station_type)
-        if not station_model:
-            logger.warning(f"No semantic model for station type: {station_type}")
+        # Compiled plan for station type
+        plans = self.plans.get(station_type)
+        if plans is None:
+            if station_type not in self._warned_types:
+                self._warned_types.add(station_type)
+                logger.warning(f"No semantic model for station type: {station_type}")
             return self._create_generic_signals(raw_data, station_metadata)
         
-        # Process each semantic signal definition
-        for signal_def in station_model.get('semantic_signals', []):
-            semantic_signal = self._process_signal(signal_def, raw_data, station_metadata)
-            if semantic_signal:
-                semantic_signals.append(semantic_signal)
+        timestamp = datetime.utcnow().isoformat() + 'Z'
+        semantic_signals = []
+        for plan in plans:
+            raw_value = raw_data.get(plan.opc_source)
+            if raw_value is not None:
+                semantic_signals.append(
+                    plan.build(raw_value, timestamp, station_metadata, self._history(plan, station_key))
+                )
         
         return semantic_signals
     
-    def _process_signal(
+    def _history(self, plan: SignalPlan, station_key: Optional[Tuple[str, str]]) -> Optional[float]:
+        """Stateful transform output of a station's signal (None without history)"""
+        if plan.stateful and station_key:
+            return self.buffers.value((*station_key, plan.semantic_id))
+        return None
+    
+    def station_signals(
         self,
-        signal_def: Dict[str, Any],
-        raw_data: Dict[str, Any],
-        metadata: Optional[Dict[str, Any]]
-    ) -> Optional[Dict[str, Any]]:
-        """Process a single semantic signal definition"""
-        
-        semantic_id = signal_def['semantic_id']
-        opc_source = signal_def['opc_source']
-        
-        # Get raw value from OPC data
-        raw_value = raw_data.get(opc_source)
-        if raw_value is None:
-            return None
-        
-        # Apply transforms
-        value = self._apply_transforms(raw_value, signal_def.get('transforms', []))
-        
-        # Determine loss category
-        loss_category = self._determine_loss_category(value, signal_def)
-        
-        # Build semantic signal
-        semantic_signal = {
-            'semantic_id': semantic_id,
-            'value': value,
-            'unit': signal_def.get('unit'),
-            'timestamp': datetime.utcnow().isoformat() + 'Z',
-            'source_node': opc_source,
-            'loss_category': loss_category,
-            'quality': 'good',
-            'description': signal_def.get('description', ''),
-            'data_type': signal_def.get('data_type', 'unknown')
+        plant: str,
+        line_id: str,
+        station_id: str,
+        station: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Semantic signals of one PlantState station"""
+        metadata = {
+            'station_id': station_id,
+            'station_name': station.get('name', station_id),
+            'line_id': line_id,
+            'plant': plant
         }
-        
-        # Add metadata if provided
-        if metadata:
-            semantic_signal['metadata'] = metadata
-        
-        return semantic_signal
+        return self.apply_semantic_mapping(
+            raw_data=station_raw_data(station),
+            station_type=station.get('type', 'generic'),
+            station_metadata=metadata,
+            station_key=(line_id, station_id)
+        )
+    
+    def observe(self, lines: Dict[str, Any], ts: float) -> int:
+        """
+        Sample every stateful signal of the plant into the ring buffers (one
+        vectorized push), then update the derived KPIs of all stations.
+        Listeners run when a buffered output or KPI value changed.
+        Returns the number of buffered signals.
+        """
+        before = (self.buffers.changed_ticks, self.kpi_engine.changed_ticks)
+        buffered = self._observe_history(lines, ts)
+        self._observe_kpis(lines, ts)
+        self.history_ticks += 1
+        if (self.buffers.changed_ticks, self.kpi_engine.changed_ticks) != before:
+            self.values_version += 1
+            for callback in self._listeners:
+                callback()
+        return buffered
+    
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """Register a callback run after observe() changed values (must be thread-safe and quick)."""
+        self._listeners.append(callback)
+    
+    def _observe_history(self, lines: Dict[str, Any], ts: float) -> int:
+        for line_id, line in lines.items():
+            for station_id, station in line.get('stations', {}).items():
+                if (line_id, station_id) in self._history_stations:
+                    continue
+                self._history_stations.add((line_id, station_id))
+                for plan in self.plans.get(station.get('type', 'generic'), []):
+                    if plan.stateful:
+                        self.buffers.register((line_id, station_id, plan.semantic_id), plan.stateful)
+                        self._history_rows.append((line_id, station_id, plan))
+        if not self._history_rows:
+            return 0
+        
+        column = np.empty(len(self._history_rows))
+        raw_by_station: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for i, (line_id, station_id, plan) in enumerate(self._history_rows):
+            raw = raw_by_station.get((line_id, station_id))
+            if raw is None:
+                station = lines.get(line_id, {}).get('stations', {}).get(station_id)
+                raw = raw_by_station[(line_id, station_id)] = station_raw_data(station) if station else {}
+            raw_value = raw.get(plan.opc_source)
+            column[i] = math.nan if raw_value is None else plan.history_input(raw_value)
+        self.buffers.push(ts, column)
+        return len(column)
+    
+    def _observe_kpis(self, lines: Dict[str, Any], ts: float) -> None:
+        """Gather the KPI inputs of every station as columns for one KPI tick"""
+        kpis = self.kpi_engine
+        if not kpis.kpis:
+            return
+        wanted = set(kpis.signal_ids)
+        keys: List[Tuple[str, str]] = []
+        columns: Dict[str, List[Any]] = {signal_id: [] for signal_id in kpis.signal_ids}
+        params: Dict[str, List[Any]] = {field: [] for field in kpis.params}
+        for line_id, line in lines.items():
+            for station_id, station in line.get('stations', {}).items():
+                key = (line_id, station_id)
+                keys.append(key)
+                raw = station_raw_data(station)
+                values: Dict[str, Any] = {}
+                for plan in self.plans.get(station.get('type', 'generic'), []):
+                    raw_value = raw.get(plan.opc_source)
+                    if plan.semantic_id in wanted and raw_value is not None:
+                        values[plan.semantic_id] = plan.value(raw_value, self._history(plan, key))
+                for signal_id, column in columns.items():
+                    column.append(values.get(signal_id))
+                for field, column in params.items():
+                    column.append(station.get(field))
+        kpis.update(ts, keys, columns, params)
     
-    def _apply_transforms(self, value: Any, transforms: List[Dict[str, Any]]) -> Any:
-        """Apply transform pipeline to raw value"""
-        result = value
+    def _compile_signal(self, signal_def: Dict[str, Any]) -> SignalPlan:
+        """Compile one YAML signal definition into a plan"""
+        return SignalPlan(
+            signal_def,
+            self._compile_transforms(signal_def.get('transforms', []), signal_def.get('semantic_id')),
+            self._compile_loss_category(signal_def)
+        )
+    
+    def _compile_transforms(
+        self,
+        transforms: List[Dict[str, Any]],
+        semantic_id: Optional[str] = None
+    ) -> Tuple[Optional[Callable], Optional[Dict[str, Any]], Optional[Callable]]:
+        """
+        Transform pipeline as (steps before the stateful transform, the
+        stateful transform definition, steps after it); one stateful
+        transform per signal.
+        """
+        before, after = [], []
+        stateful = None
         
-        for transform in transforms:
+        for transform in transforms or []:
             transform_type = transform.get('type')
+            steps = after if stateful else before
+            
+            if transform_type in STATEFUL_TRANSFORMS:
+                if stateful:
+                    logger.warning(f"Signal {semantic_id}: only one stateful transform is supported; '{transform_type}' ignored")
+                else:
+                    stateful = transform
             
-            if transform_type == 'range_check':
+            elif transform_type == 'range_check':
                 min_val = transform.get('min')
                 max_val = transform.get('max')
-                if min_val is not None and result < min_val:
-                    result = min_val
-                if max_val is not None and result > max_val:
-                    result = max_val
-            
-            elif transform_type == 'moving_average':
-                # Placeholder - would need historical data
-                pass
+                
+                def range_check(value, min_val=min_val, max_val=max_val):
+                    if min_val is not None and value < min_val:
+                        value = min_val
+                    if max_val is not None and value > max_val:
+                        value = max_val
+                    return value
+                steps.append(range_check)
             
             elif transform_type == 'scale':
                 factor = transform.get('factor', 1.0)
-                result = result * factor
+                steps.append(lambda value, factor=factor: value * factor)
             
             elif transform_type == 'offset':
                 offset = transform.get('offset', 0.0)
-                result = result + offset
+                steps.append(lambda value, offset=offset: value + offset)
+            
+            else:
+                logger.warning(f"Signal {semantic_id}: unknown transform type '{transform_type}' ignored")
         
-        return result
+        return _chain(before), stateful, _chain(after)
     
-    def _determine_loss_category(
-        self,
-        value: Any,
-        signal_def: Dict[str, Any]
-    ) -> Optional[str]:
-        """Determine loss category based on signal definition and value"""
+    def _compile_loss_category(self, signal_def: Dict[str, Any]) -> Callable[[Any], Optional[str]]:
+        """Loss category of a value, resolved once into a function"""
         
-        # Check for direct loss_category
+        # Direct loss_category (even null) takes precedence
         if 'loss_category' in signal_def:
-            return signal_def['loss_category']
+            category = signal_def['loss_category']
+            return lambda value: category
         
-        # Check for state-based mapping
+        # State-based mapping
         if 'loss_category_map' in signal_def:
-            loss_map = signal_def['loss_category_map']
-            return loss_map.get(value)
+            loss_map = signal_def['loss_category_map'] or {}
+            return loss_map.get
         
-        # Check for rule-based category
+        # Rule-based category: condition compiled once, never eval'd
         if 'loss_category_rule' in signal_def:
             rule = signal_def['loss_category_rule']
             condition = rule.get('condition', '')
             category = rule.get('category')
+            try:
+                test = compile_expression(condition, ('value',))
+            except ExpressionError as e:
+                logger.warning(f"Signal {signal_def.get('semantic_id')}: {e}; rule disabled")
+                return lambda value: None
             
-            # Simple condition evaluation
-            if self._evaluate_condition(condition, value):
-                return category
-        
-        return None
-    
-    def _evaluate_condition(self, condition: str, value: Any) -> bool:
-        """Evaluate simple condition string"""
-        try:
-            # Replace 'value' with actual value in condition
-            condition_str = condition.replace('value', str(value))
-            return eval(condition_str)
-        except Exception as e:
-            logger.warning(f"Failed to evaluate condition '{condition}': {e}")
-            return False
+            def rule_category(value):
+                try:
+                    return category if test({'value': value}) else None
+                except Exception as e:
+                    logger.warning(f"Failed to evaluate condition '{condition}': {e}")
+                    return None
+            return rule_category
+        
+        return lambda value: None
     
     def _create_generic_signals(
         self,
@@ -241,68 +449,21 @@ class SemanticEngine:
         semantic_signals: List[Dict[str, Any]],
         historical_data: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
-        """Calculate derived KPIs from semantic signals"""
-        kpis = []
-        
-        # Build signal lookup
-        signal_values = {s['semantic_id']: s['value'] for s in semantic_signals}
-        
-        for kpi_def in self.derived_kpis:
-            kpi = self._calculate_kpi(kpi_def, signal_values, historical_data)
-            if kpi:
-                kpis.append(kpi)
-        
-        return kpis
-    
-    def _calculate_kpi(
-        self,
-        kpi_def: Dict[str, Any],
-        signal_values: Dict[str, Any],
-        historical_data: Optional[Dict[str, Any]]
-    ) -> Optional[Dict[str, Any]]:
-        """Calculate a single KPI"""
-        
-        kpi_id = kpi_def['kpi_id']
-        formula = kpi_def.get('formula', '')
-        dependencies = kpi_def.get('dependencies', [])
-        
-        # Check if all dependencies are available
-        for dep in dependencies:
-            if dep not in signal_values:
-                logger.debug(f"KPI {kpi_id}: missing dependency {dep}")
-                return None
-        
-        # Placeholder: Simple KPI calculations
-        # In production, would use proper formula parser
-        value = None
-        
-        if kpi_id == 'oee.availability':
-            # Simplified - would need historical state data
-            state = signal_values.get('station.state')
-            value = 100.0 if state == 'RUNNING' else 0.0
-        
-        elif kpi_id == 'oee.quality':
-            quality_ok = signal_values.get('station.quality_ok', 0)
-            parts_count = signal_values.get('station.parts_count', 1)
-            value = (quality_ok / parts_count * 100) if parts_count > 0 else 100.0
-        
-        elif kpi_id == 'throughput.actual':
-            parts = signal_values.get('station.parts_count', 0)
-            # Simplified - would need time tracking
-            value = parts * 1.0  # parts per current period
+        """
+        Derived KPIs of one station's semantic signals.
         
-        if value is None:
-            return None
+        Stations sampled by observe() get the KPIs of the latest plant-wide
+        tick (with window aggregates over their history); other signal sets
+        are evaluated on their own, so only formulas without history resolve.
+        `historical_data` is not used; history comes from observe().
+        """
+        metadata = semantic_signals[0].get('metadata') if semantic_signals else None
+        if metadata:
+            key = (metadata.get('line_id'), metadata.get('station_id'))
+            if self.kpi_engine.has_station(key):
+                return self.kpi_engine.station_kpis(key)
         
-        return {
-            'kpi_id': kpi_id,
-            'value': value,
-            'unit': kpi_def.get('unit', ''),
-            'target': kpi_def.get('target'),
-            'timestamp': datetime.utcnow().isoformat() + 'Z',
-            'description': kpi_def.get('description', ''),
-            'formula': formula
-        }
+        return self.kpi_engine.evaluate_signals({s['semantic_id']: s['value'] for s in semantic_signals})
     
     def validate_semantic_signals(
         self,
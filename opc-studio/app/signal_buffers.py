@@ -0,0 +1,196 @@
+"""
+Ring buffers for stateful semantic transforms.
+
+Transforms such as moving_average need a signal's recent history, which the
+stateless mapping does not have. Every signal whose YAML pipeline contains a
+stateful transform gets one row in a fixed-size ring buffer, keyed by
+(line, station, semantic_id). A history tick samples the whole plant into
+one column vector; the buffer push and every transform are then computed
+for all rows at once with NumPy (rows are grouped by transform and window),
+so the cost per tick does not grow with a Python loop per signal.
+
+Supported transforms (windows are in samples, one sample per tick):
+
+  moving_average  window: N           mean of the last N samples
+  ewma            alpha: a | span: N  exponentially weighted mean (alpha = 2 / (span + 1))
+  rate_of_change  window: N, per_s    change per second (x per_s) over the last N samples
+  min_window      window: N           minimum of the last N samples
+  max_window      window: N           maximum of the last N samples
+
+Values are stored as float32; missing or non-numeric samples are NaN and are
+ignored by the window statistics.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .log import get_logger
+
+logger = get_logger("opc-studio.semantic")
+
+HISTORY_SAMPLES = int(os.getenv("SEMANTIC_HISTORY_SAMPLES", "120"))
+HISTORY_INTERVAL_S = float(os.getenv("SEMANTIC_HISTORY_INTERVAL_S", "1.0"))
+
+STATEFUL_TRANSFORMS = ("moving_average", "ewma", "rate_of_change", "min_window", "max_window")
+
+# (kind, window) -> rows; ewma rows carry their alpha instead of a window
+Group = Tuple[str, int]
+
+
+def transform_spec(transform: Dict[str, Any], capacity: int = HISTORY_SAMPLES) -> Tuple[str, int, float]:
+    """(kind, window, parameter) of a stateful transform definition"""
+    kind = transform["type"]
+    if kind == "ewma":
+        alpha = transform.get("alpha")
+        if alpha is None:
+            alpha = 2.0 / (float(transform.get("span", 10)) + 1.0)
+        return kind, 1, min(max(float(alpha), 0.0), 1.0)
+    window = int(transform.get("window", 10))
+    if window > capacity:
+        logger.warning("%s window %d exceeds SEMANTIC_HISTORY_SAMPLES=%d; clamped", kind, window, capacity)
+    window = min(max(window, 2 if kind == "rate_of_change" else 1), capacity)
+    return kind, window, float(transform.get("per_s", 1.0))
+
+
+class SignalBuffers:
+    def __init__(self, capacity: int = HISTORY_SAMPLES):
+        self.capacity = capacity
+        self.index: Dict[Hashable, int] = {}
+        self._specs: List[Tuple[str, int, float]] = []
+        # Allocated with spare rows (doubling); only the first len(_specs) are live
+        self.values = np.full((16, capacity), np.nan, dtype=np.float32)
+        self.times = np.full(capacity, np.nan)
+        self.head = 0    # next column to write
+        self.count = 0   # samples held (<= capacity)
+        self._ewma = np.full(16, np.nan)
+        # Latest transform output per row; replaced (not mutated) on each tick
+        self.output = np.full(0, np.nan)
+        self._groups: Dict[Group, np.ndarray] = {}
+        self._alphas = np.zeros(0)
+        self._per_s = np.zeros(0)
+        self._regroup_needed = False
+        self._lock = threading.Lock()
+        self.ticks = 0
+        # Ticks that changed at least one output
+        self.changed_ticks = 0
+        self.last_tick_ms: Optional[float] = None
+
+    @property
+    def rows(self) -> int:
+        return len(self._specs)
+
+    def register(self, key: Hashable, transform: Dict[str, Any]) -> int:
+        """Row for `key`, added on first use (history starts empty)."""
+        row = self.index.get(key)
+        if row is not None:
+            return row
+        with self._lock:
+            row = len(self._specs)
+            if row == len(self.values):
+                self.values = np.vstack([self.values, np.full(self.values.shape, np.nan, dtype=np.float32)])
+                self._ewma = np.concatenate([self._ewma, np.full(len(self._ewma), np.nan)])
+            self._specs.append(transform_spec(transform, self.capacity))
+            self.index[key] = row
+            self.output = np.append(self.output, np.nan)
+            self._regroup_needed = True
+        return row
+
+    def _regroup(self) -> None:
+        groups: Dict[Group, List[int]] = {}
+        for row, (kind, window, _) in enumerate(self._specs):
+            groups.setdefault((kind, window), []).append(row)
+        self._groups = {group: np.asarray(rows, dtype=np.intp) for group, rows in groups.items()}
+        self._alphas = np.asarray([param if kind == "ewma" else 0.0 for kind, _, param in self._specs])
+        self._per_s = np.asarray([param for _, _, param in self._specs])
+        self._regroup_needed = False
+
+    def push(self, ts: float, column: np.ndarray) -> None:
+        """Append one sample per row (len(column) == rows) and recompute every output."""
+        started = time.perf_counter()
+        with self._lock:
+            rows = len(self._specs)
+            column = np.asarray(column, dtype=np.float64)
+            if len(column) != rows:
+                raise ValueError(f"Expected {rows} samples, got {len(column)}")
+            if self._regroup_needed:
+                self._regroup()
+            self.values[:rows, self.head] = column
+            self.times[self.head] = ts
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            output = np.full(rows, np.nan)
+            for (kind, window), members in self._groups.items():
+                output[members] = self._compute(kind, window, members, column)
+            if not np.array_equal(output, self.output, equal_nan=True):
+                self.changed_ticks += 1
+            self.output = output
+        self.ticks += 1
+        self.last_tick_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def _compute(self, kind: str, window: int, rows: np.ndarray, column: np.ndarray) -> np.ndarray:
+        if kind == "ewma":
+            previous = self._ewma[rows]
+            x = column[rows]
+            alpha = self._alphas[rows]
+            updated = np.where(np.isnan(previous), x, alpha * x + (1.0 - alpha) * previous)
+            self._ewma[rows] = np.where(np.isnan(x), previous, updated)
+            return self._ewma[rows]
+
+        span = min(window, self.count)
+        # Columns of the last `span` samples, newest first
+        cols = (self.head - 1 - np.arange(span)) % self.capacity
+        block = self.values[np.ix_(rows, cols)].astype(np.float64)
+
+        if kind == "moving_average":
+            valid = ~np.isnan(block)
+            n = valid.sum(axis=1)
+            total = np.where(valid, block, 0.0).sum(axis=1)
+            return np.where(n > 0, total / np.maximum(n, 1), np.nan)
+        if kind == "min_window":
+            return np.fmin.reduce(block, axis=1)
+        if kind == "max_window":
+            return np.fmax.reduce(block, axis=1)
+        if kind == "rate_of_change":
+            if span < 2:
+                return np.full(len(rows), np.nan)
+            dt = self.times[cols[0]] - self.times[cols[-1]]
+            if not dt > 0:
+                return np.full(len(rows), np.nan)
+            return (block[:, 0] - block[:, -1]) / dt * self._per_s[rows]
+        raise ValueError(f"Unknown stateful transform '{kind}'")
+
+    def value(self, key: Hashable) -> Optional[float]:
+        """Latest output for `key` (None before it has data)."""
+        row = self.index.get(key)
+        if row is None:
+            return None
+        output = self.output
+        if row >= len(output) or np.isnan(output[row]):
+            return None
+        return float(output[row])
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "rows": len(self._specs),
+            "capacity": self.capacity,
+            "samples": self.count,
+            "bytes": int(self.values.nbytes + self.times.nbytes + self._ewma.nbytes),
+            "groups": {f"{kind}:{window}": len(rows) for (kind, window), rows in self._groups.items()},
+            "ticks": self.ticks,
+            "last_tick_ms": self.last_tick_ms,
+        }
+
+
+async def history_loop(state, engine, interval_s: float = HISTORY_INTERVAL_S) -> None:
+    """Sample the plant into the semantic engine's ring buffers every interval."""
+    logger.info("Semantic signal history every %ss (%d samples)", interval_s, engine.buffers.capacity)
+    while True:
+        try:
+            engine.observe(state.data["lines"], time.time())
+        except Exception as e:
+            logger.exception("Semantic history tick failed: %s", e)
+        await asyncio.sleep(interval_s)
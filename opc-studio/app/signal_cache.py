@@ -0,0 +1,165 @@
+"""
+Cached /semantic/signals responses.
+
+Mapping every station and serializing verbose per-signal objects is the
+expensive part of GET /semantic/signals, and its inputs only change when
+the plant state version moves or a history tick changes the output of a
+stateful transform or a KPI (SemanticEngine.values_version; most ticks of a
+steady plant change nothing). The result is therefore computed once per
+(boot, state version, values version) and kept as serialized bytes per format:
+
+  verbose  the original shape: one object per signal and per KPI
+  compact  columnar: station metadata and the static part of each signal /
+           KPI definition are listed once and referenced by index
+
+    {"format": "compact", "version", "boot", "timestamp", "computed_at",
+     "stations":    {"plant": [...], "line_id": [...], "station_id": [...], "station_name": [...]},
+     "signal_defs": {"semantic_id": [...], "unit": [...], "source_node": [...], "description": [...], "data_type": [...]},
+     "signals":     {"station": [...], "def": [...], "value": [...], "loss_category": [...], "quality": [...]},
+     "kpi_defs":    {"kpi_id": [...], "unit": [...], "target": [...], "description": [...], "formula": [...], "window_s": [...]},
+     "kpis":        {"station": [...], "def": [...], "value": [...]}}
+
+Readers get an ETag; If-None-Match answers 304 until the key changes.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from .log import get_logger
+
+logger = get_logger("opc-studio.semantic")
+
+FORMATS = ("verbose", "compact")
+
+STATION_FIELDS = ("plant", "line_id", "station_id", "station_name")
+SIGNAL_DEF_FIELDS = ("semantic_id", "unit", "source_node", "description", "data_type")
+SIGNAL_FIELDS = ("value", "loss_category", "quality")
+KPI_DEF_FIELDS = ("kpi_id", "unit", "target", "description", "formula", "window_s")
+
+
+def build_semantic_signals(snapshot: Dict[str, Any], semantic_engine) -> Dict[str, Any]:
+    """
+    Semantic signals and KPIs of every station, grouped per station:
+    {"timestamp", "stations": [{"metadata", "signals", "kpis"}]}
+    """
+    data = snapshot.get("data", {})
+    plant = data.get("plant", "PLANT")
+    stations = []
+    for line_id, line_data in data.get("lines", {}).items():
+        for station_id, station_data in line_data.get("stations", {}).items():
+            signals = semantic_engine.station_signals(plant, line_id, station_id, station_data)
+            stations.append({
+                "metadata": {
+                    "station_id": station_id,
+                    "station_name": station_data.get("name", station_id),
+                    "line_id": line_id,
+                    "plant": plant,
+                },
+                "signals": signals,
+                "kpis": semantic_engine.calculate_kpis(signals),
+            })
+    return {"timestamp": data.get("timestamp"), "stations": stations}
+
+
+def verbose_payload(result: Dict[str, Any]) -> Dict[str, Any]:
+    signals = [signal for station in result["stations"] for signal in station["signals"]]
+    kpis = [kpi for station in result["stations"] for kpi in station["kpis"]]
+    return {
+        "ok": True,
+        "timestamp": result["timestamp"],
+        "semantic_signals": signals,
+        "kpis": kpis,
+        "signal_count": len(signals),
+        "kpi_count": len(kpis),
+    }
+
+
+def compact_payload(result: Dict[str, Any]) -> Dict[str, Any]:
+    stations = {field: [] for field in STATION_FIELDS}
+    signal_defs = {field: [] for field in SIGNAL_DEF_FIELDS}
+    signals = {"station": [], "def": [], **{field: [] for field in SIGNAL_FIELDS}}
+    kpi_defs = {field: [] for field in KPI_DEF_FIELDS}
+    kpis = {"station": [], "def": [], "value": []}
+    signal_index: Dict[Tuple, int] = {}
+    kpi_index: Dict[Tuple, int] = {}
+
+    for i, station in enumerate(result["stations"]):
+        for field in STATION_FIELDS:
+            stations[field].append(station["metadata"][field])
+        for signal in station["signals"]:
+            key = tuple(signal.get(field) for field in SIGNAL_DEF_FIELDS)
+            if key not in signal_index:
+                signal_index[key] = len(signal_index)
+                for field, value in zip(SIGNAL_DEF_FIELDS, key):
+                    signal_defs[field].append(value)
+            signals["station"].append(i)
+            signals["def"].append(signal_index[key])
+            for field in SIGNAL_FIELDS:
+                signals[field].append(signal.get(field))
+        for kpi in station["kpis"]:
+            key = tuple(kpi.get(field) for field in KPI_DEF_FIELDS)
+            if key not in kpi_index:
+                kpi_index[key] = len(kpi_index)
+                for field, value in zip(KPI_DEF_FIELDS, key):
+                    kpi_defs[field].append(value)
+            kpis["station"].append(i)
+            kpis["def"].append(kpi_index[key])
+            kpis["value"].append(kpi["value"])
+
+    return {
+        "ok": True,
+        "format": "compact",
+        "timestamp": result["timestamp"],
+        "stations": stations,
+        "signal_defs": signal_defs,
+        "signals": signals,
+        "kpi_defs": kpi_defs,
+        "kpis": kpis,
+        "signal_count": len(signals["def"]),
+        "kpi_count": len(kpis["def"]),
+    }
+
+
+_PAYLOADS = {"verbose": verbose_payload, "compact": compact_payload}
+
+
+def _serialize(payload: Dict[str, Any]) -> bytes:
+    return json.dumps(payload, default=str, separators=(",", ":")).encode()
+
+
+class SemanticSignalsCache:
+    """Serialized /semantic/signals bodies for the current state and values version"""
+
+    def __init__(self):
+        self._key: Optional[Tuple[str, int, int]] = None
+        self._result: Optional[Dict[str, Any]] = None
+        self._bodies: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "builds": 0, "last_build_ms": None, "bytes": {}}
+
+    def get(self, state, semantic_engine, fmt: str = "verbose") -> Tuple[str, bytes]:
+        """(etag, JSON body) for `fmt`; builds at most once per key and format."""
+        if fmt not in _PAYLOADS:
+            raise ValueError(f"Unknown format '{fmt}' (expected one of {', '.join(FORMATS)})")
+        # Read the key before building: a change during the build only causes a rebuild next time
+        key = (state.boot_id, state.version, semantic_engine.values_version)
+        etag = f'"{key[0]}-{key[1]}-{key[2]}-{fmt}"'
+        with self._lock:
+            if key != self._key:
+                started = time.perf_counter()
+                self._result = build_semantic_signals(state.snapshot(), semantic_engine)
+                self._result["computed_at"] = datetime.utcnow().isoformat() + "Z"
+                self._key, self._bodies = key, {}
+                self.stats["builds"] += 1
+                self.stats["last_build_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            body = self._bodies.get(fmt)
+            if body is None:
+                payload = _PAYLOADS[fmt](self._result)
+                payload.update(version=key[1], boot=key[0], computed_at=self._result["computed_at"])
+                body = self._bodies[fmt] = _serialize(payload)
+                self.stats["bytes"][fmt] = len(body)
+            else:
+                self.stats["hits"] += 1
+        return etag, body
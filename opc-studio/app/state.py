@@ -1,16 +1,36 @@
+import copy
+import threading
 import time
-from typing import Dict, Any, List
+import uuid
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
 from .plant_model import load_model
 
 def _normalize_id(s: str) -> str:
     return (s or "").strip()
 
+# Dirty-tracking keys: (line_id, None, field) for line fields,
+# (line_id, station_id, field) for station fields
+FieldKey = Tuple[str, Optional[str], str]
+
 class PlantState:
     """In-memory plant state for simulator + UA variables."""
 
     def __init__(self):
         self.model = load_model()
         self.started_at = time.time()
+        # Fields changed since the last take_dirty(); mutated from API threads
+        # and read by the UA sync task
+        self._dirty: Set[FieldKey] = set()
+        self._dirty_lock = threading.Lock()
+        # Snapshot versioning: `version` increases on every change and each
+        # line/station remembers the version that last changed it. `boot_id`
+        # tells clients that versions restarted (new process).
+        self.boot_id = uuid.uuid4().hex[:12]
+        self.version = 0
+        self._line_versions: Dict[str, int] = {}
+        self._station_versions: Dict[Tuple[str, str], int] = {}
+        # Called after every change, possibly from API threads (live stream wake-up)
+        self._listeners: List[Callable[[], None]] = []
         self.data: Dict[str, Any] = {
             "plant": self.model.get("plant","PLANT"),
             "plant_name": self.model.get("plant_name", ""),
@@ -44,6 +64,51 @@ class PlantState:
                     "alarms": []
                 }
 
+    def set_line_field(self, line_id: str, field: str, value: Any) -> None:
+        line = self.data["lines"][line_id]
+        if line.get(field) != value:
+            line[field] = value
+            self.mark_dirty(line_id, None, field)
+
+    def set_station_field(self, line_id: str, station_id: str, field: str, value: Any) -> None:
+        st = self.data["lines"][line_id]["stations"][station_id]
+        if st.get(field) != value:
+            st[field] = value
+            self.mark_dirty(line_id, station_id, field)
+
+    def mark_dirty(self, line_id: str, station_id: Optional[str] = None, *fields: str) -> None:
+        """Record changed fields (use for in-place edits such as alarms.append)."""
+        with self._dirty_lock:
+            self._dirty.update((line_id, station_id, f) for f in fields)
+            self.version += 1
+            if station_id is None:
+                self._line_versions[line_id] = self.version
+            else:
+                self._station_versions[(line_id, station_id)] = self.version
+        for callback in self._listeners:
+            callback()
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """Register a callback run after each change (must be thread-safe and quick)."""
+        self._listeners.append(callback)
+
+    def mark_dirty_keys(self, keys: Set[FieldKey]) -> None:
+        with self._dirty_lock:
+            self._dirty.update(keys)
+
+    def mark_all_dirty(self) -> None:
+        with self._dirty_lock:
+            for line_id, line in self.data["lines"].items():
+                self._dirty.update((line_id, None, f) for f in line if f != "stations")
+                for st_id, st in line["stations"].items():
+                    self._dirty.update((line_id, st_id, f) for f in st)
+
+    def take_dirty(self) -> Set[FieldKey]:
+        """Changed fields since the previous call."""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
     def list_model(self) -> Dict[str, Any]:
         return {
             "plant": self.data.get("plant"),
@@ -106,23 +171,52 @@ class PlantState:
         ln = self.data["lines"][line_key]
         st = ln["stations"][st_key]
 
-        if "availability" in impact:
-            ln["availability"] = max(0.0, min(1.0, float(ln["availability"]) + float(impact["availability"])))
-        if "performance" in impact:
-            ln["performance"] = max(0.0, min(1.0, float(ln["performance"]) + float(impact["performance"])))
-        if "quality" in impact:
-            ln["quality"] = max(0.0, min(1.0, float(ln["quality"]) + float(impact["quality"])))
-        ln["oee"] = round(ln["availability"] * ln["performance"] * ln["quality"], 4)
+        for field in ("availability", "performance", "quality"):
+            if field in impact:
+                self.set_line_field(line_key, field, max(0.0, min(1.0, float(ln[field]) + float(impact[field]))))
+        self.set_line_field(line_key, "oee", round(ln["availability"] * ln["performance"] * ln["quality"], 4))
 
         alarms: List[str] = impact.get("alarms", []) or []
-        for a in alarms:
-            if a not in st["alarms"]:
-                st["alarms"].append(a)
+        new_alarms = [a for a in dict.fromkeys(alarms) if a not in st["alarms"]]
+        if new_alarms:
+            st["alarms"].extend(new_alarms)
+            self.mark_dirty(line_key, st_key, "alarms")
 
         if event.lower() in ("materialshortage", "fault", "blocked", "starved"):
-            st["state"] = "FAULTED" if event.lower() == "fault" else event.upper()
+            self.set_station_field(line_key, st_key, "state", "FAULTED" if event.lower() == "fault" else event.upper())
 
         return {"ok": True, "applied": {"line": line_key, "station": st_key, "event": event, "duration_min": duration_min, "impact": impact}}
 
+    def etag(self) -> str:
+        return f'"{self.boot_id}-{self.version}"'
+
     def snapshot(self) -> Dict[str, Any]:
-        return {"ok": True, "data": self.data}
+        return {"ok": True, "version": self.version, "boot": self.boot_id, "data": self.data}
+
+    def snapshot_copy(self) -> Dict[str, Any]:
+        """Like snapshot(), with a private copy of the data (safe to hand to another task)."""
+        with self._dirty_lock:
+            return {"ok": True, "version": self.version, "boot": self.boot_id, "data": copy.deepcopy(self.data)}
+
+    def delta(self, since: int, boot: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Lines and stations changed after version `since`. A changed line
+        carries its own fields and only its changed stations. If `since` is
+        from another boot (or ahead of this one) the full data is returned
+        with full=True.
+        """
+        with self._dirty_lock:
+            version = self.version
+            if (boot and boot != self.boot_id) or since > version or since < 0:
+                return {"ok": True, "version": version, "boot": self.boot_id, "since": since,
+                        "full": True, "data": copy.deepcopy(self.data)}
+            lines: Dict[str, Any] = {}
+            for line_id, v in self._line_versions.items():
+                if v > since:
+                    line = self.data["lines"][line_id]
+                    lines[line_id] = {k: copy.deepcopy(val) for k, val in line.items() if k != "stations"}
+            for (line_id, st_id), v in self._station_versions.items():
+                if v > since:
+                    st = self.data["lines"][line_id]["stations"][st_id]
+                    lines.setdefault(line_id, {}).setdefault("stations", {})[st_id] = copy.deepcopy(st)
+        return {"ok": True, "version": version, "boot": self.boot_id, "since": since, "full": False, "lines": lines}
@@ -0,0 +1,331 @@
+"""
+Live push stream of plant changes (GET /stream WebSocket, GET /stream/sse).
+
+Consumers used to poll /snapshot and /semantic/signals on timers. The hub
+is woken by PlantState whenever a field changes, and by the semantic engine
+when a history tick changed a stateful signal or KPI, and after a short
+coalescing pause publishes to every subscriber:
+
+  state    the lines/stations changed since the last publish (same shape as
+           /snapshot/delta "lines")
+  signals  the semantic signals that changed on those stations, with the
+           stations' KPIs; after a history tick, every station whose
+           signals or KPIs changed
+  event    scenario events, as they are applied
+
+Each subscriber picks topics and filters on line and station; its first
+message is a filtered snapshot (or, when resuming with since/boot from the
+same boot, the delta since that version). Messages carry the state version,
+so a client can merge them into the snapshot exactly like the delta
+endpoint. A subscriber that falls behind has its queue cleared and gets a
+fresh snapshot ("resync") instead of an unbounded backlog. Idle connections
+get a heartbeat every OPC_STREAM_HEARTBEAT_S.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from .state import PlantState
+from .log import get_logger
+
+logger = get_logger("opc-studio.stream")
+
+STREAM_COALESCE_S = float(os.getenv("OPC_STREAM_COALESCE_S", "0.1"))
+STREAM_HEARTBEAT_S = float(os.getenv("OPC_STREAM_HEARTBEAT_S", "15"))
+STREAM_QUEUE_MAX = int(os.getenv("OPC_STREAM_QUEUE_MAX", "256"))
+
+TOPICS = ("state", "signals", "events")
+
+# Queued in place of dropped messages; the subscriber gets a fresh snapshot
+_RESYNC = {"type": "resync"}
+
+# Signal fields that make a signal "changed" (timestamps are always new)
+_SIGNAL_KEY_FIELDS = ("value", "loss_category", "quality")
+
+
+def _id_set(value: Optional[str]) -> Optional[Set[str]]:
+    """Comma-separated ids -> lower-cased set (None = no filter)"""
+    if not value:
+        return None
+    ids = {part.strip().lower() for part in value.split(",") if part.strip()}
+    return ids or None
+
+
+class Subscriber:
+    def __init__(self, lines: Optional[str], stations: Optional[str], topics: Optional[str], queue_max: int):
+        self.lines = _id_set(lines)
+        self.stations = _id_set(stations)
+        requested = _id_set(topics)
+        unknown = (requested or set()) - set(TOPICS)
+        if unknown:
+            raise ValueError(f"Unknown stream topics: {sorted(unknown)}. Available: {list(TOPICS)}")
+        self.topics = requested or set(TOPICS)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_max)
+        # Version of the last snapshot sent; state/signals messages up to it are stale
+        self.baseline = -1
+        # Semantic values version of that snapshot; later signals messages are not
+        self.values_baseline = -1
+        self.sent = 0
+        self.resyncs = 0
+
+    def wants_line(self, line_id: str) -> bool:
+        return self.lines is None or line_id.lower() in self.lines
+
+    def wants_station(self, line_id: str, station_id: str) -> bool:
+        return self.wants_line(line_id) and (self.stations is None or station_id.lower() in self.stations)
+
+    def filter_lines(self, lines: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Lines tree restricted to this subscriber. The line filter selects
+        lines (with their own fields); the station filter narrows stations.
+        """
+        out = {}
+        for line_id, line in lines.items():
+            if not self.wants_line(line_id):
+                continue
+            if self.stations is not None and "stations" in line:
+                stations = {k: v for k, v in line["stations"].items() if k.lower() in self.stations}
+                line = {**line, "stations": stations}
+                if not stations and len(line) == 1:
+                    continue
+            out[line_id] = line
+        return out
+
+    def offer(self, message: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too slow: drop the backlog, resend a snapshot instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_RESYNC)
+            self.resyncs += 1
+
+
+class StreamHub:
+    def __init__(self, state: PlantState, semantic_engine=None,
+                 coalesce_s: float = STREAM_COALESCE_S,
+                 heartbeat_s: float = STREAM_HEARTBEAT_S,
+                 queue_max: int = STREAM_QUEUE_MAX):
+        self.state = state
+        self.semantic_engine = semantic_engine
+        self.coalesce_s = coalesce_s
+        self.heartbeat_s = heartbeat_s
+        self.queue_max = queue_max
+        self.subscribers: Set[Subscriber] = set()
+        # Scenario events, appended from API threads
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=1000)
+        self._version = state.version
+        self._values_version = self._engine_values_version()
+        # (line_id, station_id) -> {semantic_id: (value, loss_category, quality)} last published
+        self._signal_keys: Dict[Tuple[str, str], Dict[str, tuple]] = {}
+        # (line_id, station_id) -> KPI values last published
+        self._kpi_keys: Dict[Tuple[str, str], tuple] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.stats: Dict[str, Any] = {"publishes": 0, "messages": 0, "events": 0, "last_publish_ms": None}
+
+    # ---- producers (any thread) ----
+
+    def notify(self) -> None:
+        """Wake the publisher; safe to call from any thread."""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or not self.subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # loop closed (shutdown)
+
+    def publish_event(self, plant: str, line: str, station: str, event_type: str, payload: Dict[str, Any]) -> None:
+        if not self.subscribers:
+            return
+        self._events.append({
+            "type": "event", "ts": time.time(), "plant": plant, "line": line,
+            "station": station, "event_type": event_type, "payload": payload,
+        })
+        self.notify()
+
+    # ---- publisher task ----
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.state.add_listener(self.notify)
+        if self.semantic_engine is not None:
+            self.semantic_engine.add_listener(self.notify)
+        logger.info("Live stream ready (coalesce %ss, heartbeat %ss)", self.coalesce_s, self.heartbeat_s)
+        while True:
+            await self._wake.wait()
+            # Let a burst of field updates (one scenario) land in one message
+            await asyncio.sleep(self.coalesce_s)
+            self._wake.clear()
+            try:
+                self.publish_once()
+            except Exception as e:
+                logger.exception("Live stream publish failed: %s", e)
+
+    def publish_once(self) -> None:
+        """Send changes since the previous publish (and queued events) to the subscribers."""
+        started = time.perf_counter()
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+
+        subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+
+        messages = 0
+        lines: Dict[str, Any] = {}
+        if self.state.version != self._version:
+            delta = self.state.delta(self._version, self.state.boot_id)
+            self._version = delta["version"]
+            lines = delta["data"]["lines"] if delta.get("full") else delta["lines"]
+            for sub in subscribers:
+                if "state" in sub.topics:
+                    filtered = sub.filter_lines(lines)
+                    if filtered:
+                        sub.offer({"type": "state", "version": delta["version"], "boot": delta["boot"], "lines": filtered})
+                        messages += 1
+
+        values_version = self._engine_values_version()
+        if values_version != self._values_version:
+            # History tick: window KPIs / stateful signals may move on any station
+            self._values_version = values_version
+            lines = self.state.snapshot_copy()["data"]["lines"]
+        if lines and any("signals" in s.topics for s in subscribers):
+            changed_signals = self._changed_signals(lines)
+            for sub in subscribers:
+                if "signals" in sub.topics:
+                    mine = [s for s in changed_signals if sub.wants_station(s["line"], s["station"])]
+                    if mine:
+                        sub.offer({"type": "signals", "version": self._version, "boot": self.state.boot_id,
+                                   "values_version": values_version, "stations": mine})
+                        messages += 1
+
+        for event in events:
+            for sub in subscribers:
+                if "events" in sub.topics and sub.wants_station(event["line"] or "", event["station"] or ""):
+                    sub.offer(event)
+                    messages += 1
+
+        self.stats["publishes"] += 1
+        self.stats["messages"] += messages
+        self.stats["events"] += len(events)
+        self.stats["last_publish_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _engine_values_version(self) -> int:
+        return self.semantic_engine.values_version if self.semantic_engine is not None else 0
+
+    def _changed_signals(self, lines: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Per station with changes: the semantic signals whose value/category changed, plus KPIs."""
+        if self.semantic_engine is None:
+            return []
+        plant = self.state.data.get("plant", "PLANT")
+        out = []
+        for line_id, line in lines.items():
+            for station_id, station in (line.get("stations") or {}).items():
+                signals = self.semantic_engine.station_signals(plant, line_id, station_id, station)
+                keys = {s["semantic_id"]: tuple(s.get(f) for f in _SIGNAL_KEY_FIELDS) for s in signals}
+                last = self._signal_keys.get((line_id, station_id), {})
+                changed = [s for s in signals if last.get(s["semantic_id"]) != keys[s["semantic_id"]]]
+                self._signal_keys[(line_id, station_id)] = keys
+                kpis = self.semantic_engine.calculate_kpis(signals)
+                kpi_keys = tuple((k["kpi_id"], k["value"]) for k in kpis)
+                kpis_changed = self._kpi_keys.get((line_id, station_id)) != kpi_keys
+                self._kpi_keys[(line_id, station_id)] = kpi_keys
+                if changed or kpis_changed:
+                    out.append({
+                        "line": line_id,
+                        "station": station_id,
+                        "signals": changed,
+                        "kpis": kpis,
+                    })
+        return out
+
+    # ---- subscribers ----
+
+    def subscribe(self, line: Optional[str] = None, station: Optional[str] = None,
+                  topics: Optional[str] = None) -> Subscriber:
+        """Raises ValueError for unknown topics."""
+        sub = Subscriber(line, station, topics, self.queue_max)
+        if not self.subscribers:
+            # Nothing was published while idle; start from the current state
+            self._version = self.state.version
+            self._values_version = self._engine_values_version()
+            self._signal_keys.clear()
+            self._kpi_keys.clear()
+            self._events.clear()
+        self.subscribers.add(sub)
+        logger.info("Stream subscriber added (lines=%s stations=%s topics=%s); %d connected",
+                    sub.lines, sub.stations, sorted(sub.topics), len(self.subscribers))
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self.subscribers.discard(sub)
+        logger.info("Stream subscriber removed; %d connected", len(self.subscribers))
+
+    def snapshot_message(self, sub: Subscriber, reason: str) -> Dict[str, Any]:
+        snapshot = self.state.snapshot_copy()
+        data = {**snapshot["data"], "lines": sub.filter_lines(snapshot["data"]["lines"])}
+        message = {"type": "snapshot", "reason": reason, "version": snapshot["version"],
+                   "boot": snapshot["boot"], "values_version": self._engine_values_version(), "data": data}
+        if "signals" in sub.topics and self.semantic_engine is not None:
+            message["stations"] = [
+                {
+                    "line": line_id,
+                    "station": station_id,
+                    "signals": (signals := self.semantic_engine.station_signals(data["plant"], line_id, station_id, station)),
+                    "kpis": self.semantic_engine.calculate_kpis(signals),
+                }
+                for line_id, line in data["lines"].items()
+                for station_id, station in line.get("stations", {}).items()
+            ]
+        return message
+
+    def initial_message(self, sub: Subscriber, since: Optional[int] = None, boot: Optional[str] = None) -> Dict[str, Any]:
+        """Snapshot, or the delta since `since` when resuming within the same boot."""
+        if since is None or boot != self.state.boot_id or "signals" in sub.topics:
+            return self.snapshot_message(sub, "subscribe")
+        delta = self.state.delta(since, boot)
+        if delta.get("full"):
+            return self.snapshot_message(sub, "subscribe")
+        return {"type": "state", "version": delta["version"], "boot": delta["boot"],
+                "lines": sub.filter_lines(delta["lines"])}
+
+    async def messages(self, sub: Subscriber, since: Optional[int] = None,
+                       boot: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Messages for one subscriber, starting with its initial message; never ends."""
+        message = self.initial_message(sub, since, boot)
+        sub.baseline = message["version"]
+        sub.values_baseline = message.get("values_version", -1)
+        sub.sent += 1
+        yield message
+        while True:
+            try:
+                message = await asyncio.wait_for(sub.queue.get(), timeout=self.heartbeat_s)
+            except asyncio.TimeoutError:
+                message = {"type": "heartbeat", "ts": time.time(), "version": self.state.version, "boot": self.state.boot_id}
+            if message is _RESYNC:
+                message = self.snapshot_message(sub, "resync")
+                sub.baseline = message["version"]
+                sub.values_baseline = message["values_version"]
+            elif message["type"] == "state" and message["version"] <= sub.baseline:
+                continue  # already contained in the last snapshot
+            elif (message["type"] == "signals" and message["version"] <= sub.baseline
+                  and message["values_version"] <= sub.values_baseline):
+                continue
+            sub.sent += 1
+            yield message
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "version": self.state.version,
+            "boot": self.state.boot_id,
+            "resyncs": sum(s.resyncs for s in self.subscribers),
+            **self.stats,
+        }
@@ -1,23 +1,58 @@
 import os
+import time
 import asyncio
-from asyncua import Server
+from typing import Any, Dict, List
+from asyncua import Server, ua
 from .state import PlantState
 from .log import get_logger
 
 logger = get_logger("opc-studio.ua")
 
+SYNC_INTERVAL_S = float(os.getenv("OPC_UA_SYNC_INTERVAL_S", "1.0"))
+
+# PlantState field -> (UA variable name, variant type); fields without a UA
+# variable (alarms, names, ...) are ignored by the sync
+LINE_VARIABLES = {
+    "status": ("Status", ua.VariantType.String),
+    "oee": ("OEE", ua.VariantType.Double),
+    "availability": ("Availability", ua.VariantType.Double),
+    "performance": ("Performance", ua.VariantType.Double),
+    "quality": ("Quality", ua.VariantType.Double),
+}
+STATION_VARIABLES = {
+    "state": ("State", ua.VariantType.String),
+    "cycle_time_s": ("CycleTime_s", ua.VariantType.Double),
+    "good_count": ("GoodCount", ua.VariantType.Int64),
+    "scrap_count": ("ScrapCount", ua.VariantType.Int64),
+}
+_PYTHON_TYPES = {ua.VariantType.String: str, ua.VariantType.Double: float, ua.VariantType.Int64: int}
+
 class UAServer:
     def __init__(self, state: PlantState):
         self.state = state
         self.server = Server()
         self.endpoint = os.getenv("OPC_ENDPOINT", "opc.tcp://0.0.0.0:4840/shopfloor/opc-studio")
+        self.sync_interval_s = SYNC_INTERVAL_S
+        # (line_id, station_id or None, field) -> UA variable node
         self._nodes = {}
+        self.sync_stats: Dict[str, Any] = {
+            "cycles": 0, "idle_cycles": 0, "nodes_written": 0,
+            "last_nodes": 0, "last_cycle_ms": None, "max_cycle_ms": None, "last_error": None,
+        }
 
     async def start(self):
         await self.server.init()
         self.server.set_endpoint(self.endpoint)
         self.server.set_server_name("OPC Studio (Shopfloor-Copilot)")
+        await self.build_address_space()
+
+        await self.server.start()
+        logger.info("OPC UA server started at %s (sync every %ss)", self.endpoint, self.sync_interval_s)
+        # Changes made while the address space was being built
+        self.state.mark_all_dirty()
+        asyncio.create_task(self._sync_loop())
 
+    async def build_address_space(self):
         uri = "urn:shopfloor:opc-studio"
         idx = await self.server.register_namespace(uri)
 
@@ -26,44 +61,86 @@ class UAServer:
 
         for line_id, line in self.state.data["lines"].items():
             line_obj = await plant_obj.add_object(idx, f"Line_{line_id}")
-            self._nodes[(line_id, "Status")] = await line_obj.add_variable(idx, "Status", line["status"])
-            self._nodes[(line_id, "OEE")] = await line_obj.add_variable(idx, "OEE", float(line["oee"]))
-            self._nodes[(line_id, "Availability")] = await line_obj.add_variable(idx, "Availability", float(line["availability"]))
-            self._nodes[(line_id, "Performance")] = await line_obj.add_variable(idx, "Performance", float(line["performance"]))
-            self._nodes[(line_id, "Quality")] = await line_obj.add_variable(idx, "Quality", float(line["quality"]))
+            for field, (name, vtype) in LINE_VARIABLES.items():
+                self._nodes[(line_id, None, field)] = await line_obj.add_variable(
+                    idx, name, _PYTHON_TYPES[vtype](line[field]), varianttype=vtype
+                )
 
             stations_obj = await line_obj.add_object(idx, "Stations")
             for st_id, st in line["stations"].items():
                 st_obj = await stations_obj.add_object(idx, f"Station_{st_id}")
-                self._nodes[(line_id, st_id, "State")] = await st_obj.add_variable(idx, "State", st["state"])
-                self._nodes[(line_id, st_id, "CycleTime_s")] = await st_obj.add_variable(idx, "CycleTime_s", float(st["cycle_time_s"]))
-                self._nodes[(line_id, st_id, "GoodCount")] = await st_obj.add_variable(idx, "GoodCount", int(st["good_count"]))
-                self._nodes[(line_id, st_id, "ScrapCount")] = await st_obj.add_variable(idx, "ScrapCount", int(st["scrap_count"]))
+                for field, (name, vtype) in STATION_VARIABLES.items():
+                    self._nodes[(line_id, st_id, field)] = await st_obj.add_variable(
+                        idx, name, _PYTHON_TYPES[vtype](st[field]), varianttype=vtype
+                    )
 
         for n in self._nodes.values():
             await n.set_writable()
 
-        await self.server.start()
-        logger.info("OPC UA server started at %s", self.endpoint)
-        asyncio.create_task(self._sync_loop())
+    def _write_values(self, dirty) -> List[ua.WriteValue]:
+        """WriteValues for the dirty fields that have a UA variable"""
+        lines = self.state.data["lines"]
+        nodes_to_write = []
+        for key in dirty:
+            node = self._nodes.get(key)
+            if node is None:
+                continue
+            line_id, st_id, field = key
+            source = lines[line_id] if st_id is None else lines[line_id]["stations"][st_id]
+            _, vtype = (LINE_VARIABLES if st_id is None else STATION_VARIABLES)[field]
+            wv = ua.WriteValue()
+            wv.NodeId = node.nodeid
+            wv.AttributeId = ua.AttributeIds.Value
+            wv.Value = ua.DataValue(ua.Variant(_PYTHON_TYPES[vtype](source[field]), vtype))
+            nodes_to_write.append(wv)
+        return nodes_to_write
+
+    async def sync_once(self) -> int:
+        """Push the fields changed since the last sync in one batched Write; returns nodes written."""
+        dirty = self.state.take_dirty()
+        if not dirty:
+            return 0
+        try:
+            params = ua.WriteParameters()
+            params.NodesToWrite = self._write_values(dirty)
+            if params.NodesToWrite:
+                results = await self.server.iserver.isession.write(params)
+                failed = [r for r in results if not r.is_good()]
+                if failed:
+                    logger.warning("OPC UA sync: %d of %d writes failed (%s)", len(failed), len(results), failed[0])
+        except Exception:
+            # Retry the same fields next cycle
+            self.state.mark_dirty_keys(dirty)
+            raise
+        return len(params.NodesToWrite)
 
     async def _sync_loop(self):
+        stats = self.sync_stats
         while True:
+            started = time.perf_counter()
             try:
-                for line_id, line in self.state.data["lines"].items():
-                    await self._nodes[(line_id, "Status")].write_value(line["status"])
-                    await self._nodes[(line_id, "OEE")].write_value(float(line["oee"]))
-                    await self._nodes[(line_id, "Availability")].write_value(float(line["availability"]))
-                    await self._nodes[(line_id, "Performance")].write_value(float(line["performance"]))
-                    await self._nodes[(line_id, "Quality")].write_value(float(line["quality"]))
-                    for st_id, st in line["stations"].items():
-                        await self._nodes[(line_id, st_id, "State")].write_value(st["state"])
-                        await self._nodes[(line_id, st_id, "CycleTime_s")].write_value(float(st["cycle_time_s"]))
-                        await self._nodes[(line_id, st_id, "GoodCount")].write_value(int(st["good_count"]))
-                        await self._nodes[(line_id, st_id, "ScrapCount")].write_value(int(st["scrap_count"]))
-            except Exception:
-                pass
-            await asyncio.sleep(1.0)
+                written = await self.sync_once()
+                stats["last_error"] = None
+            except Exception as e:
+                written = 0
+                stats["last_error"] = str(e)
+                logger.exception("OPC UA sync failed: %s", e)
+            ms = round((time.perf_counter() - started) * 1000, 3)
+            stats["cycles"] += 1
+            stats["idle_cycles"] += 0 if written else 1
+            stats["nodes_written"] += written
+            stats["last_nodes"] = written
+            stats["last_cycle_ms"] = ms
+            stats["max_cycle_ms"] = max(stats["max_cycle_ms"] or 0, ms)
+            await asyncio.sleep(max(self.sync_interval_s - ms / 1000, 0))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "sync_interval_s": self.sync_interval_s,
+            "nodes": len(self._nodes),
+            **self.sync_stats,
+        }
 
     async def stop(self):
         await self.server.stop()
@@ -0,0 +1,249 @@
+"""
+Token-budgeted prompt packing for LLM calls.
+
+Counts tokens per prompt section (runtime data, KB passages, expectations, ...)
+and fits the assembled prompt into the configured Ollama context window
+(`num_ctx`). Sections are truncated deterministically - whole lines and whole
+passages are kept in order, so the same inputs always produce the same prompt.
+"""
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# tiktoken is optional - fall back to a character heuristic when unavailable
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+    TIKTOKEN_AVAILABLE = True
+except Exception:
+    _ENCODING = None
+    TIKTOKEN_AVAILABLE = False
+
+# Ollama context window and tokens reserved for the generated answer
+DEFAULT_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "4096"))
+DEFAULT_RESERVE_OUTPUT = int(os.getenv("LLM_RESERVE_OUTPUT_TOKENS", "768"))
+
+# Relative share of the remaining budget per section
+DEFAULT_SECTION_WEIGHTS = {
+    "runtime": 0.35,
+    "kb": 0.45,
+    "expectations": 0.20,
+}
+
+# Below this many tokens a partial passage is dropped rather than truncated
+MIN_PARTIAL_PASSAGE_TOKENS = 32
+
+TRUNCATION_MARKER = "[... truncated {n} tokens to fit context budget ...]"
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text (tiktoken when installed, ~4 chars/token otherwise)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncate text to at most max_tokens, keeping whole leading lines.
+
+    A marker line stating how many tokens were dropped is appended so the
+    LLM knows the section is incomplete.
+    """
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    marker_budget = count_tokens(TRUNCATION_MARKER.format(n=total))
+    budget = max_tokens - marker_budget
+    if budget <= 0:
+        return ""
+    kept: List[str] = []
+    used = 0
+    for line in text.split("\n"):
+        line_tokens = count_tokens(line + "\n")
+        if used + line_tokens > budget:
+            break
+        kept.append(line)
+        used += line_tokens
+
+    if not kept:
+        # Single oversized first line - cut it by characters proportionally
+        first = text.split("\n", 1)[0]
+        chars = max(1, int(len(first) * budget / max(1, count_tokens(first))))
+        while chars > 0 and count_tokens(first[:chars]) > budget:
+            chars = int(chars * 0.9)
+        if chars > 0:
+            kept.append(first[:chars])
+            used = count_tokens(first[:chars])
+
+    kept.append(TRUNCATION_MARKER.format(n=total - used))
+    return "\n".join(kept)
+
+
+def pack_passages(passages: List[str], max_tokens: int, separator: str = "\n\n") -> str:
+    """
+    Pack ranked passages into max_tokens.
+
+    Passages are taken in rank order and kept whole; the first passage that
+    does not fit is truncated if enough budget remains, and the rest dropped.
+    """
+    sep_tokens = count_tokens(separator)
+    packed: List[str] = []
+    used = 0
+    for passage in passages:
+        cost = count_tokens(passage) + (sep_tokens if packed else 0)
+        if used + cost <= max_tokens:
+            packed.append(passage)
+            used += cost
+            continue
+        remaining = max_tokens - used - (sep_tokens if packed else 0)
+        if remaining >= MIN_PARTIAL_PASSAGE_TOKENS:
+            packed.append(truncate_to_tokens(passage, remaining))
+        break
+    return separator.join(packed)
+
+
+@dataclass
+class PackedPrompt:
+    """Result of packing: fitted section texts plus token accounting."""
+    sections: Dict[str, str]
+    section_tokens: Dict[str, int]
+    original_tokens: Dict[str, int]
+    fixed_tokens: int
+    num_ctx: int
+    reserve_output: int
+    truncated: List[str] = field(default_factory=list)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.fixed_tokens + sum(self.section_tokens.values())
+
+    def stats(self) -> Dict[str, Union[int, bool, List[str], Dict[str, int]]]:
+        """Token counts for logging / response metadata."""
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "fixed_tokens": self.fixed_tokens,
+            "section_tokens": dict(self.section_tokens),
+            "original_tokens": dict(self.original_tokens),
+            "num_ctx": self.num_ctx,
+            "reserve_output": self.reserve_output,
+            "truncated_sections": list(self.truncated),
+            "tokenizer": "tiktoken" if TIKTOKEN_AVAILABLE else "heuristic",
+        }
+
+
+class ContextPacker:
+    """
+    Allocates a per-section token budget inside the LLM context window.
+
+    Budget available to sections = num_ctx - reserve_output - fixed tokens
+    (system prompt, template text, question). It is split by section weight;
+    sections that need less than their share release the surplus to the
+    others (water-filling), so nothing is truncated unless the total
+    actually exceeds the window.
+    """
+
+    def __init__(
+        self,
+        num_ctx: int = DEFAULT_NUM_CTX,
+        reserve_output: int = DEFAULT_RESERVE_OUTPUT,
+        weights: Optional[Dict[str, float]] = None
+    ):
+        self.num_ctx = num_ctx
+        self.reserve_output = reserve_output
+        self.weights = dict(weights or DEFAULT_SECTION_WEIGHTS)
+
+    def allocate(self, needs: Dict[str, int], available: int) -> Dict[str, int]:
+        """Split `available` tokens across sections given their needs."""
+        budgets = {name: 0 for name in needs}
+        pending = {name for name, need in needs.items() if need > 0}
+        remaining = max(0, available)
+
+        while pending and remaining > 0:
+            total_weight = sum(self.weights.get(name, 0.1) for name in pending)
+            satisfied = set()
+            for name in sorted(pending):
+                share = int(remaining * self.weights.get(name, 0.1) / total_weight)
+                if needs[name] - budgets[name] <= share:
+                    satisfied.add(name)
+
+            if satisfied:
+                # Fully serve the small sections, then re-split what is left
+                for name in satisfied:
+                    remaining -= needs[name] - budgets[name]
+                    budgets[name] = needs[name]
+                pending -= satisfied
+                continue
+
+            # Everyone needs more than their share - hand out shares and stop
+            for name in sorted(pending):
+                budgets[name] += int(remaining * self.weights.get(name, 0.1) / total_weight)
+            break
+
+        return budgets
+
+    def pack(
+        self,
+        sections: Dict[str, Union[str, List[str]]],
+        fixed_text: str = ""
+    ) -> PackedPrompt:
+        """
+        Fit sections into the context window.
+
+        Args:
+            sections: Section name -> text, or list of ranked passages
+            fixed_text: Everything else sent to the model (system prompt,
+                template scaffolding, question) - counted but never cut
+
+        Returns:
+            PackedPrompt with fitted section texts and token counts
+        """
+        fixed_tokens = count_tokens(fixed_text)
+        original: Dict[str, int] = {}
+        for name, content in sections.items():
+            if isinstance(content, list):
+                original[name] = count_tokens("\n\n".join(content))
+            else:
+                original[name] = count_tokens(content)
+
+        available = self.num_ctx - self.reserve_output - fixed_tokens
+        budgets = self.allocate(original, available)
+
+        packed: Dict[str, str] = {}
+        packed_tokens: Dict[str, int] = {}
+        truncated: List[str] = []
+        for name, content in sections.items():
+            if isinstance(content, list):
+                text = "\n\n".join(content)
+                if original[name] > budgets[name]:
+                    text = pack_passages(content, budgets[name])
+            else:
+                text = content
+                if original[name] > budgets[name]:
+                    text = truncate_to_tokens(content, budgets[name])
+            if original[name] > budgets[name]:
+                truncated.append(name)
+            packed[name] = text
+            packed_tokens[name] = count_tokens(text)
+
+        result = PackedPrompt(
+            sections=packed,
+            section_tokens=packed_tokens,
+            original_tokens=original,
+            fixed_tokens=fixed_tokens,
+            num_ctx=self.num_ctx,
+            reserve_output=self.reserve_output,
+            truncated=truncated
+        )
+        if truncated:
+            logger.info(f"Context packer truncated {truncated}: {original} -> {packed_tokens} "
+                        f"(num_ctx={self.num_ctx}, fixed={fixed_tokens})")
+        return result
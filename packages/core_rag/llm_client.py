@@ -1,6 +1,12 @@
 import os
+import time
 import httpx
-from typing import Dict, List, Any, Literal
+from typing import Dict, List, Any, Literal, Optional
+
+from packages.core_rag.context_packer import ContextPacker
+from packages.core_rag.llm_cache import LLM_CACHE_ENABLED, get_generation_cache, make_cache_key
+from packages.core_rag.llm_scheduler import LLMBusyError, get_llm_scheduler, resolve_priority
+from packages.core_rag.ollama_pool import RETRYABLE_ERRORS, get_ollama_pool, parse_endpoints
 
 # Role-specific system prompts
 ROLE_PROMPTS = {
@@ -28,53 +34,30 @@ Always cite your sources using [doc_id] notation."""
 UserRole = Literal["operator", "line_manager", "quality_manager", "plant_manager"]
 
 
-def get_ollama_client() -> httpx.Client:
-    """Get configured Ollama HTTP client"""
-    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+def get_ollama_client(base_url: Optional[str] = None) -> httpx.Client:
+    """Get Ollama HTTP client for one replica (default: first configured endpoint)"""
+    if base_url is None:
+        base_url = parse_endpoints(os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))[0]
     return httpx.Client(base_url=base_url, timeout=60.0)
 
 
-def generate_answer(
-    query: str,
-    context_passages: List[Dict[str, Any]],
-    role: UserRole = "operator",
-    temperature: float = 0.3
-) -> Dict[str, Any]:
-    """
-    Generate an answer using Ollama based on retrieved context.
-    
-    Args:
-        query: User's question
-        context_passages: List of retrieved passages with metadata
-        role: User role for context-aware prompting
-        temperature: LLM temperature (0.0-1.0)
-        
-    Returns:
-        Dict with 'answer' and 'model' keys
-    """
-    model = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
-    system_prompt = ROLE_PROMPTS.get(role, ROLE_PROMPTS["operator"])
-    
-    # Build context from passages
+def _build_context_blocks(context_passages: List[Dict[str, Any]]) -> List[str]:
+    """Format the top passages as '[doc_id] text' blocks"""
     context_blocks = []
-    for idx, passage in enumerate(context_passages[:5], 1):
+    for passage in context_passages[:5]:
         # Handle both old format (meta) and new format (metadata)
         meta = passage.get("metadata") or passage.get("meta", {})
         doc_id = meta.get("doc_id", "unknown")
         text = passage.get("text", "")
         context_blocks.append(f"[{doc_id}] {text}")
-    
-    context_text = "\n\n".join(context_blocks) if context_blocks else "No relevant context found."
-    
-    # Check if first passage is RUNTIME_CONTEXT (Phase A runtime injection)
-    has_runtime = (len(context_passages) > 0 and 
-                   context_passages[0].get("metadata", {}).get("doc_id") == "RUNTIME_CONTEXT")
-    
-    # Build prompt with guardrails
+    return context_blocks
+
+
+def _build_user_prompt(query: str, runtime_text: str, kb_text: str, has_runtime: bool) -> str:
+    """Assemble the user prompt with guardrails around the packed sections"""
     if has_runtime:
-        runtime_text = context_passages[0].get("text", "")
-        kb_context = "\n\n".join(context_blocks[1:]) if len(context_blocks) > 1 else "No additional documentation found."
-        user_prompt = f"""RUNTIME CONTEXT (Live Plant Data):
+        kb_context = kb_text or "No additional documentation found."
+        return f"""RUNTIME CONTEXT (Live Plant Data):
 
 {runtime_text}
 
@@ -91,60 +74,235 @@ IMPORTANT GUARDRAILS:
 - Reference sources using [doc_id] or [RUNTIME_CONTEXT] notation
 
 Answer based on both runtime data and knowledge base:"""
-    else:
-        user_prompt = f"""Context from knowledge base:
+    
+    context_text = kb_text or "No relevant context found."
+    return f"""Context from knowledge base:
 
 {context_text}
 
 Question: {query}
 
 Answer the question based on the context above. If the context doesn't contain enough information, say so clearly. Always reference the source documents using [doc_id] notation."""
+
+
+def _prepare_generation(
+    query: str,
+    context_passages: List[Dict[str, Any]],
+    role: UserRole,
+    temperature: float
+) -> Dict[str, Any]:
+    """Model, prompts, options and packing stats of one generate_answer call"""
+    model = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
+    system_prompt = ROLE_PROMPTS.get(role, ROLE_PROMPTS["operator"])
+    
+    # Build context from passages
+    context_blocks = _build_context_blocks(context_passages)
+    
+    # Check if first passage is RUNTIME_CONTEXT (Phase A runtime injection)
+    has_runtime = (len(context_passages) > 0 and 
+                   context_passages[0].get("metadata", {}).get("doc_id") == "RUNTIME_CONTEXT")
+    
+    # Fit runtime data and KB passages into the context window
+    packer = ContextPacker()
+    if has_runtime:
+        sections = {"runtime": context_passages[0].get("text", ""), "kb": context_blocks[1:]}
+    else:
+        sections = {"kb": context_blocks}
+    packed = packer.pack(
+        sections,
+        fixed_text=system_prompt + _build_user_prompt(query, "", "", has_runtime)
+    )
+    user_prompt = _build_user_prompt(
+        query,
+        packed.sections.get("runtime", ""),
+        packed.sections.get("kb", ""),
+        has_runtime
+    )
+    
+    prompt_stats = packed.stats()
+    print(f"[LLM] Prompt size: {len(user_prompt)} chars, ~{prompt_stats['prompt_tokens']} tokens "
+          f"(num_ctx={packer.num_ctx}, truncated={prompt_stats['truncated_sections']}), "
+          f"{len(context_passages)} passages, Model: {model}")
+    
+    options = {
+        "temperature": temperature,
+        "num_ctx": packer.num_ctx
+    }
+    return {
+        "model": model,
+        "system_prompt": system_prompt,
+        "user_prompt": user_prompt,
+        "options": options,
+        "prompt_stats": prompt_stats,
+        "cache_key": make_cache_key(model, system_prompt, user_prompt, options)
+    }
+
+
+def _cached_answer(prepared: Dict[str, Any], use_cache: bool) -> Optional[Dict[str, Any]]:
+    """Serve repeated identical prompts from the generation cache"""
+    cache = get_generation_cache()
+    if use_cache and LLM_CACHE_ENABLED:
+        cached = cache.get(prepared["cache_key"])
+        if cached is not None:
+            print(f"[LLM] Generation cache hit (hit_rate={cache.stats()['hit_rate']:.1%})")
+            return {**cached, "prompt_tokens": prepared["prompt_stats"], "cached": True}
+    elif LLM_CACHE_ENABLED:
+        cache.record_bypass()  # caller opted out of an enabled cache
+    return None
+
+
+def _generate_payload(prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "model": prepared["model"],
+        "prompt": prepared["user_prompt"],
+        "system": prepared["system_prompt"],
+        "stream": False,
+        "options": prepared["options"]
+    }
+
+
+def _answer_result(prepared: Dict[str, Any], data: Dict[str, Any], elapsed: float, use_cache: bool) -> Dict[str, Any]:
+    prompt_stats = prepared["prompt_stats"]
+    prompt_stats["prompt_eval_count"] = data.get("prompt_eval_count", 0)
+    
+    tokens = data.get("eval_count", 0)
+    print(f"[LLM] Response received in {elapsed:.1f}s ({tokens} tokens, {tokens/elapsed:.1f} tok/s)")
+    
+    result = {
+        "answer": data.get("response", "").strip(),
+        "model": prepared["model"],
+        "done": data.get("done", False)
+    }
+    if use_cache and LLM_CACHE_ENABLED and result["done"]:
+        get_generation_cache().put(prepared["cache_key"], result)
+    
+    return {**result, "prompt_tokens": prompt_stats, "cached": False}
+
+
+def _error_result(e: Exception, prompt_stats: Dict[str, Any]) -> Dict[str, Any]:
+    # Fallback if Ollama is not available
+    if os.getenv("ENABLE_CLOUD_FALLBACK", "false").lower() == "true":
+        return {
+            "answer": "Cloud fallback not yet implemented. Please ensure Ollama is running.",
+            "model": "fallback",
+            "error": str(e),
+            "prompt_tokens": prompt_stats
+        }
+    return {
+        "answer": f"Error connecting to Ollama: {str(e)}. Please ensure Ollama is running at {os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')}",
+        "model": "error",
+        "error": str(e),
+        "prompt_tokens": prompt_stats
+    }
+
+
+def generate_answer(
+    query: str,
+    context_passages: List[Dict[str, Any]],
+    role: UserRole = "operator",
+    temperature: float = 0.3,
+    use_cache: bool = True,
+    priority: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Generate an answer using Ollama based on retrieved context.
+    
+    Blocks the calling thread while waiting for a scheduler slot; async
+    code should use generate_answer_async instead.
+    
+    Args:
+        query: User's question
+        context_passages: List of retrieved passages with metadata
+        role: User role for context-aware prompting
+        temperature: LLM temperature (0.0-1.0)
+        use_cache: Serve identical prompts from the generation cache
+        priority: LLM scheduler priority class (default: derived from role)
+        
+    Returns:
+        Dict with 'answer', 'model', 'prompt_tokens' (packing stats) and
+        'cached' keys
+        
+    Raises:
+        LLMBusyError: LLM scheduler queue full or wait exceeded (429/503)
+    """
+    prepared = _prepare_generation(query, context_passages, role, temperature)
+    cached = _cached_answer(prepared, use_cache)
+    if cached is not None:
+        return cached
     
-    print(f"[LLM] Prompt size: {len(user_prompt)} chars, {len(context_passages)} passages, Model: {model}")
     print(f"[LLM] Sending request to Ollama...")
     
     try:
-        import time
         start_time = time.time()
         
-        client = get_ollama_client()
-        response = client.post(
-            "/api/generate",
-            json={
-                "model": model,
-                "prompt": user_prompt,
-                "system": system_prompt,
-                "temperature": temperature,
-                "stream": False
-            }
-        )
-        response.raise_for_status()
-        data = response.json()
+        pool = get_ollama_pool()
+        tried: List[str] = []
+        with get_llm_scheduler().slot(priority or resolve_priority(role, "ask", query)):
+            for attempt in range(pool.max_attempts):
+                try:
+                    # Sticky per role: same system prompt prefix -> reuse replica prompt cache
+                    with pool.lease(prepared["model"], session_key=f"ask:{role}", exclude=tried) as replica:
+                        tried.append(replica.url)
+                        response = get_ollama_client(replica.url).post(
+                            "/api/generate", json=_generate_payload(prepared)
+                        )
+                        response.raise_for_status()
+                    break
+                except RETRYABLE_ERRORS as e:
+                    if attempt + 1 >= pool.max_attempts:
+                        raise
+                    print(f"[LLM] Replica {tried[-1]} failed ({e}), retrying on another replica")
+        return _answer_result(prepared, response.json(), time.time() - start_time, use_cache)
         
-        elapsed = time.time() - start_time
-        tokens = data.get("eval_count", 0)
-        print(f"[LLM] Response received in {elapsed:.1f}s ({tokens} tokens, {tokens/elapsed:.1f} tok/s)")
+    except httpx.HTTPError as e:
+        return _error_result(e, prepared["prompt_stats"])
+
+
+async def generate_answer_async(
+    query: str,
+    context_passages: List[Dict[str, Any]],
+    role: UserRole = "operator",
+    temperature: float = 0.3,
+    use_cache: bool = True,
+    priority: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    generate_answer() for async callers: the scheduler slot is awaited on
+    the event loop (no worker thread parked in the queue) and Ollama is
+    called with an async client. Same arguments, result and LLMBusyError.
+    """
+    prepared = _prepare_generation(query, context_passages, role, temperature)
+    cached = _cached_answer(prepared, use_cache)
+    if cached is not None:
+        return cached
+    
+    print(f"[LLM] Sending request to Ollama...")
+    
+    try:
+        start_time = time.time()
         
-        return {
-            "answer": data.get("response", "").strip(),
-            "model": model,
-            "done": data.get("done", False)
-        }
+        pool = get_ollama_pool()
+        tried: List[str] = []
+        async with get_llm_scheduler().slot_async(priority or resolve_priority(role, "ask", query)), \
+                httpx.AsyncClient(timeout=60.0) as client:
+            for attempt in range(pool.max_attempts):
+                try:
+                    # Sticky per role: same system prompt prefix -> reuse replica prompt cache
+                    with pool.lease(prepared["model"], session_key=f"ask:{role}", exclude=tried) as replica:
+                        tried.append(replica.url)
+                        response = await client.post(
+                            f"{replica.url}/api/generate", json=_generate_payload(prepared)
+                        )
+                        response.raise_for_status()
+                    break
+                except RETRYABLE_ERRORS as e:
+                    if attempt + 1 >= pool.max_attempts:
+                        raise
+                    print(f"[LLM] Replica {tried[-1]} failed ({e}), retrying on another replica")
+        return _answer_result(prepared, response.json(), time.time() - start_time, use_cache)
         
     except httpx.HTTPError as e:
-        # Fallback if Ollama is not available
-        if os.getenv("ENABLE_CLOUD_FALLBACK", "false").lower() == "true":
-            return {
-                "answer": "Cloud fallback not yet implemented. Please ensure Ollama is running.",
-                "model": "fallback",
-                "error": str(e)
-            }
-        else:
-            return {
-                "answer": f"Error connecting to Ollama: {str(e)}. Please ensure Ollama is running at {os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')}",
-                "model": "error",
-                "error": str(e)
-            }
+        return _error_result(e, prepared["prompt_stats"])
 
 
 def generate_answer_streaming(
@@ -160,37 +318,30 @@ def generate_answer_streaming(
     model = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
     system_prompt = ROLE_PROMPTS.get(role, ROLE_PROMPTS["operator"])
     
-    # Build context from passages
-    context_blocks = []
-    for idx, passage in enumerate(context_passages[:5], 1):
-        # Handle both old format (meta) and new format (metadata)
-        meta = passage.get("metadata") or passage.get("meta", {})
-        doc_id = meta.get("doc_id", "unknown")
-        text = passage.get("text", "")
-        context_blocks.append(f"[{doc_id}] {text}")
-    
-    context_text = "\n\n".join(context_blocks) if context_blocks else "No relevant context found."
-    
-    # Build prompt
-    user_prompt = f"""Context from knowledge base:
-
-{context_text}
-
-Question: {query}
-
-Answer the question based on the context above. If the context doesn't contain enough information, say so clearly. Always reference the source documents using [doc_id] notation."""
+    # Build prompt from passages fitted into the context window
+    packer = ContextPacker()
+    packed = packer.pack(
+        {"kb": _build_context_blocks(context_passages)},
+        fixed_text=system_prompt + _build_user_prompt(query, "", "", False)
+    )
+    user_prompt = _build_user_prompt(query, "", packed.sections["kb"], False)
     
     try:
-        client = get_ollama_client()
-        with client.stream(
+        pool = get_ollama_pool()
+        with get_llm_scheduler().slot(resolve_priority(role, "ask", query)), \
+                pool.lease(model, session_key=f"ask:{role}") as replica, \
+                get_ollama_client(replica.url).stream(
             "POST",
             "/api/generate",
             json={
                 "model": model,
                 "prompt": user_prompt,
                 "system": system_prompt,
-                "temperature": temperature,
-                "stream": True
+                "stream": True,
+                "options": {
+                    "temperature": temperature,
+                    "num_ctx": packer.num_ctx
+                }
             }
         ) as response:
             response.raise_for_status()
@@ -201,26 +352,27 @@ Answer the question based on the context above. If the context doesn't contain e
                     if "response" in data:
                         yield data["response"]
                         
+    except LLMBusyError as e:
+        yield f"Error: {str(e)}. Retry in {e.retry_after}s."
     except httpx.HTTPError as e:
         yield f"Error: {str(e)}"
 
 
 def check_ollama_health() -> Dict[str, Any]:
-    """Check if Ollama is available and responsive"""
-    try:
-        client = get_ollama_client()
-        response = client.get("/api/tags")
-        response.raise_for_status()
-        models = response.json().get("models", [])
-        
-        return {
-            "available": True,
-            "models": [m.get("name") for m in models],
-            "configured_model": os.getenv("OLLAMA_MODEL", "llama3.2:latest")
-        }
-    except Exception as e:
-        return {
-            "available": False,
-            "error": str(e),
-            "configured_model": os.getenv("OLLAMA_MODEL", "llama3.2:latest")
-        }
+    """Check if Ollama replicas are available and responsive"""
+    pool = get_ollama_pool()
+    pool.probe_all()
+    pool_stats = pool.stats()
+    models = sorted({m for r in pool_stats["replicas"] if r["healthy"] for m in r["models"]})
+    health = {
+        "available": pool_stats["healthy"] > 0,
+        "models": models,
+        "configured_model": os.getenv("OLLAMA_MODEL", "llama3.2:latest"),
+        "replicas": pool_stats,
+        "generation_cache": get_generation_cache().stats()
+    }
+    if not health["available"]:
+        health["error"] = "; ".join(
+            f"{r['url']}: {r['last_error']}" for r in pool_stats["replicas"] if r["last_error"]
+        )
+    return health
@@ -0,0 +1,332 @@
+"""
+Priority-aware LLM request scheduler with backpressure.
+
+One Ollama instance serves operator Q&A, diagnostics and analysis screens.
+Every generation acquires a slot here first:
+- At most LLM_MAX_CONCURRENCY generations run at once (default
+  OLLAMA_NUM_PARALLEL x number of Ollama replicas)
+- Waiters are served by priority class, FIFO within a class
+- Each class has a queue-depth limit; a full queue is rejected immediately (429)
+- A waiter that cannot get a slot within its max wait is rejected (503)
+Both carry a Retry-After estimate. Queue wait times are tracked per class.
+
+Works for sync callers (blocking acquire) and async callers (awaitable acquire)
+in the same process.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+PRIORITY_CLASSES = ("critical", "high", "normal", "low")
+_RANK = {name: rank for rank, name in enumerate(PRIORITY_CLASSES)}
+
+ROLE_PRIORITY = {
+    "operator": "high",
+    "line_manager": "normal",
+    "quality_manager": "normal",
+    "plant_manager": "normal",
+}
+
+ENDPOINT_PRIORITY = {
+    "ask": "high",
+    "oee_query": "normal",
+    "diagnostics": "normal",
+    "analysis": "low",
+}
+
+# Operator questions about safety jump the queue
+SAFETY_PATTERN = re.compile(
+    r"\b(safety|unsafe|hazard|injur\w*|emergency|e-stop|lockout|loto|fire|spill|ppe)\b",
+    re.IGNORECASE
+)
+
+
+def _parse_limits(raw: str, default: int) -> Dict[str, int]:
+    limits = {name: default for name in PRIORITY_CLASSES}
+    for item in raw.split(","):
+        if ":" in item:
+            name, value = item.split(":", 1)
+            if name.strip() in limits:
+                limits[name.strip()] = int(value)
+    return limits
+
+
+# Default: Ollama's per-instance parallelism times the number of replicas
+_REPLICA_COUNT = len([u for u in os.getenv("OLLAMA_BASE_URL", "").split(",") if u.strip()]) or 1
+LLM_MAX_CONCURRENCY = int(os.getenv(
+    "LLM_MAX_CONCURRENCY",
+    str(int(os.getenv("OLLAMA_NUM_PARALLEL", "1")) * _REPLICA_COUNT)
+))
+LLM_QUEUE_LIMITS = _parse_limits(os.getenv("LLM_QUEUE_LIMITS", "critical:32,high:16,normal:8,low:4"), 8)
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "60"))
+
+
+class LLMBusyError(Exception):
+    """LLM capacity exhausted - surfaced to clients as 429/503 with Retry-After."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int, priority: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.priority = priority
+
+
+def resolve_priority(role: Optional[str] = None, endpoint: str = "ask", query: Optional[str] = None) -> str:
+    """
+    Map (role, endpoint) to a priority class.
+
+    The less urgent of the role and endpoint classes wins, so a background
+    analysis screen never outranks an operator. Operator safety questions
+    are always critical.
+    """
+    if role == "operator" and query and SAFETY_PATTERN.search(query):
+        return "critical"
+    endpoint_class = ENDPOINT_PRIORITY.get(endpoint, "normal")
+    role_class = ROLE_PRIORITY.get(role, endpoint_class) if role else endpoint_class
+    return PRIORITY_CLASSES[max(_RANK[endpoint_class], _RANK[role_class])]
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued_at", "granted", "cancelled", "event", "future", "loop")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.event: Optional[threading.Event] = None
+        self.future: Optional[asyncio.Future] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if self.future is not None and not self.future.done():
+            self.future.set_result(True)
+
+
+class _WaitStats:
+    """Rolling queue-wait statistics for one priority class."""
+
+    def __init__(self, window: int = 500):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    def record(self, wait_s: float) -> None:
+        self.samples.append(wait_s)
+        self.count += 1
+        self.total_s += wait_s
+        self.max_s = max(self.max_s, wait_s)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4)
+
+        return {
+            "granted": self.count,
+            "avg_wait_s": round(self.total_s / self.count, 4) if self.count else 0.0,
+            "p50_wait_s": pct(0.50),
+            "p95_wait_s": pct(0.95),
+            "max_wait_s": round(self.max_s, 4),
+            "rejected_queue_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+class LLMScheduler:
+    """Bounded-concurrency, priority-ordered admission for LLM generations."""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        queue_limits: Optional[Dict[str, int]] = None,
+        max_wait_s: float = LLM_QUEUE_TIMEOUT_S
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_limits = dict(queue_limits or LLM_QUEUE_LIMITS)
+        self.max_wait_s = max_wait_s
+        self._lock = threading.Lock()
+        self._active = 0
+        self._heap: List = []
+        self._seq = itertools.count()
+        self._depth = {name: 0 for name in PRIORITY_CLASSES}
+        self._stats = {name: _WaitStats() for name in PRIORITY_CLASSES}
+        self._service_ewma_s = 10.0
+
+    # ---------- admission ----------
+
+    def _enqueue_or_grant(self, waiter: _Waiter) -> bool:
+        """Grant immediately if a slot is free, else enqueue. Caller holds the lock."""
+        if self._active < self.max_concurrency and not self._heap:
+            self._active += 1
+            waiter.granted = True
+            self._stats[waiter.priority].record(0.0)
+            return True
+
+        if self._depth[waiter.priority] >= self.queue_limits.get(waiter.priority, 8):
+            self._stats[waiter.priority].rejected_full += 1
+            raise LLMBusyError(
+                f"LLM queue full for priority '{waiter.priority}'",
+                status_code=429,
+                retry_after=self._retry_after_locked(waiter.priority),
+                priority=waiter.priority
+            )
+
+        heapq.heappush(self._heap, (_RANK[waiter.priority], next(self._seq), waiter))
+        self._depth[waiter.priority] += 1
+        return False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Give up waiting. Returns True if the waiter was granted in the
+        meantime (the caller then owns a slot).
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._depth[waiter.priority] -= 1
+            self._stats[waiter.priority].rejected_timeout += 1
+            return False
+
+    def _timeout_error(self, waiter: _Waiter) -> LLMBusyError:
+        with self._lock:
+            retry_after = self._retry_after_locked(waiter.priority)
+        return LLMBusyError(
+            f"LLM busy: no slot within {self.max_wait_s:.0f}s for priority '{waiter.priority}'",
+            status_code=503,
+            retry_after=retry_after,
+            priority=waiter.priority
+        )
+
+    def acquire(self, priority: str = "normal", timeout: Optional[float] = None) -> float:
+        """Block until a slot is granted. Returns the queue wait in seconds."""
+        waiter = _Waiter(priority)
+        with self._lock:
+            if self._enqueue_or_grant(waiter):
+                return 0.0
+            waiter.event = threading.Event()
+
+        if not waiter.event.wait(self.max_wait_s if timeout is None else timeout):
+            if not self._abandon(waiter):
+                raise self._timeout_error(waiter)
+        return time.monotonic() - waiter.enqueued_at
+
+    async def acquire_async(self, priority: str = "normal", timeout: Optional[float] = None) -> float:
+        """Await a slot without blocking the event loop. Returns the queue wait in seconds."""
+        waiter = _Waiter(priority)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._enqueue_or_grant(waiter):
+                return 0.0
+            waiter.loop = loop
+            waiter.future = loop.create_future()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait_s if timeout is None else timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if not self._abandon(waiter):
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise self._timeout_error(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                self.release(0.0)
+                raise
+        return time.monotonic() - waiter.enqueued_at
+
+    def release(self, service_s: Optional[float] = None) -> None:
+        """Return a slot and hand it to the most urgent live waiter."""
+        with self._lock:
+            if service_s:
+                self._service_ewma_s = 0.8 * self._service_ewma_s + 0.2 * service_s
+            while self._heap:
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                self._depth[waiter.priority] -= 1
+                waiter.granted = True
+                self._stats[waiter.priority].record(time.monotonic() - waiter.enqueued_at)
+                waiter.wake()
+                return
+            self._active = max(0, self._active - 1)
+
+    @contextmanager
+    def slot(self, priority: str = "normal"):
+        """Sync context manager holding one generation slot."""
+        self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def slot_async(self, priority: str = "normal"):
+        """Async context manager holding one generation slot."""
+        await self.acquire_async(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    # ---------- metrics ----------
+
+    def _retry_after_locked(self, priority: str) -> int:
+        ahead = sum(d for name, d in self._depth.items() if _RANK[name] <= _RANK[priority])
+        estimate = (ahead + 1) * self._service_ewma_s / self.max_concurrency
+        return max(1, int(round(estimate)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "max_wait_s": self.max_wait_s,
+                "avg_service_s": round(self._service_ewma_s, 3),
+                "priorities": {
+                    name: {
+                        "queue_depth": self._depth[name],
+                        "queue_limit": self.queue_limits.get(name),
+                        **self._stats[name].snapshot()
+                    }
+                    for name in PRIORITY_CLASSES
+                }
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Get the process-wide LLM scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
@@ -0,0 +1,251 @@
+"""
+Load-balanced Ollama replica pool.
+
+OLLAMA_BASE_URL may list several Ollama endpoints (comma separated). Requests
+are routed to the healthy replica with the fewest outstanding requests that
+has the model loaded (per /api/tags). Replicas that fail are ejected and
+re-probed periodically in a background thread until they recover.
+
+Sessions can be kept sticky (same session key -> same replica) so Ollama's
+prompt cache is reused for repeated prefixes, as long as the sticky replica
+is not noticeably busier than the least loaded one.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+LLM_POOL_PROBE_INTERVAL_S = float(os.getenv("LLM_POOL_PROBE_INTERVAL_S", "15"))
+LLM_POOL_PROBE_TIMEOUT_S = float(os.getenv("LLM_POOL_PROBE_TIMEOUT_S", "2"))
+LLM_POOL_EJECT_AFTER = int(os.getenv("LLM_POOL_EJECT_AFTER", "1"))
+LLM_POOL_STICKY_SLACK = int(os.getenv("LLM_POOL_STICKY_SLACK", "1"))
+LLM_POOL_MAX_SESSIONS = 1024
+
+# The request never reached the replica: safe to retry on another one
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+# The replica is slow (long generation, queued model load), not broken: these
+# neither count towards ejection nor reset the failure count
+SLOW_ERRORS = (httpx.ReadTimeout, httpx.WriteTimeout, httpx.PoolTimeout)
+
+
+def parse_endpoints(raw: Optional[str]) -> List[str]:
+    """Split a comma separated endpoint list, dropping blanks and trailing slashes."""
+    urls = [u.strip().rstrip("/") for u in (raw or "").split(",") if u.strip()]
+    return urls or [DEFAULT_OLLAMA_URL]
+
+
+def _model_matches(model: str, available: Iterable[str]) -> bool:
+    wanted = model if ":" in model else f"{model}:latest"
+    return any(name == model or name == wanted for name in available)
+
+
+class Replica:
+    """One Ollama endpoint and its routing state."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.models: List[str] = []
+        self.consecutive_failures = 0
+        self.last_probe: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.requests = 0
+        self.failures = 0
+
+    def has_model(self, model: Optional[str]) -> bool:
+        # Unknown model list (never probed) is treated as available
+        if not model or not self.models:
+            return True
+        return _model_matches(model, self.models)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "models": list(self.models),
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_probe_age_s": round(time.monotonic() - self.last_probe, 1) if self.last_probe else None,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaPool:
+    """Least-outstanding-requests router over Ollama replicas."""
+
+    def __init__(
+        self,
+        urls: List[str],
+        probe_interval_s: float = LLM_POOL_PROBE_INTERVAL_S,
+        eject_after: int = LLM_POOL_EJECT_AFTER,
+        sticky_slack: int = LLM_POOL_STICKY_SLACK
+    ):
+        self.replicas = [Replica(url) for url in urls]
+        self.probe_interval_s = probe_interval_s
+        self.eject_after = max(1, eject_after)
+        self.sticky_slack = sticky_slack
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, str]" = OrderedDict()
+        self._prober: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ---------- routing ----------
+
+    def select(
+        self,
+        model: Optional[str] = None,
+        session_key: Optional[str] = None,
+        exclude: Iterable[str] = ()
+    ) -> Replica:
+        """Pick a replica: sticky if not overloaded, else least outstanding."""
+        excluded = set(exclude)
+        with self._lock:
+            pool = [r for r in self.replicas if r.url not in excluded] or list(self.replicas)
+            healthy = [r for r in pool if r.healthy]
+            with_model = [r for r in healthy if r.has_model(model)]
+            # Fall back to any healthy replica, then to ejected ones as a last resort
+            candidates = with_model or healthy or pool
+
+            least = min(candidates, key=lambda r: (r.outstanding, self.replicas.index(r)))
+            chosen = least
+            if session_key:
+                sticky_url = self._sessions.get(session_key)
+                sticky = next((r for r in candidates if r.url == sticky_url), None)
+                if sticky is not None and sticky.outstanding <= least.outstanding + self.sticky_slack:
+                    chosen = sticky
+                self._sessions[session_key] = chosen.url
+                self._sessions.move_to_end(session_key)
+                while len(self._sessions) > LLM_POOL_MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+
+            chosen.outstanding += 1
+            chosen.requests += 1
+            return chosen
+
+    def finish(self, replica: Replica, error: Optional[Exception] = None, counted: bool = True) -> None:
+        """Release a replica after a request; failures count towards ejection (unless not `counted`)."""
+        with self._lock:
+            replica.outstanding = max(0, replica.outstanding - 1)
+            if not counted:
+                return
+            if error is None:
+                replica.consecutive_failures = 0
+                return
+            replica.failures += 1
+            replica.consecutive_failures += 1
+            replica.last_error = str(error)
+            if replica.healthy and replica.consecutive_failures >= self.eject_after:
+                replica.healthy = False
+                logger.warning(f"Ejecting Ollama replica {replica.url}: {error}")
+
+    @contextmanager
+    def lease(self, model: Optional[str] = None, session_key: Optional[str] = None, exclude: Iterable[str] = ()):
+        """Hold a replica for one request. Transport errors (but not timeouts of a slow reply) and 5xx eject it."""
+        self._ensure_prober()
+        replica = self.select(model, session_key, exclude)
+        try:
+            yield replica
+        except SLOW_ERRORS:
+            self.finish(replica, counted=False)
+            raise
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            is_server_fault = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+            self.finish(replica, e if is_server_fault else None)
+            raise
+        except BaseException:
+            self.finish(replica)
+            raise
+        else:
+            self.finish(replica)
+
+    @property
+    def max_attempts(self) -> int:
+        """Try each replica at most once, capped at 2 attempts."""
+        return min(2, len(self.replicas))
+
+    # ---------- health probing ----------
+
+    def probe(self, replica: Replica) -> bool:
+        """Refresh a replica's health and model list from /api/tags."""
+        try:
+            response = httpx.get(f"{replica.url}/api/tags", timeout=LLM_POOL_PROBE_TIMEOUT_S)
+            response.raise_for_status()
+            models = [m.get("name") for m in response.json().get("models", []) if m.get("name")]
+        except Exception as e:
+            with self._lock:
+                replica.last_probe = time.monotonic()
+                replica.last_error = str(e)
+                if replica.healthy:
+                    replica.healthy = False
+                    logger.warning(f"Ollama replica {replica.url} failed health probe: {e}")
+            return False
+
+        with self._lock:
+            replica.last_probe = time.monotonic()
+            replica.models = models
+            replica.consecutive_failures = 0
+            if not replica.healthy:
+                logger.info(f"Ollama replica {replica.url} recovered")
+            replica.healthy = True
+            replica.last_error = None
+        return True
+
+    def probe_all(self) -> None:
+        for replica in list(self.replicas):
+            self.probe(replica)
+
+    def _probe_loop(self) -> None:
+        while not self._stop.wait(self.probe_interval_s):
+            self.probe_all()
+
+    def _ensure_prober(self) -> None:
+        if self._prober is not None or self.probe_interval_s <= 0:
+            return
+        with self._lock:
+            if self._prober is None:
+                self._prober = threading.Thread(target=self._probe_loop, name="ollama-pool-prober", daemon=True)
+                self._prober.start()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    # ---------- metrics ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "replicas": [r.to_dict() for r in self.replicas],
+                "healthy": sum(1 for r in self.replicas if r.healthy),
+                "total": len(self.replicas),
+                "sticky_sessions": len(self._sessions),
+            }
+
+
+_pools: Dict[str, OllamaPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_ollama_pool(urls: Optional[str] = None) -> OllamaPool:
+    """
+    Get the process-wide pool for an endpoint list.
+
+    Defaults to OLLAMA_BASE_URL; callers configured with the same list share
+    one pool (and so one view of replica load and health).
+    """
+    endpoints = parse_endpoints(urls if urls is not None else os.getenv("OLLAMA_BASE_URL", DEFAULT_OLLAMA_URL))
+    key = ",".join(endpoints)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = OllamaPool(endpoints)
+        return _pools[key]
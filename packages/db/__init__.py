@@ -0,0 +1,37 @@
+"""
+Database access
+Shared, pooled connections for the Shopfloor Copilot services.
+"""
+
+from .engines import (
+    get_engine, engine_pool_stats, dispose_engines, default_database_url, database_settings,
+    run_sql_script
+)
+from .async_pool import (
+    get_async_pool,
+    transaction,
+    fetch_all,
+    fetch_one,
+    fetch_val,
+    execute,
+    async_pool_stats,
+    close_async_pools
+)
+from .kpi_cache import (
+    get_kpi_cache,
+    cached_query,
+    cached_query_async,
+    ensure_kpi_cache_triggers,
+    start_kpi_cache_listener,
+    stop_kpi_cache_listener,
+    kpi_cache_stats
+)
+
+__all__ = [
+    'get_engine', 'engine_pool_stats', 'dispose_engines', 'default_database_url', 'database_settings',
+    'run_sql_script',
+    'get_async_pool', 'transaction', 'fetch_all', 'fetch_one', 'fetch_val', 'execute',
+    'async_pool_stats', 'close_async_pools',
+    'get_kpi_cache', 'cached_query', 'cached_query_async', 'ensure_kpi_cache_triggers',
+    'start_kpi_cache_listener', 'stop_kpi_cache_listener', 'kpi_cache_stats'
+]
@@ -0,0 +1,118 @@
+"""
+Process-wide SQLAlchemy engine registry.
+
+create_engine() builds a new connection pool every time it is called, so
+engines must be created once and shared. get_engine() returns one pooled
+engine per database URL for the lifetime of the process; pool statistics
+are exposed via engine_pool_stats() and all pools are closed on shutdown
+via dispose_engines().
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+# POSTGRES_* defaults; every database setting is derived from these
+DEFAULT_DATABASE = {"host": "localhost", "port": "5432", "dbname": "mes_db", "user": "mes_user", "password": "mes_pass"}
+_ENV_SUFFIXES = {"host": "HOST", "port": "PORT", "dbname": "DB", "user": "USER", "password": "PASSWORD"}
+
+
+def database_settings(prefix: str = "POSTGRES") -> Dict[str, str]:
+    """
+    host/port/dbname/user/password from {prefix}_HOST, _PORT, _DB, _USER and
+    _PASSWORD. Other prefixes (e.g. POSTGRES_REPLICA) default to the primary
+    POSTGRES_* settings.
+    """
+    base = DEFAULT_DATABASE if prefix == "POSTGRES" else database_settings()
+    return {key: os.getenv(f"{prefix}_{suffix}", base[key]) for key, suffix in _ENV_SUFFIXES.items()}
+
+
+def default_database_url() -> str:
+    """Primary MES database URL from POSTGRES_* environment variables."""
+    db = database_settings()
+    return f"postgresql+psycopg://{db['user']}:{db['password']}@{db['host']}:{db['port']}/{db['dbname']}"
+
+
+def _pool_options() -> Dict[str, Any]:
+    """Connection pooling configuration (shared by all registered engines)."""
+    return {
+        "pool_size": int(os.getenv("SQLALCHEMY_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", "20")),
+        "pool_recycle": int(os.getenv("SQLALCHEMY_POOL_RECYCLE", "3600")),
+        "pool_pre_ping": os.getenv("SQLALCHEMY_POOL_PRE_PING", "true").lower() == "true",
+        "pool_timeout": int(os.getenv("SQLALCHEMY_POOL_TIMEOUT", "30")),
+    }
+
+
+def _normalize_url(url: str) -> str:
+    # Plain postgresql:// URLs would select psycopg2; the app standardises on psycopg 3
+    if url.startswith("postgresql://"):
+        return "postgresql+psycopg://" + url[len("postgresql://"):]
+    return url
+
+
+def get_engine(url: Optional[str] = None) -> Engine:
+    """
+    Get the shared pooled engine for a database URL.
+
+    Args:
+        url: SQLAlchemy URL; defaults to the POSTGRES_* primary database
+
+    Returns:
+        Engine created once per URL and reused for the process lifetime
+    """
+    key = _normalize_url(url or default_database_url())
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(key, **_pool_options())
+            _engines[key] = engine
+            logger.info(f"Created pooled engine for {engine.url.render_as_string(hide_password=True)}")
+        return engine
+
+
+def run_sql_script(conn: Connection, script: str) -> None:
+    """
+    Run a multi-statement SQL script (e.g. sql/*.sql) on a SQLAlchemy connection.
+
+    Sent without parameters, so psycopg leaves `%I`/`%s`/`%L` inside format()
+    calls alone and uses the simple query protocol, which accepts several
+    statements in one call. exec_driver_sql(script) alone would pass an empty
+    parameter set and fail on those placeholders.
+    """
+    conn.execution_options(no_parameters=True).exec_driver_sql(script)
+
+
+def engine_pool_stats() -> Dict[str, Any]:
+    """Per-engine pool statistics (size, checked in/out, overflow)."""
+    stats = {}
+    for key, engine in list(_engines.items()):
+        pool = engine.pool
+        entry: Dict[str, Any] = {"status": pool.status()}
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            metric = getattr(pool, name, None)
+            if callable(metric):
+                entry[name] = metric()
+        stats[engine.url.render_as_string(hide_password=True)] = entry
+    return {"engines": len(stats), "pools": stats}
+
+
+def dispose_engines() -> None:
+    """Close every pooled connection; call on application shutdown."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+    logger.info("Disposed all database engines")
@@ -0,0 +1,357 @@
+"""
+KPI query result cache.
+
+KPI endpoints and dashboard screens recompute the same aggregates for every
+viewer, while the shift data behind them changes only every few minutes.
+Results are cached under a key built from the query text, its normalized
+parameters and the current time bucket (KPI_CACHE_BUCKET_S), so an entry
+never outlives its bucket.
+
+Writes to the source tables invalidate entries early: statement triggers
+(sql/kpi_cache_notify.sql) NOTIFY 'kpi_cache_invalidate' with the table name
+and a listener thread drops every entry that read that table. While the
+listener is disconnected, or the triggers could not be installed, entries
+are only bounded by their bucket; hits served in that state are counted as
+stale.
+
+    rows = cached_query(sql, params, lambda: run(sql, params))
+    data = await cached_query_async("oee.trend", params, compute, tables=("oee_line_shift",))
+
+Cached values are shared between callers and must be treated as read-only.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+KPI_CACHE_ENABLED = os.getenv("KPI_CACHE_ENABLED", "true").lower() in ("true", "1", "yes")
+KPI_CACHE_BUCKET_S = float(os.getenv("KPI_CACHE_BUCKET_S", "60"))
+KPI_CACHE_MAX_ENTRIES = int(os.getenv("KPI_CACHE_MAX_ENTRIES", "512"))
+KPI_CACHE_CHANNEL = "kpi_cache_invalidate"
+
+NOTIFY_SQL_PATH = Path(__file__).resolve().parents[2] / "sql" / "kpi_cache_notify.sql"
+
+# Tables with notify triggers, and the trigger-maintained tables derived from them
+WATCHED_TABLES = frozenset({
+    "oee_line_shift", "oee_station_shift", "oee_downtime_events",
+    "kpi_oee", "kpi_fpy", "kpi_mttr", "downtime_events"
+})
+DERIVED_TABLES = {
+    "oee_line_rollup": "oee_line_shift",
+    "oee_station_rollup": "oee_station_shift",
+    "oee_downtime_rollup": "oee_downtime_events",
+}
+
+_IDENTIFIER = re.compile(r"[a-z_][a-z0-9_]*")
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def make_query_key(query: str, params: Any = None) -> str:
+    """Stable hash of a query and its parameters (whitespace and None-valued filters ignored)."""
+    payload = json.dumps(
+        {"query": " ".join(query.split()), "params": _normalize(params)},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def tables_in(query: str) -> FrozenSet[str]:
+    """Watched source tables a SQL text reads, directly or through a rollup table."""
+    names = set(_IDENTIFIER.findall(query.lower()))
+    tables = {n for n in names if n in WATCHED_TABLES}
+    tables.update(src for derived, src in DERIVED_TABLES.items() if derived in names)
+    return frozenset(tables)
+
+
+class KPIQueryCache:
+    """Thread-safe, time-bucketed LRU cache of query results with invalidation by table."""
+
+    def __init__(self, bucket_s: float = KPI_CACHE_BUCKET_S, max_entries: int = KPI_CACHE_MAX_ENTRIES):
+        self.bucket_s = bucket_s
+        self.max_entries = max_entries
+        # key -> (bucket, computed_at, tables, value)
+        self._entries: "OrderedDict[str, Tuple[int, float, FrozenSet[str], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+        self.listener_connected = False
+        # Set by ensure_kpi_cache_triggers(); without the triggers nothing NOTIFYs
+        self.triggers_installed = False
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.invalidated_entries = 0
+        self.invalidations: Dict[str, int] = {}
+        self.last_invalidation: Optional[float] = None
+        self._hit_age_total = 0.0
+        self._hit_age_max = 0.0
+
+    def current_bucket(self) -> int:
+        return int(time.time() // self.bucket_s)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, value) for a key in the current time bucket."""
+        bucket = self.current_bucket()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != bucket:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            age = time.monotonic() - entry[1]
+            self.hits += 1
+            self._hit_age_total += age
+            self._hit_age_max = max(self._hit_age_max, age)
+            if not (self.listener_connected and self.triggers_installed):
+                self.stale_hits += 1
+            return True, entry[3]
+
+    def put(self, key: str, value: Any, tables: Iterable[str] = ()) -> None:
+        """Store a result for the current bucket, evicting least recently used entries."""
+        if self.max_entries <= 0:
+            return
+        bucket = self.current_bucket()
+        with self._lock:
+            self._entries[key] = (bucket, time.monotonic(), frozenset(tables), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table: str) -> int:
+        """Drop entries that read a table ('*' drops everything). Returns the number dropped."""
+        with self._lock:
+            if table == "*":
+                dropped = list(self._entries)
+            else:
+                # Entries with unknown dependencies are dropped on any write
+                dropped = [k for k, e in self._entries.items() if not e[2] or table in e[2]]
+            for key in dropped:
+                del self._entries[key]
+            self.invalidated_entries += len(dropped)
+            self.invalidations[table] = self.invalidations.get(table, 0) + 1
+            self.last_invalidation = time.time()
+            return len(dropped)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": KPI_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bucket_s": self.bucket_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "staleness": {
+                    "listener_connected": self.listener_connected,
+                    "triggers_installed": self.triggers_installed,
+                    "stale_hits": self.stale_hits,
+                    "avg_hit_age_s": round(self._hit_age_total / self.hits, 3) if self.hits else 0.0,
+                    "max_hit_age_s": round(self._hit_age_max, 3),
+                    "last_invalidation": self.last_invalidation,
+                },
+                "invalidations": dict(self.invalidations),
+                "invalidated_entries": self.invalidated_entries
+            }
+
+
+_cache: Optional[KPIQueryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_kpi_cache() -> KPIQueryCache:
+    """Get the process-wide KPI query cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = KPIQueryCache()
+    return _cache
+
+
+def cached_query(
+    query: str,
+    params: Any,
+    compute: Callable[[], Any],
+    tables: Optional[Iterable[str]] = None
+) -> Any:
+    """
+    Return the cached result of a query, computing and storing it on a miss.
+
+    Args:
+        query: SQL text, or a stable name for a composite computation
+        params: Parameters that determine the result (normalized into the key)
+        compute: Zero-argument callable producing the result
+        tables: Source tables the result depends on; defaults to those named in query
+    """
+    if not KPI_CACHE_ENABLED:
+        return compute()
+    cache = get_kpi_cache()
+    key = make_query_key(query, params)
+    hit, value = cache.get(key)
+    if hit:
+        return value
+    value = compute()
+    cache.put(key, value, tables_in(query) if tables is None else tables)
+    return value
+
+
+async def cached_query_async(
+    query: str,
+    params: Any,
+    compute: Callable[[], Awaitable[Any]],
+    tables: Optional[Iterable[str]] = None
+) -> Any:
+    """
+    Async cached_query. Concurrent misses for the same key share one computation.
+    """
+    if not KPI_CACHE_ENABLED:
+        return await compute()
+    cache = get_kpi_cache()
+    key = make_query_key(query, params)
+    hit, value = cache.get(key)
+    if hit:
+        return value
+    pending = cache._inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future = asyncio.get_running_loop().create_future()
+    cache._inflight[key] = future
+    try:
+        value = await compute()
+        cache.put(key, value, tables_in(query) if tables is None else tables)
+        future.set_result(value)
+        return value
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        cache._inflight.pop(key, None)
+
+
+# ==================== Invalidation ====================
+
+def ensure_kpi_cache_triggers(engine=None) -> bool:
+    """
+    Install the notify triggers (sql/kpi_cache_notify.sql) on the KPI source tables.
+
+    Returns:
+        True if the script ran; otherwise cached results are only bounded by
+        their bucket (reported as triggers_installed / stale_hits in the stats)
+    """
+    from .engines import get_engine, run_sql_script
+
+    engine = engine or get_engine()
+    cache = get_kpi_cache()
+    try:
+        with engine.begin() as conn:
+            run_sql_script(conn, NOTIFY_SQL_PATH.read_text())
+        cache.triggers_installed = True
+        return True
+    except Exception as e:
+        cache.triggers_installed = False
+        logger.error(f"Could not install KPI cache triggers: {e}")
+        return False
+
+
+def _listen_conninfo() -> str:
+    from .engines import default_database_url
+
+    # NOTIFY is not replicated, so listen on the primary that takes the writes
+    url = os.getenv("KPI_CACHE_LISTEN_URL") or default_database_url()
+    return url.replace("postgresql+psycopg://", "postgresql://", 1)
+
+
+class _InvalidationListener(threading.Thread):
+    """Daemon thread holding a LISTEN connection; reconnects with backoff."""
+
+    def __init__(self, conninfo: str, cache: KPIQueryCache):
+        super().__init__(name="kpi-cache-listener", daemon=True)
+        self.conninfo = conninfo
+        self.cache = cache
+        self.stop_event = threading.Event()
+
+    def run(self) -> None:
+        backoff = 1.0
+        while not self.stop_event.is_set():
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True, connect_timeout=5) as conn:
+                    conn.execute(f"LISTEN {KPI_CACHE_CHANNEL}")
+                    # Notifications may have been missed while disconnected
+                    self.cache.clear()
+                    self.cache.listener_connected = True
+                    backoff = 1.0
+                    logger.info("KPI cache listening for invalidations")
+                    while not self.stop_event.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            dropped = self.cache.invalidate(notify.payload or "*")
+                            logger.debug(f"KPI cache invalidated by {notify.payload}: {dropped} entries")
+            except Exception as e:
+                if self.stop_event.is_set():
+                    break
+                logger.warning(f"KPI cache listener disconnected, retrying in {backoff:.0f}s: {e}")
+            finally:
+                self.cache.listener_connected = False
+            self.stop_event.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+
+_listener: Optional[_InvalidationListener] = None
+
+
+def start_kpi_cache_listener(conninfo: Optional[str] = None) -> None:
+    """Start the invalidation listener thread (no-op if running or the cache is disabled)."""
+    global _listener
+    if not KPI_CACHE_ENABLED or (_listener is not None and _listener.is_alive()):
+        return
+    _listener = _InvalidationListener(conninfo or _listen_conninfo(), get_kpi_cache())
+    _listener.start()
+
+
+def stop_kpi_cache_listener(timeout: float = 5.0) -> None:
+    """Stop the invalidation listener thread."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop_event.set()
+    _listener.join(timeout)
+    _listener = None
+
+
+def kpi_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/staleness counters of the KPI query cache."""
+    return get_kpi_cache().stats()
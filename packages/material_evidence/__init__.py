@@ -14,6 +14,7 @@ In production, this would integrate with:
 For demo purposes, this reads from local PostgreSQL tables.
 """
 
+import asyncio
 import logging
 import os
 from dataclasses import dataclass
@@ -21,8 +22,50 @@ from typing import Optional, Dict, Any
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from packages.db import async_pool
+
 logger = logging.getLogger(__name__)
 
+# Evidence lookups, shared by the sync and async providers
+
+_SQL_MATERIAL_INSTANCE = """
+    SELECT 
+        id, mode, serial, lot, work_order, operation,
+        bom_revision, as_built_revision, quality_status
+    FROM material_instances
+    WHERE plant = %s AND line = %s AND station = %s
+      AND active = true
+    ORDER BY ts DESC
+    LIMIT 1
+"""
+
+_SQL_AUTHORIZATIONS = """
+    SELECT dry_run_authorization, deviation_id
+    FROM material_authorizations
+    WHERE station_id = %s
+      AND active = true
+    ORDER BY ts DESC
+    LIMIT 1
+"""
+
+_SQL_TOOLING_STATUS = """
+    SELECT calibration_ok, calibration_due_date
+    FROM tooling_status
+    WHERE station_id = %s
+      AND active = true
+    ORDER BY ts DESC
+    LIMIT 1
+"""
+
+_SQL_OPERATOR_CERTIFICATION = """
+    SELECT certified, operator_id
+    FROM operator_certifications
+    WHERE station_id = %s
+      AND active = true
+    ORDER BY ts DESC
+    LIMIT 1
+"""
+
 
 @dataclass
 class MaterialContext:
@@ -135,24 +178,7 @@ class MaterialEvidenceProvider:
             operator = self._get_operator_certification(cursor, station)
             
             # Combine into MaterialContext
-            context = MaterialContext(
-                mode=material.get('mode'),
-                active_serial=material.get('serial'),
-                active_lot=material.get('lot'),
-                work_order=material.get('work_order'),
-                operation=material.get('operation'),
-                bom_revision=material.get('bom_revision'),
-                as_built_revision=material.get('as_built_revision'),
-                quality_status=material.get('quality_status'),
-                deviation_id=auth.get('deviation_id'),
-                dry_run_authorization=auth.get('dry_run_authorization', False),
-                tooling_calibration_ok=tooling.get('calibration_ok', False),
-                operator_certified=operator.get('certified', False),
-                material_ref={
-                    "material_id": material.get('id'),
-                    "station_id": station
-                }
-            )
+            context = self._build_context(station, material, auth, tooling, operator)
             
             cursor.close()
             conn.close()
@@ -166,19 +192,66 @@ class MaterialEvidenceProvider:
             # Return empty context on error (demo-friendly)
             return MaterialContext()
     
+    @staticmethod
+    def _build_context(station: str, material: Dict, auth: Dict, tooling: Dict, operator: Dict) -> MaterialContext:
+        """Combine the evidence lookups into a MaterialContext"""
+        return MaterialContext(
+            mode=material.get('mode'),
+            active_serial=material.get('serial'),
+            active_lot=material.get('lot'),
+            work_order=material.get('work_order'),
+            operation=material.get('operation'),
+            bom_revision=material.get('bom_revision'),
+            as_built_revision=material.get('as_built_revision'),
+            quality_status=material.get('quality_status'),
+            deviation_id=auth.get('deviation_id'),
+            dry_run_authorization=auth.get('dry_run_authorization', False),
+            tooling_calibration_ok=tooling.get('calibration_ok', False),
+            operator_certified=operator.get('certified', False),
+            material_ref={
+                "material_id": material.get('id'),
+                "station_id": station
+            }
+        )
+    
+    async def get_material_context_async(
+        self,
+        plant: str,
+        line: str,
+        station: str
+    ) -> MaterialContext:
+        """
+        Async get_material_context for async handlers.
+        
+        The four evidence lookups run concurrently on pooled connections
+        instead of sequentially on a fresh connection.
+        """
+        async def lookup(query: str, params: tuple, what: str) -> Dict:
+            try:
+                return await async_pool.fetch_one(query, params, conninfo=self.connection_string) or {}
+            except Exception as e:
+                logger.debug(f"No {what} found: {e}")
+                return {}
+        
+        try:
+            material, auth, tooling, operator = await asyncio.gather(
+                lookup(_SQL_MATERIAL_INSTANCE, (plant, line, station), "material instance"),
+                lookup(_SQL_AUTHORIZATIONS, (station,), "authorizations"),
+                lookup(_SQL_TOOLING_STATUS, (station,), "tooling status"),
+                lookup(_SQL_OPERATOR_CERTIFICATION, (station,), "operator certification")
+            )
+            context = self._build_context(station, material, auth, tooling, operator)
+            logger.info(f"Material context retrieved for {station}: mode={context.mode}, serial={context.active_serial}")
+            return context
+        
+        except Exception as e:
+            logger.warning(f"Could not retrieve material context for {station}: {e}")
+            return MaterialContext()
+    
     def _get_material_instance(self, cursor, plant: str, line: str, station: str) -> Dict:
         """Query material_instances table"""
         try:
-            cursor.execute("""
-                SELECT 
-                    id, mode, serial, lot, work_order, operation,
-                    bom_revision, as_built_revision, quality_status
-                FROM material_instances
-                WHERE plant = %s AND line = %s AND station = %s
-                  AND active = true
-                ORDER BY ts DESC
-                LIMIT 1
-            """, (plant, line, station))
+            cursor.execute(_SQL_MATERIAL_INSTANCE, (plant, line, station))
             
             result = cursor.fetchone()
             return dict(result) if result else {}
@@ -189,14 +262,7 @@ class MaterialEvidenceProvider:
     def _get_authorizations(self, cursor, station: str) -> Dict:
         """Query material_authorizations table"""
         try:
-            cursor.execute("""
-                SELECT dry_run_authorization, deviation_id
-                FROM material_authorizations
-                WHERE station_id = %s
-                  AND active = true
-                ORDER BY ts DESC
-                LIMIT 1
-            """, (station,))
+            cursor.execute(_SQL_AUTHORIZATIONS, (station,))
             
             result = cursor.fetchone()
             return dict(result) if result else {}
@@ -207,14 +273,7 @@ class MaterialEvidenceProvider:
     def _get_tooling_status(self, cursor, station: str) -> Dict:
         """Query tooling_status table"""
         try:
-            cursor.execute("""
-                SELECT calibration_ok, calibration_due_date
-                FROM tooling_status
-                WHERE station_id = %s
-                  AND active = true
-                ORDER BY ts DESC
-                LIMIT 1
-            """, (station,))
+            cursor.execute(_SQL_TOOLING_STATUS, (station,))
             
             result = cursor.fetchone()
             return dict(result) if result else {}
@@ -225,14 +284,7 @@ class MaterialEvidenceProvider:
     def _get_operator_certification(self, cursor, station: str) -> Dict:
         """Query operator_certifications table"""
         try:
-            cursor.execute("""
-                SELECT certified, operator_id
-                FROM operator_certifications
-                WHERE station_id = %s
-                  AND active = true
-                ORDER BY ts DESC
-                LIMIT 1
-            """, (station,))
+            cursor.execute(_SQL_OPERATOR_CERTIFICATION, (station,))
             
             result = cursor.fetchone()
             return dict(result) if result else {}
@@ -267,3 +319,19 @@ def get_material_context(plant: str, line: str, station: str) -> MaterialContext
     """
     provider = get_material_evidence_provider()
     return provider.get_material_context(plant, line, station)
+
+
+async def get_material_context_async(plant: str, line: str, station: str) -> MaterialContext:
+    """
+    Async convenience function to get material context (non-blocking).
+    
+    Args:
+        plant: Plant identifier
+        line: Line identifier
+        station: Station identifier
+    
+    Returns:
+        MaterialContext with all available evidence
+    """
+    provider = get_material_evidence_provider()
+    return await provider.get_material_context_async(plant, line, station)
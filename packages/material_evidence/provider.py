@@ -4,6 +4,7 @@ from .provider import (
     MaterialContext,
     MaterialEvidenceProvider,
     get_material_context,
+    get_material_context_async,
     get_material_evidence_provider
 )
 
@@ -11,5 +12,6 @@ __all__ = [
     'MaterialContext',
     'MaterialEvidenceProvider',
     'get_material_context',
+    'get_material_context_async',
     'get_material_evidence_provider'
 ]
@@ -3,18 +3,14 @@ Import OEE CSV data into PostgreSQL
 """
 import os
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from packages.db import get_engine, ensure_kpi_cache_triggers
+from packages.tools.oee_rollups import rebuild_rollups
+from packages.tools.oee_sql_tool import TREND_INDEX_SQL
 
 def get_db_engine():
-    """Create SQLAlchemy engine for PostgreSQL"""
-    DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
-    DB_PORT = os.getenv("POSTGRES_PORT", "5432")
-    DB_NAME = os.getenv("POSTGRES_DB", "mes_db")
-    DB_USER = os.getenv("POSTGRES_USER", "mes_user")
-    DB_PASS = os.getenv("POSTGRES_PASSWORD", "mes_pass")
-    
-    connection_string = f"postgresql+psycopg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    return create_engine(connection_string)
+    """Shared pooled SQLAlchemy engine for PostgreSQL (created once per process)"""
+    return get_engine()
 
 def import_oee_data(dataset_name="shopfloor_oee_dataset", use_wide=True, use_year=False):
     """Import OEE CSV files into PostgreSQL"""
@@ -146,9 +142,15 @@ def import_oee_data(dataset_name="shopfloor_oee_dataset", use_wide=True, use_yea
     print("\n🔍 Creating indexes...")
     with engine.begin() as conn:
         conn.execute(text("CREATE INDEX idx_line_shift_date ON oee_line_shift(date, line_id, shift)"))
+        conn.execute(text(TREND_INDEX_SQL))
         conn.execute(text("CREATE INDEX idx_station_shift_date ON oee_station_shift(date, line_id, station_id)"))
         conn.execute(text("CREATE INDEX idx_downtime_date ON oee_downtime_events(date, line_id)"))
     
+    # 5. Rollups and KPI cache: tables were recreated, so reinstall the triggers and rebuild
+    print("\n📦 Rebuilding OEE rollups...")
+    rebuild_rollups(engine)
+    ensure_kpi_cache_triggers(engine)
+    
     print("\n✅ OEE data import completed successfully!")
     
     # Show summary
@@ -0,0 +1,57 @@
+"""
+OEE Rollups - installs and rebuilds the daily/weekly/monthly rollup tables
+
+The tables, refresh functions and maintenance triggers live in
+sql/oee_rollups.sql. Once installed, every insert/update/delete on
+oee_line_shift, oee_station_shift and oee_downtime_events refreshes the
+affected rollup buckets in the same transaction, so screens and routers can
+read oee_line_rollup / oee_station_rollup / oee_downtime_rollup directly.
+"""
+import logging
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from packages.db import get_engine, run_sql_script
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_SQL_PATH = Path(__file__).resolve().parents[2] / "sql" / "oee_rollups.sql"
+
+
+def ensure_rollups(engine: Optional[Engine] = None, rebuild_if_empty: bool = True) -> bool:
+    """
+    Install (or refresh) rollup tables, functions and triggers.
+
+    Idempotent and safe to call from several workers at once (the script
+    takes an advisory lock). Populates the rollups from the source tables
+    the first time they are installed.
+
+    Returns:
+        True if the rollups are installed
+    """
+    engine = engine or get_engine()
+    try:
+        with engine.begin() as conn:
+            run_sql_script(conn, ROLLUP_SQL_PATH.read_text())
+            if rebuild_if_empty:
+                empty = conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM oee_line_rollup)")).scalar()
+                has_source = conn.execute(text("SELECT to_regclass('oee_line_shift') IS NOT NULL")).scalar()
+                if empty and has_source:
+                    conn.execute(text("SELECT oee_rollup_rebuild()"))
+                    logger.info("Built OEE rollup tables from shift data")
+        return True
+    except Exception as e:
+        logger.error(f"Could not install OEE rollups: {e}")
+        return False
+
+
+def rebuild_rollups(engine: Optional[Engine] = None) -> None:
+    """Recompute all rollups from scratch (after bulk imports that recreate the source tables)."""
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        run_sql_script(conn, ROLLUP_SQL_PATH.read_text())
+        conn.execute(text("SELECT oee_rollup_rebuild()"))
+    logger.info("Rebuilt OEE rollup tables")
@@ -1,20 +1,154 @@
 """
 OEE SQL Tool - Allows LLM to query OEE data using natural language
 """
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from packages.db import get_engine
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 def get_db_engine():
-    """Create SQLAlchemy engine for PostgreSQL"""
-    DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
-    DB_PORT = os.getenv("POSTGRES_PORT", "5432")
-    DB_NAME = os.getenv("POSTGRES_DB", "mes_db")
-    DB_USER = os.getenv("POSTGRES_USER", "mes_user")
-    DB_PASS = os.getenv("POSTGRES_PASSWORD", "mes_pass")
+    """Shared pooled SQLAlchemy engine for PostgreSQL (created once per process)"""
+    return get_engine()
+
+# Covers the trend slice (line, most recent dates) so it is served from the index
+TREND_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_oee_line_shift_trend
+    ON oee_line_shift (line_id, date, shift)
+    INCLUDE (line_name, availability, performance, quality, oee, planned_time_min,
+             unplanned_downtime_min, total_units_produced, good_units, scrap_units,
+             main_loss_category)
+"""
+
+# One pass over oee_line_shift for any number of lines: the window CTE is
+# materialized once and feeds the trend rows, the loss Pareto and the summary.
+# The window is either the last :since_days calendar days or the most recent
+# :max_rows shift records per line (or both); NULL disables a bound.
+OEE_TREND_SQL = """
+    WITH windowed AS (
+        SELECT *
+        FROM (
+            SELECT
+                line_id, date, shift, line_name,
+                availability, performance, quality, oee,
+                planned_time_min, unplanned_downtime_min,
+                total_units_produced, good_units, scrap_units,
+                main_loss_category,
+                ROW_NUMBER() OVER (PARTITION BY line_id ORDER BY date DESC, shift) AS rn
+            FROM oee_line_shift
+            WHERE line_id = ANY(:line_ids)
+              AND (CAST(:shift AS text) IS NULL OR shift = CAST(:shift AS text))
+              AND (CAST(:since_days AS integer) IS NULL OR date >= CURRENT_DATE - CAST(:since_days AS integer))
+        ) s
+        WHERE CAST(:max_rows AS integer) IS NULL OR rn <= CAST(:max_rows AS integer)
+    ),
+    losses AS (
+        SELECT
+            line_id,
+            main_loss_category,
+            COUNT(*) AS occurrences,
+            SUM(unplanned_downtime_min) AS total_downtime_min,
+            AVG(oee) AS avg_oee,
+            ROW_NUMBER() OVER (
+                PARTITION BY line_id ORDER BY SUM(unplanned_downtime_min) DESC NULLS LAST
+            ) AS loss_rank
+        FROM windowed
+        GROUP BY line_id, main_loss_category
+    )
+    SELECT
+        w.line_id,
+        (ARRAY_AGG(w.line_name ORDER BY w.rn))[1] AS line_name,
+        COUNT(*) AS records,
+        AVG(w.oee) AS avg_oee,
+        AVG(w.availability) AS avg_availability,
+        AVG(w.performance) AS avg_performance,
+        AVG(w.quality) AS avg_quality,
+        SUM(w.unplanned_downtime_min) AS total_downtime_min,
+        JSON_AGG(JSON_BUILD_OBJECT(
+            'date', w.date, 'shift', w.shift, 'line_name', w.line_name,
+            'availability', w.availability, 'performance', w.performance,
+            'quality', w.quality, 'oee', w.oee,
+            'planned_time_min', w.planned_time_min,
+            'unplanned_downtime_min', w.unplanned_downtime_min,
+            'total_units_produced', w.total_units_produced,
+            'good_units', w.good_units, 'scrap_units', w.scrap_units,
+            'main_loss_category', w.main_loss_category
+        ) ORDER BY w.rn) AS trend,
+        (
+            SELECT JSON_AGG(JSON_BUILD_OBJECT(
+                'category', l.main_loss_category,
+                'occurrences', l.occurrences,
+                'total_downtime_min', l.total_downtime_min,
+                'avg_oee', l.avg_oee
+            ) ORDER BY l.loss_rank)
+            FROM losses l
+            WHERE l.line_id = w.line_id AND l.loss_rank <= :top_losses
+        ) AS top_losses
+    FROM windowed w
+    GROUP BY w.line_id
+"""
+
+
+def fetch_oee_trends(
+    conn,
+    line_ids: List[str],
+    shift: Optional[str] = None,
+    since_days: Optional[int] = None,
+    max_rows: Optional[int] = None,
+    top_losses: int = 5
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Trend rows, loss Pareto and summary statistics for several lines in one query.
+    
+    Args:
+        conn: SQLAlchemy connection
+        line_ids: Lines to fetch
+        shift: Optional shift filter ('M', 'A', 'N')
+        since_days: Only shifts from the last N calendar days
+        max_rows: Only the N most recent shift records per line
+        top_losses: Number of loss categories in the Pareto
+    
+    Returns:
+        {line_id: {line_name, records, summary, trend, top_losses}}; lines
+        without data are absent. Trend rows are most recent first.
+    """
+    result = conn.execute(text(OEE_TREND_SQL), {
+        "line_ids": list(line_ids),
+        "shift": shift,
+        "since_days": since_days,
+        "max_rows": max_rows,
+        "top_losses": top_losses
+    })
     
-    connection_string = f"postgresql+psycopg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    return create_engine(connection_string)
+    trends = {}
+    for row in result:
+        trends[row.line_id] = {
+            "line_name": row.line_name,
+            "records": int(row.records),
+            "summary": {
+                "avg_oee": float(row.avg_oee or 0),
+                "avg_availability": float(row.avg_availability or 0),
+                "avg_performance": float(row.avg_performance or 0),
+                "avg_quality": float(row.avg_quality or 0),
+                "total_downtime_min": float(row.total_downtime_min or 0)
+            },
+            "trend": row.trend,
+            "top_losses": row.top_losses or []
+        }
+    return trends
+
+
+def ensure_trend_index(engine=None) -> bool:
+    """Create the covering trend index if oee_line_shift exists. Returns True on success."""
+    engine = engine or get_db_engine()
+    try:
+        with engine.begin() as conn:
+            if conn.execute(text("SELECT to_regclass('oee_line_shift') IS NOT NULL")).scalar():
+                conn.execute(text(TREND_INDEX_SQL))
+        return True
+    except Exception as e:
+        print(f"Could not create OEE trend index: {e}")
+        return False
+
 
 def query_oee_trend(
     line_id: str,
@@ -34,98 +168,47 @@ def query_oee_trend(
     """
     engine = get_db_engine()
     
-    shift_filter = ""
-    if shift:
-        shift_filter = f"AND shift = '{shift}'"
-    
     with engine.begin() as conn:
-        # Get trend data
-        query = text(f"""
-            SELECT 
-                date,
-                shift,
-                line_name,
-                ROUND(availability::numeric, 3) as availability,
-                ROUND(performance::numeric, 3) as performance,
-                ROUND(quality::numeric, 3) as quality,
-                ROUND(oee::numeric, 3) as oee,
-                unplanned_downtime_min,
-                total_units_produced,
-                good_units,
-                scrap_units,
-                main_loss_category
-            FROM oee_line_shift
-            WHERE line_id = :line_id
-              AND date >= CURRENT_DATE - INTERVAL '{days} days'
-              {shift_filter}
-            ORDER BY date DESC, shift
-        """)
-        
-        result = conn.execute(query, {"line_id": line_id})
-        rows = result.fetchall()
-        
-        if not rows:
-            return {"error": f"No data found for line {line_id}"}
-        
-        # Get top losses
-        loss_query = text(f"""
-            SELECT 
-                main_loss_category,
-                COUNT(*) as occurrences,
-                ROUND(SUM(unplanned_downtime_min)::numeric, 1) as total_downtime_min
-            FROM oee_line_shift
-            WHERE line_id = :line_id
-              AND date >= CURRENT_DATE - INTERVAL '{days} days'
-              {shift_filter}
-            GROUP BY main_loss_category
-            ORDER BY total_downtime_min DESC
-            LIMIT 5
-        """)
-        
-        loss_result = conn.execute(loss_query, {"line_id": line_id})
-        losses = loss_result.fetchall()
-        
-        # Calculate averages
-        avg_oee = sum(float(r.oee) for r in rows) / len(rows)
-        avg_availability = sum(float(r.availability) for r in rows) / len(rows)
-        avg_performance = sum(float(r.performance) for r in rows) / len(rows)
-        avg_quality = sum(float(r.quality) for r in rows) / len(rows)
-        total_downtime = sum(float(r.unplanned_downtime_min) for r in rows)
-        
-        return {
-            "line_id": line_id,
-            "line_name": rows[0].line_name,
-            "period": f"Last {days} days",
-            "shift_filter": shift if shift else "All shifts",
-            "records": len(rows),
-            "averages": {
-                "oee": round(avg_oee, 3),
-                "availability": round(avg_availability, 3),
-                "performance": round(avg_performance, 3),
-                "quality": round(avg_quality, 3),
-                "total_downtime_min": round(total_downtime, 1)
-            },
-            "top_losses": [
-                {
-                    "category": r.main_loss_category,
-                    "occurrences": int(r.occurrences),
-                    "downtime_min": float(r.total_downtime_min)
-                }
-                for r in losses
-            ],
-            "recent_data": [
-                {
-                    "date": str(r.date),
-                    "shift": r.shift,
-                    "oee": float(r.oee),
-                    "availability": float(r.availability),
-                    "performance": float(r.performance),
-                    "quality": float(r.quality),
-                    "main_loss": r.main_loss_category
-                }
-                for r in rows[:7]  # Last 7 records
-            ]
-        }
+        data = fetch_oee_trends(conn, [line_id], shift=shift, since_days=days).get(line_id)
+    
+    if not data:
+        return {"error": f"No data found for line {line_id}"}
+    
+    summary = data["summary"]
+    return {
+        "line_id": line_id,
+        "line_name": data["line_name"],
+        "period": f"Last {days} days",
+        "shift_filter": shift if shift else "All shifts",
+        "records": data["records"],
+        "averages": {
+            "oee": round(summary["avg_oee"], 3),
+            "availability": round(summary["avg_availability"], 3),
+            "performance": round(summary["avg_performance"], 3),
+            "quality": round(summary["avg_quality"], 3),
+            "total_downtime_min": round(summary["total_downtime_min"], 1)
+        },
+        "top_losses": [
+            {
+                "category": l["category"],
+                "occurrences": int(l["occurrences"]),
+                "downtime_min": round(float(l["total_downtime_min"] or 0), 1)
+            }
+            for l in data["top_losses"]
+        ],
+        "recent_data": [
+            {
+                "date": r["date"],
+                "shift": r["shift"],
+                "oee": round(float(r["oee"] or 0), 3),
+                "availability": round(float(r["availability"] or 0), 3),
+                "performance": round(float(r["performance"] or 0), 3),
+                "quality": round(float(r["quality"] or 0), 3),
+                "main_loss": r["main_loss_category"]
+            }
+            for r in data["trend"][:7]  # Last 7 records
+        ]
+    }
 
 OEE_TOOL_DESCRIPTION = """
 Available tool: query_oee_trend(line_id, days=14, shift=None)
@@ -0,0 +1,82 @@
+"""
+OPC Semantic Client - per-station semantic signals from OPC Studio
+
+Fetches GET /semantic/signals?format=compact (station metadata and signal /
+KPI definitions listed once, values in columns) and expands it into one
+entry per station:
+
+    {"metadata": {"plant", "line_id", "station_id", "station_name"},
+     "signals": [verbose semantic signals], "kpis": [derived KPIs]}
+
+The last response is kept with its ETag, so repeated reads while the plant
+is unchanged cost a 304 with no body. Treat returned data as read-only.
+"""
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from packages.tools.opc_snapshot import DEFAULT_OPC_STUDIO_URL
+
+logger = logging.getLogger(__name__)
+
+STATION_FIELDS = ("plant", "line_id", "station_id", "station_name")
+SIGNAL_DEF_FIELDS = ("semantic_id", "unit", "source_node", "description", "data_type")
+SIGNAL_FIELDS = ("value", "loss_category", "quality")
+KPI_DEF_FIELDS = ("kpi_id", "unit", "target", "description", "formula", "window_s")
+
+# base URL -> (etag, expanded stations)
+_cache: Dict[str, Tuple[Optional[str], List[Dict[str, Any]]]] = {}
+
+
+def expand_compact(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per-station {"metadata", "signals", "kpis"} from a compact /semantic/signals payload"""
+    columns = payload["stations"]
+    stations = [
+        {"metadata": {field: columns[field][i] for field in STATION_FIELDS}, "signals": [], "kpis": []}
+        for i in range(len(columns["station_id"]))
+    ]
+    defs, signals = payload["signal_defs"], payload["signals"]
+    for j, (i, d) in enumerate(zip(signals["station"], signals["def"])):
+        signal = {field: defs[field][d] for field in SIGNAL_DEF_FIELDS}
+        signal.update({field: signals[field][j] for field in SIGNAL_FIELDS})
+        signal["timestamp"] = payload.get("computed_at")
+        signal["metadata"] = stations[i]["metadata"]
+        stations[i]["signals"].append(signal)
+    defs, kpis = payload["kpi_defs"], payload["kpis"]
+    for j, (i, d) in enumerate(zip(kpis["station"], kpis["def"])):
+        kpi = {field: defs[field][d] for field in KPI_DEF_FIELDS}
+        kpi["value"] = kpis["value"][j]
+        stations[i]["kpis"].append(kpi)
+    return stations
+
+
+async def fetch_semantic_stations(
+    opc_url: Optional[str] = None,
+    line_id: Optional[str] = None,
+    timeout: float = 10.0,
+) -> List[Dict[str, Any]]:
+    """
+    Semantic signals and KPIs of every station (optionally one line).
+
+    Args:
+        opc_url: OPC Studio base URL (default: OPC_STUDIO_URL)
+        line_id: Only stations of this line
+        timeout: Request timeout in seconds
+
+    Raises:
+        httpx.HTTPError: OPC Studio unreachable or returned an error
+    """
+    url = (opc_url or os.getenv("OPC_STUDIO_URL", DEFAULT_OPC_STUDIO_URL)).rstrip("/")
+    etag, stations = _cache.get(url, (None, []))
+    headers = {"If-None-Match": etag} if etag else {}
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        response = await client.get(f"{url}/semantic/signals", params={"format": "compact"}, headers=headers)
+    if response.status_code != 304:
+        response.raise_for_status()
+        stations = expand_compact(response.json())
+        _cache[url] = (response.headers.get("etag"), stations)
+    if line_id is not None:
+        return [st for st in stations if st["metadata"]["line_id"] == line_id]
+    return stations
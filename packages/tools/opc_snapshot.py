@@ -0,0 +1,128 @@
+"""
+OPC Snapshot Client - incremental polling of the OPC Studio plant snapshot
+
+OPC Studio versions its plant state. The first call fetches GET /snapshot;
+later calls ask GET /snapshot/delta?since=<version> for just the lines and
+stations that changed (with If-None-Match, a steady plant answers 304 with
+no body) and merge them into the cached copy. A restarted OPC Studio (new
+boot id) or an older one without the delta endpoint falls back to a full
+fetch.
+
+Merges are copy-on-write: a snapshot returned earlier is never modified, so
+callers can keep using it across awaits. Treat returned data as read-only.
+"""
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPC_STUDIO_URL = "http://opc-studio:8040"
+
+
+class SnapshotCache:
+    """Last known snapshot of one OPC Studio instance"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.etag: Optional[str] = None
+        self.delta_supported = True
+        self.stats = {"full": 0, "delta": 0, "not_modified": 0}
+
+    async def fetch(self, client: httpx.AsyncClient) -> Dict[str, Any]:
+        """Current snapshot ({"ok", "version", "boot", "data"}); raises on HTTP errors."""
+        current = self.snapshot
+        if current is None or current.get("version") is None or not self.delta_supported:
+            return await self._fetch_full(client)
+
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = await client.get(
+            f"{self.base_url}/snapshot/delta",
+            params={"since": current["version"], "boot": current.get("boot") or ""},
+            headers=headers,
+        )
+        if response.status_code == 404:
+            # OPC Studio without versioned snapshots
+            self.delta_supported = False
+            return await self._fetch_full(client)
+        if response.status_code == 304:
+            self.stats["not_modified"] += 1
+            return current
+        response.raise_for_status()
+        delta = response.json()
+
+        if delta.get("full"):
+            snapshot = {key: delta[key] for key in ("ok", "version", "boot", "data")}
+            self.stats["full"] += 1
+        else:
+            snapshot = {**current, "version": delta["version"], "data": _merge(current["data"], delta["lines"])}
+            self.stats["delta"] += 1
+        self._store(snapshot, response)
+        return snapshot
+
+    async def _fetch_full(self, client: httpx.AsyncClient) -> Dict[str, Any]:
+        headers = {"If-None-Match": self.etag} if self.etag and self.snapshot else {}
+        response = await client.get(f"{self.base_url}/snapshot", headers=headers)
+        if response.status_code == 304:
+            self.stats["not_modified"] += 1
+            return self.snapshot
+        response.raise_for_status()
+        snapshot = response.json()
+        self.stats["full"] += 1
+        self._store(snapshot, response)
+        return snapshot
+
+    def _store(self, snapshot: Dict[str, Any], response: httpx.Response) -> None:
+        # Concurrent fetches may finish out of order; keep the newest
+        if (
+            self.snapshot is not None
+            and self.snapshot.get("boot") == snapshot.get("boot")
+            and (self.snapshot.get("version") or 0) > (snapshot.get("version") or 0)
+        ):
+            return
+        self.snapshot = snapshot
+        self.etag = response.headers.get("etag")
+
+
+def _merge(data: Dict[str, Any], changed_lines: Dict[str, Any]) -> Dict[str, Any]:
+    """New data tree with the changed lines/stations applied (inputs untouched)."""
+    lines = dict(data.get("lines", {}))
+    for line_id, changes in changed_lines.items():
+        line = dict(lines.get(line_id, {}))
+        stations = changes.get("stations")
+        line.update({k: v for k, v in changes.items() if k != "stations"})
+        if stations:
+            line["stations"] = {**line.get("stations", {}), **stations}
+        lines[line_id] = line
+    return {**data, "lines": lines}
+
+
+_caches: Dict[str, SnapshotCache] = {}
+
+
+def get_snapshot_cache(opc_url: Optional[str] = None) -> SnapshotCache:
+    url = opc_url or os.getenv("OPC_STUDIO_URL", DEFAULT_OPC_STUDIO_URL)
+    if url not in _caches:
+        _caches[url] = SnapshotCache(url)
+    return _caches[url]
+
+
+async def fetch_plant_snapshot(opc_url: Optional[str] = None, timeout: float = 2.0) -> Dict[str, Any]:
+    """
+    Current OPC Studio snapshot, fetched incrementally.
+
+    Args:
+        opc_url: OPC Studio base URL (default: OPC_STUDIO_URL)
+        timeout: Request timeout in seconds
+
+    Returns:
+        {"ok": True, "version": ..., "boot": ..., "data": {...}} (same shape as GET /snapshot)
+
+    Raises:
+        httpx.HTTPError: OPC Studio unreachable or returned an error
+    """
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        return await get_snapshot_cache(opc_url).fetch(client)
@@ -0,0 +1,102 @@
+"""
+OPC Stream Client - live changes pushed by OPC Studio
+
+Replaces polling loops with one long-lived Server-Sent Events connection to
+GET /stream/sse. The first message is a snapshot (filtered to the requested
+lines/stations); after that only changes arrive:
+
+    {"type": "snapshot", "version", "boot", "values_version", "data": {...}, "stations": [...]}
+    {"type": "state", "version", "boot", "lines": {...}}        # merge into data
+    {"type": "signals", "version", "boot", "values_version", "stations": [...]}
+                        # changed semantic signals / KPIs (also on history ticks)
+    {"type": "event", "line", "station", "event_type", "payload"}
+    {"type": "heartbeat", ...}
+
+Dropped connections are re-established with Last-Event-ID, so OPC Studio
+resumes from the last version seen (or sends a new snapshot after a restart).
+Use apply_state() to keep a snapshot current.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+import httpx
+
+from packages.tools.opc_snapshot import DEFAULT_OPC_STUDIO_URL, _merge
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_MAX_S = 30.0
+
+
+def _ids(value: Optional[Iterable[str] | str]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return ",".join(value)
+
+
+async def stream_plant_changes(
+    opc_url: Optional[str] = None,
+    lines: Optional[Iterable[str] | str] = None,
+    stations: Optional[Iterable[str] | str] = None,
+    topics: Optional[Iterable[str] | str] = None,
+    heartbeats: bool = False
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Live OPC Studio messages; reconnects until the consumer stops iterating.
+
+    Args:
+        opc_url: OPC Studio base URL (default: OPC_STUDIO_URL)
+        lines: Only these lines (ids or comma-separated string)
+        stations: Only these stations
+        topics: Subset of "state", "signals", "events" (default: all)
+        heartbeats: Also yield heartbeat messages
+    """
+    base_url = (opc_url or os.getenv("OPC_STUDIO_URL", DEFAULT_OPC_STUDIO_URL)).rstrip("/")
+    params = {k: v for k, v in {"line": _ids(lines), "station": _ids(stations), "topics": _ids(topics)}.items() if v}
+    last_event_id = None
+    delay = 1.0
+    # No read timeout: heartbeats keep the connection alive
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:
+        while True:
+            headers = {"Accept": "text/event-stream"}
+            if last_event_id:
+                headers["Last-Event-ID"] = last_event_id
+            try:
+                async with client.stream("GET", f"{base_url}/stream/sse", params=params, headers=headers) as response:
+                    response.raise_for_status()
+                    delay = 1.0
+                    data = []
+                    async for line in response.aiter_lines():
+                        if line.startswith("id:"):
+                            last_event_id = line[3:].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[5:].strip())
+                        elif not line and data:
+                            message = json.loads("\n".join(data))
+                            data = []
+                            if message.get("type") != "heartbeat" or heartbeats:
+                                yield message
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code in (400, 404):
+                    # Bad filter, or an OPC Studio without the stream
+                    raise
+                logger.warning("OPC Studio stream error %s; reconnecting in %.0fs", e.response.status_code, delay)
+            except httpx.HTTPError as e:
+                logger.warning("OPC Studio stream disconnected (%s); reconnecting in %.0fs", e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_S)
+
+
+def apply_state(snapshot: Optional[Dict[str, Any]], message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Snapshot ({"version", "boot", "data"}) updated with a stream message.
+    Copy-on-write like SnapshotCache: the given snapshot is not modified.
+    """
+    if message.get("type") == "snapshot":
+        return {key: message[key] for key in ("version", "boot", "data")}
+    if message.get("type") == "state" and snapshot is not None:
+        return {**snapshot, "version": message["version"], "data": _merge(snapshot["data"], message["lines"])}
+    return snapshot
@@ -1,42 +1,196 @@
 """
 SQL KPI Tool - Read-only whitelisted queries for MES data
 Provides safe access to production KPIs: OEE, FPY, MTTR, downtime analysis
+
+Queries run on pooled connections to the POSTGRES_REPLICA_* target, as
+prepared statements. If the replica is unreachable, queries fail over to the
+primary (POSTGRES_*) and the replica is retried after KPI_REPLICA_RETRY_S.
+Results are served from the shared KPI query cache (packages.db.kpi_cache).
 """
 
+import asyncio
+import logging
 import os
-from typing import Dict, List, Any, Optional
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import psycopg
+from psycopg.conninfo import make_conninfo
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+from packages.db import async_pool, cached_query, cached_query_async, database_settings
+
+logger = logging.getLogger(__name__)
+
+Query = Tuple[str, List[Any]]
+
+KPI_POOL_MIN_SIZE = int(os.getenv("KPI_POOL_MIN_SIZE", "1"))
+KPI_POOL_MAX_SIZE = int(os.getenv("KPI_POOL_MAX_SIZE", "5"))
+KPI_POOL_TIMEOUT_S = float(os.getenv("KPI_POOL_TIMEOUT_S", "5"))
+KPI_REPLICA_RETRY_S = float(os.getenv("KPI_REPLICA_RETRY_S", "30"))
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_failover = {"replica_down_until": 0.0, "failovers": 0, "served": {"replica": 0, "primary": 0}}
+
+
+def kpi_conninfo() -> str:
+    """Connection string for the read-only KPI replica (POSTGRES_REPLICA_*, defaulting to the primary)"""
+    return make_conninfo(**database_settings("POSTGRES_REPLICA"))
+
+
+def primary_conninfo() -> str:
+    """Connection string for the primary database (failover target), as default_database_url()"""
+    return make_conninfo(**database_settings())
+
+
+def _kpi_targets() -> List[Tuple[str, str]]:
+    """(name, conninfo) in the order to try: replica first unless it is marked down."""
+    replica = ("replica", kpi_conninfo())
+    primary = ("primary", primary_conninfo())
+    if replica[1] == primary[1]:
+        return [replica]
+    if time.monotonic() < _failover["replica_down_until"]:
+        return [primary, replica]
+    return [replica, primary]
+
+
+def _is_connection_failure(e: Exception) -> bool:
+    # Statement timeouts are OperationalErrors too, but failing over would not help
+    return isinstance(e, psycopg.OperationalError) and not isinstance(e, psycopg.errors.QueryCanceled)
+
+
+def _record_result(target: str, error: Optional[Exception] = None) -> None:
+    if error is None:
+        _failover["served"][target] += 1
+        if target == "replica":
+            _failover["replica_down_until"] = 0.0
+        return
+    if target == "replica":
+        _failover["replica_down_until"] = time.monotonic() + KPI_REPLICA_RETRY_S
+        _failover["failovers"] += 1
+        logger.warning(f"KPI replica unavailable, failing over to primary for {KPI_REPLICA_RETRY_S:.0f}s: {error}")
+
+
+def _get_kpi_pool(conninfo: str) -> ConnectionPool:
+    pool = _pools.get(conninfo)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(conninfo)
+        if pool is None:
+            pool = ConnectionPool(
+                conninfo,
+                min_size=KPI_POOL_MIN_SIZE,
+                max_size=KPI_POOL_MAX_SIZE,
+                timeout=KPI_POOL_TIMEOUT_S,
+                kwargs={
+                    "autocommit": True,
+                    "row_factory": dict_row,
+                    "options": f"-c statement_timeout={async_pool.DB_STATEMENT_TIMEOUT_MS}",
+                },
+                name=f"kpi-pool-{len(_pools) + 1}",
+                open=True,
+            )
+            _pools[conninfo] = pool
+        return pool
+
 
 def get_kpi_connection():
-    """Get read-only connection to PostgreSQL KPI database"""
-    host = os.getenv("POSTGRES_REPLICA_HOST", "postgres")
-    port = os.getenv("POSTGRES_REPLICA_PORT", "5432")
-    db = os.getenv("POSTGRES_REPLICA_DB", "ragdb")
-    user = os.getenv("POSTGRES_REPLICA_USER", "postgres")
-    password = os.getenv("POSTGRES_REPLICA_PASSWORD", "postgres")
-    
-    return psycopg.connect(
-        f"host={host} port={port} dbname={db} user={user} password={password}",
-        row_factory=dict_row
-    )
+    """Borrow a pooled read-only connection to the KPI database (use as a context manager)"""
+    _, conninfo = _kpi_targets()[0]
+    return _get_kpi_pool(conninfo).connection()
 
 
-def get_oee_metrics(
-    line: Optional[str] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None
-) -> List[Dict[str, Any]]:
-    """
-    Get OEE (Overall Equipment Effectiveness) metrics.
-    OEE = Availability × Performance × Quality
-    
-    Args:
-        line: Production line filter (e.g., "A01")
-        start_date: Start date (ISO format)
-        end_date: End date (ISO format)
-    """
+def _execute_sync(conninfo: str, sql: str, params: List[Any]) -> List[Dict[str, Any]]:
+    with _get_kpi_pool(conninfo).connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params, prepare=True)
+            return cur.fetchall()
+
+
+async def _execute_async(conninfo: str, sql: str, params: List[Any]) -> List[Dict[str, Any]]:
+    return await async_pool.fetch_all(sql, params, conninfo=conninfo, prepare=True)
+
+
+def _run_query(query: Query) -> List[Dict[str, Any]]:
+    return cached_query(query[0], query[1], lambda: _query_with_failover(query))
+
+
+async def _run_query_async(query: Query) -> List[Dict[str, Any]]:
+    return await cached_query_async(query[0], query[1], lambda: _query_with_failover_async(query))
+
+
+def _query_with_failover(query: Query) -> List[Dict[str, Any]]:
+    sql, params = query
+    targets = _kpi_targets()
+    for i, (target, conninfo) in enumerate(targets):
+        try:
+            rows = _execute_sync(conninfo, sql, params)
+        except Exception as e:
+            if not _is_connection_failure(e) or i == len(targets) - 1:
+                raise
+            _record_result(target, e)
+            continue
+        _record_result(target)
+        return rows
+    return []
+
+
+async def _query_with_failover_async(query: Query) -> List[Dict[str, Any]]:
+    sql, params = query
+    targets = _kpi_targets()
+    for i, (target, conninfo) in enumerate(targets):
+        try:
+            rows = await _execute_async(conninfo, sql, params)
+        except Exception as e:
+            if not _is_connection_failure(e) or i == len(targets) - 1:
+                raise
+            _record_result(target, e)
+            continue
+        _record_result(target)
+        return rows
+    return []
+
+
+def kpi_pool_stats() -> Dict[str, Any]:
+    """Replica/primary routing state and sync pool statistics"""
+    down_for = _failover["replica_down_until"] - time.monotonic()
+    return {
+        "replica_available": down_for <= 0,
+        "replica_retry_in_s": round(max(0.0, down_for), 1),
+        "failovers": _failover["failovers"],
+        "served": dict(_failover["served"]),
+        "pools": {pool.name: pool.get_stats() for pool in list(_pools.values())},
+    }
+
+
+def close_kpi_pools() -> None:
+    """Close the sync KPI pools; call on application shutdown"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def _date_filters(query: str, line: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> Query:
+    params = []
+    if line:
+        query += " AND line = %s"
+        params.append(line)
+    if start_date:
+        query += " AND shift_date >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND shift_date <= %s"
+        params.append(end_date)
+    query += " ORDER BY shift_date DESC, shift LIMIT 100"
+    return query, params
+
+
+def _oee_query(line: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> Query:
     query = """
         SELECT 
             line,
@@ -54,40 +208,36 @@ def get_oee_metrics(
         FROM kpi_oee
         WHERE 1=1
     """
-    
-    params = []
-    if line:
-        query += " AND line = %s"
-        params.append(line)
-    if start_date:
-        query += " AND shift_date >= %s"
-        params.append(start_date)
-    if end_date:
-        query += " AND shift_date <= %s"
-        params.append(end_date)
-    
-    query += " ORDER BY shift_date DESC, shift LIMIT 100"
-    
-    with get_kpi_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            return cur.fetchall()
+    return _date_filters(query, line, start_date, end_date)
 
 
-def get_fpy_metrics(
+def get_oee_metrics(
     line: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
-    Get FPY (First Pass Yield) metrics.
-    FPY = Good Units / Total Units (first time through)
+    Get OEE (Overall Equipment Effectiveness) metrics.
+    OEE = Availability × Performance × Quality
     
     Args:
-        line: Production line filter
+        line: Production line filter (e.g., "A01")
         start_date: Start date (ISO format)
         end_date: End date (ISO format)
     """
+    return _run_query(_oee_query(line, start_date, end_date))
+
+
+async def get_oee_metrics_async(
+    line: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Async get_oee_metrics on the shared connection pool"""
+    return await _run_query_async(_oee_query(line, start_date, end_date))
+
+
+def _fpy_query(line: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> Query:
     query = """
         SELECT 
             line,
@@ -102,40 +252,36 @@ def get_fpy_metrics(
         FROM kpi_fpy
         WHERE 1=1
     """
-    
-    params = []
-    if line:
-        query += " AND line = %s"
-        params.append(line)
-    if start_date:
-        query += " AND shift_date >= %s"
-        params.append(start_date)
-    if end_date:
-        query += " AND shift_date <= %s"
-        params.append(end_date)
-    
-    query += " ORDER BY shift_date DESC, shift LIMIT 100"
-    
-    with get_kpi_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            return cur.fetchall()
+    return _date_filters(query, line, start_date, end_date)
 
 
-def get_mttr_metrics(
+def get_fpy_metrics(
     line: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
-    Get MTTR (Mean Time To Repair) metrics.
-    MTTR = Total Downtime / Number of Failures
+    Get FPY (First Pass Yield) metrics.
+    FPY = Good Units / Total Units (first time through)
     
     Args:
         line: Production line filter
         start_date: Start date (ISO format)
         end_date: End date (ISO format)
     """
+    return _run_query(_fpy_query(line, start_date, end_date))
+
+
+async def get_fpy_metrics_async(
+    line: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Async get_fpy_metrics on the shared connection pool"""
+    return await _run_query_async(_fpy_query(line, start_date, end_date))
+
+
+def _mttr_query(line: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> Query:
     query = """
         SELECT 
             line,
@@ -149,39 +295,36 @@ def get_mttr_metrics(
         FROM kpi_mttr
         WHERE 1=1
     """
-    
-    params = []
-    if line:
-        query += " AND line = %s"
-        params.append(line)
-    if start_date:
-        query += " AND shift_date >= %s"
-        params.append(start_date)
-    if end_date:
-        query += " AND shift_date <= %s"
-        params.append(end_date)
-    
-    query += " ORDER BY shift_date DESC, shift LIMIT 100"
-    
-    with get_kpi_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            return cur.fetchall()
+    return _date_filters(query, line, start_date, end_date)
 
 
-def get_downtime_events(
+def get_mttr_metrics(
     line: Optional[str] = None,
     start_date: Optional[str] = None,
-    limit: int = 50
+    end_date: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
-    Get recent downtime events with reasons.
+    Get MTTR (Mean Time To Repair) metrics.
+    MTTR = Total Downtime / Number of Failures
     
     Args:
         line: Production line filter
         start_date: Start date (ISO format)
-        limit: Maximum number of events to return
+        end_date: End date (ISO format)
     """
+    return _run_query(_mttr_query(line, start_date, end_date))
+
+
+async def get_mttr_metrics_async(
+    line: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Async get_mttr_metrics on the shared connection pool"""
+    return await _run_query_async(_mttr_query(line, start_date, end_date))
+
+
+def _downtime_query(line: Optional[str], start_date: Optional[str], limit: int) -> Query:
     query = """
         SELECT 
             id,
@@ -205,12 +348,34 @@ def get_downtime_events(
         query += " AND event_start >= %s"
         params.append(start_date)
     
-    query += f" ORDER BY event_start DESC LIMIT {min(limit, 200)}"
+    query += " ORDER BY event_start DESC LIMIT %s"
+    params.append(min(limit, 200))
+    return query, params
+
+
+def get_downtime_events(
+    line: Optional[str] = None,
+    start_date: Optional[str] = None,
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """
+    Get recent downtime events with reasons.
     
-    with get_kpi_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            return cur.fetchall()
+    Args:
+        line: Production line filter
+        start_date: Start date (ISO format)
+        limit: Maximum number of events to return
+    """
+    return _run_query(_downtime_query(line, start_date, limit))
+
+
+async def get_downtime_events_async(
+    line: Optional[str] = None,
+    start_date: Optional[str] = None,
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """Async get_downtime_events on the shared connection pool"""
+    return await _run_query_async(_downtime_query(line, start_date, limit))
 
 
 def get_line_summary(line: str, days: int = 7) -> Dict[str, Any]:
@@ -221,13 +386,34 @@ def get_line_summary(line: str, days: int = 7) -> Dict[str, Any]:
         line: Production line (e.g., "A01")
         days: Number of days to look back
     """
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=days)
+    start_date, end_date = _summary_window(days)
     
     oee_data = get_oee_metrics(line, str(start_date), str(end_date))
     fpy_data = get_fpy_metrics(line, str(start_date), str(end_date))
     mttr_data = get_mttr_metrics(line, str(start_date), str(end_date))
     
+    return _summarize(line, days, start_date, end_date, oee_data, fpy_data, mttr_data)
+
+
+async def get_line_summary_async(line: str, days: int = 7) -> Dict[str, Any]:
+    """Async get_line_summary: the three KPI queries run concurrently"""
+    start_date, end_date = _summary_window(days)
+    
+    oee_data, fpy_data, mttr_data = await asyncio.gather(
+        get_oee_metrics_async(line, str(start_date), str(end_date)),
+        get_fpy_metrics_async(line, str(start_date), str(end_date)),
+        get_mttr_metrics_async(line, str(start_date), str(end_date))
+    )
+    
+    return _summarize(line, days, start_date, end_date, oee_data, fpy_data, mttr_data)
+
+
+def _summary_window(days: int):
+    end_date = datetime.now().date()
+    return end_date - timedelta(days=days), end_date
+
+
+def _summarize(line, days, start_date, end_date, oee_data, fpy_data, mttr_data) -> Dict[str, Any]:
     # Calculate averages
     avg_oee = sum(r['oee'] for r in oee_data) / len(oee_data) if oee_data else 0
     avg_fpy = sum(r['fpy'] for r in fpy_data) / len(fpy_data) if fpy_data else 0
@@ -255,16 +441,32 @@ def get_line_summary(line: str, days: int = 7) -> Dict[str, Any]:
 def check_kpi_health() -> Dict[str, Any]:
     """Check if KPI database connection is working"""
     try:
-        with get_kpi_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT COUNT(*) as count FROM kpi_oee")
-                result = cur.fetchone()
-                return {
-                    "available": True,
-                    "oee_records": result['count'] if result else 0
-                }
+        result = _query_with_failover(("SELECT COUNT(*) as count FROM kpi_oee", []))
+        return {
+            "available": True,
+            "oee_records": result[0]['count'] if result else 0,
+            "routing": kpi_pool_stats()
+        }
+    except Exception as e:
+        return {
+            "available": False,
+            "error": str(e),
+            "routing": kpi_pool_stats()
+        }
+
+
+async def check_kpi_health_async() -> Dict[str, Any]:
+    """Async check_kpi_health on the shared connection pool"""
+    try:
+        result = await _query_with_failover_async(("SELECT COUNT(*) as count FROM kpi_oee", []))
+        return {
+            "available": True,
+            "oee_records": result[0]['count'] if result else 0,
+            "routing": kpi_pool_stats()
+        }
     except Exception as e:
         return {
             "available": False,
-            "error": str(e)
+            "error": str(e),
+            "routing": kpi_pool_stats()
         }
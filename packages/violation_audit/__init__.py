@@ -17,9 +17,106 @@ from datetime import datetime
 from typing import List, Optional, Dict, Any
 import psycopg2
 from psycopg2.extras import RealDictCursor, Json
+from psycopg.types.json import Jsonb
+
+from packages.db import async_pool
 
 logger = logging.getLogger(__name__)
 
+# Statements shared by the sync (psycopg2) and async (pooled psycopg 3) paths
+
+_SQL_FIND_ACTIVE = """
+    SELECT id FROM violations
+    WHERE station = %s
+      AND ts_end IS NULL
+      AND blocking_conditions = %s::jsonb
+    ORDER BY ts_start DESC
+    LIMIT 1
+"""
+
+_SQL_UPDATE_VIOLATION = """
+    UPDATE violations
+    SET violated_expectations = %s::jsonb,
+        warnings = %s::jsonb,
+        severity = %s,
+        requires_human_confirmation = %s,
+        material_ref = %s::jsonb,
+        snapshot_ref = %s::jsonb,
+        updated_at = NOW()
+    WHERE id = %s
+"""
+
+_SQL_INSERT_VIOLATION = """
+    INSERT INTO violations (
+        profile, plant, line, station,
+        severity, requires_human_confirmation,
+        violated_expectations, blocking_conditions, warnings,
+        material_ref, snapshot_ref
+    )
+    VALUES (%s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s::jsonb, %s::jsonb, %s::jsonb)
+    RETURNING id
+"""
+
+_SQL_INSERT_ACK = """
+    INSERT INTO violation_ack (
+        violation_id, ack_by, ack_type, comment, evidence_ref
+    )
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING id
+"""
+
+_SQL_CLOSE_VIOLATION = """
+    UPDATE violations
+    SET ts_end = NOW()
+    WHERE id = %s AND ts_end IS NULL
+"""
+
+_SQL_VIOLATION_BY_ID = """
+    SELECT * FROM violations WHERE id = %s
+"""
+
+_SQL_ACKS_FOR_VIOLATION = """
+    SELECT * FROM violation_ack
+    WHERE violation_id = %s
+    ORDER BY ts ASC
+"""
+
+# Acknowledgments for many violations in one round trip (active list enrichment)
+_SQL_ACKS_FOR_VIOLATIONS = """
+    SELECT * FROM violation_ack
+    WHERE violation_id = ANY(%s)
+    ORDER BY ts ASC
+"""
+
+
+def _active_violations_query(station: Optional[str], profile: Optional[str], blocking_only: bool):
+    query = "SELECT * FROM v_violations_active WHERE 1=1"
+    params = []
+    if station:
+        query += " AND station = %s"
+        params.append(station)
+    if profile:
+        query += " AND profile = %s"
+        params.append(profile)
+    if blocking_only:
+        query += " AND requires_human_confirmation = true"
+    query += " ORDER BY ts_start DESC"
+    return query, params
+
+
+def _violation_history_query(station: Optional[str], profile: Optional[str], limit: int):
+    query = "SELECT * FROM v_violations_history WHERE 1=1"
+    params = []
+    if station:
+        query += " AND station = %s"
+        params.append(station)
+    if profile:
+        query += " AND profile = %s"
+        params.append(profile)
+    query += " ORDER BY ts_end DESC LIMIT %s"
+    params.append(limit)
+    return query, params
+
 
 class ViolationPersistence:
     """
@@ -78,14 +175,7 @@ class ViolationPersistence:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             
             # Check for existing active violation with same conditions
-            cursor.execute("""
-                SELECT id FROM violations
-                WHERE station = %s
-                  AND ts_end IS NULL
-                  AND blocking_conditions = %s::jsonb
-                ORDER BY ts_start DESC
-                LIMIT 1
-            """, (
+            cursor.execute(_SQL_FIND_ACTIVE, (
                 station,
                 Json(expectation_result.blocking_conditions)
             ))
@@ -95,17 +185,7 @@ class ViolationPersistence:
             if existing:
                 # Update existing violation
                 violation_id = existing['id']
-                cursor.execute("""
-                    UPDATE violations
-                    SET violated_expectations = %s::jsonb,
-                        warnings = %s::jsonb,
-                        severity = %s,
-                        requires_human_confirmation = %s,
-                        material_ref = %s::jsonb,
-                        snapshot_ref = %s::jsonb,
-                        updated_at = NOW()
-                    WHERE id = %s
-                """, (
+                cursor.execute(_SQL_UPDATE_VIOLATION, (
                     Json(expectation_result.violated_expectations),
                     Json(expectation_result.warnings),
                     expectation_result.severity,
@@ -118,16 +198,7 @@ class ViolationPersistence:
                 logger.info(f"Updated existing violation {violation_id} for {station}")
             else:
                 # Create new violation
-                cursor.execute("""
-                    INSERT INTO violations (
-                        profile, plant, line, station,
-                        severity, requires_human_confirmation,
-                        violated_expectations, blocking_conditions, warnings,
-                        material_ref, snapshot_ref
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s::jsonb, %s::jsonb, %s::jsonb)
-                    RETURNING id
-                """, (
+                cursor.execute(_SQL_INSERT_VIOLATION, (
                     profile,
                     plant,
                     line,
@@ -168,11 +239,7 @@ class ViolationPersistence:
             conn = psycopg2.connect(self.connection_string)
             cursor = conn.cursor()
             
-            cursor.execute("""
-                UPDATE violations
-                SET ts_end = NOW()
-                WHERE id = %s AND ts_end IS NULL
-            """, (str(violation_id),))
+            cursor.execute(_SQL_CLOSE_VIOLATION, (str(violation_id),))
             
             rows_affected = cursor.rowcount
             
@@ -249,13 +316,7 @@ class ViolationPersistence:
             conn = psycopg2.connect(self.connection_string)
             cursor = conn.cursor()
             
-            cursor.execute("""
-                INSERT INTO violation_ack (
-                    violation_id, ack_by, ack_type, comment, evidence_ref
-                )
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
-            """, (
+            cursor.execute(_SQL_INSERT_ACK, (
                 str(violation_id),
                 ack_by,
                 ack_type,
@@ -267,11 +328,7 @@ class ViolationPersistence:
             
             # If ack_type is 'resolved', close the violation
             if ack_type == 'resolved':
-                cursor.execute("""
-                    UPDATE violations
-                    SET ts_end = NOW()
-                    WHERE id = %s AND ts_end IS NULL
-                """, (str(violation_id),))
+                cursor.execute(_SQL_CLOSE_VIOLATION, (str(violation_id),))
             
             conn.commit()
             cursor.close()
@@ -305,22 +362,7 @@ class ViolationPersistence:
             conn = psycopg2.connect(self.connection_string)
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             
-            query = "SELECT * FROM v_violations_active WHERE 1=1"
-            params = []
-            
-            if station:
-                query += " AND station = %s"
-                params.append(station)
-            
-            if profile:
-                query += " AND profile = %s"
-                params.append(profile)
-            
-            if blocking_only:
-                query += " AND requires_human_confirmation = true"
-            
-            query += " ORDER BY ts_start DESC"
-            
+            query, params = _active_violations_query(station, profile, blocking_only)
             cursor.execute(query, params)
             results = [dict(row) for row in cursor.fetchall()]
             
@@ -354,20 +396,7 @@ class ViolationPersistence:
             conn = psycopg2.connect(self.connection_string)
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             
-            query = "SELECT * FROM v_violations_history WHERE 1=1"
-            params = []
-            
-            if station:
-                query += " AND station = %s"
-                params.append(station)
-            
-            if profile:
-                query += " AND profile = %s"
-                params.append(profile)
-            
-            query += " ORDER BY ts_end DESC LIMIT %s"
-            params.append(limit)
-            
+            query, params = _violation_history_query(station, profile, limit)
             cursor.execute(query, params)
             results = [dict(row) for row in cursor.fetchall()]
             
@@ -394,9 +423,7 @@ class ViolationPersistence:
             conn = psycopg2.connect(self.connection_string)
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             
-            cursor.execute("""
-                SELECT * FROM violations WHERE id = %s
-            """, (str(violation_id),))
+            cursor.execute(_SQL_VIOLATION_BY_ID, (str(violation_id),))
             
             result = cursor.fetchone()
             
@@ -425,9 +452,7 @@ class ViolationPersistence:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             
             # Get violation
-            cursor.execute("""
-                SELECT * FROM violations WHERE id = %s
-            """, (str(violation_id),))
+            cursor.execute(_SQL_VIOLATION_BY_ID, (str(violation_id),))
             
             violation = cursor.fetchone()
             
@@ -437,11 +462,7 @@ class ViolationPersistence:
                 return None
             
             # Get all acknowledgments
-            cursor.execute("""
-                SELECT * FROM violation_ack
-                WHERE violation_id = %s
-                ORDER BY ts ASC
-            """, (str(violation_id),))
+            cursor.execute(_SQL_ACKS_FOR_VIOLATION, (str(violation_id),))
             
             acks = [dict(row) for row in cursor.fetchall()]
             
@@ -551,6 +572,194 @@ class ViolationPersistence:
         )
         return ack_id is not None
 
+    # ---------- async API (pooled psycopg 3, for async FastAPI handlers) ----------
+    
+    async def upsert_violation_async(
+        self,
+        profile: str,
+        plant: str,
+        line: str,
+        station: str,
+        expectation_result,
+        material_context: Optional[Dict] = None,
+        snapshot_ref: Optional[Dict] = None
+    ) -> uuid.UUID:
+        """Async upsert_violation: same semantics, single pooled transaction."""
+        try:
+            async with async_pool.transaction(self.connection_string) as conn:
+                cur = await conn.execute(_SQL_FIND_ACTIVE, (
+                    station,
+                    Jsonb(expectation_result.blocking_conditions)
+                ))
+                existing = await cur.fetchone()
+                
+                if existing:
+                    violation_id = existing['id']
+                    await conn.execute(_SQL_UPDATE_VIOLATION, (
+                        Jsonb(expectation_result.violated_expectations),
+                        Jsonb(expectation_result.warnings),
+                        expectation_result.severity,
+                        expectation_result.requires_human_confirmation,
+                        Jsonb(material_context or {}),
+                        Jsonb(snapshot_ref or {}),
+                        violation_id
+                    ))
+                    logger.info(f"Updated existing violation {violation_id} for {station}")
+                else:
+                    cur = await conn.execute(_SQL_INSERT_VIOLATION, (
+                        profile,
+                        plant,
+                        line,
+                        station,
+                        expectation_result.severity,
+                        expectation_result.requires_human_confirmation,
+                        Jsonb(expectation_result.violated_expectations),
+                        Jsonb(expectation_result.blocking_conditions),
+                        Jsonb(expectation_result.warnings),
+                        Jsonb(material_context or {}),
+                        Jsonb(snapshot_ref or {})
+                    ))
+                    violation_id = (await cur.fetchone())['id']
+                    logger.info(f"Created new violation {violation_id} for {station}")
+            
+            return violation_id
+        
+        except Exception as e:
+            logger.error(f"Failed to upsert violation for {station}: {e}")
+            raise
+    
+    async def add_acknowledgment_async(
+        self,
+        violation_id: uuid.UUID,
+        ack_by: str,
+        ack_type: str,
+        comment: Optional[str] = None,
+        evidence_ref: Optional[str] = None
+    ) -> Optional[int]:
+        """Async add_acknowledgment. Returns the acknowledgment ID, or None if failed."""
+        try:
+            async with async_pool.transaction(self.connection_string) as conn:
+                cur = await conn.execute(_SQL_INSERT_ACK, (
+                    str(violation_id),
+                    ack_by,
+                    ack_type,
+                    comment,
+                    evidence_ref
+                ))
+                ack_id = (await cur.fetchone())['id']
+                
+                # If ack_type is 'resolved', close the violation
+                if ack_type == 'resolved':
+                    await conn.execute(_SQL_CLOSE_VIOLATION, (str(violation_id),))
+            
+            logger.info(f"Added acknowledgment {ack_id} to violation {violation_id} by {ack_by}")
+            return ack_id
+        
+        except Exception as e:
+            logger.error(f"Failed to add acknowledgment to {violation_id}: {e}")
+            return None
+    
+    async def resolve_violation_async(
+        self,
+        violation_id: uuid.UUID,
+        ack_by: str,
+        comment: Optional[str] = None
+    ) -> bool:
+        """Async resolve_violation: 'resolved' acknowledgment plus ts_end."""
+        ack_id = await self.add_acknowledgment_async(
+            violation_id=violation_id,
+            ack_by=ack_by,
+            ack_type='resolved',
+            comment=comment
+        )
+        return ack_id is not None
+    
+    async def get_active_violations_async(
+        self,
+        station: Optional[str] = None,
+        profile: Optional[str] = None,
+        blocking_only: bool = False,
+        with_state: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Async get_active_violations.
+        
+        With with_state=True each record also carries 'state' and 'ack_count',
+        computed from one batched acknowledgment query instead of a timeline
+        lookup per violation.
+        """
+        try:
+            query, params = _active_violations_query(station, profile, blocking_only)
+            violations = await async_pool.fetch_all(query, params, conninfo=self.connection_string)
+            
+            if with_state and violations:
+                acks = await async_pool.fetch_all(
+                    _SQL_ACKS_FOR_VIOLATIONS,
+                    ([str(v['id']) for v in violations],),
+                    conninfo=self.connection_string
+                )
+                acks_by_violation: Dict[str, List[Dict]] = {}
+                for ack in acks:
+                    acks_by_violation.setdefault(str(ack['violation_id']), []).append(ack)
+                for violation in violations:
+                    violation_acks = acks_by_violation.get(str(violation['id']), [])
+                    violation['state'] = self._compute_violation_state(violation, violation_acks)
+                    violation['ack_count'] = len(violation_acks)
+            
+            return violations
+        
+        except Exception as e:
+            logger.error(f"Failed to query active violations: {e}")
+            return []
+    
+    async def get_violation_history_async(
+        self,
+        station: Optional[str] = None,
+        profile: Optional[str] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Async get_violation_history."""
+        try:
+            query, params = _violation_history_query(station, profile, limit)
+            return await async_pool.fetch_all(query, params, conninfo=self.connection_string)
+        except Exception as e:
+            logger.error(f"Failed to query violation history: {e}")
+            return []
+    
+    async def get_violation_by_id_async(self, violation_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        """Async get_violation_by_id."""
+        try:
+            return await async_pool.fetch_one(
+                _SQL_VIOLATION_BY_ID, (str(violation_id),), conninfo=self.connection_string
+            )
+        except Exception as e:
+            logger.error(f"Failed to get violation {violation_id}: {e}")
+            return None
+    
+    async def get_violation_timeline_async(self, violation_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        """Async get_violation_timeline."""
+        try:
+            violation = await async_pool.fetch_one(
+                _SQL_VIOLATION_BY_ID, (str(violation_id),), conninfo=self.connection_string
+            )
+            if not violation:
+                return None
+            
+            acks = await async_pool.fetch_all(
+                _SQL_ACKS_FOR_VIOLATION, (str(violation_id),), conninfo=self.connection_string
+            )
+            
+            return {
+                'violation': violation,
+                'acknowledgments': acks,
+                'state': self._compute_violation_state(violation, acks),
+                'ack_count': len(acks)
+            }
+        
+        except Exception as e:
+            logger.error(f"Failed to get timeline for {violation_id}: {e}")
+            return None
+
 
 # Global singleton instance
 _persistence = None
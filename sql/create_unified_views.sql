@@ -3,6 +3,9 @@
 
 -- v_runtime_kpi: Unified KPI view
 -- Prefers opc_kpi_samples when data is recent (< 2 minutes old)
+-- The historian writes unchanged lines only every max_silence_s
+-- (opc-studio/config/historian_recording.yaml, 60 s): keep that heartbeat
+-- below this window or steady live lines drop out of the OPC branch
 -- Falls back to oee_line_shift for historical/simulation data
 CREATE OR REPLACE VIEW v_runtime_kpi AS
 WITH opc_recent AS (
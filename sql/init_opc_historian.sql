@@ -1,8 +1,44 @@
--- OPC Studio Historian schema (v0.2)
--- Run once in your Postgres (ragdb)
+-- OPC Studio Historian schema (v0.3)
+-- Run in your Postgres (ragdb); safe to re-run.
+--
+-- Raw samples and events are range-partitioned by day (UTC) on ts. OPC Studio
+-- calls the maintenance functions below every HISTORIAN_MAINTENANCE_INTERVAL_S:
+--   opc_historian_ensure_partitions(days_ahead)  create upcoming daily partitions
+--   opc_historian_refresh_rollups()              fold new samples into the 1m/1h tables
+--   opc_historian_apply_retention(...)           drop raw partitions older than N days
+-- Rollup tables (opc_kpi_samples_1m/_1h, opc_station_samples_1m/_1h) are kept
+-- after raw partitions are dropped.
+--
+-- Upgrading from v0.2 (plain tables): the old table is renamed to
+-- <table>_legacy and attached as the partition holding all existing rows, so
+-- retention drops it once it ages out. Views reading these tables follow the
+-- rename, so re-run sql/create_unified_views.sql after upgrading.
+
+SELECT pg_advisory_xact_lock(hashtext('opc_historian_schema'));
+
+-- ==================== Raw samples (partitioned) ====================
+
+DO $$
+DECLARE
+    tbl TEXT;
+    idx TEXT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['opc_kpi_samples', 'opc_station_samples', 'opc_events'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass(tbl) AND relkind = 'r') THEN
+            -- Free the index and sequence names for the partitioned table
+            FOR idx IN SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = tbl LOOP
+                EXECUTE format('ALTER INDEX %I RENAME TO %I', idx, idx || '_legacy');
+            END LOOP;
+            EXECUTE format('ALTER SEQUENCE IF EXISTS %I RENAME TO %I', tbl || '_id_seq', tbl || '_legacy_id_seq');
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, tbl || '_legacy');
+            RAISE NOTICE 'Migrating % to a partitioned table (old rows kept in %_legacy); re-run create_unified_views.sql',
+                         tbl, tbl;
+        END IF;
+    END LOOP;
+END $$;
 
 CREATE TABLE IF NOT EXISTS opc_kpi_samples (
-  id BIGSERIAL PRIMARY KEY,
+  id BIGSERIAL,
   ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   plant TEXT NOT NULL,
   line TEXT NOT NULL,
@@ -10,14 +46,15 @@ CREATE TABLE IF NOT EXISTS opc_kpi_samples (
   availability DOUBLE PRECISION,
   performance DOUBLE PRECISION,
   quality DOUBLE PRECISION,
-  status TEXT
-);
+  status TEXT,
+  PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
 
 CREATE INDEX IF NOT EXISTS idx_opc_kpi_samples_ts ON opc_kpi_samples(ts);
 CREATE INDEX IF NOT EXISTS idx_opc_kpi_samples_dim ON opc_kpi_samples(plant, line, ts);
 
 CREATE TABLE IF NOT EXISTS opc_station_samples (
-  id BIGSERIAL PRIMARY KEY,
+  id BIGSERIAL,
   ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   plant TEXT NOT NULL,
   line TEXT NOT NULL,
@@ -26,21 +63,310 @@ CREATE TABLE IF NOT EXISTS opc_station_samples (
   cycle_time_s DOUBLE PRECISION,
   good_count BIGINT,
   scrap_count BIGINT,
-  alarms JSONB DEFAULT '[]'::jsonb
-);
+  alarms JSONB DEFAULT '[]'::jsonb,
+  PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
 
 CREATE INDEX IF NOT EXISTS idx_opc_station_samples_ts ON opc_station_samples(ts);
 CREATE INDEX IF NOT EXISTS idx_opc_station_samples_dim ON opc_station_samples(plant, line, station, ts);
 
 CREATE TABLE IF NOT EXISTS opc_events (
-  id BIGSERIAL PRIMARY KEY,
+  id BIGSERIAL,
   ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   plant TEXT NOT NULL,
   line TEXT NOT NULL,
   station TEXT NOT NULL,
   event_type TEXT NOT NULL,
-  payload JSONB NOT NULL DEFAULT '{}'::jsonb
-);
+  payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+  PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
 
 CREATE INDEX IF NOT EXISTS idx_opc_events_ts ON opc_events(ts);
 CREATE INDEX IF NOT EXISTS idx_opc_events_dim ON opc_events(plant, line, station, ts);
+
+-- Attach migrated v0.2 tables as the partition covering everything up to the
+-- end of their last day, and continue the id sequence after their ids
+DO $$
+DECLARE
+    tbl TEXT;
+    upper_bound TIMESTAMPTZ;
+    max_id BIGINT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['opc_kpi_samples', 'opc_station_samples', 'opc_events'] LOOP
+        IF to_regclass(tbl || '_legacy') IS NOT NULL
+           AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(tbl || '_legacy')) THEN
+            EXECUTE format('SELECT MAX(ts), MAX(id) FROM %I', tbl || '_legacy') INTO upper_bound, max_id;
+            upper_bound := date_trunc('day', COALESCE(upper_bound, NOW()) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+                           + INTERVAL '1 day';
+            EXECUTE format('ALTER TABLE %I ALTER COLUMN id DROP DEFAULT', tbl || '_legacy');
+            -- The parent's PRIMARY KEY (id, ts) replaces the old one on id
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT IF EXISTS %I', tbl || '_legacy', tbl || '_pkey_legacy');
+            EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (MINVALUE) TO (%L)',
+                           tbl, tbl || '_legacy', upper_bound);
+            IF max_id IS NOT NULL THEN
+                PERFORM setval(pg_get_serial_sequence(tbl, 'id'), max_id);
+            END IF;
+        END IF;
+    END LOOP;
+END $$;
+
+-- ==================== Rollups ====================
+-- <metric>_avg/_min/_max per bucket; 1h rows are folded from the 1m rows
+
+CREATE TABLE IF NOT EXISTS opc_kpi_samples_1m (
+  bucket TIMESTAMPTZ NOT NULL,
+  plant TEXT NOT NULL,
+  line TEXT NOT NULL,
+  samples INTEGER NOT NULL,
+  oee_avg DOUBLE PRECISION, oee_min DOUBLE PRECISION, oee_max DOUBLE PRECISION,
+  availability_avg DOUBLE PRECISION, availability_min DOUBLE PRECISION, availability_max DOUBLE PRECISION,
+  performance_avg DOUBLE PRECISION, performance_min DOUBLE PRECISION, performance_max DOUBLE PRECISION,
+  quality_avg DOUBLE PRECISION, quality_min DOUBLE PRECISION, quality_max DOUBLE PRECISION,
+  last_status TEXT,
+  PRIMARY KEY (plant, line, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS opc_kpi_samples_1h (LIKE opc_kpi_samples_1m INCLUDING ALL);
+
+CREATE TABLE IF NOT EXISTS opc_station_samples_1m (
+  bucket TIMESTAMPTZ NOT NULL,
+  plant TEXT NOT NULL,
+  line TEXT NOT NULL,
+  station TEXT NOT NULL,
+  samples INTEGER NOT NULL,
+  cycle_time_s_avg DOUBLE PRECISION, cycle_time_s_min DOUBLE PRECISION, cycle_time_s_max DOUBLE PRECISION,
+  good_count_min BIGINT, good_count_max BIGINT,
+  scrap_count_min BIGINT, scrap_count_max BIGINT,
+  alarm_samples INTEGER NOT NULL DEFAULT 0,
+  last_state TEXT,
+  PRIMARY KEY (plant, line, station, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS opc_station_samples_1h (LIKE opc_station_samples_1m INCLUDING ALL);
+
+CREATE INDEX IF NOT EXISTS idx_opc_kpi_samples_1m_bucket ON opc_kpi_samples_1m(bucket);
+CREATE INDEX IF NOT EXISTS idx_opc_kpi_samples_1h_bucket ON opc_kpi_samples_1h(bucket);
+CREATE INDEX IF NOT EXISTS idx_opc_station_samples_1m_bucket ON opc_station_samples_1m(bucket);
+CREATE INDEX IF NOT EXISTS idx_opc_station_samples_1h_bucket ON opc_station_samples_1h(bucket);
+
+CREATE TABLE IF NOT EXISTS opc_historian_state (
+  key TEXT PRIMARY KEY,
+  value TIMESTAMPTZ NOT NULL
+);
+
+-- ==================== Maintenance functions ====================
+
+-- Create the daily partitions from yesterday to p_days_ahead days ahead (UTC)
+CREATE OR REPLACE FUNCTION opc_historian_ensure_partitions(p_days_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER AS $$
+DECLARE
+    tbl TEXT;
+    d DATE;
+    part TEXT;
+    created INTEGER := 0;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['opc_kpi_samples', 'opc_station_samples', 'opc_events'] LOOP
+        FOR d IN
+            SELECT generate_series((NOW() AT TIME ZONE 'UTC')::date - 1,
+                                   (NOW() AT TIME ZONE 'UTC')::date + p_days_ahead,
+                                   INTERVAL '1 day')::date
+        LOOP
+            part := tbl || '_p' || to_char(d, 'YYYYMMDD');
+            CONTINUE WHEN to_regclass(part) IS NOT NULL;
+            BEGIN
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               part, tbl,
+                               d::timestamp AT TIME ZONE 'UTC',
+                               (d + 1)::timestamp AT TIME ZONE 'UTC');
+                created := created + 1;
+            EXCEPTION WHEN invalid_object_definition THEN
+                -- Day already covered by the migrated legacy partition
+                NULL;
+            END;
+        END LOOP;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute the 1m buckets of raw samples in [p_from, p_to) and the 1h buckets containing them
+CREATE OR REPLACE FUNCTION opc_historian_rollup_range(p_from TIMESTAMPTZ, p_to TIMESTAMPTZ)
+RETURNS VOID AS $$
+DECLARE
+    m_from TIMESTAMPTZ := date_trunc('minute', p_from);
+    h_from TIMESTAMPTZ := date_trunc('hour', p_from);
+    h_to TIMESTAMPTZ := date_trunc('hour', p_to) + INTERVAL '1 hour';
+BEGIN
+    INSERT INTO opc_kpi_samples_1m
+    SELECT
+        date_trunc('minute', ts), plant, line, COUNT(*),
+        AVG(oee), MIN(oee), MAX(oee),
+        AVG(availability), MIN(availability), MAX(availability),
+        AVG(performance), MIN(performance), MAX(performance),
+        AVG(quality), MIN(quality), MAX(quality),
+        (ARRAY_AGG(status ORDER BY ts DESC))[1]
+    FROM opc_kpi_samples
+    WHERE ts >= m_from AND ts < p_to
+    GROUP BY 1, 2, 3
+    ON CONFLICT (plant, line, bucket) DO UPDATE SET
+        samples = EXCLUDED.samples,
+        oee_avg = EXCLUDED.oee_avg, oee_min = EXCLUDED.oee_min, oee_max = EXCLUDED.oee_max,
+        availability_avg = EXCLUDED.availability_avg, availability_min = EXCLUDED.availability_min,
+        availability_max = EXCLUDED.availability_max,
+        performance_avg = EXCLUDED.performance_avg, performance_min = EXCLUDED.performance_min,
+        performance_max = EXCLUDED.performance_max,
+        quality_avg = EXCLUDED.quality_avg, quality_min = EXCLUDED.quality_min, quality_max = EXCLUDED.quality_max,
+        last_status = EXCLUDED.last_status;
+
+    INSERT INTO opc_kpi_samples_1h
+    SELECT
+        date_trunc('hour', bucket), plant, line, SUM(samples),
+        SUM(oee_avg * samples) / SUM(samples), MIN(oee_min), MAX(oee_max),
+        SUM(availability_avg * samples) / SUM(samples), MIN(availability_min), MAX(availability_max),
+        SUM(performance_avg * samples) / SUM(samples), MIN(performance_min), MAX(performance_max),
+        SUM(quality_avg * samples) / SUM(samples), MIN(quality_min), MAX(quality_max),
+        (ARRAY_AGG(last_status ORDER BY bucket DESC))[1]
+    FROM opc_kpi_samples_1m
+    WHERE bucket >= h_from AND bucket < h_to
+    GROUP BY 1, 2, 3
+    ON CONFLICT (plant, line, bucket) DO UPDATE SET
+        samples = EXCLUDED.samples,
+        oee_avg = EXCLUDED.oee_avg, oee_min = EXCLUDED.oee_min, oee_max = EXCLUDED.oee_max,
+        availability_avg = EXCLUDED.availability_avg, availability_min = EXCLUDED.availability_min,
+        availability_max = EXCLUDED.availability_max,
+        performance_avg = EXCLUDED.performance_avg, performance_min = EXCLUDED.performance_min,
+        performance_max = EXCLUDED.performance_max,
+        quality_avg = EXCLUDED.quality_avg, quality_min = EXCLUDED.quality_min, quality_max = EXCLUDED.quality_max,
+        last_status = EXCLUDED.last_status;
+
+    INSERT INTO opc_station_samples_1m
+    SELECT
+        date_trunc('minute', ts), plant, line, station, COUNT(*),
+        AVG(cycle_time_s), MIN(cycle_time_s), MAX(cycle_time_s),
+        MIN(good_count), MAX(good_count),
+        MIN(scrap_count), MAX(scrap_count),
+        COUNT(*) FILTER (WHERE jsonb_array_length(COALESCE(alarms, '[]'::jsonb)) > 0),
+        (ARRAY_AGG(state ORDER BY ts DESC))[1]
+    FROM opc_station_samples
+    WHERE ts >= m_from AND ts < p_to
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (plant, line, station, bucket) DO UPDATE SET
+        samples = EXCLUDED.samples,
+        cycle_time_s_avg = EXCLUDED.cycle_time_s_avg, cycle_time_s_min = EXCLUDED.cycle_time_s_min,
+        cycle_time_s_max = EXCLUDED.cycle_time_s_max,
+        good_count_min = EXCLUDED.good_count_min, good_count_max = EXCLUDED.good_count_max,
+        scrap_count_min = EXCLUDED.scrap_count_min, scrap_count_max = EXCLUDED.scrap_count_max,
+        alarm_samples = EXCLUDED.alarm_samples,
+        last_state = EXCLUDED.last_state;
+
+    INSERT INTO opc_station_samples_1h
+    SELECT
+        date_trunc('hour', bucket), plant, line, station, SUM(samples),
+        SUM(cycle_time_s_avg * samples) / SUM(samples), MIN(cycle_time_s_min), MAX(cycle_time_s_max),
+        MIN(good_count_min), MAX(good_count_max),
+        MIN(scrap_count_min), MAX(scrap_count_max),
+        SUM(alarm_samples),
+        (ARRAY_AGG(last_state ORDER BY bucket DESC))[1]
+    FROM opc_station_samples_1m
+    WHERE bucket >= h_from AND bucket < h_to
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (plant, line, station, bucket) DO UPDATE SET
+        samples = EXCLUDED.samples,
+        cycle_time_s_avg = EXCLUDED.cycle_time_s_avg, cycle_time_s_min = EXCLUDED.cycle_time_s_min,
+        cycle_time_s_max = EXCLUDED.cycle_time_s_max,
+        good_count_min = EXCLUDED.good_count_min, good_count_max = EXCLUDED.good_count_max,
+        scrap_count_min = EXCLUDED.scrap_count_min, scrap_count_max = EXCLUDED.scrap_count_max,
+        alarm_samples = EXCLUDED.alarm_samples,
+        last_state = EXCLUDED.last_state;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fold samples written since the last refresh into the rollups. The last
+-- p_overlap of already-rolled-up time is recomputed to pick up late rows.
+-- Returns the new watermark (rollups are complete before it).
+CREATE OR REPLACE FUNCTION opc_historian_refresh_rollups(p_overlap INTERVAL DEFAULT INTERVAL '5 minutes')
+RETURNS TIMESTAMPTZ AS $$
+DECLARE
+    v_from TIMESTAMPTZ;
+    v_to TIMESTAMPTZ := date_trunc('minute', NOW());
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('opc_historian_refresh_rollups')) THEN
+        RETURN (SELECT value FROM opc_historian_state WHERE key = 'rollups_refreshed_to');
+    END IF;
+
+    SELECT value - p_overlap INTO v_from FROM opc_historian_state WHERE key = 'rollups_refreshed_to';
+    IF v_from IS NULL THEN
+        SELECT LEAST((SELECT MIN(ts) FROM opc_kpi_samples), (SELECT MIN(ts) FROM opc_station_samples))
+        INTO v_from;
+    END IF;
+
+    IF v_from IS NOT NULL AND v_from < v_to THEN
+        PERFORM opc_historian_rollup_range(v_from, v_to);
+    END IF;
+
+    INSERT INTO opc_historian_state (key, value) VALUES ('rollups_refreshed_to', v_to)
+    ON CONFLICT (key) DO UPDATE SET value = GREATEST(opc_historian_state.value, EXCLUDED.value);
+    RETURN v_to;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop partitions of p_table whose range ends before NOW() - p_keep_days and
+-- before p_safe_before. p_keep_days <= 0 keeps everything.
+CREATE OR REPLACE FUNCTION opc_historian_drop_partitions(p_table TEXT, p_keep_days INTEGER, p_safe_before TIMESTAMPTZ)
+RETURNS TEXT[] AS $$
+DECLARE
+    r RECORD;
+    upper_bound TIMESTAMPTZ;
+    dropped TEXT[] := '{}';
+BEGIN
+    IF p_keep_days IS NULL OR p_keep_days <= 0 OR p_safe_before IS NULL THEN
+        RETURN dropped;
+    END IF;
+    FOR r IN
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = p_table::regclass
+    LOOP
+        upper_bound := substring(r.bound FROM 'TO \(''([^'']+)''\)')::timestamptz;
+        IF upper_bound IS NOT NULL
+           AND upper_bound <= LEAST(NOW() - make_interval(days => p_keep_days), p_safe_before) THEN
+            EXECUTE format('DROP TABLE %I', r.relname);
+            dropped := dropped || r.relname::text;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retention: raw sample partitions are only dropped once rolled up
+CREATE OR REPLACE FUNCTION opc_historian_apply_retention(
+    p_raw_keep_days INTEGER DEFAULT 30,
+    p_events_keep_days INTEGER DEFAULT 365,
+    p_rollup_1m_keep_days INTEGER DEFAULT 0
+)
+RETURNS JSONB AS $$
+DECLARE
+    watermark TIMESTAMPTZ := (SELECT value FROM opc_historian_state WHERE key = 'rollups_refreshed_to');
+    dropped TEXT[];
+    deleted_1m BIGINT := 0;
+    n BIGINT;
+BEGIN
+    dropped := opc_historian_drop_partitions('opc_kpi_samples', p_raw_keep_days, watermark)
+            || opc_historian_drop_partitions('opc_station_samples', p_raw_keep_days, watermark)
+            || opc_historian_drop_partitions('opc_events', p_events_keep_days, NOW());
+
+    IF p_rollup_1m_keep_days > 0 THEN
+        DELETE FROM opc_kpi_samples_1m WHERE bucket < NOW() - make_interval(days => p_rollup_1m_keep_days);
+        GET DIAGNOSTICS n = ROW_COUNT;
+        deleted_1m := deleted_1m + n;
+        DELETE FROM opc_station_samples_1m WHERE bucket < NOW() - make_interval(days => p_rollup_1m_keep_days);
+        GET DIAGNOSTICS n = ROW_COUNT;
+        deleted_1m := deleted_1m + n;
+    END IF;
+
+    RETURN jsonb_build_object('dropped_partitions', to_jsonb(dropped), 'deleted_1m_rows', deleted_1m);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT opc_historian_ensure_partitions(3);
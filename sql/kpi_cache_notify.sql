@@ -0,0 +1,43 @@
+-- ============================================================================
+-- KPI query cache invalidation
+--
+-- Statement-level triggers publish the name of every written KPI source table
+-- on the 'kpi_cache_invalidate' channel. packages/db/kpi_cache.py LISTENs on
+-- it and drops the cached aggregates that read that table. Postgres folds
+-- identical notifications within a transaction, so a bulk load costs a single
+-- message per table.
+--
+-- Idempotent: safe to re-run; tables that do not exist (yet) are skipped.
+-- ============================================================================
+
+SELECT pg_advisory_xact_lock(hashtext('kpi_cache_notify'));
+
+CREATE OR REPLACE FUNCTION kpi_cache_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('kpi_cache_invalidate', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tbl TEXT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY[
+        'oee_line_shift', 'oee_station_shift', 'oee_downtime_events',
+        'kpi_oee', 'kpi_fpy', 'kpi_mttr', 'downtime_events'
+    ] LOOP
+        -- Plain tables only: statement triggers cannot be attached to views
+        IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass(tbl) AND relkind IN ('r', 'p')) THEN
+            EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || tbl || '_kpi_cache', tbl);
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+                'FOR EACH STATEMENT EXECUTE FUNCTION kpi_cache_notify()',
+                'trg_' || tbl || '_kpi_cache', tbl
+            );
+        END IF;
+    END LOOP;
+END $$;
+
+-- Tables may have been recreated without triggers: drop everything cached
+SELECT pg_notify('kpi_cache_invalidate', '*');
@@ -0,0 +1,274 @@
+-- OEE Rollup Tables
+-- Daily / weekly / monthly aggregates per line, per station and per downtime
+-- loss category, maintained incrementally by statement-level triggers on
+-- oee_line_shift, oee_station_shift and oee_downtime_events.
+--
+-- Dashboards read these instead of re-aggregating 30-90 days of shift rows.
+-- Averages are stored as sums plus a row count so that any range of buckets
+-- can be combined exactly: avg_oee = SUM(sum_oee) / SUM(shifts).
+--
+-- Idempotent: safe to re-run (packages/tools/oee_rollups.ensure_rollups runs
+-- it at application startup and after CSV imports).
+
+SELECT pg_advisory_xact_lock(hashtext('oee_rollups'));
+
+
+-- ==================== Rollup tables ====================
+
+CREATE TABLE IF NOT EXISTS oee_line_rollup (
+    grain VARCHAR(5) NOT NULL CHECK (grain IN ('day', 'week', 'month')),
+    period_start DATE NOT NULL,
+    line_id VARCHAR(50) NOT NULL,
+    line_name VARCHAR(100),
+    shifts INTEGER NOT NULL,
+    operating_days INTEGER NOT NULL,
+    first_date DATE,
+    last_date DATE,
+    planned_time_min DOUBLE PRECISION,
+    unplanned_downtime_min DOUBLE PRECISION,
+    operating_time_min DOUBLE PRECISION,
+    total_units_produced BIGINT,
+    good_units BIGINT,
+    scrap_units BIGINT,
+    sum_availability DOUBLE PRECISION,
+    sum_performance DOUBLE PRECISION,
+    sum_quality DOUBLE PRECISION,
+    sum_oee DOUBLE PRECISION,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (grain, line_id, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_oee_line_rollup_period ON oee_line_rollup (grain, period_start);
+
+CREATE TABLE IF NOT EXISTS oee_station_rollup (
+    grain VARCHAR(5) NOT NULL CHECK (grain IN ('day', 'week', 'month')),
+    period_start DATE NOT NULL,
+    line_id VARCHAR(50) NOT NULL,
+    station_id VARCHAR(50) NOT NULL,
+    shifts INTEGER NOT NULL,
+    planned_time_min DOUBLE PRECISION,
+    unplanned_downtime_min DOUBLE PRECISION,
+    total_units_produced BIGINT,
+    good_units BIGINT,
+    scrap_units BIGINT,
+    sum_availability DOUBLE PRECISION,
+    sum_performance DOUBLE PRECISION,
+    sum_quality DOUBLE PRECISION,
+    sum_oee DOUBLE PRECISION,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (grain, line_id, station_id, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_oee_station_rollup_line ON oee_station_rollup (grain, line_id, period_start);
+
+CREATE TABLE IF NOT EXISTS oee_downtime_rollup (
+    grain VARCHAR(5) NOT NULL CHECK (grain IN ('day', 'week', 'month')),
+    period_start DATE NOT NULL,
+    line_id VARCHAR(50) NOT NULL,
+    loss_category VARCHAR(100) NOT NULL,
+    events INTEGER NOT NULL,
+    timed_events INTEGER NOT NULL,          -- events with a duration (for averages)
+    total_duration_min DOUBLE PRECISION,
+    max_duration_min DOUBLE PRECISION,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (grain, line_id, loss_category, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_oee_downtime_rollup_period ON oee_downtime_rollup (grain, period_start);
+
+
+-- ==================== Bucket refresh ====================
+-- Each refresh recomputes only the (grain, line, period) buckets touched by
+-- the given (line_id, date) pairs, from the source rows of those buckets.
+-- Concurrent writers touching the same bucket are serialized by a
+-- transaction-level advisory lock per bucket (taken in hash order, so two
+-- writers never wait on each other's locks in opposite order); without it
+-- both could delete the bucket and the second INSERT would hit the primary key.
+
+CREATE OR REPLACE FUNCTION oee_rollup_touched(p_line_ids TEXT[], p_dates DATE[])
+RETURNS TABLE (grain TEXT, line_id TEXT, period_start DATE, period_end DATE) AS $$
+    SELECT DISTINCT
+        g.grain,
+        t.line_id,
+        date_trunc(g.grain, t.date::timestamp)::date,
+        (date_trunc(g.grain, t.date::timestamp) + ('1 ' || g.grain)::interval)::date
+    FROM unnest(p_line_ids, p_dates) AS t(line_id, date)
+    CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS g(grain)
+    WHERE t.line_id IS NOT NULL AND t.date IS NOT NULL
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION oee_rollup_lock(p_table TEXT, p_line_ids TEXT[], p_dates DATE[])
+RETURNS void AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(k.key)
+    FROM (
+        SELECT DISTINCT hashtext(p_table || ':' || t.grain || ':' || t.line_id || ':' || t.period_start) AS key
+        FROM oee_rollup_touched(p_line_ids, p_dates) t
+        ORDER BY 1
+    ) k;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION oee_rollup_refresh_lines(p_line_ids TEXT[], p_dates DATE[])
+RETURNS void AS $$
+BEGIN
+    PERFORM oee_rollup_lock('oee_line_rollup', p_line_ids, p_dates);
+
+    DELETE FROM oee_line_rollup r
+    USING oee_rollup_touched(p_line_ids, p_dates) t
+    WHERE r.grain = t.grain AND r.line_id = t.line_id AND r.period_start = t.period_start;
+
+    INSERT INTO oee_line_rollup (
+        grain, period_start, line_id, line_name, shifts, operating_days, first_date, last_date,
+        planned_time_min, unplanned_downtime_min, operating_time_min,
+        total_units_produced, good_units, scrap_units,
+        sum_availability, sum_performance, sum_quality, sum_oee
+    )
+    SELECT
+        t.grain, t.period_start, t.line_id, MAX(s.line_name),
+        COUNT(*), COUNT(DISTINCT s.date), MIN(s.date), MAX(s.date),
+        SUM(s.planned_time_min), SUM(s.unplanned_downtime_min), SUM(s.operating_time_min),
+        SUM(s.total_units_produced), SUM(s.good_units), SUM(s.scrap_units),
+        SUM(s.availability), SUM(s.performance), SUM(s.quality), SUM(s.oee)
+    FROM oee_rollup_touched(p_line_ids, p_dates) t
+    JOIN oee_line_shift s
+      ON s.line_id = t.line_id AND s.date >= t.period_start AND s.date < t.period_end
+    GROUP BY t.grain, t.period_start, t.line_id;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION oee_rollup_refresh_stations(p_line_ids TEXT[], p_dates DATE[])
+RETURNS void AS $$
+BEGIN
+    PERFORM oee_rollup_lock('oee_station_rollup', p_line_ids, p_dates);
+
+    DELETE FROM oee_station_rollup r
+    USING oee_rollup_touched(p_line_ids, p_dates) t
+    WHERE r.grain = t.grain AND r.line_id = t.line_id AND r.period_start = t.period_start;
+
+    INSERT INTO oee_station_rollup (
+        grain, period_start, line_id, station_id, shifts,
+        planned_time_min, unplanned_downtime_min,
+        total_units_produced, good_units, scrap_units,
+        sum_availability, sum_performance, sum_quality, sum_oee
+    )
+    SELECT
+        t.grain, t.period_start, t.line_id, s.station_id, COUNT(*),
+        SUM(s.planned_time_min), SUM(s.unplanned_downtime_min),
+        SUM(s.total_units_produced), SUM(s.good_units), SUM(s.scrap_units),
+        SUM(s.availability), SUM(s.performance), SUM(s.quality), SUM(s.oee)
+    FROM oee_rollup_touched(p_line_ids, p_dates) t
+    JOIN oee_station_shift s
+      ON s.line_id = t.line_id AND s.date >= t.period_start AND s.date < t.period_end
+    GROUP BY t.grain, t.period_start, t.line_id, s.station_id;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION oee_rollup_refresh_downtime(p_line_ids TEXT[], p_dates DATE[])
+RETURNS void AS $$
+BEGIN
+    PERFORM oee_rollup_lock('oee_downtime_rollup', p_line_ids, p_dates);
+
+    DELETE FROM oee_downtime_rollup r
+    USING oee_rollup_touched(p_line_ids, p_dates) t
+    WHERE r.grain = t.grain AND r.line_id = t.line_id AND r.period_start = t.period_start;
+
+    INSERT INTO oee_downtime_rollup (
+        grain, period_start, line_id, loss_category,
+        events, timed_events, total_duration_min, max_duration_min
+    )
+    SELECT
+        t.grain, t.period_start, t.line_id, COALESCE(e.loss_category, 'Unknown'),
+        COUNT(*), COUNT(e.duration_min), SUM(e.duration_min), MAX(e.duration_min)
+    FROM oee_rollup_touched(p_line_ids, p_dates) t
+    JOIN oee_downtime_events e
+      ON e.line_id = t.line_id AND e.date >= t.period_start AND e.date < t.period_end
+    GROUP BY t.grain, t.period_start, t.line_id, COALESCE(e.loss_category, 'Unknown');
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- ==================== Incremental maintenance triggers ====================
+-- Statement-level with transition tables: one refresh per statement, however
+-- many rows it wrote. TG_ARGV[0] names the refresh function.
+
+CREATE OR REPLACE FUNCTION oee_rollup_trigger() RETURNS trigger AS $$
+DECLARE
+    v_line_ids TEXT[];
+    v_dates DATE[];
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT array_agg(line_id), array_agg(date) INTO v_line_ids, v_dates
+        FROM (SELECT DISTINCT line_id, date FROM new_rows) n;
+        EXECUTE format('SELECT %I($1, $2)', TG_ARGV[0]) USING v_line_ids, v_dates;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT array_agg(line_id), array_agg(date) INTO v_line_ids, v_dates
+        FROM (SELECT DISTINCT line_id, date FROM old_rows) o;
+        EXECUTE format('SELECT %I($1, $2)', TG_ARGV[0]) USING v_line_ids, v_dates;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+DO $$
+DECLARE
+    src RECORD;
+BEGIN
+    FOR src IN
+        SELECT * FROM (VALUES
+            ('oee_line_shift', 'oee_rollup_refresh_lines'),
+            ('oee_station_shift', 'oee_rollup_refresh_stations'),
+            ('oee_downtime_events', 'oee_rollup_refresh_downtime')
+        ) AS v(tbl, fn)
+    LOOP
+        -- Source tables are (re)created by the importers; skip until they exist
+        CONTINUE WHEN to_regclass(src.tbl) IS NULL;
+
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_rollup_ins ON %I', src.tbl, src.tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_rollup_upd ON %I', src.tbl, src.tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_rollup_del ON %I', src.tbl, src.tbl);
+
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_rollup_ins AFTER INSERT ON %I '
+            'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT '
+            'EXECUTE FUNCTION oee_rollup_trigger(%L)', src.tbl, src.tbl, src.fn);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_rollup_upd AFTER UPDATE ON %I '
+            'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT '
+            'EXECUTE FUNCTION oee_rollup_trigger(%L)', src.tbl, src.tbl, src.fn);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_rollup_del AFTER DELETE ON %I '
+            'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT '
+            'EXECUTE FUNCTION oee_rollup_trigger(%L)', src.tbl, src.tbl, src.fn);
+    END LOOP;
+END;
+$$;
+
+
+-- ==================== Full rebuild ====================
+-- Used after bulk imports that recreate the source tables.
+
+CREATE OR REPLACE FUNCTION oee_rollup_rebuild() RETURNS void AS $$
+BEGIN
+    TRUNCATE oee_line_rollup, oee_station_rollup, oee_downtime_rollup;
+
+    IF to_regclass('oee_line_shift') IS NOT NULL THEN
+        PERFORM oee_rollup_refresh_lines(array_agg(line_id), array_agg(date))
+        FROM (SELECT DISTINCT line_id, date FROM oee_line_shift) s;
+    END IF;
+    IF to_regclass('oee_station_shift') IS NOT NULL THEN
+        PERFORM oee_rollup_refresh_stations(array_agg(line_id), array_agg(date))
+        FROM (SELECT DISTINCT line_id, date FROM oee_station_shift) s;
+    END IF;
+    IF to_regclass('oee_downtime_events') IS NOT NULL THEN
+        PERFORM oee_rollup_refresh_downtime(array_agg(line_id), array_agg(date))
+        FROM (SELECT DISTINCT line_id, date FROM oee_downtime_events) s;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
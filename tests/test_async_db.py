@@ -0,0 +1,111 @@
+"""
+Async Data Access Tests
+
+PURPOSE:
+Ensure the async data-access paths used by async routers:
+- Batch violation state enrichment into one acknowledgment query
+- Compute the same line KPI summary as the sync tool
+- Fetch material context for a whole line in one query
+- Degrade to empty results when the database is unreachable
+"""
+
+import asyncio
+import sys
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+pytest.importorskip("psycopg_pool")
+pytest.importorskip("psycopg2")
+
+from packages.db import async_pool
+from packages.diagnostics.explainer import DiagnosticsExplainer
+from packages.tools import sqlkpi
+from packages.violation_audit import ViolationPersistence
+
+
+def test_active_violations_state_is_batched(monkeypatch):
+    v1, v2 = uuid.uuid4(), uuid.uuid4()
+    calls = []
+
+    async def fake_fetch_all(query, params=None, **kwargs):
+        calls.append(query)
+        if "v_violations_active" in query:
+            return [{"id": v1, "ts_end": None}, {"id": v2, "ts_end": None}]
+        return [
+            {"violation_id": v1, "ack_type": "acknowledged"},
+            {"violation_id": v1, "ack_type": "justified"},
+        ]
+
+    monkeypatch.setattr(async_pool, "fetch_all", fake_fetch_all)
+    persistence = ViolationPersistence("postgresql://test/db")
+    violations = asyncio.run(persistence.get_active_violations_async(with_state=True))
+
+    assert len(calls) == 2
+    assert [(v["state"], v["ack_count"]) for v in violations] == [("JUSTIFIED", 2), ("OPEN", 0)]
+
+
+def test_line_summary_async(monkeypatch):
+    rows = {
+        "kpi_oee": [{"oee": 0.8}, {"oee": 0.6}],
+        "kpi_fpy": [{"fpy": 0.9}],
+        "kpi_mttr": [],
+    }
+
+    async def fake_fetch_all(query, params=None, **kwargs):
+        return next(r for table, r in rows.items() if table in query)
+
+    monkeypatch.setattr(async_pool, "fetch_all", fake_fetch_all)
+    summary = asyncio.run(sqlkpi.get_line_summary_async("A01", days=7))
+
+    assert summary["avg_oee"] == 0.7
+    assert summary["avg_fpy"] == 0.9
+    assert summary["avg_mttr_minutes"] == 0
+    assert summary["data_points"] == {"oee": 2, "fpy": 1, "mttr": 0}
+
+
+def test_line_material_context_is_batched(monkeypatch):
+    calls = []
+
+    async def fake_fetch_all(query, params=None, **kwargs):
+        calls.append((query, params))
+        return [{
+            "station": "ST18", "mode": "serial", "active_serial": "SN-1", "active_lot": None,
+            "work_order": "WO-7", "operation": "OP10", "bom_revision": "B", "as_built_revision": "B",
+            "quality_status": "RELEASED", "dry_run_authorization": False, "deviation_id": None,
+            "tooling_calibration_ok": True, "operator_certified": True,
+            "material_ts": datetime(2026, 1, 1, 8, 0),
+        }]
+
+    monkeypatch.setattr(async_pool, "fetch_all", fake_fetch_all)
+    explainer = DiagnosticsExplainer()
+    profile = SimpleNamespace(display_name="Aerospace & Defence")
+    contexts = asyncio.run(explainer._fetch_material_contexts(["ST18", "ST19"], profile))
+
+    assert len(calls) == 1
+    assert "station = ANY(%s)" in calls[0][0]
+    assert calls[0][1] == (["ST18", "ST19"],)
+    assert contexts["ST18"]["evidence_present"] is True
+    assert contexts["ST18"]["material_ts"] == "2026-01-01T08:00:00"
+    assert contexts["ST19"]["evidence_present"] is False
+    assert contexts["ST19"]["mode"] == "serial"
+
+
+def test_unreachable_database_returns_empty(monkeypatch):
+    monkeypatch.setattr(async_pool, "DB_ASYNC_POOL_TIMEOUT_S", 0.5)
+
+    async def scenario():
+        persistence = ViolationPersistence("postgresql://nobody@127.0.0.1:1/none?connect_timeout=1")
+        try:
+            return await persistence.get_violation_history_async()
+        finally:
+            await async_pool.close_async_pools()
+
+    assert asyncio.run(scenario()) == []
@@ -0,0 +1,92 @@
+"""
+Context Packer Tests
+
+PURPOSE:
+Ensure token-budgeted prompt packing is:
+- Deterministic (same input -> same prompt)
+- Bounded by num_ctx minus the output reserve
+- Lossless when everything already fits
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from packages.core_rag.context_packer import (
+    ContextPacker,
+    count_tokens,
+    pack_passages,
+    truncate_to_tokens,
+)
+
+
+def _lines(prefix: str, n: int) -> str:
+    return "\n".join(f"{prefix} line {i}: status RUNNING cycle 42.0s" for i in range(n))
+
+
+class TestTruncation:
+
+    def test_short_text_untouched(self):
+        text = "Station ST18: RUNNING"
+        assert truncate_to_tokens(text, 100) == text
+
+    def test_truncated_text_fits_budget(self):
+        text = _lines("runtime", 200)
+        out = truncate_to_tokens(text, 120)
+        assert count_tokens(out) <= 120
+        assert "truncated" in out
+        # Leading lines are kept whole and in order
+        assert out.startswith("runtime line 0:")
+
+    def test_passages_kept_in_rank_order(self):
+        passages = [f"[DOC-{i}] " + _lines(f"doc{i}", 20) for i in range(5)]
+        out = pack_passages(passages, count_tokens(passages[0]) + 5)
+        assert out.startswith("[DOC-0]")
+        assert "[DOC-1]" not in out
+
+
+class TestContextPacker:
+
+    def test_everything_fits_no_truncation(self):
+        packer = ContextPacker(num_ctx=4096, reserve_output=512)
+        sections = {"runtime": "Line A01: OEE=80%", "kb": ["[WI-1] torque 12Nm"], "expectations": ""}
+        packed = packer.pack(sections, fixed_text="system")
+
+        assert packed.truncated == []
+        assert packed.sections["runtime"] == "Line A01: OEE=80%"
+        assert packed.sections["kb"] == "[WI-1] torque 12Nm"
+
+    def test_prompt_fits_context_window(self):
+        packer = ContextPacker(num_ctx=1024, reserve_output=256)
+        sections = {
+            "runtime": _lines("runtime", 300),
+            "kb": [_lines(f"doc{i}", 80) for i in range(5)],
+            "expectations": _lines("expectation", 100),
+        }
+        packed = packer.pack(sections, fixed_text="system prompt and question")
+
+        assert packed.prompt_tokens <= 1024 - 256
+        assert set(packed.truncated) == {"runtime", "kb", "expectations"}
+        assert packed.stats()["original_tokens"]["runtime"] > packed.section_tokens["runtime"]
+
+    def test_unused_budget_is_redistributed(self):
+        packer = ContextPacker(num_ctx=2048, reserve_output=0)
+        sections = {"runtime": "tiny", "kb": _lines("kb", 400), "expectations": ""}
+        packed = packer.pack(sections)
+
+        # kb gets (almost) the whole window, not just its 45% share
+        assert packed.section_tokens["kb"] > 0.9 * 2048 - count_tokens("tiny")
+
+    def test_packing_is_deterministic(self):
+        packer = ContextPacker(num_ctx=800, reserve_output=200)
+        sections = {"runtime": _lines("runtime", 150), "kb": [_lines("doc", 60)] * 3}
+        first = packer.pack(sections, fixed_text="fixed")
+        second = packer.pack(sections, fixed_text="fixed")
+
+        assert first.sections == second.sections
+        assert first.stats() == second.stats()
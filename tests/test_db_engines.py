@@ -0,0 +1,51 @@
+"""
+Database Engine Registry Tests
+
+PURPOSE:
+Ensure the shared engine registry:
+- Returns the same pooled engine for the same URL
+- Normalises plain postgresql:// URLs to psycopg 3
+- Reports pool statistics and disposes all engines
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+pytest.importorskip("sqlalchemy")
+
+from packages.db import dispose_engines, engine_pool_stats, get_engine
+from packages.db.engines import _normalize_url
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    dispose_engines()
+    yield
+    dispose_engines()
+
+
+def test_same_url_shares_engine(tmp_path):
+    url = f"sqlite:///{tmp_path / 'a.db'}"
+    assert get_engine(url) is get_engine(url)
+    assert get_engine(url) is not get_engine(f"sqlite:///{tmp_path / 'b.db'}")
+
+
+def test_postgres_url_uses_psycopg3():
+    assert _normalize_url("postgresql://u:p@h/db") == "postgresql+psycopg://u:p@h/db"
+    assert _normalize_url("postgresql+psycopg://u:p@h/db") == "postgresql+psycopg://u:p@h/db"
+
+
+def test_pool_stats_and_dispose(tmp_path):
+    get_engine(f"sqlite:///{tmp_path / 'a.db'}")
+    stats = engine_pool_stats()
+    assert stats["engines"] == 1
+    assert "checkedout" in next(iter(stats["pools"].values()))
+
+    dispose_engines()
+    assert engine_pool_stats()["engines"] == 0
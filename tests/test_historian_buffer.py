@@ -0,0 +1,184 @@
+"""
+Historian Store-and-Forward Tests
+
+PURPOSE:
+Ensure historian writes survive a database outage:
+- Batches queue in memory and spill to the local file once it is full
+- A failed write switches new batches to the spill file
+- Everything is replayed in order when the database is back
+- Queued batches move to the spill file on shutdown and are replayed after a restart
+- Batches written later than the rollup overlap are re-rolled-up until that succeeds
+"""
+
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+# Add OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+pytest.importorskip("psycopg_pool")
+
+import psycopg
+
+from app import historian
+from app.historian import Historian
+from app.historian_buffer import SpillBuffer
+
+
+class _FlakyConn:
+    """Records event payloads; raises OperationalError while `down`"""
+
+    def __init__(self):
+        self.down = False
+        self.written = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None, prepare=None):
+        if self.down:
+            raise psycopg.OperationalError("connection refused")
+        self.written.append(params[-1].obj["n"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def db(monkeypatch):
+    conn = _FlakyConn()
+
+    @contextmanager
+    def fake_pooled_conn():
+        yield conn
+
+    monkeypatch.setattr(historian, "pooled_conn", fake_pooled_conn)
+    return conn
+
+
+def _historian(monkeypatch, tmp_path, max_batches=3):
+    monkeypatch.setattr(historian, "SPILL_PATH", str(tmp_path / "spill.jsonl"))
+    monkeypatch.setattr(historian, "QUEUE_MAX_BATCHES", max_batches)
+    h = Historian()
+    h.enabled = True
+    return h
+
+
+def _event(h, n):
+    h.write_event("TORINO", "A01", "ST1", "Test", {"n": n})
+
+
+def test_outage_spills_and_replays_in_order(db, monkeypatch, tmp_path):
+    h = _historian(monkeypatch, tmp_path)
+    db.down = True
+    for n in range(2):
+        _event(h, n)
+    with pytest.raises(psycopg.OperationalError):
+        h.flush()
+
+    # After the failure new batches bypass memory
+    for n in range(2, 6):
+        _event(h, n)
+    stats = h.write_stats()
+    assert stats["queue_depth"] == 2 and stats["spilling"]
+    assert stats["spilled_batches"] == 4 and stats["spilled_bytes"] > 0
+
+    db.down = False
+    assert h.flush() == 6
+    assert db.written == list(range(6))
+    stats = h.write_stats()
+    assert not stats["spilling"] and stats["spilled_bytes"] == 0 and stats["replayed_batches"] == 4
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_full_queue_spills_without_dropping(db, monkeypatch, tmp_path):
+    h = _historian(monkeypatch, tmp_path, max_batches=2)
+    for n in range(5):
+        _event(h, n)
+    assert h.write_stats()["queue_depth"] == 2
+    h.flush()
+    assert db.written == list(range(5))
+
+
+def test_queued_batches_survive_restart(db, monkeypatch, tmp_path):
+    h = _historian(monkeypatch, tmp_path)
+    db.down = True
+    _event(h, 0)
+    with pytest.raises(psycopg.OperationalError):
+        h.flush()
+    _event(h, 1)   # spilled
+    h.buffer.persist()  # shutdown: queued batch 0 goes ahead of batch 1
+
+    db.down = False
+    restarted = SpillBuffer(str(tmp_path / "spill.jsonl"))
+    assert restarted.spilling
+    h.buffer = restarted
+    h.flush()
+    assert db.written == [0, 1]
+
+
+class _MaintenanceConn:
+    """Answers the maintenance statements; rollup_range fails while `fail_range`"""
+
+    def __init__(self):
+        self.autocommit = False
+        self.fail_range = False
+        self.ranges = []
+        self._last = None
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        if "opc_historian_rollup_range" in sql:
+            if self.fail_range:
+                raise psycopg.OperationalError("statement timeout")
+            self.ranges.append(params[0])
+        self._last = sql
+
+    def fetchone(self):
+        if "refresh_rollups" in self._last:
+            return (datetime.now(timezone.utc),)
+        if "apply_retention" in self._last:
+            return ({},)
+        return (0,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_late_batches_are_rerolled_until_success(db, monkeypatch, tmp_path):
+    h = _historian(monkeypatch, tmp_path)
+    maintenance = _MaintenanceConn()
+    monkeypatch.setattr(historian, "get_conn", lambda: maintenance)
+
+    _event(h, 0)
+    h.flush()
+    assert h._late_from is None  # in-memory batch within the overlap
+
+    # A batch older than the overlap needs a re-rollup even if it never spilled
+    monkeypatch.setattr(historian, "ROLLUP_OVERLAP_S", -60.0)
+    _event(h, 1)
+    h.flush()
+    late_from = h._late_from
+    assert late_from is not None
+
+    maintenance.fail_range = True
+    with pytest.raises(psycopg.OperationalError):
+        h.run_maintenance()
+    assert h._late_from == late_from
+
+    maintenance.fail_range = False
+    h.run_maintenance()
+    assert maintenance.ranges == [late_from] and h._late_from is None
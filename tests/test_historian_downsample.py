@@ -0,0 +1,127 @@
+"""
+Historian Downsampling Tests
+
+PURPOSE:
+Ensure the OPC Studio historian series downsampling:
+- Returns exactly the target number of points with LTTB
+- Keeps the first/last sample and isolated spikes
+- Rejects metrics that are not whitelisted column names
+- Reads the 1m/1h rollups for ranges past raw retention
+- Holds change-only samples as steps across the requested range
+- Looks back at least one rollup bucket for the held value, and picks it deterministically
+"""
+
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+# Add OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+pytest.importorskip("psycopg")
+
+from app.historian_query import hold_steps, lttb, query_series, series_tier
+
+
+def _series(n, spike_at=None):
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [
+        (t0 + timedelta(seconds=5 * i), 0.1 if i == spike_at else 0.7 + 0.01 * (i % 7))
+        for i in range(n)
+    ]
+
+
+def test_lttb_hits_target_and_keeps_endpoints():
+    points = _series(10_000)
+    sampled = lttb(points, 500)
+    assert len(sampled) == 500
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert [p[0] for p in sampled] == sorted(p[0] for p in sampled)
+
+
+def test_lttb_keeps_spike():
+    points = _series(10_000, spike_at=4321)
+    assert points[4321] in lttb(points, 200)
+
+
+def test_short_series_is_returned_unchanged():
+    points = _series(50)
+    assert lttb(points, 1000) == points
+
+
+def test_unknown_metric_is_rejected():
+    with pytest.raises(ValueError):
+        query_series("A01", "oee; DROP TABLE opc_kpi_samples")
+    with pytest.raises(ValueError):
+        query_series("A01", "oee", station="ST1")  # oee is a line metric
+
+
+def test_ranges_past_raw_retention_use_rollups(monkeypatch):
+    from app import historian_query
+    monkeypatch.setattr(historian_query, "RETENTION_DAYS", 30)
+    monkeypatch.setattr(historian_query, "ROLLUP_1M_RETENTION_DAYS", 0)
+    now = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+    assert series_tier(now - timedelta(days=7), now, 1000, now=now) == "raw"
+    assert series_tier(now - timedelta(days=40), now - timedelta(days=39), 1000, now=now) == "1m"
+    assert series_tier(now - timedelta(days=365), now, 1000, now=now) == "1h"
+
+    monkeypatch.setattr(historian_query, "ROLLUP_1M_RETENTION_DAYS", 35)
+    assert series_tier(now - timedelta(days=40), now - timedelta(days=39), 1000, now=now) == "1h"
+
+
+def test_hold_steps_carries_values_to_range_edges():
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    points = [(t0 + timedelta(minutes=10), 0.8), (t0 + timedelta(minutes=20), 0.6)]
+    held = hold_steps(points, 0.7, t0, t0 + timedelta(hours=1))
+    assert held == [(t0, 0.7)] + points + [(t0 + timedelta(hours=1), 0.6)]
+    assert hold_steps([], None, t0, t0 + timedelta(hours=1)) == []
+
+
+def test_held_value_lookback_covers_rollup_bucket(monkeypatch):
+    from app import historian_query
+    monkeypatch.setattr(historian_query, "RETENTION_DAYS", 30)
+    monkeypatch.setattr(historian_query, "_heartbeat_lookback", timedelta(minutes=2))
+    statements = []
+
+    class _Cursor:
+        def execute(self, sql, params):
+            statements.append((sql, params))
+
+        def fetchall(self):
+            return []
+
+        def fetchone(self):
+            return (0.75,)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    class _Conn:
+        def cursor(self):
+            return _Cursor()
+
+    @contextmanager
+    def fake_pooled_conn():
+        yield _Conn()
+
+    monkeypatch.setattr(historian_query, "pooled_conn", fake_pooled_conn)
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    result = query_series("A01", "oee", start=start, end=start + timedelta(days=100), points=100)
+
+    assert result["source"] == "1h"
+    prior_sql, prior_params = statements[1]
+    assert "oee_avg" in prior_sql and "ORDER BY r.bucket DESC" in prior_sql
+    assert prior_params["end"] - prior_params["start"] == timedelta(hours=1, minutes=2)
+    assert result["points"][0][1] == 0.75
+
+    query_series("A01", "good_count", station="ST1", start=start, end=start + timedelta(days=100), points=100)
+    assert "good_count_max" in statements[3][0]
+    assert historian_query.hold_lookback("raw") == timedelta(minutes=2)
@@ -0,0 +1,145 @@
+"""
+Historian Write Tests
+
+PURPOSE:
+Ensure the OPC Studio historian:
+- Flattens a plant snapshot into one row per line and per station
+- Writes each table with a single statement per snapshot
+- Reports write latency and throughput for /historian/status
+- Skips rows whose signals stay within their deadband until the heartbeat
+"""
+
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+# Add OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+pytest.importorskip("psycopg_pool")
+
+from app import historian
+from app.historian import Historian, snapshot_rows
+from app.recording import RecordingPolicy
+
+
+SNAPSHOT = {
+    "data": {
+        "plant": "TORINO",
+        "lines": {
+            "A01": {"oee": 0.8, "status": "RUNNING", "stations": {
+                "ST1": {"state": "RUNNING", "cycle_time_s": 31.5, "good_count": 10, "alarms": []},
+                "ST2": {"state": "DOWN", "alarms": ["E-STOP"]},
+            }},
+            "B02": {"oee": 0.6},
+        },
+    }
+}
+
+
+class _Conn:
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None, prepare=None):
+        self.statements.append((sql, params, prepare))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = _Conn()
+
+    @contextmanager
+    def fake_pooled_conn():
+        yield conn
+
+    monkeypatch.setattr(historian, "pooled_conn", fake_pooled_conn)
+    return conn
+
+
+@pytest.fixture
+def h(monkeypatch, tmp_path):
+    monkeypatch.setattr(historian, "SPILL_PATH", str(tmp_path / "spill.jsonl"))
+    h = Historian()
+    h.enabled = True
+    return h
+
+
+def test_snapshot_rows():
+    kpi_rows, station_rows = snapshot_rows(SNAPSHOT)
+    assert [r[:3] for r in kpi_rows] == [("TORINO", "A01", 0.8), ("TORINO", "B02", 0.6)]
+    assert [r[2] for r in station_rows] == ["ST1", "ST2"]
+    assert station_rows[1][4:8] == (0.0, 0, 0, ["E-STOP"])
+
+
+def test_snapshot_is_one_prepared_statement_per_table(conn, h):
+    h.write_snapshot(SNAPSHOT)
+    assert conn.statements == []  # queued for the writer
+    assert h.flush() == 1
+
+    assert [sql for sql, _, _ in conn.statements] == [historian.KPI_INSERT_SQL, historian.STATION_INSERT_SQL]
+    assert all(prepare for _, _, prepare in conn.statements)
+    # Sampling time, then column arrays: the line column of the station insert
+    assert conn.statements[1][1][0] == conn.statements[0][1][0]
+    assert conn.statements[1][1][2] == ["A01", "A01"]
+
+    stats = h.write_stats()
+    assert stats["writes"] == 1 and stats["rows_written"] == 4 and stats["last_write_rows"] == 4
+    assert stats["last_write_ms"] is not None
+
+
+def test_deadband_policy():
+    policy = RecordingPolicy({
+        "mode": "deadband", "max_silence_s": 60,
+        "line": {"oee": {"deadband_abs": 0.01}},
+        "station": {"cycle_time_s": {"deadband_pct": 5}},
+    })
+    assert not policy.signal_changed("line", "oee", 0.80, 0.805)
+    assert policy.signal_changed("line", "oee", 0.80, 0.81)
+    assert not policy.signal_changed("station", "cycle_time_s", 40.0, 41.0)
+    assert policy.signal_changed("station", "cycle_time_s", 40.0, 42.0)
+    assert policy.signal_changed("station", "alarms", [], ["E-STOP"])
+
+    values = (0.8, 0.9, 0.9, 0.9, "RUNNING")
+    assert policy.should_record("line", values, None, 0)
+    assert not policy.should_record("line", values, values, 59)
+    assert policy.should_record("line", values, values, 60)
+
+
+def test_unchanged_snapshot_is_not_rewritten(conn, h, monkeypatch):
+    monkeypatch.setattr(historian.time, "time", lambda: 1000.0)
+    h.policy = RecordingPolicy({"mode": "deadband", "max_silence_s": 300})
+    h.write_snapshot(SNAPSHOT)
+    h.flush()
+    assert len(conn.statements) == 2
+
+    h.write_snapshot(SNAPSHOT)
+    assert h.flush() == 0
+    assert len(conn.statements) == 2 and h.rows_skipped == 4
+
+    # Only the station whose alarms changed is written
+    changed = {"data": {**SNAPSHOT["data"], "lines": {**SNAPSHOT["data"]["lines"]}}}
+    a01 = dict(changed["data"]["lines"]["A01"])
+    a01["stations"] = {**a01["stations"], "ST1": {**a01["stations"]["ST1"], "alarms": ["JAM"]}}
+    changed["data"]["lines"]["A01"] = a01
+    h.write_snapshot(changed)
+    h.flush()
+    assert [sql for sql, _, _ in conn.statements[2:]] == [historian.STATION_INSERT_SQL]
+    assert conn.statements[2][1][3] == ["ST1"]
+
+    monkeypatch.setattr(historian.time, "time", lambda: 1300.0)
+    h.write_snapshot(changed)
+    h.flush()
+    assert len(conn.statements) == 5  # heartbeat rewrites everything
@@ -0,0 +1,101 @@
+"""
+KPI Query Cache Tests
+
+PURPOSE:
+Ensure the KPI query cache:
+- Keys on normalized query text and parameters
+- Expires entries at the end of their time bucket
+- Drops only the entries that read an invalidated table
+- Shares one computation between concurrent async misses
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+pytest.importorskip("psycopg")
+
+from packages.db import kpi_cache
+from packages.db.kpi_cache import KPIQueryCache, make_query_key, tables_in
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fresh = KPIQueryCache(bucket_s=60, max_entries=8)
+    monkeypatch.setattr(kpi_cache, "_cache", fresh)
+    monkeypatch.setattr(kpi_cache, "KPI_CACHE_ENABLED", True)
+    return fresh
+
+
+def test_key_normalizes_whitespace_and_empty_filters():
+    a = make_query_key("SELECT *\n  FROM kpi_oee WHERE line = %s", {"line": "A01", "shift": None})
+    b = make_query_key("SELECT * FROM kpi_oee WHERE line = %s", {"line": " A01"})
+    assert a == b
+    assert a != make_query_key("SELECT * FROM kpi_oee WHERE line = %s", {"line": "A02"})
+
+
+def test_tables_in_maps_rollups_to_source_tables():
+    assert tables_in("SELECT * FROM kpi_oee JOIN kpi_fpy USING (line)") == {"kpi_oee", "kpi_fpy"}
+    assert tables_in("SELECT SUM(events) FROM oee_downtime_rollup") == {"oee_downtime_events"}
+
+
+def test_hit_until_bucket_rolls_over(cache, monkeypatch):
+    calls = []
+    compute = lambda: calls.append(1) or [{"oee": 0.8}]
+
+    assert kpi_cache.cached_query("SELECT oee FROM kpi_oee", [], compute) == [{"oee": 0.8}]
+    assert kpi_cache.cached_query("SELECT oee FROM kpi_oee", [], compute) == [{"oee": 0.8}]
+    assert len(calls) == 1
+
+    bucket = cache.current_bucket()
+    monkeypatch.setattr(cache, "current_bucket", lambda: bucket + 1)
+    kpi_cache.cached_query("SELECT oee FROM kpi_oee", [], compute)
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_invalidation_drops_dependent_entries_only(cache):
+    kpi_cache.cached_query("SELECT * FROM kpi_oee", [], lambda: "oee")
+    kpi_cache.cached_query("SELECT * FROM oee_downtime_rollup", [], lambda: "losses")
+    kpi_cache.cached_query("dashboard.tile", None, lambda: "tile", tables=())
+
+    # Entries with unknown dependencies go on any write
+    assert cache.invalidate("oee_downtime_events") == 2
+    assert cache.get(make_query_key("SELECT * FROM kpi_oee", []))[0]
+    assert cache.invalidate("*") == 1
+    assert cache.stats()["invalidations"] == {"oee_downtime_events": 1, "*": 1}
+
+
+def test_hits_without_listener_count_as_stale(cache):
+    kpi_cache.cached_query("SELECT * FROM kpi_oee", [], lambda: 1)
+    kpi_cache.cached_query("SELECT * FROM kpi_oee", [], lambda: 1)
+    cache.listener_connected = True
+    kpi_cache.cached_query("SELECT * FROM kpi_oee", [], lambda: 1)
+    assert cache.stats()["staleness"]["stale_hits"] == 2  # no triggers installed: nothing NOTIFYs
+    cache.triggers_installed = True
+    kpi_cache.cached_query("SELECT * FROM kpi_oee", [], lambda: 1)
+    assert cache.stats()["staleness"]["stale_hits"] == 2
+
+
+def test_concurrent_async_misses_share_computation(cache):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [{"fpy": 0.9}]
+
+    async def scenario():
+        return await asyncio.gather(*[
+            kpi_cache.cached_query_async("SELECT * FROM kpi_fpy", ["A01"], compute) for _ in range(5)
+        ])
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(r == [{"fpy": 0.9}] for r in results)
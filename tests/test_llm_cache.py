@@ -0,0 +1,97 @@
+"""
+LLM Generation Cache Tests
+
+PURPOSE:
+Ensure the generation cache:
+- Keys on model, system prompt, prompt and options
+- Expires entries after the TTL
+- Evicts least recently used entries beyond the size bound
+- Reports hit-rate metrics
+- Counts bypasses only when the cache is enabled and the caller opted out
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from packages.core_rag import llm_cache
+from packages.core_rag.llm_cache import GenerationCache, make_cache_key
+
+
+class TestCacheKey:
+
+    def test_key_is_stable(self):
+        a = make_cache_key("llama3.2:3b", "sys", "prompt", {"temperature": 0.3, "num_ctx": 4096})
+        b = make_cache_key("llama3.2:3b", "sys", "prompt", {"num_ctx": 4096, "temperature": 0.3})
+        assert a == b
+
+    @pytest.mark.parametrize("change", [
+        ("llama3.2:1b", "sys", "prompt", {"temperature": 0.3}),
+        ("llama3.2:3b", "other", "prompt", {"temperature": 0.3}),
+        ("llama3.2:3b", "sys", "prompt!", {"temperature": 0.3}),
+        ("llama3.2:3b", "sys", "prompt", {"temperature": 0.7}),
+    ])
+    def test_any_input_changes_key(self, change):
+        base = make_cache_key("llama3.2:3b", "sys", "prompt", {"temperature": 0.3})
+        assert make_cache_key(*change) != base
+
+
+class TestGenerationCache:
+
+    def test_hit_and_miss_counters(self):
+        cache = GenerationCache(ttl_s=60, max_entries=10)
+        assert cache.get("k") is None
+        cache.put("k", "answer")
+        assert cache.get("k") == "answer"
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_entries_expire(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(llm_cache.time, "monotonic", lambda: now[0])
+        cache = GenerationCache(ttl_s=30, max_entries=10)
+        cache.put("k", "answer")
+
+        now[0] += 29
+        assert cache.get("k") == "answer"
+        now[0] += 2
+        assert cache.get("k") is None
+        assert cache.stats()["expirations"] == 1
+
+    def test_lru_eviction(self):
+        cache = GenerationCache(ttl_s=60, max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")  # a is now most recently used
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+
+class TestBypassCounting:
+
+    @pytest.mark.parametrize("enabled, use_cache, bypasses", [
+        (True, False, 1),
+        (True, True, 0),
+        (False, False, 0),
+        (False, True, 0),
+    ])
+    def test_bypass_recorded_only_for_opt_out_of_enabled_cache(self, monkeypatch, enabled, use_cache, bypasses):
+        from packages.core_rag import llm_client
+
+        cache = GenerationCache(ttl_s=60, max_entries=10)
+        monkeypatch.setattr(llm_client, "get_generation_cache", lambda: cache)
+        monkeypatch.setattr(llm_client, "LLM_CACHE_ENABLED", enabled)
+        assert llm_client._cached_answer({"cache_key": "k", "prompt_stats": {}}, use_cache) is None
+        assert cache.stats()["bypasses"] == bypasses
@@ -0,0 +1,130 @@
+"""
+LLM Scheduler Tests
+
+PURPOSE:
+Ensure the LLM scheduler:
+- Never exceeds its concurrency limit
+- Serves waiters by priority class, FIFO within a class
+- Rejects fast (429) when a priority queue is full
+- Rejects (503) when the wait exceeds the max wait, with a retry hint
+- Lets async /ask handlers queue for a slot without holding worker threads
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from packages.core_rag.llm_scheduler import LLMBusyError, LLMScheduler, resolve_priority
+
+
+class TestResolvePriority:
+
+    def test_operator_ask_is_high(self):
+        assert resolve_priority("operator", "ask") == "high"
+
+    def test_operator_safety_question_is_critical(self):
+        assert resolve_priority("operator", "ask", "What PPE is required at ST18?") == "critical"
+
+    def test_less_urgent_class_wins(self):
+        assert resolve_priority("plant_manager", "ask") == "normal"
+        assert resolve_priority("operator", "analysis") == "low"
+        assert resolve_priority(endpoint="diagnostics") == "normal"
+
+
+class TestScheduler:
+
+    def test_priority_order(self):
+        scheduler = LLMScheduler(max_concurrency=1, queue_limits={"high": 4, "low": 4}, max_wait_s=5)
+        scheduler.acquire("normal")  # occupy the only slot
+        order = []
+
+        def worker(priority, tag):
+            with scheduler.slot(priority):
+                order.append(tag)
+
+        threads = [
+            threading.Thread(target=worker, args=("low", "low-1")),
+            threading.Thread(target=worker, args=("high", "high-1")),
+            threading.Thread(target=worker, args=("high", "high-2")),
+        ]
+        for t in threads:
+            t.start()
+            time.sleep(0.05)  # deterministic enqueue order
+        scheduler.release()
+        for t in threads:
+            t.join(2)
+
+        assert order == ["high-1", "high-2", "low-1"]
+        assert scheduler.stats()["active"] == 0
+
+    def test_queue_full_rejects_with_429(self):
+        scheduler = LLMScheduler(max_concurrency=1, queue_limits={"low": 0}, max_wait_s=5)
+        scheduler.acquire("normal")
+
+        with pytest.raises(LLMBusyError) as exc:
+            scheduler.acquire("low")
+        assert exc.value.status_code == 429
+        assert exc.value.retry_after >= 1
+        assert scheduler.stats()["priorities"]["low"]["rejected_queue_full"] == 1
+
+    def test_wait_timeout_rejects_with_503(self):
+        scheduler = LLMScheduler(max_concurrency=1, queue_limits={"normal": 4}, max_wait_s=0.05)
+        scheduler.acquire("normal")
+
+        with pytest.raises(LLMBusyError) as exc:
+            scheduler.acquire("normal")
+        assert exc.value.status_code == 503
+        assert scheduler.stats()["priorities"]["normal"]["queue_depth"] == 0
+
+    def test_async_waiter_is_woken(self):
+        scheduler = LLMScheduler(max_concurrency=1, queue_limits={"high": 4}, max_wait_s=2)
+
+        async def scenario():
+            await scheduler.acquire_async("normal")
+            waiter = asyncio.create_task(scheduler.acquire_async("high"))
+            await asyncio.sleep(0.05)
+            assert not waiter.done()
+            scheduler.release(1.0)
+            waited = await waiter
+            scheduler.release(1.0)
+            return waited
+
+        waited = asyncio.run(scenario())
+        assert waited > 0
+        stats = scheduler.stats()
+        assert stats["active"] == 0
+        assert stats["priorities"]["high"]["granted"] == 1
+
+    def test_generate_answer_async_waits_without_threads(self, monkeypatch):
+        from packages.core_rag import llm_client
+
+        scheduler = LLMScheduler(max_concurrency=1, queue_limits={"high": 16}, max_wait_s=0.2)
+        monkeypatch.setattr(llm_client, "get_llm_scheduler", lambda: scheduler)
+        scheduler.acquire("normal")  # occupy the only slot
+        passages = [{"text": "Torque spec is 12 Nm.", "metadata": {"doc_id": "WI-1"}}]
+
+        async def scenario():
+            threads = threading.active_count()
+            waiters = [
+                asyncio.create_task(llm_client.generate_answer_async(
+                    f"question {i}", passages, use_cache=False, priority="high"
+                ))
+                for i in range(8)
+            ]
+            await asyncio.sleep(0.05)
+            queued = scheduler.stats()["priorities"]["high"]["queue_depth"]
+            grown = threading.active_count() - threads
+            results = await asyncio.gather(*waiters, return_exceptions=True)
+            return queued, grown, results
+
+        queued, grown, results = asyncio.run(scenario())
+        assert queued == 8 and grown == 0
+        assert all(isinstance(r, LLMBusyError) and r.status_code == 503 for r in results)
@@ -0,0 +1,108 @@
+"""
+Material Context Tests
+
+PURPOSE:
+Ensure /semantic/snapshot stays cheap and side-effect free:
+- All stations are looked up in a single query, then served from the TTL cache
+- Stations without evidence get evidence_present=False; failures are not cached
+- The response is a copy: plant state is never given a material_context
+"""
+
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+# Add OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+pytest.importorskip("psycopg_pool")
+pytest.importorskip("yaml")
+
+from app import material_context
+from app.material_context import MaterialContextCache
+
+
+class _Conn:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self.fail = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None, prepare=None):
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        self.queries.append(params)
+
+    def fetchall(self):
+        return [row for row in self.rows if row[0] in self.queries[-1][0]]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    ts = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc)
+    row = ("ST17", "PRODUCTION", "SN-1", "LOT-7", "WO-1", "OP10", "B", "B", "RELEASED", False, None, True, True, ts)
+    conn = _Conn([row])
+
+    @contextmanager
+    def fake_pooled_conn():
+        yield conn
+
+    monkeypatch.setattr(material_context, "pooled_conn", fake_pooled_conn)
+    return conn
+
+
+def test_one_query_for_all_stations_then_cache(conn):
+    cache = MaterialContextCache(ttl_s=60)
+    contexts = cache.get_many(["ST17", "ST18", "ST17"])
+
+    assert conn.queries == [(["ST17", "ST18"],)]
+    assert contexts["ST17"]["active_serial"] == "SN-1" and contexts["ST17"]["evidence_present"]
+    assert contexts["ST17"]["material_ts"] == "2026-01-05T08:00:00+00:00"
+    assert contexts["ST18"]["evidence_present"] is False
+
+    contexts["ST17"]["active_serial"] = "changed by caller"
+    assert cache.get("ST17")["active_serial"] == "SN-1"
+    assert len(conn.queries) == 1
+
+
+def test_errors_are_reported_and_not_cached(conn):
+    cache = MaterialContextCache(ttl_s=60)
+    conn.fail = True
+    assert cache.get("ST17")["error"] == "database unavailable"
+    conn.fail = False
+    assert cache.get("ST17")["evidence_present"]
+
+
+def test_semantic_snapshot_does_not_touch_state(conn, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    from app.api import build_api
+    from app.historian import Historian
+    from app.state import PlantState
+
+    monkeypatch.setattr(material_context, "_cache", MaterialContextCache(ttl_s=60))
+    state = PlantState()
+    client = TestClient(build_api(state, Historian()))
+
+    body = client.get("/semantic/snapshot").json()
+    stations = [st for line in body["data"]["lines"].values() for st in line["stations"].values()]
+    assert stations and all("material_context" in st for st in stations)
+    assert len(conn.queries) == 1
+    assert not any(
+        "material_context" in st
+        for line in state.data["lines"].values() for st in line["stations"].values()
+    )
@@ -0,0 +1,94 @@
+"""
+OEE Trend Endpoint Tests
+
+PURPOSE:
+Ensure /oee/trend and /oee/trend/batch:
+- Fetch every requested line through one fetch_oee_trends call
+- Shape rows, loss Pareto and summary like the single-line endpoint
+- Report lines without data (404 for a single line, "missing" for a batch)
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi import HTTPException
+
+from packages.db import kpi_cache
+from apps.shopfloor_copilot.routers import oee_analytics
+
+
+LINE_DATA = {
+    "line_name": "Line A",
+    "records": 1,
+    "summary": {
+        "avg_oee": 0.612345, "avg_availability": 0.9, "avg_performance": 0.8,
+        "avg_quality": 0.85, "total_downtime_min": 12.0
+    },
+    "trend": [{
+        "date": "2026-10-01", "shift": "M", "line_name": "Line A",
+        "availability": 0.9, "performance": 0.8, "quality": 0.85, "oee": 0.612345,
+        "planned_time_min": 480, "unplanned_downtime_min": 12.0,
+        "total_units_produced": 100, "good_units": 95, "scrap_units": 5,
+        "main_loss_category": "Changeover"
+    }],
+    "top_losses": [{"category": "Changeover", "occurrences": 1, "total_downtime_min": 12.0, "avg_oee": 0.612345}]
+}
+
+
+class _Engine:
+    def begin(self):
+        return self
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def fetch_calls(monkeypatch):
+    calls = []
+
+    def fake_fetch(conn, line_ids, shift=None, since_days=None, max_rows=None, top_losses=5):
+        calls.append({"line_ids": list(line_ids), "shift": shift, "max_rows": max_rows})
+        return {line_id: LINE_DATA for line_id in line_ids if line_id == "A01"}
+
+    monkeypatch.setattr(kpi_cache, "KPI_CACHE_ENABLED", False)
+    monkeypatch.setattr(oee_analytics, "get_db_engine", lambda: _Engine())
+    monkeypatch.setattr(oee_analytics, "fetch_oee_trends", fake_fetch)
+    return calls
+
+
+def test_single_line_trend_payload(fetch_calls):
+    result = oee_analytics.get_oee_trend(oee_analytics.OEETrendRequest(line_id="A01", days=7, shift="M"))
+
+    assert fetch_calls == [{"line_ids": ["A01"], "shift": "M", "max_rows": 21}]
+    assert result["summary"]["avg_oee"] == 0.6123
+    assert result["trend_data"][0]["downtime_min"] == 12.0
+    assert result["top_losses"][0]["category"] == "Changeover"
+
+
+def test_single_line_without_data_is_404(fetch_calls):
+    with pytest.raises(HTTPException) as exc:
+        oee_analytics.get_oee_trend(oee_analytics.OEETrendRequest(line_id="ZZ"))
+    assert exc.value.status_code == 404
+
+
+def test_batch_uses_one_query(fetch_calls):
+    req = oee_analytics.OEETrendBatchRequest(line_ids=["A01", "ZZ", "A01"], days=14)
+    result = oee_analytics.get_oee_trend_batch(req)
+
+    assert fetch_calls == [{"line_ids": ["A01", "ZZ"], "shift": None, "max_rows": 42}]
+    assert list(result["lines"]) == ["A01"]
+    assert result["missing"] == ["ZZ"]
+    assert result["lines"]["A01"] == oee_analytics.get_oee_trend(oee_analytics.OEETrendRequest(line_id="A01"))
@@ -0,0 +1,104 @@
+"""
+Ollama Replica Pool Tests
+
+PURPOSE:
+Ensure LLM requests are routed:
+- To the replica with the fewest outstanding requests
+- Only to replicas that have the model loaded (when known)
+- Away from replicas that failed, until a probe succeeds again
+- Not away from replicas that are merely slow (read timeouts)
+- Stickily per session while the sticky replica is not overloaded
+"""
+
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from packages.core_rag import ollama_pool
+from packages.core_rag.ollama_pool import OllamaPool, parse_endpoints
+
+URLS = ["http://ollama-1:11434", "http://ollama-2:11434", "http://ollama-3:11434"]
+
+
+@pytest.fixture
+def pool():
+    # probe_interval_s=0 disables the background prober
+    return OllamaPool(URLS, probe_interval_s=0, sticky_slack=1)
+
+
+def test_parse_endpoints():
+    assert parse_endpoints(" http://a:1/, http://b:2 ,") == ["http://a:1", "http://b:2"]
+    assert parse_endpoints("") == ["http://localhost:11434"]
+
+
+def test_least_outstanding(pool):
+    first = pool.select()
+    second = pool.select()
+    third = pool.select()
+    assert {first.url, second.url, third.url} == set(URLS)
+
+    pool.finish(second)
+    assert pool.select().url == second.url
+
+
+def test_model_availability(pool):
+    pool.replicas[0].models = ["mistral:latest"]
+    pool.replicas[1].models = ["llama3.2:3b"]
+    pool.replicas[2].models = ["mistral:latest"]
+
+    for _ in range(3):
+        assert pool.select("llama3.2:3b").url == URLS[1]
+
+
+def test_failed_replica_is_ejected_and_recovers(pool, monkeypatch):
+    with pytest.raises(httpx.ConnectError):
+        with pool.lease() as replica:
+            raise httpx.ConnectError("connection refused")
+    assert not pool.replicas[0].healthy
+    assert replica.url == URLS[0]
+    assert all(pool.select().url != URLS[0] for _ in range(4))
+
+    class _Resp:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"models": [{"name": "llama3.2:3b"}]}
+
+    monkeypatch.setattr(ollama_pool.httpx, "get", lambda *a, **k: _Resp())
+    pool.probe_all()
+    assert pool.replicas[0].healthy
+    assert pool.replicas[0].models == ["llama3.2:3b"]
+
+
+def test_read_timeout_does_not_eject(pool):
+    with pytest.raises(httpx.ConnectError):
+        with pool.lease() as replica:
+            raise httpx.ConnectError("connection refused")
+    pool.replicas[0].healthy = True  # one connect failure counted, then recovered
+
+    with pytest.raises(httpx.ReadTimeout):
+        with pool.lease(exclude=[URLS[1], URLS[2]]) as replica:
+            raise httpx.ReadTimeout("generation still running")
+    assert replica.url == URLS[0] and replica.healthy
+    assert replica.outstanding == 0 and replica.consecutive_failures == 1
+    assert isinstance(httpx.ConnectTimeout("x"), ollama_pool.RETRYABLE_ERRORS)
+    assert not isinstance(httpx.ReadTimeout("x"), ollama_pool.RETRYABLE_ERRORS)
+
+
+def test_sticky_session_until_overloaded(pool):
+    sticky = pool.select(session_key="ask:operator")
+    pool.finish(sticky)
+    assert pool.select(session_key="ask:operator").url == sticky.url  # outstanding 1 vs 0: within slack
+
+    pool.select(session_key="other")
+    pool.select(session_key="other")
+    pool.select(session_key="ask:operator")  # sticky replica now 2 ahead of the idlest
+    moved = pool.select(session_key="ask:operator")
+    assert moved.url != sticky.url
@@ -0,0 +1,94 @@
+"""
+OPC UA Client Watchlist Tests
+
+PURPOSE:
+Ensure the OPC Explorer client scales to large watchlists:
+- Many nodes are read with batched Read requests; bad nodes do not fail the call
+- Subscribing 500 nodes sends a handful of CreateMonitoredItems requests, not 500
+- Each watched node keeps a bounded history of its value changes
+"""
+
+import asyncio
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+asyncua = pytest.importorskip("asyncua")
+
+from app.opcua_client import OPCUAClient, WatchlistHandler
+
+NODES = 500
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _server(endpoint: str):
+    server = asyncua.Server()
+    await server.init()
+    server.set_endpoint(endpoint)
+    idx = await server.register_namespace("urn:test:watchlist")
+    folder = await server.nodes.objects.add_folder(idx, "Tags")
+    variables = [await folder.add_variable(idx, f"Tag{i}", float(i)) for i in range(NODES)]
+    await server.start()
+    return server, variables
+
+
+def test_bulk_read_batched_subscribe_and_history():
+    async def scenario():
+        endpoint = f"opc.tcp://127.0.0.1:{_free_port()}/test"
+        server, variables = await _server(endpoint)
+        client = OPCUAClient()
+        client.batch_size = 200
+        client.handler = WatchlistHandler(history_size=3)
+        try:
+            await client.connect(endpoint)
+            node_ids = [v.nodeid.to_string() for v in variables]
+
+            values = await client.read_values(node_ids[:3] + ["ns=9;s=Missing", "not a node id"])
+            assert [v["value"] for v in values[:3]] == [0.0, 1.0, 2.0]
+            assert "error" in values[3] and "error" in values[4]
+
+            calls = []
+            uaclient = client.client.uaclient
+            create = uaclient.create_monitored_items
+
+            async def counting_create(params):
+                calls.append(len(params.ItemsToCreate))
+                return await create(params)
+
+            uaclient.create_monitored_items = counting_create
+            result = await client.subscribe_nodes(node_ids + node_ids[:1], publishing_interval=50)
+            assert calls == [200, 200, 100]
+            assert len(result["subscribed"]) == NODES and result["failed"] == []
+            assert (await client.subscribe_node(node_ids[0]))["message"] == "Already monitoring this node"
+
+            for value in (10.0, 11.0, 12.0, 13.0):
+                await variables[7].write_value(value)
+                await asyncio.sleep(0.25)
+            history = client.get_watchlist_history(node_ids[7])["nodes"][node_ids[7]]
+            watchlist = await client.get_watchlist()
+
+            await client.unsubscribe_nodes(node_ids[:250])
+            remaining = len(client.monitored_nodes)
+            return history, watchlist, remaining
+        finally:
+            await client.disconnect()
+            await server.stop()
+
+    history, watchlist, remaining = asyncio.run(scenario())
+    # Bounded: the initial value and the first change have been dropped
+    assert [change["value"] for change in history] == [11.0, 12.0, 13.0]
+    assert watchlist["monitoring_count"] == NODES
+    tag7 = next(item for item in watchlist["watchlist"] if item["display_name"] == "Tag7")
+    assert tag7["value"] == 13.0 and tag7["history_count"] == 3
+    assert remaining == NODES - 250
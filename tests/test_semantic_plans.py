@@ -0,0 +1,81 @@
+"""
+Semantic Mapping Plan Tests
+
+PURPOSE:
+Ensure semantic mappings are compiled once and evaluated without eval:
+- Conditions support comparisons, boolean logic and arithmetic on `value`
+- Calls, attribute access and unknown names are rejected at compile time
+- Compiled plans produce the same signals as the YAML definitions describe
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+pytest.importorskip("yaml")
+
+from app.expressions import ExpressionError, compile_expression
+from app.semantic_engine import SemanticEngine
+
+CONFIG = str(project_root / "opc-studio" / "config" / "semantic_mappings.yaml")
+
+
+@pytest.mark.parametrize("source, value, expected", [
+    ("value < 90", 80, True),
+    ("value < 90", 95, False),
+    ("70 <= value < 90", 75, True),
+    ("value * 2 + 1 > 10 and not value == 5", 5, False),
+    ("value in ('FAULTED', 'BLOCKED')", "BLOCKED", True),
+    ("value == 'RUNNING' or value > 3 if value != 'RUNNING' else True", 4, True),
+])
+def test_conditions(source, value, expected):
+    assert compile_expression(source, ("value",))({"value": value}) is expected
+
+
+@pytest.mark.parametrize("source", [
+    "__import__('os').system('true')",
+    "value.__class__",
+    "value[0]",
+    "other < 1",
+    "lambda: 1",
+    "value < ",
+])
+def test_unsafe_expressions_are_rejected(source):
+    with pytest.raises(ExpressionError):
+        compile_expression(source, ("value",))
+
+
+def test_plans_follow_yaml_definitions():
+    engine = SemanticEngine(CONFIG)
+    assert set(engine.plans) == set(engine.station_types)
+
+    raw = {"Status": "FAULTED", "Temperature": 250, "Speed": 80, "ProductCount": 5, "CycleTime": 42}
+    signals = {s["semantic_id"]: s for s in engine.apply_semantic_mapping(raw, "assembly", {"station_id": "ST1"})}
+
+    assert signals["station.state"]["loss_category"] == "availability.equipment_failure"
+    assert signals["station.temperature"]["value"] == 200  # range_check max
+    assert signals["station.speed_actual"]["loss_category"] == "performance.reduced_speed"
+    assert signals["station.cycle_time_actual"]["loss_category"] is None
+    assert "station.quality_ok" not in signals  # no QualityOK tag in the raw data
+    assert all(s["metadata"] == {"station_id": "ST1"} for s in signals.values())
+    assert list(signals["station.state"]) == [
+        "semantic_id", "value", "unit", "timestamp", "source_node",
+        "loss_category", "quality", "description", "data_type", "metadata",
+    ]
+
+    raw["Speed"] = 95
+    fast = {s["semantic_id"]: s for s in engine.apply_semantic_mapping(raw, "assembly")}
+    assert fast["station.speed_actual"]["loss_category"] is None
+
+
+def test_bad_rule_is_disabled_not_evaluated():
+    engine = SemanticEngine(CONFIG)
+    loss_category = engine._compile_loss_category(
+        {"semantic_id": "x", "loss_category_rule": {"condition": "open('/etc/passwd')", "category": "bad"}}
+    )
+    assert loss_category(1) is None
@@ -0,0 +1,110 @@
+"""
+Semantic Signals Cache Tests
+
+PURPOSE:
+Ensure /semantic/signals is computed once per state version and values version:
+- Repeated reads serve the same pre-serialized body (and 304 with If-None-Match)
+- A state change or a history tick that changes a transform / KPI output
+  invalidates the cached result; ticks of a steady plant do not
+- The compact format deduplicates metadata and expands back to the same signals
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("yaml")
+
+from fastapi.testclient import TestClient
+
+from app import api as api_module
+from app.api import build_api
+from app.historian import Historian
+from app.semantic_engine import SemanticEngine
+from app.state import PlantState
+from packages.tools.opc_semantic import expand_compact
+
+CONFIG = str(project_root / "opc-studio" / "config" / "semantic_mappings.yaml")
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    engine = SemanticEngine(CONFIG)
+    monkeypatch.setattr(api_module, "get_semantic_engine", lambda: engine)
+    state = PlantState()
+    for line in state.data["lines"].values():
+        for station in line["stations"].values():
+            station["type"] = "assembly"
+    builds = []
+    original = engine.station_signals
+
+    def counting_station_signals(*args):
+        builds.append(args[2])
+        return original(*args)
+
+    monkeypatch.setattr(engine, "station_signals", counting_station_signals)
+    return state, engine, TestClient(build_api(state, Historian())), builds
+
+
+def test_cached_per_version_and_values_version(setup):
+    state, engine, client, builds = setup
+    stations = sum(len(line["stations"]) for line in state.data["lines"].values())
+
+    first = client.get("/semantic/signals")
+    assert first.status_code == 200 and first.json()["signal_count"] > 0
+    assert client.get("/semantic/signals").content == first.content
+    assert client.get("/semantic/signals?format=compact").status_code == 200
+    assert len(builds) == stations
+
+    etag = first.headers["etag"]
+    assert client.get("/semantic/signals", headers={"If-None-Match": etag}).status_code == 304
+
+    line_id = next(iter(state.data["lines"]))
+    station_id = next(iter(state.data["lines"][line_id]["stations"]))
+    state.set_station_field(line_id, station_id, "state", "FAULTED")
+    changed = client.get("/semantic/signals", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert len(builds) == 2 * stations
+
+    engine.observe(state.data["lines"], 1000.0)
+    assert client.get("/semantic/signals").headers["etag"] != changed.headers["etag"]
+    assert len(builds) == 3 * stations
+
+    # Once the buffered outputs and KPIs settle, further ticks keep the ETag
+    engine.observe(state.data["lines"], 1001.0)
+    steady = client.get("/semantic/signals").headers["etag"]
+    for ts in (1002.0, 1003.0, 1004.0):
+        engine.observe(state.data["lines"], ts)
+    assert client.get("/semantic/signals", headers={"If-None-Match": steady}).status_code == 304
+    assert len(builds) == 4 * stations
+    assert client.get("/semantic/signals?format=xml").status_code == 422
+
+
+def test_compact_format_expands_to_verbose_signals(setup):
+    state, engine, client, _ = setup
+    engine.observe(state.data["lines"], 1000.0)
+    engine.observe(state.data["lines"], 1010.0)
+
+    verbose = client.get("/semantic/signals")
+    compact = client.get("/semantic/signals?format=compact")
+    body = compact.json()
+    assert body["format"] == "compact" and len(compact.content) < len(verbose.content) / 2
+    # Static signal fields are listed once per definition, not per station
+    assert len(body["signal_defs"]["semantic_id"]) < body["signal_count"]
+
+    def key(signal):
+        return signal["metadata"]["station_id"], signal["semantic_id"]
+
+    expected = {key(s): (s["value"], s["loss_category"], s["unit"]) for s in verbose.json()["semantic_signals"]}
+    stations = expand_compact(body)
+    expanded = {key(s): (s["value"], s["loss_category"], s["unit"]) for st in stations for s in st["signals"]}
+    assert expanded == expected
+    assert sum(len(st["kpis"]) for st in stations) == verbose.json()["kpi_count"] > 0
@@ -0,0 +1,99 @@
+"""
+Versioned Plant Snapshot Tests
+
+PURPOSE:
+Ensure OPC Studio snapshots can be polled incrementally:
+- Every change bumps the state version and marks only its line/station
+- /snapshot/delta returns just what changed, or everything after a restart
+- The copilot-side snapshot client merges deltas without mutating earlier results
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root and OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+pytest.importorskip("yaml")
+httpx = pytest.importorskip("httpx")
+
+from app.state import PlantState
+from packages.tools.opc_snapshot import SnapshotCache
+
+
+def _ids(state):
+    line_id = next(iter(state.data["lines"]))
+    station_ids = list(state.data["lines"][line_id]["stations"])
+    return line_id, station_ids
+
+
+def test_delta_contains_only_changed_station():
+    state = PlantState()
+    line_id, station_ids = _ids(state)
+    v0 = state.version
+
+    state.set_station_field(line_id, station_ids[0], "state", "BLOCKED")
+    assert state.version == v0 + 1
+
+    delta = state.delta(v0)
+    assert not delta["full"]
+    assert list(delta["lines"]) == [line_id]
+    assert list(delta["lines"][line_id]["stations"]) == [station_ids[0]]
+    assert "oee" not in delta["lines"][line_id]  # line fields unchanged
+    assert state.delta(state.version)["lines"] == {}
+
+
+def test_delta_from_another_boot_is_full():
+    state = PlantState()
+    delta = state.delta(0, boot="previous-run")
+    assert delta["full"] and delta["data"]["lines"].keys() == state.data["lines"].keys()
+
+
+def _transport(state, requests):
+    """Serves /snapshot and /snapshot/delta from a PlantState like the OPC Studio API"""
+
+    def handler(request):
+        requests.append(request.url.path)
+        etag = state.etag()
+        if request.headers.get("if-none-match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        if request.url.path == "/snapshot":
+            body = state.snapshot()
+        else:
+            body = state.delta(int(request.url.params["since"]), request.url.params.get("boot"))
+        return httpx.Response(200, content=json.dumps(body), headers={"ETag": etag})
+
+    return httpx.MockTransport(handler)
+
+
+def test_client_merges_deltas_copy_on_write():
+    state = PlantState()
+    line_id, station_ids = _ids(state)
+    requests = []
+    cache = SnapshotCache("http://opc-studio:8040")
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=_transport(state, requests)) as client:
+            first = await cache.fetch(client)
+            unchanged = await cache.fetch(client)
+            state.set_line_field(line_id, "oee", 0.42)
+            state.set_station_field(line_id, station_ids[-1], "good_count", 7)
+            second = await cache.fetch(client)
+            return first, unchanged, second
+
+    first, unchanged, second = asyncio.run(scenario())
+    assert requests == ["/snapshot", "/snapshot/delta", "/snapshot/delta"]
+    assert unchanged is first and cache.stats["not_modified"] == 1
+
+    assert second["version"] == state.version
+    assert second["data"]["lines"][line_id]["oee"] == 0.42
+    assert second["data"]["lines"][line_id]["stations"][station_ids[-1]]["good_count"] == 7
+    assert json.loads(json.dumps(second["data"])) == json.loads(json.dumps(state.data))
+    # The earlier snapshot is untouched
+    assert first["data"]["lines"][line_id]["oee"] != 0.42
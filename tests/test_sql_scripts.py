@@ -0,0 +1,113 @@
+"""
+SQL Script Installation Tests
+
+PURPOSE:
+Ensure the sql/*.sql scripts installed at startup reach the server intact:
+- They are sent without parameters, so psycopg does not parse the %I / %s /
+  %L of their format() calls as placeholders
+- They go out as one simple-protocol call (multi-statement scripts are
+  rejected by the server when sent with parameters)
+
+The SQLAlchemy psycopg dialect and psycopg's own query conversion run for
+real; only the server connection is replaced.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+psycopg = pytest.importorskip("psycopg")
+pytest.importorskip("sqlalchemy")
+
+from psycopg._queries import PostgresQuery
+from psycopg.adapt import Transformer
+from sqlalchemy import create_engine
+from sqlalchemy.exc import ProgrammingError
+
+from packages.db import kpi_cache
+from packages.tools import oee_rollups
+
+
+class _Cursor:
+    description = None
+    rowcount = -1
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, query, params=None, **kwargs):
+        # What psycopg does before sending: placeholders are parsed only with params
+        PostgresQuery(Transformer()).convert(query, params)
+        if params is not None and query.strip().rstrip(";").count(";"):
+            raise psycopg.errors.SyntaxError("cannot insert multiple commands into a prepared statement")
+        self.executed.append((query, params))
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    autocommit = False
+    closed = False
+    broken = False
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def cursor(self, *args, **kwargs):
+        return _Cursor(self.executed)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def engine():
+    executed = []
+    engine = create_engine(
+        "postgresql+psycopg://mes_user@localhost/mes_db",
+        creator=lambda: _Connection(executed),
+        _initialize=False,
+    )
+    engine.executed = executed
+    return engine
+
+
+def test_script_with_format_placeholders_needs_no_parameters(engine):
+    script = oee_rollups.ROLLUP_SQL_PATH.read_text()
+    assert "%I" in script
+    with pytest.raises(ProgrammingError, match="got '%I'"):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(script)
+
+
+def test_oee_rollups_install_and_rebuild(engine):
+    assert oee_rollups.ensure_rollups(engine, rebuild_if_empty=False)
+    oee_rollups.rebuild_rollups(engine)
+
+    script = oee_rollups.ROLLUP_SQL_PATH.read_text()
+    scripts = [params for query, params in engine.executed if query == script]
+    assert scripts == [None, None]
+    assert engine.executed[-1][0] == "SELECT oee_rollup_rebuild()"
+
+
+def test_kpi_cache_triggers_install(engine, monkeypatch):
+    cache = kpi_cache.KPIQueryCache()
+    monkeypatch.setattr(kpi_cache, "get_kpi_cache", lambda: cache)
+    script = kpi_cache.NOTIFY_SQL_PATH.read_text()
+    assert "%I" in script
+
+    assert kpi_cache.ensure_kpi_cache_triggers(engine)
+    assert engine.executed == [(script, None)]
+    assert cache.stats()["staleness"]["triggers_installed"]
@@ -0,0 +1,98 @@
+"""
+SQL KPI Replica Failover Tests
+
+PURPOSE:
+Ensure KPI queries:
+- Are served from the replica when it is reachable
+- Fail over to the primary when the replica connection fails
+- Skip the replica until the retry window has passed
+- Do not fail over on query errors or statement timeouts
+- Use the same POSTGRES_* defaults as the shared engines (replica defaults to the primary)
+"""
+
+import sys
+from pathlib import Path
+
+import psycopg
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+pytest.importorskip("psycopg_pool")
+
+from packages.db import kpi_cache
+from packages.tools import sqlkpi
+
+
+@pytest.fixture
+def targets(monkeypatch):
+    monkeypatch.setenv("POSTGRES_REPLICA_HOST", "replica")
+    monkeypatch.setenv("POSTGRES_HOST", "primary")
+    monkeypatch.setattr(kpi_cache, "KPI_CACHE_ENABLED", False)  # every call must reach a target
+    monkeypatch.setattr(sqlkpi, "_failover", {
+        "replica_down_until": 0.0, "failovers": 0, "served": {"replica": 0, "primary": 0}
+    })
+    calls = []
+    down = set()
+
+    def fake_execute(conninfo, sql, params):
+        host = conninfo.split()[0].split("=")[1]
+        calls.append(host)
+        if host in down:
+            raise psycopg.OperationalError(f"connection to {host} refused")
+        return [{"host": host}]
+
+    monkeypatch.setattr(sqlkpi, "_execute_sync", fake_execute)
+    return calls, down
+
+
+def test_replica_serves_by_default(targets):
+    calls, _ = targets
+    assert sqlkpi.get_oee_metrics("A01") == [{"host": "replica"}]
+    assert calls == ["replica"]
+
+
+def test_failover_to_primary_and_back(targets, monkeypatch):
+    calls, down = targets
+    down.add("replica")
+
+    assert sqlkpi.get_fpy_metrics("A01") == [{"host": "primary"}]
+    assert sqlkpi.get_fpy_metrics("A01") == [{"host": "primary"}]
+    assert calls == ["replica", "primary", "primary"]  # replica skipped while marked down
+    assert sqlkpi.kpi_pool_stats()["failovers"] == 1
+
+    down.clear()
+    monkeypatch.setitem(sqlkpi._failover, "replica_down_until", 0.0)  # retry window elapsed
+    assert sqlkpi.get_fpy_metrics("A01") == [{"host": "replica"}]
+
+
+def test_query_errors_do_not_fail_over(targets, monkeypatch):
+    def cancelled(conninfo, sql, params):
+        raise psycopg.errors.QueryCanceled("canceling statement due to statement timeout")
+
+    monkeypatch.setattr(sqlkpi, "_execute_sync", cancelled)
+    with pytest.raises(psycopg.errors.QueryCanceled):
+        sqlkpi.get_mttr_metrics("A01")
+    assert sqlkpi.kpi_pool_stats()["failovers"] == 0
+
+
+def test_conninfo_defaults_match_engines(monkeypatch):
+    from psycopg.conninfo import conninfo_to_dict
+    from sqlalchemy.engine import make_url
+    from packages.db import default_database_url
+
+    for var in ("HOST", "PORT", "DB", "USER", "PASSWORD"):
+        monkeypatch.delenv(f"POSTGRES_{var}", raising=False)
+        monkeypatch.delenv(f"POSTGRES_REPLICA_{var}", raising=False)
+    monkeypatch.setenv("POSTGRES_DB", "plant_db")
+
+    url = make_url(default_database_url())
+    primary = conninfo_to_dict(sqlkpi.primary_conninfo())
+    assert (primary["dbname"], primary["user"], primary["host"]) == (url.database, url.username, url.host) == (
+        "plant_db", "mes_user", "localhost"
+    )
+    assert sqlkpi.kpi_conninfo() == sqlkpi.primary_conninfo()
+    monkeypatch.setenv("POSTGRES_REPLICA_HOST", "replica")
+    assert conninfo_to_dict(sqlkpi.kpi_conninfo()) == {**primary, "host": "replica"}
@@ -0,0 +1,73 @@
+"""
+OPC UA Variable Sync Tests
+
+PURPOSE:
+Ensure OPC Studio pushes plant state to OPC UA variables efficiently:
+- PlantState records only the fields that actually changed
+- UAServer writes just the dirty variables, in one batch, with their UA types
+- Idle cycles write nothing
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add OPC Studio to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "opc-studio"))
+
+pytest.importorskip("yaml")
+
+from app.state import PlantState
+
+
+def _first(state):
+    line_id = next(iter(state.data["lines"]))
+    station_id = next(iter(state.data["lines"][line_id]["stations"]))
+    return line_id, station_id
+
+
+def test_scenario_marks_changed_fields_only():
+    state = PlantState()
+    line_id, station_id = _first(state)
+    assert state.take_dirty() == set()
+
+    state.apply_scenario({"line": line_id, "station": station_id, "event": "Fault",
+                          "impact": {"availability": -0.1, "alarms": ["E-STOP"]}})
+    assert state.take_dirty() == {
+        (line_id, None, "availability"), (line_id, None, "oee"),
+        (line_id, station_id, "alarms"), (line_id, station_id, "state"),
+    }
+
+    # Same value again is not a change
+    state.set_station_field(line_id, station_id, "state", "FAULTED")
+    assert state.take_dirty() == set()
+
+
+def test_sync_writes_only_dirty_nodes():
+    pytest.importorskip("asyncua")
+    from app.ua_server import UAServer
+
+    async def scenario():
+        state = PlantState()
+        line_id, station_id = _first(state)
+        server = UAServer(state)
+        await server.server.init()
+        await server.build_address_space()
+
+        assert await server.sync_once() == 0
+        state.set_line_field(line_id, "oee", 0.5)
+        state.set_station_field(line_id, station_id, "good_count", 42)
+        state.mark_dirty(line_id, station_id, "alarms")  # no UA variable
+        written = await server.sync_once()
+        values = (
+            await server._nodes[(line_id, None, "oee")].read_value(),
+            await server._nodes[(line_id, station_id, "good_count")].read_value(),
+        )
+        return written, values
+
+    written, values = asyncio.run(scenario())
+    assert written == 2
+    assert values == (0.5, 42)